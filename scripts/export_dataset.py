@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+データセットエクスポートスクリプト
+
+テーマのTrainDataを学習用の形式で書き出します。
+
+使用例:
+    # パック済みデータセット（memmap用）として書き出す
+    python scripts/export_dataset.py --theme-id 7 --output data/packed/theme_7
+
+    # 決定論的な前処理を適用した状態で書き出す
+    python scripts/export_dataset.py --theme-id 7 --output data/packed/theme_7 --apply-preprocessing
+
+    # 書き出したデータセットで学習
+    python scripts/train.py --packed-dir data/packed/theme_7
+
+    # マニフェスト（JSONL）として書き出す
+    python scripts/export_dataset.py --theme-id 7 --format manifest --output data/manifests/theme_7.jsonl
+    python scripts/train.py --manifest data/manifests/theme_7.jsonl
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def parse_args():
+    """コマンドライン引数をパース"""
+    parser = argparse.ArgumentParser(
+        description="テーマのデータセットを書き出す",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--theme-id",
+        type=int,
+        required=True,
+        help="Djangoテーマ ID"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="出力先（packed: ディレクトリ、manifest: JSONLファイル）"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default="packed",
+        choices=["packed", "manifest"],
+        help="出力形式"
+    )
+    parser.add_argument(
+        "--splits",
+        type=str,
+        nargs="+",
+        default=["train", "valid", "test"],
+        help="書き出す分割"
+    )
+    parser.add_argument(
+        "--augments",
+        type=str,
+        default="auguments.yaml",
+        help="auguments.yamlファイルのパス"
+    )
+    parser.add_argument(
+        "--apply-preprocessing",
+        action="store_true",
+        help="前処理を適用した画像を書き出す"
+    )
+    parser.add_argument(
+        "--no-hash",
+        action="store_true",
+        help="マニフェストに画像のSHA-256を含めない"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="ログレベル"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format="%(asctime)s [%(levelname)8s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    if args.format == "packed":
+        from src.data.packed_dataset import export_packed_dataset
+        meta = export_packed_dataset(
+            theme_id=args.theme_id,
+            output_dir=args.output,
+            splits=args.splits,
+            augments_config=args.augments,
+            apply_preprocessing=args.apply_preprocessing
+        )
+        print(f"✓ 書き出しが完了しました: {args.output}")
+        print(f"  - テーマ: {meta['theme_name']} (ID: {meta['theme_id']})")
+        print(f"  - クラス名: {meta['class_names']}")
+        for split, count in meta["splits"].items():
+            print(f"  - {split}: {count}サンプル")
+    elif args.format == "manifest":
+        from src.data.manifest import export_manifest
+        meta = export_manifest(
+            theme_id=args.theme_id,
+            output_path=args.output,
+            compute_hash=not args.no_hash
+        )
+        print(f"✓ マニフェストを書き出しました: {args.output}")
+        print(f"  - テーマ: {meta['theme_name']} (ID: {meta['theme_id']})")
+        print(f"  - SHA-256: {meta['sha256']}")
+        for split, count in meta["splits"].items():
+            print(f"  - {split}: {count}サンプル")
+
+
+if __name__ == "__main__":
+    main()
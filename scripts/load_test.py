@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+推論サーバー負荷試験スクリプト
+
+指定した並列数で/predictにリクエストを送り、スループットとレイテンシを表示します。
+
+使用例:
+    python scripts/load_test.py --image image.png --concurrency 32 --requests 2000
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+
+def parse_args():
+    """コマンドライン引数をパース"""
+    parser = argparse.ArgumentParser(description="推論サーバーの負荷試験")
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://127.0.0.1:8000",
+        help="推論サーバーのURL"
+    )
+    parser.add_argument(
+        "--image",
+        type=str,
+        required=True,
+        help="送信する画像ファイル"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="並列リクエスト数"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=1000,
+        help="総リクエスト数"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    image_path = Path(args.image)
+    body = image_path.read_bytes()
+    content_type = f"image/{image_path.suffix.lstrip('.').lower() or 'png'}"
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            request = urllib.request.Request(
+                f"{args.url}/predict", data=body, headers={"Content-Type": content_type}
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"✗ すべてのリクエストが失敗しました: {errors[:1]}")
+        sys.exit(1)
+
+    latencies_ms = np.array(latencies) * 1000.0
+    print(f"リクエスト数: {len(latencies)}（エラー: {len(errors)}）")
+    print(f"スループット: {len(latencies) / elapsed:.1f} req/s")
+    print(
+        "レイテンシ: "
+        f"p50={np.percentile(latencies_ms, 50):.1f}ms, "
+        f"p90={np.percentile(latencies_ms, 90):.1f}ms, "
+        f"p99={np.percentile(latencies_ms, 99):.1f}ms"
+    )
+
+    with urllib.request.urlopen(f"{args.url}/metrics") as response:
+        metrics = json.loads(response.read())
+    print(f"サーバー側メトリクス: {json.dumps(metrics, ensure_ascii=False, indent=2)}")
+
+
+if __name__ == "__main__":
+    main()
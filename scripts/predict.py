@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+バッチ推論スクリプト
+
+MLflowに記録されたモデルで大量の画像を推論し、結果をCSVに書き出します。
+結果はマイクロバッチごとに逐次書き出すため、画像数によらずメモリ使用量は一定です。
+
+使用例:
+    # ディレクトリ内の画像を推論
+    python scripts/predict.py --model-uri runs:/<run_id>/model --input data/images --output predictions.csv
+
+    # バッチサイズと前処理ワーカー数を指定
+    python scripts/predict.py --model-uri runs:/<run_id>/model --input data/images \\
+        --output predictions.csv --batch-size 128 --num-workers 8
+"""
+
+import argparse
+import csv
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def parse_args():
+    """コマンドライン引数をパース"""
+    parser = argparse.ArgumentParser(
+        description="画像のバッチ推論を実行",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--model-uri",
+        type=str,
+        required=True,
+        help="MLflowのモデルURI（例: runs:/<run_id>/model）"
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        nargs="+",
+        required=True,
+        help="画像ファイルまたはディレクトリ"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="出力CSVファイルのパス"
+    )
+    parser.add_argument(
+        "--augments",
+        type=str,
+        default=None,
+        help="auguments.yamlファイルのパス（省略時はrunのartifactを使用）"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="マイクロバッチのサイズ"
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="前処理のワーカー数（省略時はCPUコア数）"
+    )
+    parser.add_argument(
+        "--executor",
+        type=str,
+        default="thread",
+        choices=["thread", "process"],
+        help="前処理の並列化方式"
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default=None,
+        help="推論デバイス（省略時は自動選択）"
+    )
+    parser.add_argument(
+        "--runtime",
+        type=str,
+        default="eager",
+        choices=["eager", "torchscript", "onnxruntime", "auto"],
+        help="推論ランタイム（auto: 書き出し済みのモデルから最速のものを計測して選択）"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="ログレベル"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format="%(asctime)s [%(levelname)8s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    from src.inference import InferenceEngine
+
+    engine = InferenceEngine.from_mlflow(
+        args.model_uri,
+        augments_config=args.augments,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        executor=args.executor,
+        device=args.device,
+        runtime=args.runtime
+    )
+
+    count = 0
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["image", "prediction", "label", "probability"])
+        for result in engine.predict_iter(args.input):
+            writer.writerow([
+                result["input"], result["prediction"], result["label"] or "", f"{result['probability']:.6f}"
+            ])
+            count += 1
+            if count % 10000 == 0:
+                logging.info(f"{count}枚の推論が完了しました")
+
+    print(f"✓ 推論が完了しました: {count}枚 → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
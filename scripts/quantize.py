@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+量子化スクリプト
+
+学習済みモデル（MLflow run）をint8に静的量子化し、fp32との精度差・レイテンシ・サイズを表示します。
+量子化済みモデルは同じrunのartifact（quantized/）に記録されます。
+
+使用例:
+    # validデータ10バッチでキャリブレーション
+    python scripts/quantize.py --run-id <run_id>
+
+    # キャリブレーションのバッチ数を指定
+    python scripts/quantize.py --run-id <run_id> --calibration-batches 32
+
+    # MLflowに記録せずに結果のみ確認
+    python scripts/quantize.py --run-id <run_id> --no-mlflow
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def parse_args():
+    """コマンドライン引数をパース"""
+    parser = argparse.ArgumentParser(
+        description="学習済みモデルをint8に量子化",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--run-id",
+        type=str,
+        required=True,
+        help="学習済みモデルのMLflow run ID"
+    )
+    parser.add_argument(
+        "--params",
+        type=str,
+        default="params.yaml",
+        help="params.yamlファイルのパス"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="config.yaml",
+        help="config.yamlファイルのパス"
+    )
+    parser.add_argument(
+        "--augments",
+        type=str,
+        default="auguments.yaml",
+        help="auguments.yamlファイルのパス"
+    )
+    parser.add_argument(
+        "--calibration-batches",
+        type=int,
+        default=10,
+        help="キャリブレーションに使用するvalidデータのバッチ数"
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default=None,
+        choices=["x86", "fbgemm", "qnnpack"],
+        help="量子化バックエンド（省略時は自動選択）"
+    )
+    parser.add_argument(
+        "--use-preprocessing",
+        action="store_true",
+        help="前処理を使用する（学習時と合わせる）"
+    )
+    parser.add_argument(
+        "--no-mlflow",
+        action="store_true",
+        help="結果をMLflowに記録しない"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="ログレベル"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format="%(asctime)s [%(levelname)8s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    from src.training.quantize import quantize_run
+
+    results = quantize_run(
+        run_id=args.run_id,
+        params_file=args.params,
+        config_file=args.config,
+        augments_config=args.augments,
+        calibration_batches=args.calibration_batches,
+        backend=args.backend,
+        use_preprocessing=args.use_preprocessing,
+        log_to_mlflow=not args.no_mlflow
+    )
+
+    print(f"✓ 量子化が完了しました: {results['model_name']} (backend: {results['backend']})")
+    if results["recorded_test_acc"] is not None:
+        print(f"  - test_acc（学習時の記録）: {results['recorded_test_acc']:.4f}")
+    print(
+        f"  - test_acc: fp32 {results['fp32_test_acc']:.4f} → int8 {results['int8_test_acc']:.4f} "
+        f"({results['test_acc_delta']:+.4f})"
+    )
+    print(
+        f"  - レイテンシ（バッチサイズ{results['batch_size']}）: "
+        f"{results['fp32_latency_ms']:.1f}ms → {results['int8_latency_ms']:.1f}ms ({results['speedup']:.2f}x)"
+    )
+    print(
+        f"  - モデルサイズ: {results['fp32_size_mb']:.1f}MB → {results['int8_size_mb']:.1f}MB "
+        f"({results['size_reduction']:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
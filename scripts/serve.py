@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+推論サーバー起動スクリプト
+
+MLflowに記録（登録）されたモデルを読み込み、動的バッチ推論を行うHTTPサーバーを起動します。
+
+使用例:
+    # 登録済みモデルを起動
+    python scripts/serve.py --model-uri models:/image_classifier/1
+
+    # runのモデルを起動し、バッチ設定を調整
+    python scripts/serve.py --model-uri runs:/<run_id>/model --max-batch-size 64 --max-wait-ms 10
+
+    # 推論
+    curl -X POST --data-binary @image.png -H "Content-Type: image/png" http://127.0.0.1:8000/predict
+
+    # サーバー上の画像をパスで指定（--allowed-root配下のみ）
+    python scripts/serve.py --model-uri models:/image_classifier/1 --allowed-root /data/images
+    curl -X POST -H "Content-Type: application/json" -d '{"paths": ["a/001.png"]}' http://127.0.0.1:8000/predict
+
+    # メトリクス（p50/p99レイテンシ、キューの深さ）
+    curl http://127.0.0.1:8000/metrics
+
+    # 負荷試験
+    python scripts/load_test.py --image image.png --concurrency 32 --requests 2000
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def parse_args():
+    """コマンドライン引数をパース"""
+    parser = argparse.ArgumentParser(
+        description="動的バッチ推論サーバーを起動",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--model-uri",
+        type=str,
+        required=True,
+        help="MLflowのモデルURI（例: models:/<name>/<version>, runs:/<run_id>/model）"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="ホスト"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8000,
+        help="ポート"
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=32,
+        help="1回の推論の最大画像数"
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5.0,
+        help="バッチを揃えるための最大待ち時間（ミリ秒）"
+    )
+    parser.add_argument(
+        "--augments",
+        type=str,
+        default=None,
+        help="auguments.yamlファイルのパス（省略時はrunのartifactを使用）"
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default=None,
+        help="推論デバイス（省略時は自動選択）"
+    )
+    parser.add_argument(
+        "--runtime",
+        type=str,
+        default="eager",
+        choices=["eager", "torchscript", "onnxruntime", "auto"],
+        help="推論ランタイム（auto: 書き出し済みのモデルから最速のものを計測して選択）"
+    )
+    parser.add_argument(
+        "--allowed-root",
+        type=str,
+        default=None,
+        help="JSONの\"paths\"で指定できる画像のルートディレクトリ（省略時はpathsを受け付けない）"
+    )
+    parser.add_argument(
+        "--max-body-mb",
+        type=float,
+        default=32,
+        help="リクエストボディの最大サイズ（MB）。超えた場合は413を返す"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="ログレベル"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format="%(asctime)s [%(levelname)8s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    from src.inference.server import serve
+
+    serve(
+        args.model_uri,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        augments_config=args.augments,
+        device=args.device,
+        runtime=args.runtime,
+        allowed_root=args.allowed_root,
+        max_body_bytes=int(args.max_body_mb * 1024 * 1024)
+    )
+
+
+if __name__ == "__main__":
+    main()
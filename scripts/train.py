@@ -20,8 +20,23 @@
     # MLflowなしで実行
     python scripts/train.py --theme-id 7 --no-mlflow
     
+    # bf16混合精度とchannels_lastで実行（AVX512-BF16/AMX対応CPUやGPUで高速）
+    python scripts/train.py --theme-id 7 --precision bf16-mixed --channels-last
+    
+    # torch.compileで実行（コンパイル結果は.cache/torch_compileに保存され、次回以降は再利用）
+    python scripts/train.py --theme-id 7 --compile reduce-overhead
+    
+    # 学習前にバッチサイズ（メモリ予算内で最大）と学習率を自動で探索
+    python scripts/train.py --theme-id 7 --auto-tune
+    
     # カスタム設定ファイルを使用
     python scripts/train.py --params custom_params.yaml --config custom_config.yaml
+    
+    # パック済みデータセットを使用（DBアクセスなし）
+    python scripts/train.py --packed-dir data/packed/theme_7
+    
+    # マニフェストを使用（DBアクセスなし）
+    python scripts/train.py --manifest data/manifests/theme_7.jsonl
 """
 
 import argparse
@@ -75,6 +90,18 @@ def parse_args():
         default=None,
         help="Djangoテーマ ID（params.yamlを上書き）"
     )
+    parser.add_argument(
+        "--packed-dir",
+        type=str,
+        default=None,
+        help="パック済みデータセットのディレクトリ（指定した場合はDBを使用しない）"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="マニフェストファイル（指定した場合はDBを使用しない）"
+    )
     
     # 学習設定
     parser.add_argument(
@@ -146,9 +173,26 @@ def parse_args():
     parser.add_argument(
         "--precision",
         type=str,
-        default="32-true",
+        default=None,
         choices=["32-true", "16-mixed", "bf16-mixed"],
-        help="精度（32bit, 16bit mixed precision, bfloat16）"
+        help="精度（32bit, 16bit mixed precision, bfloat16）。省略時はparams.yamlのtraining.precision（既定32-true）"
+    )
+    parser.add_argument(
+        "--channels-last",
+        action="store_true",
+        help="モデルと入力をchannels_last（NHWC）のメモリ形式で扱う（params.yamlのtraining.channels_lastを上書き）"
+    )
+    parser.add_argument(
+        "--compile",
+        type=str,
+        default=None,
+        choices=["default", "reduce-overhead", "max-autotune"],
+        help="torch.compileのモードを指定してモデルをコンパイル（params.yamlのtraining.compileを上書き）"
+    )
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help="学習前にバッチサイズと学習率を自動で探索（params.yamlのtraining.auto_tuneを有効化）"
     )
     parser.add_argument(
         "--deterministic",
@@ -216,6 +260,18 @@ def override_params(params_file: str, args: argparse.Namespace):
         modified = True
         logging.info(f"テーマ IDを上書き: {args.theme_id}")
     
+    if args.packed_dir is not None:
+        params.setdefault("data", {})["source"] = "packed"
+        params["data"]["packed_dir"] = args.packed_dir
+        modified = True
+        logging.info(f"パック済みデータセットを使用: {args.packed_dir}")
+    
+    if args.manifest is not None:
+        params.setdefault("data", {})["source"] = "manifest"
+        params["data"]["manifest_path"] = args.manifest
+        modified = True
+        logging.info(f"マニフェストを使用: {args.manifest}")
+    
     if args.epochs is not None:
         params.setdefault("training", {})["num_epochs"] = args.epochs
         modified = True
@@ -236,6 +292,27 @@ def override_params(params_file: str, args: argparse.Namespace):
         modified = True
         logging.info(f"ワーカー数を上書き: {args.num_workers}")
     
+    if args.channels_last:
+        params.setdefault("training", {})["channels_last"] = True
+        modified = True
+        logging.info("channels_lastを有効化")
+    
+    if args.compile is not None:
+        training = params.setdefault("training", {})
+        if isinstance(training.get("compile"), dict):
+            training["compile"].update({"enabled": True, "mode": args.compile})
+        else:
+            training["compile"] = args.compile
+        modified = True
+        logging.info(f"torch.compileを有効化: mode={args.compile}")
+    
+    if args.auto_tune:
+        training = params.setdefault("training", {})
+        if not isinstance(training.get("auto_tune"), dict):
+            training["auto_tune"] = True
+        modified = True
+        logging.info("バッチサイズ・学習率の自動チューニングを有効化")
+    
     if args.run_name is not None:
         params.setdefault("training", {})["run_name"] = args.run_name
         modified = True
@@ -8,6 +8,7 @@ Optunaを使用してハイパーパラメータチューニングを実行し
     python scripts/tune.py
     python scripts/tune.py --n-trials 100 --timeout 3600
     python scripts/tune.py --storage sqlite:///optuna.db --study-name my_study
+    python scripts/tune.py --workers 4 --storage journal:optuna_journal/my_study.log
 """
 
 import argparse
@@ -73,7 +74,7 @@ def parse_args():
         "--storage",
         type=str,
         default=None,
-        help="Optunaストレージ（例: sqlite:///optuna.db）"
+        help="Optunaストレージ（例: sqlite:///optuna.db, journal:optuna_journal/study.log）"
     )
     parser.add_argument(
         "--study-name",
@@ -93,6 +94,12 @@ def parse_args():
         default=None,
         help="タイムアウト（秒）（params.yaml内の設定を上書き）"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="並列ワーカープロセス数（params.yaml内のoptuna.n_workersを上書き。2以上でストレージを共有して並列実行）"
+    )
     parser.add_argument(
         "--load-if-exists",
         action="store_true",
@@ -117,9 +124,9 @@ def parse_args():
     parser.add_argument(
         "--precision",
         type=str,
-        default="32-true",
+        default=None,
         choices=["32-true", "16-mixed", "bf16-mixed"],
-        help="精度（32bit, 16bit mixed precision, bfloat16）"
+        help="精度（32bit, 16bit mixed precision, bfloat16）。省略時はparams.yamlのtraining.precision（既定32-true）"
     )
     
     # その他
@@ -324,6 +331,7 @@ def main():
             storage=args.storage,
             study_name=args.study_name,
             load_if_exists=args.load_if_exists,
+            n_workers=args.workers,
             accelerator=args.accelerator,
             devices=args.devices,
             precision=args.precision,
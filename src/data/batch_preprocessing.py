@@ -0,0 +1,354 @@
+"""
+バッチ前処理
+
+(N, H, W, C) のuint8バッチに対して、ヒストグラム均等化とガンマ補正をまとめて適用します。
+PreprocessingPipelineは1枚ずつ処理しますが、こちらは以下のようにバッチ単位で処理します。
+
+- ガンマ補正: 256要素のLUTを事前計算し、バッチ全体に1回で適用
+- ヒストグラム均等化: RGB<->YCrCbの色変換をバッチ全体で1回行い、Yチャンネルを均等化
+  - global: numpyではcv2.equalizeHistを画像ごとに呼び出し、torchではヒストグラム・LUTをバッチ全体で計算
+  - clahe: タイル単位の処理のためcv2を画像ごとに呼び出す（スレッド並列）
+
+numpy配列とtorch.Tensorの両方に対応しています。torch版はGPU上のバッチに対して使用することを想定しています。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BatchType = Union[np.ndarray, torch.Tensor]
+
+# cv2のRGB<->YCrCb変換（uint8）の固定小数点ビット数
+_SHIFT = 14
+
+
+def build_gamma_lut(gamma: float) -> np.ndarray:
+    """
+    ガンマ補正用のLUTを作成
+
+    out = 255 * (in / 255) ^ gamma
+
+    Args:
+        gamma: ガンマ値（< 1.0: 明るく、> 1.0: 暗く）
+
+    Returns:
+        LUT [256] (uint8)
+    """
+    if gamma <= 0:
+        raise ValueError(f"ガンマ値は正の値である必要があります: {gamma}")
+    values = (np.arange(256, dtype=np.float64) / 255.0) ** gamma * 255.0
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def apply_lut(batch: BatchType, lut: np.ndarray) -> BatchType:
+    """
+    LUTをバッチ全体に適用
+
+    Args:
+        batch: uint8のバッチ（任意の形状）
+        lut: LUT [256]
+
+    Returns:
+        LUT適用後のバッチ（入力と同じ型・形状）
+    """
+    if isinstance(batch, torch.Tensor):
+        lut_tensor = torch.as_tensor(lut, device=batch.device)
+        return lut_tensor[batch.long()]
+    if batch.size == 0:
+        return batch.copy()
+    # cv2.LUTは2次元配列として渡すとバッチ全体を1回で処理できる
+    flat = np.ascontiguousarray(batch).reshape(batch.shape[0], -1)
+    return cv2.LUT(flat, lut).reshape(batch.shape)
+
+
+def _equalization_luts_torch(hist: torch.Tensor) -> torch.Tensor:
+    """
+    ヒストグラムから均等化LUTを計算（cv2.equalizeHistと同じ計算式）
+
+    デバイス上で計算するため、ホストとの同期は発生しません。
+
+    Args:
+        hist: 画像ごとのヒストグラム [N, 256] (int64)
+
+    Returns:
+        LUT [N, 256] (int64)
+    """
+    cdf = hist.cumsum(dim=1)
+    total = cdf[:, -1:]
+    first = (hist > 0).long().argmax(dim=1, keepdim=True)
+    cdf_min = torch.gather(hist, 1, first)
+    denom = total - cdf_min
+    constant = denom == 0
+
+    luts = torch.round((cdf - cdf_min).double() * (255.0 / denom.clamp_min(1).double()))
+    luts = luts.clamp(0, 255).long()
+    return torch.where(constant, first.expand_as(luts), luts)
+
+
+def equalize_histogram_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    バッチ全体にグローバルヒストグラム均等化を適用
+
+    RGB<->YCrCb変換はバッチ全体で1回ずつ行います。
+
+    Args:
+        batch: uint8のバッチ [N, H, W, 3]（RGB）または [N, H, W]（グレースケール）
+
+    Returns:
+        均等化後のバッチ
+    """
+    if batch.ndim == 3:
+        return _equalize_channel(batch)
+
+    n, h, w, _ = batch.shape
+    # 色変換は画素単位なので、バッチを縦に連結した1枚の画像として1回で変換できる
+    ycrcb = cv2.cvtColor(batch.reshape(n * h, w, 3), cv2.COLOR_RGB2YCrCb)
+    ycrcb = ycrcb.reshape(n, h, w, 3)
+    ycrcb[..., 0] = _equalize_channel(ycrcb[..., 0])
+    return cv2.cvtColor(ycrcb.reshape(n * h, w, 3), cv2.COLOR_YCrCb2RGB).reshape(n, h, w, 3)
+
+
+def _equalize_channel(channel: np.ndarray) -> np.ndarray:
+    channel = np.ascontiguousarray(channel)
+    result = np.empty_like(channel)
+    # 1枚あたりのヒストグラム計算はcv2の方が速いため、画像ごとにcv2.equalizeHistを呼ぶ
+    for i, image in enumerate(channel):
+        cv2.equalizeHist(image, dst=result[i])
+    return result
+
+
+def equalize_histogram_batch_torch(batch: torch.Tensor) -> torch.Tensor:
+    """
+    torch.Tensorのバッチにグローバルヒストグラム均等化を適用（GPU対応）
+
+    cv2と同じ固定小数点の係数でYCrCbとの相互変換を行うため、equalize_histogram_batchと同じ結果になります。
+
+    Args:
+        batch: uint8のバッチ [N, H, W, 3]
+
+    Returns:
+        均等化後のバッチ [N, H, W, 3] (uint8)
+    """
+    n = batch.shape[0]
+    rgb = batch.long()
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    half = 1 << (_SHIFT - 1)
+    y = (r * 4899 + g * 9617 + b * 1868 + half) >> _SHIFT
+    cr = ((((r - y) * 11682 + half) >> _SHIFT) + 128).clamp(0, 255) - 128
+    cb = ((((b - y) * 9241 + half) >> _SHIFT) + 128).clamp(0, 255) - 128
+    y_flat = y.reshape(n, -1)
+
+    hist = torch.zeros(n, 256, dtype=torch.long, device=batch.device)
+    hist.scatter_add_(1, y_flat, torch.ones_like(y_flat))
+    luts = _equalization_luts_torch(hist)
+    y_eq = torch.gather(luts, 1, y_flat).reshape(y.shape)
+
+    out = torch.stack([
+        y_eq + ((cr * 22987 + half) >> _SHIFT),
+        y_eq + ((cr * -11698 + cb * -5636 + half) >> _SHIFT),
+        y_eq + ((cb * 29049 + half) >> _SHIFT),
+    ], dim=-1)
+    return out.clamp(0, 255).to(torch.uint8)
+
+
+def clahe_batch(
+    batch: np.ndarray,
+    clip_limit: float = 2.0,
+    tile_grid_size: Tuple[int, int] = (8, 8),
+    num_threads: int = 4
+) -> np.ndarray:
+    """
+    バッチにCLAHEを適用
+
+    CLAHEはタイル単位の処理のため、画像ごとにcv2を呼び出します。
+    cv2はGILを解放するため、スレッドで並列化します。
+
+    Args:
+        batch: uint8のバッチ [N, H, W, 3]（RGB）
+        clip_limit: コントラスト制限値
+        tile_grid_size: タイルグリッドサイズ
+        num_threads: スレッド数
+
+    Returns:
+        CLAHE適用後のバッチ
+    """
+    n, h, w = batch.shape[:3]
+    ycrcb = cv2.cvtColor(batch.reshape(n * h, w, 3), cv2.COLOR_RGB2YCrCb).reshape(n, h, w, 3)
+
+    def _apply(i: int):
+        # CLAHEオブジェクトはスレッドセーフではないため画像ごとに作成
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+        ycrcb[i, ..., 0] = clahe.apply(np.ascontiguousarray(ycrcb[i, ..., 0]))
+
+    if num_threads > 1 and n > 1:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(_apply, range(n)))
+    else:
+        for i in range(n):
+            _apply(i)
+
+    return cv2.cvtColor(ycrcb.reshape(n * h, w, 3), cv2.COLOR_YCrCb2RGB).reshape(n, h, w, 3)
+
+
+class BatchPreprocessingPipeline:
+    """
+    バッチ単位の前処理パイプライン
+
+    ヒストグラム均等化 → ガンマ補正 の順に適用します（PreprocessingPipelineと同じ順序）。
+
+    Args:
+        histogram_equalization: "global", "clahe" またはNone（無効）
+        clip_limit: CLAHEのコントラスト制限値
+        tile_grid_size: CLAHEのタイルグリッドサイズ
+        gamma: ガンマ値（Noneの場合は無効）
+        num_threads: CLAHEのスレッド数
+    """
+
+    def __init__(
+        self,
+        histogram_equalization: Optional[str] = None,
+        clip_limit: float = 2.0,
+        tile_grid_size: Tuple[int, int] = (8, 8),
+        gamma: Optional[float] = None,
+        num_threads: int = 4
+    ):
+        if histogram_equalization not in (None, "global", "clahe"):
+            raise ValueError(f"不明なヒストグラム均等化の方法です: {histogram_equalization}")
+        self.histogram_equalization = histogram_equalization
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tuple(tile_grid_size)
+        self.gamma = gamma
+        self.num_threads = num_threads
+        self.gamma_lut = build_gamma_lut(gamma) if gamma is not None else None
+
+    @classmethod
+    def from_config(
+        cls,
+        preprocessing_config: Dict[str, Any],
+        num_threads: int = 4
+    ) -> Optional["BatchPreprocessingPipeline"]:
+        """
+        auguments.yamlのpreprocessingセクションからパイプラインを作成
+
+        Args:
+            preprocessing_config: preprocessingセクション
+            num_threads: CLAHEのスレッド数
+
+        Returns:
+            BatchPreprocessingPipeline（有効な前処理がない場合はNone）
+        """
+        preprocessing_config = preprocessing_config or {}
+        kwargs: Dict[str, Any] = {"num_threads": num_threads}
+
+        hist_eq_config = preprocessing_config.get("histogram_equalization", {}) or {}
+        if hist_eq_config.get("enabled", False):
+            kwargs["histogram_equalization"] = hist_eq_config.get("method", "clahe")
+            clahe_config = hist_eq_config.get("clahe", {}) or {}
+            kwargs["clip_limit"] = clahe_config.get("clip_limit", 2.0)
+            kwargs["tile_grid_size"] = tuple(clahe_config.get("tile_grid_size", [8, 8]))
+
+        gamma_config = preprocessing_config.get("gamma_correction", {}) or {}
+        if gamma_config.get("enabled", False):
+            kwargs["gamma"] = gamma_config.get("gamma", 1.2)
+
+        patching_config = preprocessing_config.get("patching", {}) or {}
+        if patching_config.get("enabled", False):
+            logger.warning("バッチ前処理ではパッチ化は適用されません。パッチ化はDataset側で行ってください")
+
+        if "histogram_equalization" not in kwargs and "gamma" not in kwargs:
+            return None
+        return cls(**kwargs)
+
+    def __call__(self, batch: Union[BatchType, Sequence[np.ndarray]]) -> Union[BatchType, List[np.ndarray]]:
+        """
+        バッチに前処理を適用
+
+        Args:
+            batch: uint8のバッチ [N, H, W, C]（numpy配列またはtorch.Tensor）、
+                   または形状の異なる画像のリスト
+
+        Returns:
+            前処理後のバッチ（入力と同じ型）
+        """
+        if isinstance(batch, (list, tuple)):
+            return self._apply_list(batch)
+        if isinstance(batch, torch.Tensor):
+            return self._apply_torch(batch)
+        return self._apply_numpy(batch)
+
+    def _apply_numpy(self, batch: np.ndarray) -> np.ndarray:
+        if batch.dtype != np.uint8:
+            raise ValueError(f"バッチ前処理の入力はuint8である必要があります: {batch.dtype}")
+        if len(batch) == 0:
+            return batch
+        if self.histogram_equalization == "global":
+            batch = equalize_histogram_batch(batch)
+        elif self.histogram_equalization == "clahe":
+            batch = clahe_batch(batch, self.clip_limit, self.tile_grid_size, self.num_threads)
+        if self.gamma_lut is not None:
+            batch = apply_lut(batch, self.gamma_lut)
+        return batch
+
+    def _apply_torch(self, batch: torch.Tensor) -> torch.Tensor:
+        if batch.dtype != torch.uint8:
+            raise ValueError(f"バッチ前処理の入力はuint8である必要があります: {batch.dtype}")
+        if self.histogram_equalization == "global":
+            batch = equalize_histogram_batch_torch(batch)
+        elif self.histogram_equalization == "clahe":
+            # CLAHEはcv2で処理
+            result = clahe_batch(batch.cpu().numpy(), self.clip_limit, self.tile_grid_size, self.num_threads)
+            batch = torch.from_numpy(result).to(batch.device)
+        if self.gamma_lut is not None:
+            batch = apply_lut(batch, self.gamma_lut)
+        return batch
+
+    def _apply_list(self, images: Sequence[np.ndarray]) -> List[np.ndarray]:
+        # 同じ形状の画像ごとにまとめて処理
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for idx, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(idx)
+        for indices in groups.values():
+            processed = self._apply_numpy(np.stack([images[i] for i in indices]))
+            for i, image in zip(indices, processed):
+                results[i] = image
+        return results
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(histogram_equalization={self.histogram_equalization}, "
+            f"gamma={self.gamma})"
+        )
+
+
+class BatchPreprocessingCollate:
+    """
+    collate時にバッチ前処理を適用するcollate_fn
+
+    Datasetはuint8の画像 [H, W, C] とラベルを返す必要があります。
+    前処理をバッチ単位で適用した後、各サンプルに変換（オーグメンテーション）を適用してスタックします。
+    DataLoaderのワーカープロセス内で実行されます。
+
+    Args:
+        pipeline: BatchPreprocessingPipeline
+        transform: 前処理後に適用する変換（albumentationsまたはtorchvision）
+    """
+
+    def __init__(self, pipeline: BatchPreprocessingPipeline, transform: Optional[Callable] = None):
+        self.pipeline = pipeline
+        self.transform = transform
+
+    def __call__(self, samples: Sequence[Tuple[np.ndarray, int]]):
+        from src.data.packed_dataset import apply_transform
+
+        images = [image for image, _ in samples]
+        labels = torch.as_tensor([label for _, label in samples], dtype=torch.long)
+        images = self.pipeline(images)
+        tensors = [apply_transform(image, self.transform) for image in images]
+        return torch.stack(tensors), labels
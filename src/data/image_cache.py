@@ -0,0 +1,476 @@
+"""
+デコード済み・前処理済み画像のキャッシュ
+
+ClassificationDatasetの__getitem__で毎エポック実行されている
+画像デコード（JPEG/PNG）と決定論的な前処理（CLAHE・ガンマ補正など）の結果をキャッシュします。
+ランダムなオーグメンテーション（get_transformsのtrain変換）はキャッシュ後に毎回適用します。
+
+キャッシュキー:
+- 画像パス
+- ファイルのmtime（およびファイルサイズ）
+- auguments.yamlのpreprocessingセクションのハッシュ
+
+バックエンド:
+- "memory": プロセス内のLRUキャッシュ（DataLoaderワーカーごとに独立）。
+  image_cache_worker_init_fnで上限をワーカー数で分割し、合計が上限に収まるようにします
+- "disk": ディレクトリに.npyとして保存し、np.loadのmmapで読み込むLRUキャッシュ
+  （/dev/shm等を指定すると、ワーカー間でページを共有できます）。
+  インデックスはプロセスごとのため、他ワーカーが書き込んだファイルはヒット時に、
+  他ワーカーが退避で削除したファイルはミスとして扱います
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# このプロセスで作成・復元したキャッシュ（DataLoaderワーカーで上限を分割するため）
+_process_caches: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def compute_preprocessing_hash(
+    preprocessing_config: Optional[Dict[str, Any]],
+    image_config: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    前処理設定のハッシュを計算
+
+    Args:
+        preprocessing_config: auguments.yamlのpreprocessingセクション
+        image_config: auguments.yamlのimageセクション（リサイズ等に影響する場合）
+
+    Returns:
+        16桁の16進文字列
+    """
+    payload = {"preprocessing": preprocessing_config or {}}
+    if image_config:
+        payload["image"] = image_config
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def load_preprocessing_config(augments_config: str) -> Dict[str, Any]:
+    """
+    auguments.yamlからpreprocessing・imageセクションを読み込む
+
+    Args:
+        augments_config: auguments.yamlファイルのパス
+
+    Returns:
+        {"preprocessing": {...}, "image": {...}}
+    """
+    with open(augments_config, "r") as f:
+        config = yaml.safe_load(f) or {}
+    return {
+        "preprocessing": config.get("preprocessing", {}) or {},
+        "image": config.get("image", {}) or {},
+    }
+
+
+def identity_pipeline(image: np.ndarray) -> List[np.ndarray]:
+    """前処理なしのパイプライン（pickle可能なようにモジュールレベルで定義）"""
+    return [image]
+
+
+def make_cache_key(image_path: Union[str, Path], preprocessing_hash: str) -> str:
+    """
+    キャッシュキーを作成
+
+    Args:
+        image_path: 画像のパス
+        preprocessing_hash: compute_preprocessing_hashの結果
+
+    Returns:
+        キャッシュキー（SHA1の16進文字列）
+    """
+    path = Path(image_path).resolve()
+    stat = path.stat()
+    raw = f"{path}|{stat.st_mtime_ns}|{stat.st_size}|{preprocessing_hash}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_nbytes(images: List[np.ndarray]) -> int:
+    return int(sum(image.nbytes for image in images))
+
+
+class PreprocessedImageCache:
+    """
+    バイト数上限付きのLRUキャッシュ
+
+    値は前処理パイプラインの出力（np.ndarrayのリスト）です。
+    パッチ化が有効な場合は複数のパッチ、無効な場合は1枚の画像になります。
+
+    Args:
+        max_bytes: キャッシュの上限バイト数（diskバックエンドではこのインスタンスが把握しているファイルの合計）
+        backend: "memory" または "disk"
+        cache_dir: diskバックエンドの保存先ディレクトリ
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 2 * 1024 ** 3,
+        backend: str = "memory",
+        cache_dir: Optional[str] = None
+    ):
+        if backend not in ("memory", "disk"):
+            raise ValueError(f"サポートされていないバックエンド: {backend}")
+        if backend == "disk" and not cache_dir:
+            raise ValueError("diskバックエンドにはcache_dirが必要です")
+
+        self.max_bytes = int(max_bytes)
+        self.backend = backend
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+
+        self._lock = threading.Lock()
+        # key -> (images or None, nbytes)。diskバックエンドではサイズのみ保持
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+        if self.backend == "disk":
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._scan_disk()
+        _process_caches.add(self)
+
+    def __getstate__(self):
+        # DataLoaderワーカーへ渡す際にロックはpickleできないため除外
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        _process_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _scan_disk(self):
+        """既存のキャッシュファイルをmtimeの古い順に登録"""
+        files = sorted(self.cache_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+        for file_path in files:
+            nbytes = file_path.stat().st_size
+            self._entries[file_path.stem] = nbytes
+            self.current_bytes += nbytes
+        self._evict()
+        if files:
+            logger.info(
+                f"ディスクキャッシュを読み込みました: {len(self._entries)}件, "
+                f"{self.current_bytes / 1024 ** 2:.1f}MB ({self.cache_dir})"
+            )
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[List[np.ndarray]]:
+        """
+        キャッシュから取得
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            画像のリスト（キャッシュにない場合はNone）
+        """
+        with self._lock:
+            if key not in self._entries:
+                if self.backend == "memory":
+                    self.misses += 1
+                    return None
+                # 他ワーカーが書き込んだファイルをインデックスに登録（削除済みの場合はミス）
+                try:
+                    nbytes = self._disk_path(key).stat().st_size
+                except FileNotFoundError:
+                    self.misses += 1
+                    return None
+                self._entries[key] = nbytes
+                self.current_bytes += nbytes
+            self._entries.move_to_end(key)
+
+            if self.backend == "memory":
+                self.hits += 1
+                images, _ = self._entries[key]
+                # 後段の変換がin-placeで書き換えてもキャッシュが壊れないようコピーを返す
+                return [image.copy() for image in images]
+
+        # diskバックエンド（ロック外でI/O）
+        path = self._disk_path(key)
+        try:
+            # copy-on-writeのmmap: 書き込まない限り他ワーカーとページを共有
+            stacked = np.load(path, mmap_mode="c")
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # 他プロセスに削除された場合
+            with self._lock:
+                nbytes = self._entries.pop(key, 0)
+                self.current_bytes -= nbytes
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return list(stacked)
+
+    def put(self, key: str, images: List[np.ndarray]):
+        """
+        キャッシュに保存
+
+        Args:
+            key: キャッシュキー
+            images: 前処理済み画像のリスト
+        """
+        nbytes = _entry_nbytes(images)
+        if nbytes > self.max_bytes:
+            logger.debug(f"エントリが上限より大きいためキャッシュしません: {nbytes}bytes")
+            return
+
+        if self.backend == "disk":
+            shapes = {image.shape for image in images}
+            if len(shapes) != 1:
+                # 形状の異なるパッチはスタックできないためキャッシュしない
+                return
+            path = self._disk_path(key)
+            tmp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.stack(images))
+            os.replace(tmp_path, path)
+            nbytes = path.stat().st_size
+            value = nbytes
+        else:
+            value = (tuple(image.copy() for image in images), nbytes)
+
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self.current_bytes -= old if self.backend == "disk" else old[1]
+            self._entries[key] = value
+            self.current_bytes += nbytes
+            self._evict()
+
+    def split_for_workers(self, num_workers: int):
+        """
+        memoryバックエンドの上限をワーカー数で分割
+
+        diskバックエンドはファイルをワーカー間で共有するため分割しません。
+
+        Args:
+            num_workers: DataLoaderのワーカー数
+        """
+        if self.backend != "memory" or num_workers <= 1:
+            return
+        with self._lock:
+            self.max_bytes //= num_workers
+            self._evict()
+
+    def _evict(self):
+        """上限を超えた分を古い順に削除（ロック取得済みで呼び出す）"""
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, value = self._entries.popitem(last=False)
+            if self.backend == "disk":
+                self.current_bytes -= value
+                try:
+                    self._disk_path(key).unlink()
+                except FileNotFoundError:
+                    pass
+            else:
+                self.current_bytes -= value[1]
+
+    def clear(self):
+        """キャッシュを空にする"""
+        with self._lock:
+            if self.backend == "disk":
+                for key in list(self._entries.keys()):
+                    try:
+                        self._disk_path(key).unlink()
+                    except FileNotFoundError:
+                        pass
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """ヒット率などの統計を取得"""
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+
+class CachedImageLoader:
+    """
+    画像の読み込みと決定論的な前処理をキャッシュ付きで実行するローダー
+
+    ClassificationDatasetの「load_image → preprocessing」の組をこのローダーに置き換えることで、
+    2エポック目以降はデコードと前処理をスキップできます。
+
+    Args:
+        preprocessing_config: auguments.yamlのpreprocessingセクション
+        image_config: auguments.yamlのimageセクション
+        cache: PreprocessedImageCache（Noneの場合はキャッシュしない）
+        pipeline: 前処理パイプライン（Noneの場合はpreprocessing_configから作成）
+        image_loader: 画像読み込み関数（Noneの場合はsrc.data.preprocessing.load_image）
+    """
+
+    def __init__(
+        self,
+        preprocessing_config: Optional[Dict[str, Any]] = None,
+        image_config: Optional[Dict[str, Any]] = None,
+        cache: Optional[PreprocessedImageCache] = None,
+        pipeline: Optional[Callable[[np.ndarray], List[np.ndarray]]] = None,
+        image_loader: Optional[Callable[[str], np.ndarray]] = None
+    ):
+        self.preprocessing_config = preprocessing_config or {}
+        self.image_config = image_config or {}
+        self.cache = cache
+        self.preprocessing_hash = compute_preprocessing_hash(
+            self.preprocessing_config, self.image_config
+        )
+        self._pipeline = pipeline
+        self._pipeline_built = pipeline is not None
+        self._image_loader = image_loader
+
+    @classmethod
+    def from_augments_config(
+        cls,
+        augments_config: str,
+        cache: Optional[PreprocessedImageCache] = None,
+        **kwargs
+    ) -> "CachedImageLoader":
+        """
+        auguments.yamlからローダーを作成
+
+        Args:
+            augments_config: auguments.yamlファイルのパス
+            cache: PreprocessedImageCache
+            **kwargs: その他のパラメータ
+
+        Returns:
+            CachedImageLoader
+        """
+        config = load_preprocessing_config(augments_config)
+        return cls(
+            preprocessing_config=config["preprocessing"],
+            image_config=config["image"],
+            cache=cache,
+            **kwargs
+        )
+
+    @property
+    def pipeline(self) -> Optional[Callable[[np.ndarray], List[np.ndarray]]]:
+        if not self._pipeline_built:
+            from src.data.preprocessing import create_preprocessing_pipeline
+            self._pipeline = create_preprocessing_pipeline(
+                self.preprocessing_config,
+                image_config=self.image_config
+            )
+            self._pipeline_built = True
+        return self._pipeline
+
+    def _load(self, image_path: str) -> np.ndarray:
+        if self._image_loader is None:
+            from src.data.preprocessing import load_image
+            self._image_loader = load_image
+        return self._image_loader(image_path)
+
+    def __call__(self, image_path: Union[str, Path]) -> List[np.ndarray]:
+        """
+        画像を読み込み、前処理済みの画像リストを返す
+
+        Args:
+            image_path: 画像のパス
+
+        Returns:
+            前処理済み画像のリスト（パッチ化無効時は要素1つ）
+        """
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(image_path, self.preprocessing_hash)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        image = self._load(str(image_path))
+        pipeline = self.pipeline
+        images = pipeline(image) if pipeline is not None else [image]
+
+        if key is not None:
+            self.cache.put(key, images)
+        return images
+
+
+def image_cache_worker_init_fn(worker_id: int):
+    """
+    DataLoaderのworker_init_fn: ワーカー内のmemoryバックエンドの上限をワーカー数で分割
+
+    memoryバックエンドはワーカーごとに独立しているため、分割しないと
+    合計でmax_size_mb×num_workersのメモリを使います。
+
+    Args:
+        worker_id: ワーカーID（未使用）
+    """
+    from torch.utils.data import get_worker_info
+
+    worker_info = get_worker_info()
+    if worker_info is None:
+        return
+    for cache in list(_process_caches):
+        cache.split_for_workers(worker_info.num_workers)
+
+
+def create_image_cache(cache_config: Optional[Dict[str, Any]]) -> Optional[PreprocessedImageCache]:
+    """
+    params.yamlのdata.image_cache設定からキャッシュを作成
+
+    例:
+        data:
+          image_cache:
+            enabled: true
+            backend: disk
+            cache_dir: /dev/shm/image_classifier_cache
+            max_size_mb: 4096
+
+    max_size_mbの扱いはバックエンドで異なります。
+    - memory: DataLoaderごとの上限です。image_cache_worker_init_fnで各ワーカーに
+      max_size_mb/num_workersずつ割り当てます
+    - disk: プロセスごとの上限です。各ワーカーは自分が書き込んだ・読み込んだファイルだけを数えるため、
+      ディレクトリ全体では最大でmax_size_mb×num_workersになります
+
+    Args:
+        cache_config: data.image_cacheセクション
+
+    Returns:
+        PreprocessedImageCache（無効な場合はNone）
+    """
+    if not cache_config or not cache_config.get("enabled", False):
+        return None
+
+    max_bytes = int(cache_config.get("max_size_mb", 2048)) * 1024 ** 2
+    backend = cache_config.get("backend", "memory")
+    cache_dir = cache_config.get("cache_dir")
+
+    logger.info(
+        f"画像キャッシュを有効化します: backend={backend}, "
+        f"max_size={max_bytes / 1024 ** 2:.0f}MB, cache_dir={cache_dir}"
+    )
+    return PreprocessedImageCache(max_bytes=max_bytes, backend=backend, cache_dir=cache_dir)
@@ -0,0 +1,360 @@
+"""
+DataLoaderの設定と自動チューニング
+
+params.yamlのtraining.loaderでDataLoaderの設定（prefetch_factor, pin_memory, persistent_workers）を
+指定し、auto_tuneを有効にするとnum_workers・prefetch_factor・pin_memoryの組み合わせを
+短時間ずつ計測してスループット（samples/sec）が最大のものを選びます。
+
+    training:
+      num_workers: 4
+      loader:
+        prefetch_factor: 2
+        pin_memory: false
+        persistent_workers: true
+        auto_tune: true                 # または辞書で探索範囲を指定
+        # auto_tune:
+        #   num_workers: [0, 2, 4, 8]   # 省略時は0と2の累乗（使用可能なCPU数まで）
+        #   prefetch_factor: [2, 4]
+        #   pin_memory: [false, true]   # 省略時はGPUがある場合のみtrueも計測
+        #   num_batches: 20             # 1つの組み合わせで計測するバッチ数
+        #   warmup_batches: 3           # ワーカーの起動を除くため計測しないバッチ数
+        #   cache_dir: .cache/loader_tuning
+
+計測結果はホストごとのファイル（cache_dir/<ホスト名>.json）に、テーマ・データ設定・前処理・
+バッチサイズなどのハッシュをキーとして保存され、同じ条件では再計測しません。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import time
+from collections import defaultdict
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import torch
+from torch.utils.data import DataLoader, default_collate
+
+logger = logging.getLogger(__name__)
+
+LOADER_OPTIONS = ("num_workers", "prefetch_factor", "pin_memory", "persistent_workers")
+
+DEFAULT_LOADER_TUNE_CONFIG = {
+    "num_workers": None,
+    "prefetch_factor": [2, 4],
+    "pin_memory": None,
+    "num_batches": 20,
+    "warmup_batches": 3,
+    "cache_dir": ".cache/loader_tuning",
+}
+
+
+def available_cpu_count() -> int:
+    """このプロセスが使用できるCPU数（CPUアフィニティを考慮）"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_worker_candidates() -> List[int]:
+    """num_workersの候補（0と、使用可能なCPU数までの2の累乗）"""
+    cpu_count = available_cpu_count()
+    candidates = [0]
+    workers = 1
+    while workers <= cpu_count:
+        candidates.append(workers)
+        workers *= 2
+    return candidates
+
+
+def parse_loader_tune_config(loader_tune_config: Any) -> Optional[Dict[str, Any]]:
+    """
+    training.loader.auto_tuneの設定を正規化
+
+    Args:
+        loader_tune_config: true / false / 辞書
+
+    Returns:
+        既定値を補った設定（無効な場合はNone）
+    """
+    if not loader_tune_config:
+        return None
+    if loader_tune_config is True:
+        loader_tune_config = {}
+    elif not isinstance(loader_tune_config, dict):
+        raise ValueError(f"training.loader.auto_tuneの形式が不正です: {loader_tune_config}")
+
+    unknown = set(loader_tune_config) - set(DEFAULT_LOADER_TUNE_CONFIG)
+    if unknown:
+        raise ValueError(f"training.loader.auto_tuneに不明なキーがあります: {sorted(unknown)}")
+
+    config = {**DEFAULT_LOADER_TUNE_CONFIG, **loader_tune_config}
+    if config["num_workers"] is None:
+        config["num_workers"] = default_worker_candidates()
+    if config["pin_memory"] is None:
+        config["pin_memory"] = [False, True] if torch.cuda.is_available() else [False]
+    if config["num_batches"] < 1:
+        raise ValueError(f"num_batchesは1以上である必要があります: {config['num_batches']}")
+    return config
+
+
+def configure_loader(datamodule: Any, settings: Dict[str, Any]):
+    """
+    DataModuleのDataLoader設定を変更
+
+    DataModuleが持たない設定（ClassificationDataModuleのprefetch_factorなど）は無視します。
+
+    Args:
+        datamodule: DataModule
+        settings: num_workers, prefetch_factor, pin_memory, persistent_workers
+    """
+    for key, value in settings.items():
+        if key not in LOADER_OPTIONS:
+            raise ValueError(f"不明なDataLoaderの設定です: {key}（{', '.join(LOADER_OPTIONS)}）")
+        if hasattr(datamodule, key):
+            setattr(datamodule, key, value)
+        else:
+            logger.warning(f"{type(datamodule).__name__}は{key}の設定に対応していないため、無視します")
+
+
+def compute_loader_config_hash(config: Dict[str, Any]) -> str:
+    """
+    計測結果のキャッシュのキーを作成
+
+    Args:
+        config: 計測条件（データ設定・前処理・バッチサイズ・探索範囲など）
+
+    Returns:
+        16桁の16進文字列
+    """
+    canonical = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def benchmark_loader(
+    dataset,
+    batch_size: int,
+    num_workers: int,
+    prefetch_factor: Optional[int] = None,
+    pin_memory: bool = False,
+    collate_fn=None,
+    num_batches: int = 20,
+    warmup_batches: int = 3
+) -> float:
+    """
+    DataLoaderのスループットを計測
+
+    Args:
+        dataset: Dataset
+        batch_size: バッチサイズ
+        num_workers: ワーカー数
+        prefetch_factor: ワーカーごとの先読みバッチ数（num_workers=0の場合は無視）
+        pin_memory: ピン留めメモリを使用するか
+        collate_fn: collate関数
+        num_batches: 計測するバッチ数
+        warmup_batches: 計測前に読み込むバッチ数（ワーカーの起動時間を除くため）
+
+    Returns:
+        samples/sec
+    """
+    from src.data.image_cache import image_cache_worker_init_fn
+    from src.data.patching import create_patch_sampler
+
+    sampler = create_patch_sampler(dataset, shuffle=True)
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=sampler is None,
+        sampler=sampler,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        pin_memory=pin_memory,
+        collate_fn=collate_fn,
+        worker_init_fn=image_cache_worker_init_fn,
+    )
+    iterator = iter(loader)
+    n_samples = 0
+    start = time.perf_counter()
+    try:
+        for i in range(warmup_batches + num_batches):
+            try:
+                images, _ = next(iterator)
+            except StopIteration:
+                # データが少ない場合はエポックを繰り返す
+                iterator = iter(loader)
+                images, _ = next(iterator)
+            if i == warmup_batches - 1:
+                start = time.perf_counter()
+            elif i >= warmup_batches:
+                n_samples += len(images)
+        elapsed = time.perf_counter() - start
+    finally:
+        del iterator
+    return n_samples / max(elapsed, 1e-9)
+
+
+def _read_cache(cache_file: Path) -> Dict[str, Any]:
+    if not cache_file.exists():
+        return {}
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"DataLoaderの計測結果のキャッシュを読み込めません: {cache_file}: {e}")
+        return {}
+
+
+def _write_cache(cache_file: Path, key: str, result: Dict[str, Any]):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    cache = _read_cache(cache_file)
+    cache[key] = result
+    # 並列ワーカーから同時に書き込まれても壊れないよう、一時ファイルから置き換える
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, cache_file)
+
+
+def tune_loader(
+    datamodule: Any,
+    tune_config: Dict[str, Any],
+    cache_key: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    DataLoaderの設定を計測して最もスループットの高いものを選択
+
+    DataModuleのtrain_dataloader()と同じDataset・collate関数で計測します。
+    結果はDataModuleに設定されます。
+
+    Args:
+        datamodule: セットアップ済みのDataModule
+        tune_config: parse_loader_tune_config()で正規化した設定
+        cache_key: 計測条件（データ設定・前処理など。ハッシュをキャッシュのキーにする）
+
+    Returns:
+        {"num_workers", "prefetch_factor", "pin_memory", "samples_per_sec"}
+    """
+    # DataModuleが対応していない設定は探索しない
+    prefetch_candidates = tune_config["prefetch_factor"] if hasattr(datamodule, "prefetch_factor") else [None]
+    pin_memory_candidates = tune_config["pin_memory"] if hasattr(datamodule, "pin_memory") else [False]
+
+    search_space = {
+        "num_workers": list(tune_config["num_workers"]),
+        "prefetch_factor": list(prefetch_candidates),
+        "pin_memory": list(pin_memory_candidates),
+        "num_batches": tune_config["num_batches"],
+    }
+    key = compute_loader_config_hash({
+        "config": cache_key or {},
+        "search_space": search_space,
+        "batch_size": datamodule.batch_size,
+        "cpu_count": available_cpu_count(),
+    })
+    cache_file = Path(tune_config["cache_dir"]) / f"{socket.gethostname()}.json"
+
+    result = _read_cache(cache_file).get(key)
+    if result is not None:
+        logger.info(f"DataLoaderの計測結果のキャッシュを使用します: {result}")
+    else:
+        reference = datamodule.train_dataloader()
+        dataset, collate_fn = reference.dataset, reference.collate_fn
+
+        result = None
+        for num_workers, prefetch_factor, pin_memory in product(
+            search_space["num_workers"], search_space["prefetch_factor"], search_space["pin_memory"]
+        ):
+            # num_workers=0ではprefetch_factorは使われないため1回のみ計測
+            if num_workers == 0 and prefetch_factor != search_space["prefetch_factor"][0]:
+                continue
+            samples_per_sec = benchmark_loader(
+                dataset,
+                batch_size=datamodule.batch_size,
+                num_workers=num_workers,
+                prefetch_factor=prefetch_factor,
+                pin_memory=pin_memory,
+                collate_fn=collate_fn,
+                num_batches=tune_config["num_batches"],
+                warmup_batches=tune_config["warmup_batches"],
+            )
+            logger.info(
+                f"DataLoader計測: num_workers={num_workers}, prefetch_factor={prefetch_factor}, "
+                f"pin_memory={pin_memory}: {samples_per_sec:.1f} samples/sec"
+            )
+            if result is None or samples_per_sec > result["samples_per_sec"]:
+                result = {
+                    "num_workers": num_workers,
+                    "prefetch_factor": prefetch_factor if num_workers > 0 else None,
+                    "pin_memory": pin_memory,
+                    "samples_per_sec": round(samples_per_sec, 1),
+                }
+        _write_cache(cache_file, key, result)
+        logger.info(f"DataLoaderの設定を選択しました: {result}")
+
+    configure_loader(datamodule, {
+        name: value for name, value in result.items()
+        if name in LOADER_OPTIONS and (name == "num_workers" or hasattr(datamodule, name))
+    })
+    return result
+
+
+def measure_loading_stages(loader: DataLoader, num_batches: int = 2, seed: int = 0) -> Dict[str, float]:
+    """
+    DataLoaderの1バッチの作成にかかる時間を段階ごとに計測
+
+    DataLoaderのワーカーでは計測できないため、メインプロセスで同じDatasetとcollate関数を使って
+    num_batches分のバッチを作成します。
+
+    段階:
+        dataset: Datasetからのサンプルの読み込み（画像の読み込み・画像単位の前処理・変換を含む）
+        batch_preprocessing: バッチ前処理（BatchPreprocessingCollateの場合）
+        transform: サンプルごとの変換（BatchPreprocessingCollateの場合）
+        collate: バッチへのスタック
+        channels_last: channels_lastへの変換（ChannelsLastCollateの場合）
+
+    Args:
+        loader: DataLoader
+        num_batches: 計測するバッチ数
+        seed: サンプルを選ぶ乱数シード
+
+    Returns:
+        段階名 -> 1バッチあたりの時間（ミリ秒）
+    """
+    from src.data.batch_preprocessing import BatchPreprocessingCollate
+    from src.data.packed_dataset import ChannelsLastCollate, apply_transform, to_channels_last
+
+    dataset = loader.dataset
+    batch_size = loader.batch_size or 1
+    collate_fn = loader.collate_fn
+    channels_last = isinstance(collate_fn, ChannelsLastCollate)
+    if channels_last:
+        collate_fn = collate_fn.collate_fn
+
+    rng = random.Random(seed)
+    totals: Dict[str, float] = defaultdict(float)
+
+    def timed(stage: str, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        totals[stage] += time.perf_counter() - start
+        return result
+
+    for _ in range(num_batches):
+        indices = rng.sample(range(len(dataset)), min(batch_size, len(dataset)))
+        samples = timed("dataset", lambda: [dataset[i] for i in indices])
+
+        if isinstance(collate_fn, BatchPreprocessingCollate):
+            labels = torch.as_tensor([label for _, label in samples], dtype=torch.long)
+            images = timed("batch_preprocessing", collate_fn.pipeline, [image for image, _ in samples])
+            tensors = timed("transform", lambda: [apply_transform(image, collate_fn.transform) for image in images])
+            images, labels = timed("collate", lambda: (torch.stack(tensors), labels))
+        else:
+            images, labels = timed("collate", collate_fn or default_collate, samples)
+
+        if channels_last:
+            timed("channels_last", to_channels_last, images)
+
+    return {stage: total / num_batches * 1000 for stage, total in totals.items()}
@@ -0,0 +1,388 @@
+"""
+学習データマニフェスト
+
+テーマのTrainDataを (traindata_id, 画像パス, ラベルインデックス, 分割, コンテンツハッシュ)
+の一覧としてJSONLファイルに書き出し、Djangoなしで学習データを読み込めるようにします。
+
+ファイル形式（1行目はメタ情報、2行目以降が1サンプル1行）:
+    {"meta": {"theme_id": 7, "theme_name": "...", "class_names": [...], "media_root": "..."}}
+    {"traindata_id": 1, "image": "images/2025/01/01/a.png", "label": 0, "split": "train", "sha256": "..."}
+
+マニフェストはdata.dvcと一緒にバージョン管理でき、runが使用した行を正確に特定できます。
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from torch.utils.data import Dataset
+
+from src.data.packed_dataset import SnapshotDataModule, apply_transform, _setup_django
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+def compute_file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    ファイルのSHA-256ハッシュを計算
+
+    Args:
+        path: ファイルパス
+        chunk_size: 読み込み単位（バイト）
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest_records(
+    traindata_list: Sequence[Any],
+    label_to_index: Dict[int, int],
+    media_root: str,
+    compute_hash: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    TrainDataのリストからマニフェストのレコードを作成
+
+    ラベル未設定・分割未設定のデータは除外します。
+
+    Args:
+        traindata_list: TrainDataのリスト
+        label_to_index: ラベルID → クラスインデックス
+        media_root: 画像のルートディレクトリ
+        compute_hash: 画像ファイルのSHA-256を記録するか（TrainData.content_hashがあればその値を使用）
+
+    Returns:
+        レコードのリスト（traindata_id順）
+    """
+    records = []
+    skipped = 0
+    for traindata in sorted(traindata_list, key=lambda t: t.id):
+        if traindata.label_id is None or not traindata.split:
+            skipped += 1
+            continue
+        image_name = str(traindata.image)
+        record = {
+            "traindata_id": traindata.id,
+            "image": image_name,
+            "label": label_to_index[traindata.label_id],
+            "split": traindata.split,
+        }
+        if compute_hash:
+            # 取り込み時に保存したコンテンツハッシュがあればファイルを読まない
+            record["sha256"] = (
+                getattr(traindata, "content_hash", None)
+                or compute_file_sha256(str(Path(media_root) / image_name))
+            )
+        records.append(record)
+
+    if skipped:
+        logger.info(f"ラベルまたは分割が未設定のデータを{skipped}件除外しました")
+    return records
+
+
+def write_manifest(path: str, meta: Dict[str, Any], records: Sequence[Dict[str, Any]]) -> str:
+    """
+    マニフェストをJSONLファイルに書き出す
+
+    Args:
+        path: 出力ファイルパス
+        meta: メタ情報
+        records: レコードのリスト
+
+    Returns:
+        マニフェストファイルのSHA-256
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"meta": meta}, ensure_ascii=False, sort_keys=True) + "\n")
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+    tmp_path.replace(path)
+    return compute_file_sha256(str(path))
+
+
+def load_manifest(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    マニフェストを読み込む
+
+    Args:
+        path: マニフェストファイルのパス
+
+    Returns:
+        (メタ情報, レコードのリスト)
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"マニフェストが見つかりません: {path}")
+
+    meta: Dict[str, Any] = {}
+    records: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if "meta" in row:
+                meta = row["meta"]
+            else:
+                records.append(row)
+
+    if "class_names" not in meta:
+        raise ValueError(f"マニフェストにメタ情報（class_names）がありません: {path}")
+    return meta, records
+
+
+def export_manifest(
+    theme_id: int,
+    output_path: str,
+    compute_hash: bool = True
+) -> Dict[str, Any]:
+    """
+    テーマのTrainDataからマニフェストを作成して書き出す
+
+    Args:
+        theme_id: テーマID
+        output_path: 出力ファイルパス（例: data/manifests/theme_7.jsonl）
+        compute_hash: 画像ファイルのSHA-256を計算するか
+
+    Returns:
+        メタ情報（sha256・サンプル数を含む）
+    """
+    _setup_django()
+    from django.conf import settings
+    from data_management.crud import get_theme, get_labels_by_theme, get_traindata_by_theme
+
+    theme = get_theme(theme_id=theme_id)
+    if theme is None:
+        raise ValueError(f"テーマID {theme_id} が見つかりません")
+
+    labels = list(get_labels_by_theme(theme_id=theme_id))
+    label_to_index = {label.id: idx for idx, label in enumerate(labels)}
+
+    records = build_manifest_records(
+        get_traindata_by_theme(theme_id=theme_id),
+        label_to_index=label_to_index,
+        media_root=settings.MEDIA_ROOT,
+        compute_hash=compute_hash
+    )
+
+    splits: Dict[str, int] = {}
+    for record in records:
+        splits[record["split"]] = splits.get(record["split"], 0) + 1
+
+    meta = {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "theme_id": theme_id,
+        "theme_name": theme.name,
+        "class_names": [label.label_name for label in labels],
+        "media_root": str(settings.MEDIA_ROOT),
+        "splits": splits,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    sha256 = write_manifest(output_path, meta, records)
+    logger.info(f"マニフェストを書き出しました: {output_path} {splits} (sha256={sha256[:12]})")
+    return {**meta, "sha256": sha256, "path": str(output_path)}
+
+
+class ManifestDataset(Dataset):
+    """
+    マニフェストから画像を読み込むDataset
+
+    保持するのはパス・ラベルのリストのみなので、DataLoaderワーカーへのpickleは軽量です。
+
+    Args:
+        records: マニフェストのレコード
+        media_root: 画像のルートディレクトリ
+        split: 使用する分割（Noneの場合はすべて）
+        transform: albumentationsまたはtorchvisionの変換
+        image_loader: 画像パスから画像リストを返す関数（CachedImageLoaderなど）
+        class_names: クラス名のリスト
+        return_raw: Trueの場合は変換せずuint8画像を返す（バッチ前処理用）
+    """
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        media_root: str,
+        split: Optional[str] = None,
+        transform: Optional[Callable] = None,
+        image_loader: Optional[Callable[[str], List[np.ndarray]]] = None,
+        class_names: Optional[List[str]] = None,
+        return_raw: bool = False
+    ):
+        if split is not None:
+            records = [r for r in records if r["split"] == split]
+        self.media_root = Path(media_root)
+        self.split = split
+        self.transform = transform
+        self.return_raw = return_raw
+        self.image_paths = [str(self.media_root / r["image"]) for r in records]
+        self.labels = [int(r["label"]) for r in records]
+        self.traindata_ids = [int(r["traindata_id"]) for r in records]
+        self.class_names = list(class_names or [])
+        self.class_to_idx = {name: idx for idx, name in enumerate(self.class_names)}
+
+        if image_loader is None:
+            from src.data.image_cache import CachedImageLoader, identity_pipeline
+            image_loader = CachedImageLoader(pipeline=identity_pipeline)
+        self.image_loader = image_loader
+
+    @classmethod
+    def from_manifest(
+        cls,
+        manifest_path: str,
+        split: Optional[str] = None,
+        media_root: Optional[str] = None,
+        **kwargs
+    ) -> "ManifestDataset":
+        """
+        マニフェストファイルからDatasetを作成
+
+        Args:
+            manifest_path: マニフェストファイルのパス
+            split: 使用する分割
+            media_root: 画像のルートディレクトリ（Noneの場合はマニフェストの値）
+            **kwargs: その他のパラメータ
+
+        Returns:
+            ManifestDataset
+        """
+        meta, records = load_manifest(manifest_path)
+        return cls(
+            records,
+            media_root=media_root or meta["media_root"],
+            split=split,
+            class_names=meta["class_names"],
+            **kwargs
+        )
+
+    def __len__(self) -> int:
+        return len(self.image_paths)
+
+    def __getitem__(self, idx: int):
+        images = self.image_loader(self.image_paths[idx])
+        image_np = images[0]  # パッチ化されている場合は最初の画像を使用
+        if self.return_raw:
+            return image_np, self.labels[idx]
+        return apply_transform(image_np, self.transform), self.labels[idx]
+
+    def get_labels(self) -> List[int]:
+        """全サンプルのラベルインデックスを取得"""
+        return list(self.labels)
+
+    def get_class_distribution(self) -> Dict[str, int]:
+        """クラスごとのサンプル数を取得"""
+        counts = np.bincount(self.labels, minlength=len(self.class_names))
+        return {name: int(counts[idx]) for idx, name in enumerate(self.class_names)}
+
+
+class ManifestDataModule(SnapshotDataModule):
+    """
+    マニフェストを使用するLightning DataModule
+
+    Args:
+        manifest_path: マニフェストファイルのパス
+        augments_config: auguments.yamlファイルのパス
+        batch_size: バッチサイズ
+        num_workers: DataLoaderのワーカー数
+        use_preprocessing: auguments.yamlの前処理を適用するか
+        media_root: 画像のルートディレクトリ（Noneの場合はマニフェストの値）
+        image_cache: PreprocessedImageCache（Noneの場合はキャッシュしない）
+        batch_preprocessing: BatchPreprocessingPipeline（指定した場合は画像単位の前処理の代わりに使用）
+        channels_last: バッチの画像をchannels_lastのメモリ形式で返すか
+    """
+
+    def __init__(
+        self,
+        manifest_path: str,
+        augments_config: Optional[str] = "auguments.yaml",
+        batch_size: int = 32,
+        num_workers: int = 4,
+        use_preprocessing: bool = False,
+        media_root: Optional[str] = None,
+        image_cache: Optional[Any] = None,
+        batch_preprocessing: Optional[Callable] = None,
+        channels_last: bool = False
+    ):
+        meta, records = load_manifest(manifest_path)
+        super().__init__(
+            meta=meta,
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            batch_preprocessing=batch_preprocessing,
+            channels_last=channels_last
+        )
+        self.manifest_path = manifest_path
+        self.records = records
+        self.media_root = media_root or meta["media_root"]
+        self.use_preprocessing = use_preprocessing
+        self.image_cache = image_cache
+
+    def _create_image_loader(self, preprocessing_config: Optional[Dict[str, Any]] = None):
+        from src.data.image_cache import CachedImageLoader, identity_pipeline, load_preprocessing_config
+        if self.use_preprocessing and self.augments_config and self.batch_preprocessing is None:
+            config = load_preprocessing_config(self.augments_config)
+            return CachedImageLoader(
+                preprocessing_config=preprocessing_config if preprocessing_config is not None else config["preprocessing"],
+                image_config=config["image"],
+                cache=self.image_cache
+            )
+        return CachedImageLoader(pipeline=identity_pipeline, cache=self.image_cache)
+
+    def _get_patching(self):
+        """前処理でパッチ化が有効な場合は (パッチ化を除いた前処理設定, StreamingPatching, 画像サイズ) を返す"""
+        if not (self.use_preprocessing and self.augments_config and self.batch_preprocessing is None):
+            return None
+        from src.data.image_cache import load_preprocessing_config
+        from src.data.patching import split_patching_config
+
+        config = load_preprocessing_config(self.augments_config)
+        preprocessing_config, patching = split_patching_config(config["preprocessing"])
+        if patching is None:
+            return None
+        image_size = config["image"].get("size")
+        if not isinstance(image_size, (list, tuple)) or len(image_size) != 2:
+            image_size = None
+        return preprocessing_config, patching, image_size
+
+    def _create_dataset(self, split: str) -> Dataset:
+        patching = self._get_patching()
+        if patching is not None:
+            # パッチ単位のサンプル（画像ヘッダーのみ読み込んでインデックスを作成）
+            from src.data.patching import PatchDataset
+            preprocessing_config, streaming_patching, image_size = patching
+            records = [r for r in self.records if r["split"] == split]
+            return PatchDataset(
+                [str(Path(self.media_root) / r["image"]) for r in records],
+                [r["label"] for r in records],
+                patching=streaming_patching,
+                image_loader=self._create_image_loader(preprocessing_config),
+                transform=self._dataset_transform(split),
+                image_size=image_size
+            )
+
+        return ManifestDataset(
+            self.records,
+            media_root=self.media_root,
+            split=split,
+            transform=self._dataset_transform(split),
+            image_loader=self._create_image_loader(),
+            class_names=self.meta["class_names"],
+            return_raw=self.batch_preprocessing is not None
+        )
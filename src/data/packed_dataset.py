@@ -0,0 +1,524 @@
+"""
+パック済みデータセット（メモリマップ）
+
+テーマのTrainDataを分割（train/valid/test）ごとに1つの連続したuint8ファイルへパックし、
+numpy.memmap経由で読み込みます。
+
+ディレクトリ構成:
+    {packed_dir}/
+        meta.json           # テーマ情報・クラス名・前処理ハッシュ
+        {split}.bin         # 画像データ（uint8、HWCを連結）
+        {split}.index.npz   # offsets, shapes, labels, traindata_ids
+
+学習時にDjango ORMへのアクセスが不要になり、分割ごとに1ファイルを順次読み込むだけになります。
+また、DataLoaderワーカー間でOSのページキャッシュを共有できます。
+"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pytorch_lightning as pl
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+logger = logging.getLogger(__name__)
+
+PACKED_FORMAT_VERSION = 1
+SPLITS = ("train", "valid", "test")
+
+# データ分割名 → auguments.yamlのセクション名
+TRANSFORM_SPLIT_NAMES = {"train": "train", "valid": "val", "test": "test"}
+
+
+def apply_transform(image_np: np.ndarray, transform: Optional[Callable]) -> torch.Tensor:
+    """
+    numpy画像に変換を適用してテンソルにする
+
+    Args:
+        image_np: NumPy配列の画像 [height, width, channels]
+        transform: albumentationsまたはtorchvisionの変換（Noneの場合は[0, 1]に正規化のみ）
+
+    Returns:
+        テンソル [channels, height, width]
+    """
+    if transform is None:
+        return torch.from_numpy(np.ascontiguousarray(image_np)).permute(2, 0, 1).float() / 255.0
+
+    # albumentationsの場合
+    if 'albumentations' in str(type(transform)):
+        return transform(image=image_np)['image']
+
+    # torchvisionの場合
+    return transform(Image.fromarray(np.asarray(image_np)))
+
+
+def to_channels_last(images: torch.Tensor) -> torch.Tensor:
+    """4次元の画像テンソル [B, C, H, W] をchannels_lastのメモリ形式に変換"""
+    if images.dim() != 4:
+        return images
+    return images.contiguous(memory_format=torch.channels_last)
+
+
+class ChannelsLastCollate:
+    """
+    バッチの画像をchannels_lastに変換するcollate_fn
+
+    DataLoaderのワーカープロセス内で変換するため、メインプロセスの負荷になりません。
+
+    Args:
+        collate_fn: 元のcollate_fn（Noneの場合はdefault_collate）
+    """
+
+    def __init__(self, collate_fn: Optional[Callable] = None):
+        self.collate_fn = collate_fn
+
+    def __call__(self, samples):
+        from torch.utils.data import default_collate
+
+        images, labels = (self.collate_fn or default_collate)(samples)
+        return to_channels_last(images), labels
+
+
+def _setup_django():
+    """Django環境をセットアップ"""
+    project_root = Path(__file__).resolve().parent.parent.parent
+    sys.path.insert(0, str(project_root / 'src' / 'web'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+def read_packed_meta(packed_dir: str) -> Dict[str, Any]:
+    """
+    meta.jsonを読み込む
+
+    Args:
+        packed_dir: パック済みデータセットのディレクトリ
+
+    Returns:
+        メタ情報の辞書
+    """
+    meta_path = Path(packed_dir) / "meta.json"
+    if not meta_path.exists():
+        raise FileNotFoundError(f"meta.jsonが見つかりません: {meta_path}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_packed_split(
+    output_dir: str,
+    split: str,
+    records: Sequence[Dict[str, Any]],
+    image_loader: Callable[[str], List[np.ndarray]]
+) -> int:
+    """
+    1つの分割をパックして書き出す
+
+    Args:
+        output_dir: 出力ディレクトリ
+        split: 分割名
+        records: {"traindata_id", "image_path", "label_index"} のリスト
+        image_loader: 画像パスから画像リストを返す関数（前処理込み）
+
+    Returns:
+        書き出したサンプル数
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    offsets: List[int] = []
+    shapes: List[Sequence[int]] = []
+    labels: List[int] = []
+    traindata_ids: List[int] = []
+
+    bin_path = output_dir / f"{split}.bin"
+    tmp_bin_path = bin_path.with_suffix(".bin.tmp")
+    offset = 0
+    with open(tmp_bin_path, "wb") as f:
+        for record in records:
+            for image in image_loader(record["image_path"]):
+                image = np.ascontiguousarray(image, dtype=np.uint8)
+                if image.ndim == 2:
+                    image = np.repeat(image[:, :, None], 3, axis=2)
+                f.write(image.tobytes())
+                offsets.append(offset)
+                shapes.append(image.shape)
+                labels.append(record["label_index"])
+                traindata_ids.append(record["traindata_id"])
+                offset += image.nbytes
+    os.replace(tmp_bin_path, bin_path)
+
+    np.savez(
+        output_dir / f"{split}.index.npz",
+        offsets=np.asarray(offsets, dtype=np.int64),
+        shapes=np.asarray(shapes, dtype=np.int32).reshape(-1, 3),
+        labels=np.asarray(labels, dtype=np.int64),
+        traindata_ids=np.asarray(traindata_ids, dtype=np.int64),
+    )
+
+    logger.info(f"{split}: {len(offsets)}サンプル, {offset / 1024 ** 2:.1f}MB -> {bin_path}")
+    return len(offsets)
+
+
+def export_packed_dataset(
+    theme_id: int,
+    output_dir: str,
+    splits: Sequence[str] = SPLITS,
+    augments_config: Optional[str] = None,
+    apply_preprocessing: bool = False
+) -> Dict[str, Any]:
+    """
+    テーマのTrainDataをパック済みデータセットとして書き出す
+
+    Args:
+        theme_id: テーマID
+        output_dir: 出力ディレクトリ
+        splits: 書き出す分割
+        augments_config: auguments.yamlファイルのパス（前処理を焼き込む場合）
+        apply_preprocessing: 決定論的な前処理を適用した画像を保存するか
+
+    Returns:
+        meta.jsonの内容
+    """
+    _setup_django()
+    from data_management.crud import get_theme, get_labels_by_theme
+    from data_management.models import TrainData
+    from src.data.image_cache import CachedImageLoader, identity_pipeline
+
+    theme = get_theme(theme_id=theme_id)
+    if theme is None:
+        raise ValueError(f"テーマID {theme_id} が見つかりません")
+
+    labels = list(get_labels_by_theme(theme_id=theme_id))
+    class_names = [label.label_name for label in labels]
+    label_to_index = {label.id: idx for idx, label in enumerate(labels)}
+
+    if apply_preprocessing:
+        if not augments_config:
+            raise ValueError("前処理を適用するにはaugments_configが必要です")
+        image_loader = CachedImageLoader.from_augments_config(augments_config)
+    else:
+        image_loader = CachedImageLoader(pipeline=identity_pipeline)
+
+    sample_counts = {}
+    for split in splits:
+        rows = (
+            TrainData.objects
+            .filter(theme_id=theme_id, split=split, label__isnull=False)
+            .order_by('id')
+            .values_list('id', 'image', 'label_id')
+        )
+        records = [
+            {
+                "traindata_id": traindata_id,
+                "image_path": _media_path(image_name),
+                "label_index": label_to_index[label_id],
+            }
+            for traindata_id, image_name, label_id in rows
+        ]
+        sample_counts[split] = write_packed_split(output_dir, split, records, image_loader)
+
+    meta = {
+        "format_version": PACKED_FORMAT_VERSION,
+        "theme_id": theme_id,
+        "theme_name": theme.name,
+        "class_names": class_names,
+        "splits": sample_counts,
+        "preprocessing_hash": image_loader.preprocessing_hash if apply_preprocessing else None,
+    }
+    with open(Path(output_dir) / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"パック済みデータセットを書き出しました: {output_dir} {sample_counts}")
+    return meta
+
+
+def _media_path(image_name: str) -> str:
+    from django.conf import settings
+    return str(Path(settings.MEDIA_ROOT) / image_name)
+
+
+class PackedDataset(Dataset):
+    """
+    パック済みデータセットをnumpy.memmapで読み込むDataset
+
+    Args:
+        packed_dir: パック済みデータセットのディレクトリ
+        split: 分割名（"train", "valid", "test"）
+        transform: albumentationsまたはtorchvisionの変換
+        indices: 使用するサンプルのインデックス（Noneの場合はすべて）
+        return_raw: Trueの場合は変換せずuint8画像を返す（バッチ前処理用）
+    """
+
+    def __init__(
+        self,
+        packed_dir: str,
+        split: str,
+        transform: Optional[Callable] = None,
+        indices: Optional[Sequence[int]] = None,
+        return_raw: bool = False
+    ):
+        self.packed_dir = Path(packed_dir)
+        self.split = split
+        self.transform = transform
+        self.return_raw = return_raw
+
+        meta = read_packed_meta(packed_dir)
+        self.class_names = meta["class_names"]
+        self.class_to_idx = {name: idx for idx, name in enumerate(self.class_names)}
+
+        index = np.load(self.packed_dir / f"{split}.index.npz")
+        self.offsets = index["offsets"]
+        self.shapes = index["shapes"]
+        self.labels = index["labels"]
+        self.traindata_ids = index["traindata_ids"]
+        if indices is not None:
+            indices = np.asarray(indices, dtype=np.int64)
+            self.offsets = self.offsets[indices]
+            self.shapes = self.shapes[indices]
+            self.labels = self.labels[indices]
+            self.traindata_ids = self.traindata_ids[indices]
+
+        # memmapはワーカープロセス内で遅延オープンする
+        self._data: Optional[np.memmap] = None
+
+    def __getstate__(self):
+        # memmapをpickleすると全データがコピーされるため除外
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def _get_data(self) -> np.memmap:
+        if self._data is None:
+            bin_path = self.packed_dir / f"{self.split}.bin"
+            if bin_path.stat().st_size == 0:
+                self._data = np.zeros(0, dtype=np.uint8)
+            else:
+                self._data = np.memmap(bin_path, dtype=np.uint8, mode="r")
+        return self._data
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def get_image(self, idx: int) -> np.ndarray:
+        """
+        変換前の画像を取得（memmap上のビューのコピー）
+
+        Args:
+            idx: サンプルインデックス
+
+        Returns:
+            画像 [height, width, channels]
+        """
+        shape = tuple(int(v) for v in self.shapes[idx])
+        start = int(self.offsets[idx])
+        size = shape[0] * shape[1] * shape[2]
+        return np.array(self._get_data()[start:start + size]).reshape(shape)
+
+    def __getitem__(self, idx: int):
+        image = self.get_image(idx)
+        if self.return_raw:
+            return image, int(self.labels[idx])
+        return apply_transform(image, self.transform), int(self.labels[idx])
+
+    def get_labels(self) -> List[int]:
+        """全サンプルのラベルインデックスを取得"""
+        return self.labels.tolist()
+
+    def get_class_distribution(self) -> Dict[str, int]:
+        """クラスごとのサンプル数を取得"""
+        counts = np.bincount(self.labels, minlength=len(self.class_names))
+        return {name: int(counts[idx]) for idx, name in enumerate(self.class_names)}
+
+
+class SnapshotDataModule(pl.LightningDataModule, ABC):
+    """
+    DBを使わずファイルから読み込むDataModuleの基底クラス
+
+    ClassificationDataModuleと同じインターフェース（setup, *_dataloader,
+    get_num_classes, get_class_names）を提供します。
+    サブクラスは_create_datasetを実装します。
+
+    batch_preprocessingを指定した場合、Datasetはuint8画像を返し、
+    前処理と変換はcollate時にバッチ単位で適用されます。
+
+    Args:
+        meta: class_names, theme_id, theme_nameを含むメタ情報
+        augments_config: auguments.yamlファイルのパス
+        batch_size: バッチサイズ
+        num_workers: DataLoaderのワーカー数
+        batch_preprocessing: BatchPreprocessingPipeline（Noneの場合は使用しない）
+        channels_last: バッチの画像をchannels_lastのメモリ形式で返すか
+
+    DataLoaderのprefetch_factor, pin_memory, persistent_workersは属性で変更できます
+    （training.loaderの設定はsrc.data.loader_tuning.configure_loaderで反映されます）。
+    """
+
+    def __init__(
+        self,
+        meta: Dict[str, Any],
+        augments_config: Optional[str] = "auguments.yaml",
+        batch_size: int = 32,
+        num_workers: int = 4,
+        batch_preprocessing: Optional[Callable] = None,
+        channels_last: bool = False
+    ):
+        super().__init__()
+        self.meta = meta
+        self.augments_config = augments_config
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.batch_preprocessing = batch_preprocessing
+        self.channels_last = channels_last
+
+        # DataLoaderの設定（persistent_workers=Noneの場合はnum_workers > 0のとき有効）
+        self.prefetch_factor: Optional[int] = None
+        self.pin_memory = False
+        self.persistent_workers: Optional[bool] = None
+
+        self.train_dataset = None
+        self.val_dataset = None
+        self.test_dataset = None
+
+    def _get_transform(self, split: str) -> Optional[Callable]:
+        if not self.augments_config:
+            return None
+        from src.data.augmentation import get_transforms
+        return get_transforms(self.augments_config, split=TRANSFORM_SPLIT_NAMES[split])
+
+    def _dataset_transform(self, split: str) -> Optional[Callable]:
+        # バッチ前処理を使う場合、変換はcollate時に適用する
+        if self.batch_preprocessing is not None:
+            return None
+        return self._get_transform(split)
+
+    @abstractmethod
+    def _create_dataset(self, split: str) -> Dataset:
+        """
+        分割のDatasetを作成（サブクラスで実装）
+
+        Args:
+            split: "train", "valid", "test"
+
+        Returns:
+            Dataset
+        """
+
+    def setup(self, stage: Optional[str] = None):
+        # 作成済みのDatasetは再利用する（Trainerからの再呼び出しやトライアル間の再利用時）
+        if stage in ("fit", None):
+            if self.train_dataset is None:
+                self.train_dataset = self._create_dataset("train")
+            if self.val_dataset is None:
+                self.val_dataset = self._create_dataset("valid")
+        if stage in ("test", None) and self.test_dataset is None:
+            self.test_dataset = self._create_dataset("test")
+        if stage == "validate" and self.val_dataset is None:
+            self.val_dataset = self._create_dataset("valid")
+
+    def _dataloader(self, dataset: Dataset, split: str, shuffle: bool) -> DataLoader:
+        from src.data.image_cache import image_cache_worker_init_fn
+        from src.data.patching import create_patch_sampler
+
+        # パッチ単位のDatasetは画像単位でシャッフル（デコード済み画像を再利用するため）
+        sampler = create_patch_sampler(dataset, shuffle)
+        collate_fn = None
+        if self.batch_preprocessing is not None:
+            from src.data.batch_preprocessing import BatchPreprocessingCollate
+            collate_fn = BatchPreprocessingCollate(self.batch_preprocessing, self._get_transform(split))
+        if self.channels_last:
+            collate_fn = ChannelsLastCollate(collate_fn)
+        return DataLoader(
+            dataset,
+            batch_size=self.batch_size,
+            shuffle=shuffle and sampler is None,
+            sampler=sampler,
+            num_workers=self.num_workers,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else None,
+            pin_memory=self.pin_memory,
+            persistent_workers=self.num_workers > 0 and self.persistent_workers is not False,
+            collate_fn=collate_fn,
+            worker_init_fn=image_cache_worker_init_fn,
+        )
+
+    def train_dataloader(self) -> DataLoader:
+        return self._dataloader(self.train_dataset, "train", shuffle=True)
+
+    def val_dataloader(self) -> DataLoader:
+        return self._dataloader(self.val_dataset, "valid", shuffle=False)
+
+    def test_dataloader(self) -> DataLoader:
+        return self._dataloader(self.test_dataset, "test", shuffle=False)
+
+    def get_num_classes(self) -> int:
+        return len(self.meta["class_names"])
+
+    def get_class_names(self) -> List[str]:
+        return list(self.meta["class_names"])
+
+    def get_theme_name(self) -> str:
+        return self.meta.get("theme_name", "")
+
+
+class PackedDataModule(SnapshotDataModule):
+    """
+    パック済みデータセットを使用するLightning DataModule
+
+    Args:
+        packed_dir: パック済みデータセットのディレクトリ
+        augments_config: auguments.yamlファイルのパス
+        batch_size: バッチサイズ
+        num_workers: DataLoaderのワーカー数
+        batch_preprocessing: BatchPreprocessingPipeline（前処理を焼き込んでいない場合に使用）
+        channels_last: バッチの画像をchannels_lastのメモリ形式で返すか
+    """
+
+    def __init__(
+        self,
+        packed_dir: str,
+        augments_config: Optional[str] = "auguments.yaml",
+        batch_size: int = 32,
+        num_workers: int = 4,
+        batch_preprocessing: Optional[Callable] = None,
+        channels_last: bool = False,
+        **kwargs
+    ):
+        meta = read_packed_meta(packed_dir)
+        if batch_preprocessing is not None and meta.get("preprocessing_hash"):
+            logger.warning("パック済みデータセットには前処理が適用済みのため、バッチ前処理は使用しません")
+            batch_preprocessing = None
+
+        super().__init__(
+            meta=meta,
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            batch_preprocessing=batch_preprocessing,
+            channels_last=channels_last
+        )
+        self.packed_dir = packed_dir
+
+        if (
+            kwargs.get("use_preprocessing")
+            and not self.meta.get("preprocessing_hash")
+            and self.batch_preprocessing is None
+        ):
+            logger.warning(
+                "use_preprocessingが指定されましたが、パック済みデータセットには前処理が適用されていません。"
+                "export時にapply_preprocessing=Trueを指定するか、バッチ前処理を有効にしてください"
+            )
+
+    def _create_dataset(self, split: str) -> Dataset:
+        return PackedDataset(
+            self.packed_dir,
+            split=split,
+            transform=self._dataset_transform(split),
+            return_raw=self.batch_preprocessing is not None
+        )
@@ -0,0 +1,527 @@
+"""
+ストリーミングパッチ抽出
+
+画像をパッチに分割する際に、すべてのパッチを個別の配列として生成せず、
+元画像のストライドビュー（numpy.lib.stride_tricks / torch.Tensor.unfold）として扱います。
+
+- patch_grid_view: (rows, cols, h, w, C) のゼロコピービュー
+- iter_patches: パッチを1枚ずつ遅延生成
+- PatchIndex: フラットなサンプルインデックス → (画像, パッチ) の対応（画像のデコード不要）
+- PatchDataset: PatchIndexを使用したDataset
+- ImageGroupedPatchSampler: 画像単位でシャッフルし、同じ画像のパッチを連続して返すSampler
+
+パッチの並びは行優先（左上から右へ、次の行へ）です。
+padding=Trueの場合、画像全体を覆うように右端・下端を0でパディングします。
+"""
+
+import logging
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+from torch.utils.data import Dataset, Sampler
+
+logger = logging.getLogger(__name__)
+
+
+def _pair(value) -> Tuple[int, int]:
+    if isinstance(value, (list, tuple)):
+        return int(value[0]), int(value[1])
+    return int(value), int(value)
+
+
+def compute_patch_grid(
+    height: int,
+    width: int,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    padding: bool = True
+) -> Tuple[int, int, int, int]:
+    """
+    パッチのグリッドを計算
+
+    Args:
+        height: 画像の高さ
+        width: 画像の幅
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)
+        padding: 画像全体を覆うようにパディングするか
+
+    Returns:
+        (行数, 列数, パディング後の高さ, パディング後の幅)
+    """
+    patch_h, patch_w = patch_size
+    stride_h, stride_w = stride
+
+    def _axis(size: int, patch: int, step: int) -> Tuple[int, int]:
+        if padding:
+            count = 1 + math.ceil(max(size - patch, 0) / step)
+            return count, patch + (count - 1) * step
+        if size < patch:
+            return 0, size
+        return 1 + (size - patch) // step, size
+
+    rows, padded_h = _axis(height, patch_h, stride_h)
+    cols, padded_w = _axis(width, patch_w, stride_w)
+    return rows, cols, padded_h, padded_w
+
+
+def _pad_image(image: np.ndarray, padded_h: int, padded_w: int) -> np.ndarray:
+    pad_h = padded_h - image.shape[0]
+    pad_w = padded_w - image.shape[1]
+    if pad_h <= 0 and pad_w <= 0:
+        return image
+    pad_width = [(0, max(pad_h, 0)), (0, max(pad_w, 0))] + [(0, 0)] * (image.ndim - 2)
+    return np.pad(image, pad_width, mode="constant")
+
+
+def patch_grid_view(
+    image: np.ndarray,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    padding: bool = True
+) -> np.ndarray:
+    """
+    パッチのグリッドをゼロコピービューとして取得
+
+    行と列のストライドは一般に結合できないため、(P, h, w, C) ではなく
+    (rows, cols, h, w, C) の形状で返します。(P, h, w, C) が必要な場合は
+    reshapeすると（その時点で）コピーされます。
+
+    Args:
+        image: 画像 [H, W, C] または [H, W]
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)
+        padding: 画像全体を覆うようにパディングするか（必要な場合は画像を1回だけコピー）
+
+    Returns:
+        読み取り専用ビュー [rows, cols, h, w, C]（グレースケールの場合は [rows, cols, h, w]）
+    """
+    patch_h, patch_w = patch_size
+    stride_h, stride_w = stride
+    rows, cols, padded_h, padded_w = compute_patch_grid(
+        image.shape[0], image.shape[1], patch_size, stride, padding
+    )
+    if rows == 0 or cols == 0:
+        return np.empty((0, 0, patch_h, patch_w) + image.shape[2:], dtype=image.dtype)
+
+    image = _pad_image(image, padded_h, padded_w)
+    # sliding_window_viewは窓の軸を末尾に追加する: [H', W', C, h, w]
+    windows = sliding_window_view(image, (patch_h, patch_w), axis=(0, 1))
+    windows = windows[::stride_h, ::stride_w][:rows, :cols]
+    if image.ndim == 3:
+        return windows.transpose(0, 1, 3, 4, 2)
+    return windows
+
+
+def extract_patches(
+    image: np.ndarray,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    padding: bool = True
+) -> np.ndarray:
+    """
+    すべてのパッチを連続した配列として取得
+
+    Args:
+        image: 画像 [H, W, C]
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)
+        padding: 画像全体を覆うようにパディングするか
+
+    Returns:
+        パッチ [P, h, w, C]
+    """
+    grid = patch_grid_view(image, patch_size, stride, padding)
+    return np.ascontiguousarray(grid.reshape((-1,) + grid.shape[2:]))
+
+
+def iter_patches(
+    image: np.ndarray,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    padding: bool = True
+) -> Iterator[np.ndarray]:
+    """
+    パッチを1枚ずつ遅延生成（各パッチは元画像のビュー）
+
+    Args:
+        image: 画像 [H, W, C]
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)
+        padding: 画像全体を覆うようにパディングするか
+
+    Yields:
+        パッチ [h, w, C]
+    """
+    grid = patch_grid_view(image, patch_size, stride, padding)
+    for row in range(grid.shape[0]):
+        for col in range(grid.shape[1]):
+            yield grid[row, col]
+
+
+def extract_patches_torch(
+    tensor: torch.Tensor,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    padding: bool = True
+) -> torch.Tensor:
+    """
+    torch.Tensor.unfoldでパッチのグリッドを取得（GPU上のテンソルにも使用可能）
+
+    Args:
+        tensor: 画像 [C, H, W] または [N, C, H, W]
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)
+        padding: 画像全体を覆うようにパディングするか
+
+    Returns:
+        ビュー [..., C, rows, cols, h, w]
+    """
+    patch_h, patch_w = patch_size
+    stride_h, stride_w = stride
+    height, width = tensor.shape[-2:]
+    rows, cols, padded_h, padded_w = compute_patch_grid(height, width, patch_size, stride, padding)
+    if padded_h > height or padded_w > width:
+        tensor = torch.nn.functional.pad(tensor, (0, padded_w - width, 0, padded_h - height))
+    return tensor.unfold(-2, patch_h, stride_h).unfold(-2, patch_w, stride_w)[..., :rows, :cols, :, :]
+
+
+class StreamingPatching:
+    """
+    ストライドビューによるパッチ化
+
+    Patchingと同じく呼び出すとパッチのリストを返しますが、各パッチは元画像のビューで、
+    パッチごとの配列コピーは発生しません。
+
+    Args:
+        patch_size: パッチサイズ (h, w)
+        stride: ストライド (h, w)（Noneの場合はパッチサイズと同じ）
+        padding: 画像全体を覆うようにパディングするか
+    """
+
+    def __init__(
+        self,
+        patch_size: Sequence[int] = (14, 14),
+        stride: Optional[Sequence[int]] = None,
+        padding: bool = True
+    ):
+        self.patch_size = _pair(patch_size)
+        self.stride = self.patch_size if stride is None else _pair(stride)
+        if min(self.patch_size) <= 0 or min(self.stride) <= 0:
+            raise ValueError(f"パッチサイズとストライドは正の値である必要があります: {self.patch_size}, {self.stride}")
+        self.padding = padding
+
+    @classmethod
+    def from_config(cls, preprocessing_config: Dict[str, Any]) -> Optional["StreamingPatching"]:
+        """
+        auguments.yamlのpreprocessingセクションから作成
+
+        Args:
+            preprocessing_config: preprocessingセクション
+
+        Returns:
+            StreamingPatching（パッチ化が無効な場合はNone）
+        """
+        patching_config = (preprocessing_config or {}).get("patching", {}) or {}
+        if not patching_config.get("enabled", False):
+            return None
+        return cls(
+            patch_size=patching_config.get("patch_size", [14, 14]),
+            stride=patching_config.get("stride"),
+            padding=patching_config.get("padding", True)
+        )
+
+    def num_patches(self, height: int, width: int) -> int:
+        """画像サイズからパッチ数を計算"""
+        rows, cols, _, _ = compute_patch_grid(height, width, self.patch_size, self.stride, self.padding)
+        return rows * cols
+
+    def grid(self, image: np.ndarray) -> np.ndarray:
+        """パッチのグリッドビュー [rows, cols, h, w, C] を取得"""
+        return patch_grid_view(image, self.patch_size, self.stride, self.padding)
+
+    def get_patch(self, image: np.ndarray, index: int) -> np.ndarray:
+        """
+        指定したパッチのみを取得
+
+        Args:
+            image: 画像 [H, W, C]
+            index: パッチインデックス（行優先）
+
+        Returns:
+            パッチ [h, w, C]
+        """
+        rows, cols, padded_h, padded_w = compute_patch_grid(
+            image.shape[0], image.shape[1], self.patch_size, self.stride, self.padding
+        )
+        if not 0 <= index < rows * cols:
+            raise IndexError(f"パッチインデックスが範囲外です: {index} (パッチ数: {rows * cols})")
+        row, col = divmod(index, cols)
+        top = row * self.stride[0]
+        left = col * self.stride[1]
+        patch = image[top:top + self.patch_size[0], left:left + self.patch_size[1]]
+        if patch.shape[:2] != self.patch_size:
+            # 端のパッチのみパディングする
+            patch = _pad_image(patch, self.patch_size[0], self.patch_size[1])
+        return patch
+
+    def iter(self, image: np.ndarray) -> Iterator[np.ndarray]:
+        """パッチを1枚ずつ遅延生成"""
+        return iter_patches(image, self.patch_size, self.stride, self.padding)
+
+    def __call__(self, image: np.ndarray) -> List[np.ndarray]:
+        grid = self.grid(image)
+        return [grid[row, col] for row in range(grid.shape[0]) for col in range(grid.shape[1])]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(patch_size={self.patch_size}, stride={self.stride}, padding={self.padding})"
+
+
+def split_patching_config(
+    preprocessing_config: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Optional[StreamingPatching]]:
+    """
+    前処理設定からパッチ化を分離
+
+    パッチ化以外の前処理はPreprocessingPipelineで画像単位に適用し、
+    パッチ化はStreamingPatchingで必要なパッチだけ切り出すために使用します。
+
+    Args:
+        preprocessing_config: auguments.yamlのpreprocessingセクション
+
+    Returns:
+        (パッチ化を無効にした前処理設定, StreamingPatching（無効な場合はNone）)
+    """
+    preprocessing_config = dict(preprocessing_config or {})
+    patching = StreamingPatching.from_config(preprocessing_config)
+    if patching is not None:
+        preprocessing_config["patching"] = {**preprocessing_config["patching"], "enabled": False}
+    return preprocessing_config, patching
+
+
+def read_image_size(path: str) -> Tuple[int, int]:
+    """
+    画像ファイルのヘッダーから (高さ, 幅) を取得（ピクセルはデコードしない）
+
+    Args:
+        path: 画像のパス
+
+    Returns:
+        (height, width)
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+    return height, width
+
+
+class PatchIndex:
+    """
+    フラットなサンプルインデックスと (画像インデックス, パッチインデックス) の対応
+
+    画像ごとのパッチ数の累積和のみを保持し、二分探索で位置を求めます。
+
+    Args:
+        image_sizes: 各画像の (高さ, 幅)（前処理でリサイズされる場合はリサイズ後のサイズ）
+        patching: StreamingPatching
+    """
+
+    def __init__(self, image_sizes: Sequence[Tuple[int, int]], patching: StreamingPatching):
+        self.patching = patching
+        counts = np.fromiter(
+            (patching.num_patches(h, w) for h, w in image_sizes),
+            dtype=np.int64,
+            count=len(image_sizes)
+        )
+        self.counts = counts
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    @classmethod
+    def from_paths(
+        cls,
+        image_paths: Sequence[str],
+        patching: StreamingPatching,
+        image_size: Optional[Tuple[int, int]] = None,
+        num_threads: int = 8
+    ) -> "PatchIndex":
+        """
+        画像パスからインデックスを作成
+
+        Args:
+            image_paths: 画像パスのリスト
+            patching: StreamingPatching
+            image_size: 前処理後の画像サイズ (h, w)（指定した場合はファイルを読まない）
+            num_threads: ヘッダー読み込みのスレッド数
+
+        Returns:
+            PatchIndex
+        """
+        if image_size is not None:
+            sizes = [tuple(image_size)] * len(image_paths)
+        else:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                sizes = list(executor.map(read_image_size, image_paths))
+        return cls(sizes, patching)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def locate(self, index: int) -> Tuple[int, int]:
+        """
+        フラットなインデックスを (画像インデックス, パッチインデックス) に変換
+
+        Args:
+            index: サンプルインデックス
+
+        Returns:
+            (image_index, patch_index)
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"インデックスが範囲外です: {index} (サンプル数: {len(self)})")
+        image_index = int(np.searchsorted(self.offsets, index, side="right") - 1)
+        return image_index, int(index - self.offsets[image_index])
+
+    def sample_labels(self, image_labels: Sequence[int]) -> np.ndarray:
+        """画像ごとのラベルからサンプルごとのラベルを作成"""
+        return np.repeat(np.asarray(image_labels, dtype=np.int64), self.counts)
+
+
+class PatchDataset(Dataset):
+    """
+    パッチ単位のDataset
+
+    起動時は画像ヘッダーのみ読み込み、パッチはアクセス時に元画像から切り出します。
+    直近にデコードした画像を数枚保持するため、同じ画像のパッチが続く場合はデコードを省略できます。
+    シャッフルする場合はパッチ単位のshuffle=Trueではなく、ImageGroupedPatchSampler
+    （create_patch_samplerを参照）を使用してください。パッチ単位でシャッフルすると連続するパッチが
+    ほぼ別の画像になり、パッチごとに画像全体のデコードと前処理が発生します。
+
+    Args:
+        image_paths: 画像パスのリスト
+        labels: 画像ごとのラベルインデックス
+        patching: StreamingPatching
+        image_loader: 画像パスから画像を返す関数（パッチ化を含まない前処理を適用）
+        transform: albumentationsまたはtorchvisionの変換
+        image_size: 前処理後の画像サイズ (h, w)（リサイズする場合に指定）
+        return_raw: Trueの場合は変換せずuint8パッチを返す
+        decoded_cache_size: 保持するデコード済み画像の数
+    """
+
+    def __init__(
+        self,
+        image_paths: Sequence[str],
+        labels: Sequence[int],
+        patching: StreamingPatching,
+        image_loader: Callable[[str], Any],
+        transform: Optional[Callable] = None,
+        image_size: Optional[Tuple[int, int]] = None,
+        return_raw: bool = False,
+        decoded_cache_size: int = 4
+    ):
+        self.image_paths = list(image_paths)
+        self.image_labels = [int(label) for label in labels]
+        self.patching = patching
+        self.image_loader = image_loader
+        self.transform = transform
+        self.return_raw = return_raw
+        self.decoded_cache_size = decoded_cache_size
+        self.index = PatchIndex.from_paths(self.image_paths, patching, image_size=image_size)
+        self._decoded: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        logger.info(f"パッチインデックスを作成しました: {len(self.image_paths)}画像, {len(self.index)}パッチ")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_decoded"] = OrderedDict()
+        return state
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _load(self, image_index: int) -> np.ndarray:
+        image = self._decoded.get(image_index)
+        if image is not None:
+            self._decoded.move_to_end(image_index)
+            return image
+        image = self.image_loader(self.image_paths[image_index])
+        if isinstance(image, list):
+            image = image[0]
+        self._decoded[image_index] = image
+        while len(self._decoded) > self.decoded_cache_size:
+            self._decoded.popitem(last=False)
+        return image
+
+    def __getitem__(self, idx: int):
+        from src.data.packed_dataset import apply_transform
+
+        image_index, patch_index = self.index.locate(idx)
+        patch = self.patching.get_patch(self._load(image_index), patch_index)
+        label = self.image_labels[image_index]
+        if self.return_raw:
+            return np.ascontiguousarray(patch), label
+        return apply_transform(np.ascontiguousarray(patch), self.transform), label
+
+    def get_labels(self) -> List[int]:
+        """全サンプルのラベルインデックスを取得"""
+        return self.index.sample_labels(self.image_labels).tolist()
+
+
+class ImageGroupedPatchSampler(Sampler):
+    """
+    画像単位でシャッフルするSampler
+
+    エポックごとに画像の順序をシャッフルし、各画像のパッチ（画像内でもシャッフル）を連続して返します。
+    同じ画像のパッチが続くため、PatchDatasetのデコード済み画像の保持が効き、
+    画像1枚のデコードと前処理は（DataLoaderのワーカーごとに）1回程度で済みます。
+    その代わり、1バッチ内のパッチは少数の画像に偏ります。
+
+    Args:
+        index: PatchIndex
+        seed: 乱数シード（Noneの場合はtorchの乱数から毎エポック決定）
+    """
+
+    def __init__(self, index: PatchIndex, seed: Optional[int] = None):
+        self.index = index
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """エポックを設定（seedを指定した場合のエポックごとの順序に使用。Lightningが毎エポック呼び出します）"""
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[int]:
+        if self.seed is None:
+            seed = int(torch.empty((), dtype=torch.int64).random_().item())
+        else:
+            seed = self.seed + self.epoch
+        rng = np.random.default_rng(seed)
+        for image_index in rng.permutation(len(self.index.counts)):
+            start = int(self.index.offsets[image_index])
+            for patch_index in rng.permutation(int(self.index.counts[image_index])):
+                yield start + int(patch_index)
+
+
+def create_patch_sampler(dataset: Dataset, shuffle: bool) -> Optional[Sampler]:
+    """
+    DataLoaderに渡すSamplerを作成
+
+    Args:
+        dataset: Dataset
+        shuffle: シャッフルするか
+
+    Returns:
+        PatchDatasetをシャッフルする場合はImageGroupedPatchSampler、それ以外はNone
+        （Noneの場合はDataLoaderのshuffleをそのまま使用）
+    """
+    if shuffle and isinstance(dataset, PatchDataset):
+        return ImageGroupedPatchSampler(dataset.index)
+    return None
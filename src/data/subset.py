@@ -0,0 +1,101 @@
+"""
+学習データの層化サブサンプリング
+
+マルチフィデリティのチューニングで、trainデータの一部のみを使って学習するために使用します。
+ラベルごとに同じ割合を抽出するため、クラス比率は元のtrainデータとほぼ同じになります。
+
+同じseedであれば、割合を大きくしたサブセットは小さい割合のサブセットを含みます
+（ラベルごとのシャッフル順の先頭から取り出すため）。
+"""
+
+import logging
+from collections import defaultdict
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from torch.utils.data import Dataset, Subset
+
+logger = logging.getLogger(__name__)
+
+
+def stratified_subset_indices(labels: Sequence[int], fraction: float, seed: int = 0) -> List[int]:
+    """
+    ラベルごとに同じ割合でインデックスを抽出
+
+    各ラベルから少なくとも1件は抽出します。
+
+    Args:
+        labels: サンプルごとのラベル
+        fraction: 抽出する割合（0 < fraction <= 1）
+        seed: 乱数シード
+
+    Returns:
+        抽出したインデックス（昇順）
+    """
+    if not 0.0 < fraction <= 1.0:
+        raise ValueError(f"fractionは0より大きく1以下である必要があります: {fraction}")
+
+    indices_by_label = defaultdict(list)
+    for idx, label in enumerate(labels):
+        indices_by_label[int(label)].append(idx)
+
+    selected = []
+    for label in sorted(indices_by_label):
+        indices = indices_by_label[label]
+        # ラベルごとに独立した乱数でシャッフル（他のラベルの件数に影響されない）
+        order = np.random.default_rng([seed, label]).permutation(len(indices))
+        n_selected = max(1, int(round(len(indices) * fraction)))
+        selected.extend(indices[i] for i in order[:n_selected])
+    return sorted(selected)
+
+
+def stratified_subset(dataset: Dataset, fraction: float, seed: int = 0) -> Dataset:
+    """
+    Datasetの層化サブセットを作成
+
+    Args:
+        dataset: get_labels()を持つDataset
+        fraction: 抽出する割合（1.0の場合は元のDatasetをそのまま返す）
+        seed: 乱数シード
+
+    Returns:
+        サブセット
+    """
+    if fraction >= 1.0:
+        return dataset
+    if not hasattr(dataset, "get_labels"):
+        raise ValueError(f"{type(dataset).__name__}はget_labels()を持たないため、層化サブセットを作成できません")
+
+    indices = stratified_subset_indices(dataset.get_labels(), fraction, seed=seed)
+    logger.info(f"trainデータの層化サブセットを使用します: {len(indices)}/{len(dataset)}件 (fraction={fraction})")
+    return Subset(dataset, indices)
+
+
+def limit_train_split(datamodule: Any, fraction: Optional[float], seed: int = 0) -> Any:
+    """
+    DataModuleのtrainデータを層化サブセットに置き換える
+
+    setup()の後にtrain_datasetを置き換えるため、ClassificationDataModuleと
+    SnapshotDataModuleのどちらにも使用できます。valid/testデータはそのままです。
+
+    Args:
+        datamodule: train_datasetを持つDataModule
+        fraction: trainデータの割合（Noneまたは1.0の場合は何もしない）
+        seed: 乱数シード
+
+    Returns:
+        同じDataModule
+    """
+    if fraction is None or fraction >= 1.0:
+        return datamodule
+
+    original_setup = datamodule.setup
+
+    def setup(stage: Optional[str] = None):
+        original_setup(stage)
+        dataset = getattr(datamodule, "train_dataset", None)
+        if dataset is not None and not isinstance(dataset, Subset):
+            datamodule.train_dataset = stratified_subset(dataset, fraction, seed=seed)
+
+    datamodule.setup = setup
+    return datamodule
@@ -1,4 +1,22 @@
 """
-推論関連モジュール（将来実装）
+推論関連モジュール
 """
 
+from .engine import ImagePreprocessor, InferenceEngine, iter_image_files, iter_inputs
+from .runtimes import OnnxRuntimeModel, available_runtimes, select_runtime
+from .server import DynamicBatcher, ModelServer, ServingMetrics, create_server, serve
+
+__all__ = [
+    'ImagePreprocessor',
+    'InferenceEngine',
+    'iter_image_files',
+    'iter_inputs',
+    'OnnxRuntimeModel',
+    'available_runtimes',
+    'select_runtime',
+    'DynamicBatcher',
+    'ModelServer',
+    'ServingMetrics',
+    'create_server',
+    'serve',
+]
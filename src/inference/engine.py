@@ -0,0 +1,503 @@
+"""
+バッチ推論エンジン
+
+大量の画像をオフラインで推論するためのエンジンです。
+
+- 入力: 画像パスのリスト、ディレクトリ、numpy配列のバッチ [N, H, W, C]、numpy配列のリスト
+- デコードと前処理はスレッドプール（またはプロセスプール）で並列実行
+- 設定したサイズのマイクロバッチ単位で torch.inference_mode() の下で推論
+- 結果は入力順にストリーミングで返す（先読みするバッチ数を制限してメモリ使用量を一定に保つ）
+"""
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".gif", ".webp"}
+
+InputItem = Union[str, Path, np.ndarray]
+
+
+def iter_image_files(directory: Union[str, Path], recursive: bool = True) -> Iterator[str]:
+    """
+    ディレクトリ内の画像ファイルをパス順に列挙
+
+    Args:
+        directory: ディレクトリ
+        recursive: サブディレクトリも対象にするか
+
+    Yields:
+        画像ファイルのパス
+    """
+    pattern = "**/*" if recursive else "*"
+    for path in sorted(Path(directory).glob(pattern)):
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield str(path)
+
+
+def iter_inputs(inputs: Union[InputItem, Iterable[InputItem]]) -> Iterator[InputItem]:
+    """
+    さまざまな形式の入力を1件ずつの入力に展開
+
+    Args:
+        inputs: 画像パス、ディレクトリ、numpy配列 [N, H, W, C] または [H, W, C]、それらのリスト
+
+    Yields:
+        画像パスまたはnumpy配列 [H, W, C]
+    """
+    if isinstance(inputs, np.ndarray):
+        if inputs.ndim == 4:
+            yield from inputs
+        elif inputs.ndim in (2, 3):
+            yield inputs
+        else:
+            raise ValueError(f"サポートされていない配列の形状です: {inputs.shape}")
+        return
+
+    if isinstance(inputs, (str, Path)):
+        if Path(inputs).is_dir():
+            yield from iter_image_files(inputs)
+        else:
+            yield str(inputs)
+        return
+
+    for item in inputs:
+        if isinstance(item, (str, Path)) and Path(item).is_dir():
+            yield from iter_image_files(item)
+        elif isinstance(item, Path):
+            yield str(item)
+        else:
+            yield item
+
+
+def load_rgb_image(path: str) -> np.ndarray:
+    """画像をRGBのnumpy配列として読み込む"""
+    with Image.open(path) as image:
+        return np.array(image.convert("RGB"))
+
+
+def read_class_names(path: Union[str, Path]) -> Optional[List[str]]:
+    """
+    class_names.txtを読み込む
+
+    Args:
+        path: class_names.txtのパス
+
+    Returns:
+        クラス名のリスト（ファイルがない場合はNone）
+    """
+    path = Path(path)
+    if not path.exists():
+        logger.warning(f"クラス名ファイルが見つかりません: {path}")
+        return None
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def resolve_run_id(model_uri: str) -> Optional[str]:
+    """
+    モデルURIから学習時のMLflow run IDを取得
+
+    Args:
+        model_uri: runs:/<run_id>/... または models:/<name>/<version or stage>
+
+    Returns:
+        run ID（解決できない場合はNone）
+    """
+    if model_uri.startswith("runs:/"):
+        return model_uri[len("runs:/"):].split("/")[0]
+    if model_uri.startswith("models:/"):
+        from mlflow.tracking import MlflowClient
+
+        name, _, version = model_uri[len("models:/"):].strip("/").partition("/")
+        client = MlflowClient()
+        try:
+            if version.isdigit():
+                return client.get_model_version(name, version).run_id
+            versions = client.get_latest_versions(name, stages=[version] if version else None)
+            return versions[0].run_id if versions else None
+        except Exception as e:
+            logger.warning(f"モデルのrun IDの取得に失敗しました: {e}")
+    return None
+
+
+class ImagePreprocessor:
+    """
+    1枚の画像をモデル入力のテンソルに変換
+
+    前処理パイプライン → パッチ化（最初のパッチ）→ 変換 の順に適用します。
+    プロセスプールで使用できるようにpickle可能です。
+
+    Args:
+        preprocessing: 前処理パイプライン（画像 → 画像リスト）
+        patching: StreamingPatching（Noneの場合はパッチ化しない）
+        transform: albumentationsまたはtorchvisionの変換
+        image_loader: 画像パスから画像を読み込む関数
+    """
+
+    def __init__(
+        self,
+        preprocessing: Optional[Callable[[np.ndarray], List[np.ndarray]]] = None,
+        patching: Optional[Any] = None,
+        transform: Optional[Callable] = None,
+        image_loader: Optional[Callable[[str], np.ndarray]] = None
+    ):
+        self.preprocessing = preprocessing
+        self.patching = patching
+        self.transform = transform
+        self.image_loader = image_loader or load_rgb_image
+
+    @classmethod
+    def from_augments_config(cls, augments_config: str, split: str = "test") -> "ImagePreprocessor":
+        """
+        auguments.yamlから作成
+
+        Args:
+            augments_config: auguments.yamlファイルのパス
+            split: 使用する変換（"test" / "val"）
+
+        Returns:
+            ImagePreprocessor
+        """
+        from src.data.augmentation import get_transforms
+        from src.data.image_cache import load_preprocessing_config
+        from src.data.patching import split_patching_config
+        from src.data.preprocessing import create_preprocessing_pipeline
+
+        config = load_preprocessing_config(augments_config)
+        preprocessing_config, patching = split_patching_config(config["preprocessing"])
+        preprocessing = None
+        if preprocessing_config:
+            preprocessing = create_preprocessing_pipeline(preprocessing_config, image_config=config["image"])
+        return cls(
+            preprocessing=preprocessing,
+            patching=patching,
+            transform=get_transforms(augments_config, split=split)
+        )
+
+    def __call__(self, item: InputItem) -> torch.Tensor:
+        from src.data.packed_dataset import apply_transform
+
+        image = self.image_loader(str(item)) if isinstance(item, (str, Path)) else np.asarray(item)
+        if image.ndim == 2:
+            image = np.repeat(image[:, :, None], 3, axis=2)
+        if self.preprocessing is not None:
+            image = self.preprocessing(image)[0]
+        if self.patching is not None:
+            image = self.patching.get_patch(image, 0)
+        return apply_transform(np.ascontiguousarray(image), self.transform)
+
+
+# プロセスプールのワーカーで使用する前処理
+_WORKER_PREPROCESSOR: Optional[ImagePreprocessor] = None
+
+
+def _init_worker(preprocessor: ImagePreprocessor, num_threads: int):
+    global _WORKER_PREPROCESSOR
+    _WORKER_PREPROCESSOR = preprocessor
+    torch.set_num_threads(num_threads)
+
+
+def _preprocess_in_worker(item: InputItem) -> torch.Tensor:
+    return _WORKER_PREPROCESSOR(item)
+
+
+class InferenceEngine:
+    """
+    バッチ推論エンジン
+
+    Args:
+        model: PyTorchモデル、またはテンソルを受け取りロジットを返す呼び出し可能オブジェクト
+            （TorchScript / onnxruntimeのランタイムなど）
+        preprocessor: 1件の入力をテンソルに変換する関数（ImagePreprocessorなど）
+        class_names: クラス名のリスト
+        batch_size: マイクロバッチのサイズ
+        num_workers: 前処理のワーカー数（Noneの場合はCPUコア数、0の場合はメインスレッドで実行）
+        executor: "thread" または "process"
+        prefetch_batches: 推論中に先読みして前処理しておくバッチ数
+        device: 推論デバイス（Noneの場合は自動選択）
+    """
+
+    def __init__(
+        self,
+        model: Union[torch.nn.Module, Callable[[torch.Tensor], torch.Tensor]],
+        preprocessor: Optional[Callable[[InputItem], torch.Tensor]] = None,
+        class_names: Optional[List[str]] = None,
+        batch_size: int = 64,
+        num_workers: Optional[int] = None,
+        executor: str = "thread",
+        prefetch_batches: int = 2,
+        device: Optional[Union[str, torch.device]] = None
+    ):
+        if batch_size <= 0:
+            raise ValueError(f"batch_sizeは正の値である必要があります: {batch_size}")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"executorは'thread'または'process'である必要があります: {executor}")
+
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        if isinstance(model, torch.nn.Module):
+            model = model.to(self.device).eval()
+        self.model = model
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.class_names = class_names
+        self.batch_size = batch_size
+        self.num_workers = (os.cpu_count() or 1) if num_workers is None else num_workers
+        self.executor_type = executor
+        self.prefetch_batches = max(prefetch_batches, 0)
+
+    @classmethod
+    def from_augments_config(
+        cls,
+        model: torch.nn.Module,
+        augments_config: Optional[str] = None,
+        **kwargs
+    ) -> "InferenceEngine":
+        """
+        auguments.yamlの前処理・テスト時変換を使用してエンジンを作成
+
+        Args:
+            model: PyTorchモデル
+            augments_config: auguments.yamlファイルのパス（Noneの場合は[0, 1]に正規化のみ）
+            **kwargs: InferenceEngineのその他のパラメータ
+
+        Returns:
+            InferenceEngine
+        """
+        preprocessor = ImagePreprocessor.from_augments_config(augments_config) if augments_config else None
+        return cls(model, preprocessor=preprocessor, **kwargs)
+
+    @classmethod
+    def from_mlflow(
+        cls,
+        model_uri: str,
+        augments_config: Optional[str] = None,
+        runtime: str = "eager",
+        **kwargs
+    ) -> "InferenceEngine":
+        """
+        MLflowに記録されたモデルからエンジンを作成
+
+        モデルとクラス名はrunのweights artifact（なければmodel artifact）から、
+        auguments.yamlは（指定がなければ）runのconfig/auguments.yamlから取得します。
+        読み込んだモデルはプロセス全体のモデルキャッシュで共有されます。
+
+        Args:
+            model_uri: モデルURI（例: runs:/<run_id>/model, models:/<name>/<version>）
+            augments_config: auguments.yamlファイルのパス
+            runtime: "eager" / "torchscript" / "onnxruntime" / "auto"
+                （torchscript・onnxruntimeはrunのexport artifactを使用、autoは最速のものを計測して選択）
+            **kwargs: InferenceEngineのその他のパラメータ
+
+        Returns:
+            InferenceEngine
+        """
+        import mlflow.artifacts
+        import mlflow.pytorch
+
+        run_id = resolve_run_id(model_uri)
+        if run_id is not None:
+            # 同じrunのモデルはプロセス内で共有する
+            from src.models.model_cache import load_run_model
+
+            model, meta = load_run_model(run_id, device=kwargs.get("device"))
+            class_names = meta.get("class_names")
+        else:
+            # モデルのartifact（class_names.txtを含む）をまとめて取得
+            model_dir = Path(mlflow.artifacts.download_artifacts(model_uri))
+            model = mlflow.pytorch.load_model(str(model_dir), map_location="cpu")
+            class_names = read_class_names(model_dir / "class_names.txt")
+
+        if runtime != "eager":
+            from src.inference.runtimes import select_runtime
+
+            export_dir = None
+            if run_id is not None:
+                try:
+                    export_dir = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="export")
+                except Exception as e:
+                    logger.warning(f"export artifactの取得に失敗しました: {e}")
+            _, model = select_runtime(
+                export_dir,
+                eager_model=model,
+                device=kwargs.get("device") or ("cuda" if torch.cuda.is_available() else "cpu"),
+                preference=None if runtime == "auto" else [runtime]
+            )
+
+        if augments_config is None and run_id is not None:
+            try:
+                augments_config = mlflow.artifacts.download_artifacts(
+                    run_id=run_id, artifact_path="config/auguments.yaml"
+                )
+            except Exception as e:
+                logger.warning(f"auguments.yamlの取得に失敗しました: {e}")
+
+        return cls.from_augments_config(model, augments_config, class_names=class_names, **kwargs)
+
+    def _create_executor(self) -> Optional[Executor]:
+        if self.num_workers <= 0:
+            return None
+        if self.executor_type == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=_init_worker,
+                initargs=(self.preprocessor, 1)
+            )
+        return ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def iter_batches(
+        self,
+        inputs: Union[InputItem, Iterable[InputItem]]
+    ) -> Iterator[Tuple[List[InputItem], torch.Tensor]]:
+        """
+        入力を前処理してマイクロバッチ単位で返す
+
+        前処理は並列に実行し、先読みはprefetch_batches分に制限します。
+
+        Args:
+            inputs: 推論対象
+
+        Yields:
+            (バッチの入力, テンソル [B, C, H, W])
+        """
+        items = iter_inputs(inputs)
+        executor = self._create_executor()
+
+        if executor is None:
+            while True:
+                chunk = list(islice(items, self.batch_size))
+                if not chunk:
+                    return
+                yield chunk, torch.stack([self.preprocessor(item) for item in chunk])
+
+        preprocess = _preprocess_in_worker if self.executor_type == "process" else self.preprocessor
+        max_in_flight = self.batch_size * (self.prefetch_batches + 1)
+        pending: deque = deque()
+        try:
+            with executor:
+                for item in islice(items, max_in_flight):
+                    pending.append((item, executor.submit(preprocess, item)))
+
+                while pending:
+                    batch_items = []
+                    tensors = []
+                    while pending and len(batch_items) < self.batch_size:
+                        item, future = pending.popleft()
+                        batch_items.append(item)
+                        tensors.append(future.result())
+                        # 取り出した分だけ次の入力を投入
+                        for next_item in islice(items, 1):
+                            pending.append((next_item, executor.submit(preprocess, next_item)))
+                    yield batch_items, torch.stack(tensors)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        前処理済みのバッチを推論
+
+        Args:
+            batch: テンソル [B, C, H, W]
+
+        Returns:
+            ロジット [B, num_classes]
+        """
+        if self.device.type == "cuda":
+            batch = batch.pin_memory().to(self.device, non_blocking=True)
+        else:
+            batch = batch.to(self.device)
+        with torch.inference_mode():
+            return self.model(batch)
+
+    def predict_batches(
+        self,
+        inputs: Union[InputItem, Iterable[InputItem]]
+    ) -> Iterator[Tuple[List[InputItem], np.ndarray]]:
+        """
+        マイクロバッチ単位で推論し、ロジットを返す
+
+        Args:
+            inputs: 推論対象
+
+        Yields:
+            (バッチの入力, ロジット [B, num_classes])
+        """
+        for batch_items, batch in self.iter_batches(inputs):
+            yield batch_items, self.forward(batch).float().cpu().numpy()
+
+    def predict_iter(
+        self,
+        inputs: Union[InputItem, Iterable[InputItem]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        入力順に1件ずつ推論結果を返す
+
+        Args:
+            inputs: 推論対象
+
+        Yields:
+            {"input": 画像パスまたは入力インデックス, "prediction": クラスインデックス,
+             "label": クラス名, "probability": 予測クラスの確率, "probabilities": 全クラスの確率}
+        """
+        index = 0
+        for batch_items, logits in self.predict_batches(inputs):
+            for item, result in zip(batch_items, self.format_results(logits)):
+                result["input"] = str(item) if isinstance(item, (str, Path)) else index
+                yield result
+                index += 1
+
+    def format_results(self, logits: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        ロジットを1件ずつの推論結果に変換
+
+        Args:
+            logits: ロジット [B, num_classes]
+
+        Returns:
+            {"prediction": クラスインデックス, "label": クラス名,
+             "probability": 予測クラスの確率, "probabilities": 全クラスの確率} のリスト
+        """
+        probabilities = _softmax(logits)
+        predictions = probabilities.argmax(axis=1)
+        return [
+            {
+                "prediction": int(prediction),
+                "label": self.class_names[prediction] if self.class_names else None,
+                "probability": float(probs[prediction]),
+                "probabilities": probs,
+            }
+            for prediction, probs in zip(predictions, probabilities)
+        ]
+
+    def predict(self, inputs: Union[InputItem, Iterable[InputItem]]) -> np.ndarray:
+        """
+        すべての入力を推論してロジットを返す
+
+        Args:
+            inputs: 推論対象
+
+        Returns:
+            ロジット [N, num_classes]
+        """
+        outputs = [logits for _, logits in self.predict_batches(inputs)]
+        if not outputs:
+            raise ValueError("入力画像が空です")
+        return np.concatenate(outputs, axis=0)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
@@ -0,0 +1,216 @@
+"""
+推論ランタイムの選択
+
+export_modelで書き出したモデル（TorchScript / ONNX）とeagerのPyTorchモデルから、
+ホストで利用可能なランタイムを選択します。benchmark=Trueの場合は実際に推論時間を計測し、
+最も速いランタイムを選びます。
+
+どのランタイムも「テンソル [B, C, H, W] → ロジットのテンソル [B, num_classes]」の
+呼び出し可能オブジェクトとして扱えるため、InferenceEngineにそのまま渡せます。
+"""
+
+import importlib.util
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+RUNTIMES = ("onnxruntime", "torchscript", "eager")
+
+
+def is_onnxruntime_available() -> bool:
+    """onnxruntimeが利用可能か"""
+    return importlib.util.find_spec("onnxruntime") is not None
+
+
+class OnnxRuntimeModel:
+    """
+    onnxruntimeのセッションをPyTorchモデルと同じように呼び出すラッパー
+
+    Args:
+        path: ONNXファイルのパス
+        num_threads: intra-opスレッド数（Noneの場合はonnxruntimeのデフォルト）
+    """
+
+    def __init__(self, path: Union[str, Path], num_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in ort.get_available_providers()]
+        self.session = ort.InferenceSession(str(path), sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = str(path)
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        inputs = {self.input_name: np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)}
+        (logits,) = self.session.run(None, inputs)
+        return torch.from_numpy(logits)
+
+
+def load_runtime(
+    runtime: str,
+    export_dir: Optional[Union[str, Path]] = None,
+    eager_model: Optional[nn.Module] = None,
+    device: Union[str, torch.device] = "cpu"
+) -> Callable[[torch.Tensor], torch.Tensor]:
+    """
+    指定したランタイムでモデルを読み込む
+
+    Args:
+        runtime: "onnxruntime" / "torchscript" / "eager"
+        export_dir: export_modelの出力ディレクトリ
+        eager_model: eager実行に使用するPyTorchモデル
+        device: 推論デバイス
+
+    Returns:
+        テンソルを受け取りロジットを返す呼び出し可能オブジェクト
+    """
+    from src.models.export import EXPORT_FILES
+
+    if runtime == "eager":
+        if eager_model is None:
+            raise ValueError("eagerランタイムにはeager_modelが必要です")
+        return eager_model.to(device).eval()
+
+    if export_dir is None:
+        raise ValueError(f"{runtime}ランタイムにはexport_dirが必要です")
+
+    if runtime == "torchscript":
+        path = Path(export_dir) / EXPORT_FILES["torchscript"]
+        return torch.jit.load(str(path), map_location=device).eval()
+    if runtime == "onnxruntime":
+        if not is_onnxruntime_available():
+            raise ImportError("onnxruntimeがインストールされていません。pip install onnxruntime でインストールしてください。")
+        return OnnxRuntimeModel(Path(export_dir) / EXPORT_FILES["onnx"])
+    raise ValueError(f"サポートされていないランタイムです: {runtime}. サポートされているランタイム: {list(RUNTIMES)}")
+
+
+def available_runtimes(
+    export_dir: Optional[Union[str, Path]] = None,
+    eager_model: Optional[nn.Module] = None
+) -> list:
+    """
+    ホストで利用可能なランタイムを列挙
+
+    Args:
+        export_dir: export_modelの出力ディレクトリ
+        eager_model: eager実行に使用するPyTorchモデル
+
+    Returns:
+        ランタイム名のリスト（RUNTIMESの順）
+    """
+    from src.models.export import read_export_meta
+
+    formats = {}
+    if export_dir is not None and Path(export_dir).exists():
+        try:
+            formats = read_export_meta(export_dir)["formats"]
+        except FileNotFoundError:
+            logger.warning(f"エクスポートのメタデータが見つかりません: {export_dir}")
+
+    runtimes = []
+    if "onnx" in formats and is_onnxruntime_available():
+        runtimes.append("onnxruntime")
+    if "torchscript" in formats:
+        runtimes.append("torchscript")
+    if eager_model is not None:
+        runtimes.append("eager")
+    return runtimes
+
+
+def benchmark_runtime(
+    model: Callable[[torch.Tensor], torch.Tensor],
+    example_input: torch.Tensor,
+    warmup: int = 2,
+    repeats: int = 5
+) -> float:
+    """
+    推論時間を計測
+
+    Args:
+        model: 呼び出し可能なモデル
+        example_input: 入力 [B, C, H, W]
+        warmup: ウォームアップ回数
+        repeats: 計測回数
+
+    Returns:
+        1回あたりの推論時間の中央値（秒）
+    """
+    timings = []
+    with torch.inference_mode():
+        for _ in range(warmup):
+            model(example_input)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(example_input)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def select_runtime(
+    export_dir: Optional[Union[str, Path]] = None,
+    eager_model: Optional[nn.Module] = None,
+    device: Union[str, torch.device] = "cpu",
+    preference: Optional[Sequence[str]] = None,
+    benchmark: bool = True,
+    example_input: Optional[torch.Tensor] = None
+) -> Tuple[str, Callable[[torch.Tensor], torch.Tensor]]:
+    """
+    利用可能なランタイムから推論に使用するものを選択
+
+    Args:
+        export_dir: export_modelの出力ディレクトリ
+        eager_model: eager実行に使用するPyTorchモデル
+        device: 推論デバイス
+        preference: 候補とするランタイム（Noneの場合はRUNTIMES）
+        benchmark: 推論時間を計測して最速のものを選ぶか（Falseの場合は候補の先頭）
+        example_input: 計測に使用する入力（Noneの場合は [8, 3, H, W] の乱数、H, Wはエクスポート時の入力サイズ）
+
+    Returns:
+        (ランタイム名, モデル)
+    """
+    from src.models.export import read_export_meta
+
+    available = available_runtimes(export_dir, eager_model)
+    candidates = [runtime for runtime in (preference or RUNTIMES) if runtime in available]
+    if not candidates:
+        raise ValueError(f"利用可能なランタイムがありません（候補: {list(preference or RUNTIMES)}）")
+
+    models: Dict[str, Callable] = {}
+    for runtime in candidates:
+        try:
+            models[runtime] = load_runtime(runtime, export_dir, eager_model, device)
+        except Exception as e:
+            logger.warning(f"{runtime}ランタイムの読み込みに失敗しました: {e}")
+    if not models:
+        raise RuntimeError("ランタイムの読み込みにすべて失敗しました")
+
+    if not benchmark or len(models) == 1:
+        runtime = next(iter(models))
+        logger.info(f"推論ランタイム: {runtime}")
+        return runtime, models[runtime]
+
+    if example_input is None:
+        input_size = (224, 224)
+        if export_dir is not None:
+            try:
+                input_size = tuple(read_export_meta(export_dir)["input_size"])
+            except FileNotFoundError:
+                pass
+        example_input = torch.randn(8, 3, *input_size)
+    example_input = example_input.to(device)
+
+    timings = {runtime: benchmark_runtime(model, example_input) for runtime, model in models.items()}
+    runtime = min(timings, key=timings.get)
+    summary = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items())
+    logger.info(f"推論ランタイム: {runtime}（{summary}）")
+    return runtime, models[runtime]
@@ -0,0 +1,542 @@
+"""
+推論サーバー
+
+ローカルで動作するHTTP推論サーバーです。並行して届いたリクエストを
+動的バッチ（最大バッチサイズ・最大待ち時間で制御）にまとめて1回の推論で処理します。
+
+エンドポイント:
+    POST /predict  画像（image/*, application/octet-stream）または
+                   JSON {"images": [base64文字列, ...]} / {"paths": [画像パス, ...]}
+                   （pathsはallowed_root配下のファイルのみ。allowed_rootを指定しない場合は使用不可）
+    GET  /metrics  レイテンシ（p50/p90/p99）、キューの深さ、バッチサイズなど
+    GET  /health   ヘルスチェック
+"""
+
+import base64
+import io
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .engine import InferenceEngine
+
+logger = logging.getLogger(__name__)
+
+# リクエストボディの最大サイズ（バイト）のデフォルト値
+DEFAULT_MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class QueueFullError(Exception):
+    """リクエストキューが満杯の場合の例外"""
+
+
+class ServingMetrics:
+    """
+    推論サーバーのメトリクス
+
+    直近window件のリクエストのレイテンシとバッチサイズを保持します。
+
+    Args:
+        window: 保持する件数
+    """
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._started_at = time.monotonic()
+        self.total_requests = 0
+        self.total_images = 0
+        self.total_errors = 0
+
+    def record_request(self, latency: float, num_images: int):
+        """リクエストの完了を記録"""
+        with self._lock:
+            self._latencies.append((time.monotonic(), latency, num_images))
+            self.total_requests += 1
+            self.total_images += num_images
+
+    def record_error(self):
+        """エラーを記録"""
+        with self._lock:
+            self.total_errors += 1
+
+    def record_batch(self, batch_size: int):
+        """推論したバッチのサイズを記録"""
+        with self._lock:
+            self._batch_sizes.append(batch_size)
+
+    def snapshot(self, queue_depth: int = 0) -> Dict[str, Any]:
+        """
+        現在のメトリクスを取得
+
+        Args:
+            queue_depth: 推論待ちの画像数
+
+        Returns:
+            メトリクスの辞書
+        """
+        with self._lock:
+            records = list(self._latencies)
+            batch_sizes = list(self._batch_sizes)
+            totals = {
+                "requests": self.total_requests,
+                "images": self.total_images,
+                "errors": self.total_errors,
+            }
+
+        latencies_ms = np.array([latency for _, latency, _ in records]) * 1000.0
+        latency = {"p50": None, "p90": None, "p99": None, "mean": None}
+        throughput = 0.0
+        if len(latencies_ms) > 0:
+            p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+            latency = {
+                "p50": round(float(p50), 3),
+                "p90": round(float(p90), 3),
+                "p99": round(float(p99), 3),
+                "mean": round(float(latencies_ms.mean()), 3),
+            }
+            elapsed = time.monotonic() - records[0][0] + records[0][1]
+            if elapsed > 0:
+                throughput = sum(n for _, _, n in records) / elapsed
+
+        return {
+            **totals,
+            "uptime_sec": round(time.monotonic() - self._started_at, 1),
+            "latency_ms": latency,
+            "throughput_images_per_sec": round(throughput, 2),
+            "batch_size": {
+                "mean": round(float(np.mean(batch_sizes)), 2) if batch_sizes else None,
+                "max": int(max(batch_sizes)) if batch_sizes else None,
+            },
+            "queue_depth": queue_depth,
+        }
+
+
+class _PendingRequest:
+    """推論待ちのリクエスト"""
+
+    __slots__ = ("tensors", "future")
+
+    def __init__(self, tensors: List[torch.Tensor]):
+        self.tensors = tensors
+        self.future: Future = Future()
+
+
+class DynamicBatcher:
+    """
+    並行リクエストを動的バッチにまとめて推論
+
+    最初のリクエストが届いてからmax_wait_msが経過するか、
+    画像数がmax_batch_sizeに達した時点でまとめて推論します。
+
+    Args:
+        engine: 推論エンジン
+        max_batch_size: 1回の推論の最大画像数
+        max_wait_ms: バッチを揃えるための最大待ち時間（ミリ秒）
+        max_queue_size: キューに保持する最大リクエスト数（超えた場合はQueueFullError）
+        metrics: メトリクス
+    """
+
+    def __init__(
+        self,
+        engine: InferenceEngine,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 1024,
+        metrics: Optional[ServingMetrics] = None
+    ):
+        if max_batch_size <= 0:
+            raise ValueError(f"max_batch_sizeは正の値である必要があります: {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_msは0以上である必要があります: {max_wait_ms}")
+
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics or ServingMetrics()
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue(maxsize=max_queue_size)
+        self._carry: Optional[_PendingRequest] = None
+        self._pending_images = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """推論待ちの画像数"""
+        with self._lock:
+            return self._pending_images
+
+    def start(self):
+        """推論スレッドを開始"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dynamic-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """推論スレッドを停止"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, tensors: List[torch.Tensor]) -> Future:
+        """
+        前処理済みの画像を推論キューに追加
+
+        Args:
+            tensors: 画像テンソル [C, H, W] のリスト
+
+        Returns:
+            推論結果（engine.format_resultsの形式のリスト）のFuture
+        """
+        if not tensors:
+            raise ValueError("入力画像が空です")
+        request = _PendingRequest(tensors)
+        with self._lock:
+            self._pending_images += len(tensors)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._pending_images -= len(tensors)
+            raise QueueFullError("リクエストキューが満杯です")
+        return request.future
+
+    def predict(self, tensors: List[torch.Tensor], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """推論キューに追加して結果を待つ"""
+        return self.submit(tensors).result(timeout)
+
+    def _collect(self) -> Optional[List[_PendingRequest]]:
+        """次のバッチにまとめるリクエストを集める（停止時はNone）"""
+        first = self._carry
+        self._carry = None
+        if first is None:
+            first = self._queue.get()
+            if first is None:
+                return None
+
+        batch = [first]
+        size = len(first.tensors)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # 停止要求は残りのバッチを処理した後に扱う
+                self._queue.put(None)
+                break
+            if size + len(request.tensors) > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.tensors)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error(f"バッチ推論でエラーが発生しました: {e}", exc_info=True)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending_images -= sum(len(request.tensors) for request in batch)
+
+    def _process(self, batch: List[_PendingRequest]):
+        # タイムアウトしてキャンセルされたリクエストは推論しない
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        tensors = [tensor for request in batch for tensor in request.tensors]
+
+        # 画像サイズが揃っていない場合はサイズごとに推論
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tensors)
+        groups: Dict[tuple, List[int]] = {}
+        for i, tensor in enumerate(tensors):
+            groups.setdefault(tuple(tensor.shape), []).append(i)
+        for indices in groups.values():
+            logits = self.engine.forward(torch.stack([tensors[i] for i in indices])).float().cpu().numpy()
+            for i, result in zip(indices, self.engine.format_results(logits)):
+                results[i] = result
+            self.metrics.record_batch(len(indices))
+
+        offset = 0
+        for request in batch:
+            n = len(request.tensors)
+            request.future.set_result(results[offset:offset + n])
+            offset += n
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    画像のバイト列をRGBのnumpy配列にデコード
+
+    Args:
+        data: 画像ファイルのバイト列
+
+    Returns:
+        画像 [H, W, 3]
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return np.array(image.convert("RGB"))
+    except Exception as e:
+        raise ValueError(f"画像のデコードに失敗しました: {e}")
+
+
+class ModelServer(ThreadingHTTPServer):
+    """
+    動的バッチ推論を行うHTTPサーバー
+
+    リクエストのデコードと前処理は各リクエストのスレッドで並列に行い、
+    推論のみDynamicBatcherでまとめて実行します。
+
+    Args:
+        address: (ホスト, ポート)
+        engine: 推論エンジン
+        max_batch_size: 1回の推論の最大画像数
+        max_wait_ms: バッチを揃えるための最大待ち時間（ミリ秒）
+        max_queue_size: キューに保持する最大リクエスト数
+        request_timeout: 推論結果を待つ最大時間（秒）。超えた場合は504を返し、キューに残ったリクエストは推論しない
+        allowed_root: JSONのpathsで指定できる画像のルートディレクトリ（Noneの場合はpathsを受け付けない）
+        max_body_bytes: リクエストボディの最大サイズ（バイト）。超えた場合は413を返す
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: tuple,
+        engine: InferenceEngine,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 1024,
+        request_timeout: float = 30.0,
+        allowed_root: Optional[str] = None,
+        max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+    ):
+        super().__init__(address, PredictionRequestHandler)
+        self.allowed_root = Path(allowed_root).resolve() if allowed_root else None
+        self.max_body_bytes = max_body_bytes
+        self.engine = engine
+        self.metrics = ServingMetrics()
+        self.batcher = DynamicBatcher(
+            engine,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            max_queue_size=max_queue_size,
+            metrics=self.metrics
+        )
+        self.request_timeout = request_timeout
+        self.batcher.start()
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """メトリクスを取得"""
+        return self.metrics.snapshot(queue_depth=self.batcher.queue_depth)
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """推論サーバーのリクエストハンドラ"""
+
+    server: ModelServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.server.get_metrics())
+        else:
+            self._send_json(404, {"error": f"見つかりません: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"見つかりません: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, {"error": "Content-Lengthが不正です"})
+            return
+        if length > self.server.max_body_bytes:
+            # ボディを読まずに接続を閉じる
+            self.close_connection = True
+            self.server.metrics.record_error()
+            self._send_json(413, {"error": f"リクエストが大きすぎます（最大{self.server.max_body_bytes}バイト）"})
+            return
+
+        start = time.perf_counter()
+        try:
+            inputs = self._parse_inputs(self.rfile.read(length))
+            preprocessor = self.server.engine.preprocessor
+            tensors = [preprocessor(item) for item in inputs]
+            future = self.server.batcher.submit(tensors)
+            results = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            # TimeoutErrorはOSErrorのサブクラスのため、不正な入力より先に扱う
+            future.cancel()
+            self.server.metrics.record_error()
+            self._send_json(504, {"error": f"推論が{self.server.request_timeout}秒以内に完了しませんでした"})
+            return
+        except (ValueError, OSError) as e:
+            # 不正な入力・読み込めない画像（存在しないファイルを含む）
+            self.server.metrics.record_error()
+            self._send_json(400, {"error": str(e)})
+            return
+        except QueueFullError as e:
+            self.server.metrics.record_error()
+            self._send_json(503, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.error(f"推論リクエストの処理でエラーが発生しました: {e}", exc_info=True)
+            self.server.metrics.record_error()
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self.server.metrics.record_request(time.perf_counter() - start, len(results))
+        predictions = [
+            {**result, "probabilities": result["probabilities"].tolist()}
+            for result in results
+        ]
+        self._send_json(200, {"predictions": predictions})
+
+    def _parse_inputs(self, body: bytes) -> List[Any]:
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type != "application/json":
+            return [decode_image(body)]
+
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSONの解析に失敗しました: {e}")
+        if "images" in payload:
+            return [decode_image(base64.b64decode(image)) for image in payload["images"]]
+        if "paths" in payload:
+            return [self._resolve_path(path) for path in payload["paths"]]
+        raise ValueError("'images'または'paths'を指定してください")
+
+    def _resolve_path(self, path: str) -> str:
+        """pathsの画像パスを解決し、allowed_root配下の存在するファイルのみ許可"""
+        root = self.server.allowed_root
+        if root is None:
+            raise ValueError("'paths'は許可するルートディレクトリ（allowed_root）を指定した場合のみ使用できます")
+        resolved = (root / str(path)).resolve()
+        if not resolved.is_relative_to(root):
+            raise ValueError(f"許可されていないパスです: {path}")
+        if not resolved.is_file():
+            raise ValueError(f"ファイルが見つかりません: {path}")
+        return str(resolved)
+
+
+def create_server(
+    engine: InferenceEngine,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    **kwargs
+) -> ModelServer:
+    """
+    推論サーバーを作成
+
+    Args:
+        engine: 推論エンジン
+        host: ホスト
+        port: ポート（0の場合は空きポートを使用）
+        **kwargs: ModelServerのその他のパラメータ
+
+    Returns:
+        ModelServer
+    """
+    return ModelServer((host, port), engine, **kwargs)
+
+
+def serve(
+    model_uri: str,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    max_batch_size: int = 32,
+    max_wait_ms: float = 5.0,
+    augments_config: Optional[str] = None,
+    device: Optional[str] = None,
+    runtime: str = "eager",
+    allowed_root: Optional[str] = None,
+    max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+):
+    """
+    MLflowのモデルを読み込んで推論サーバーを起動
+
+    Args:
+        model_uri: モデルURI（例: models:/<name>/<version>, runs:/<run_id>/model）
+        host: ホスト
+        port: ポート
+        max_batch_size: 1回の推論の最大画像数
+        max_wait_ms: バッチを揃えるための最大待ち時間（ミリ秒）
+        augments_config: auguments.yamlファイルのパス（省略時はrunのartifactを使用）
+        device: 推論デバイス
+        runtime: 推論ランタイム（"eager" / "torchscript" / "onnxruntime" / "auto"）
+        allowed_root: JSONのpathsで指定できる画像のルートディレクトリ（Noneの場合はpathsを受け付けない）
+        max_body_bytes: リクエストボディの最大サイズ（バイト）
+    """
+    engine = InferenceEngine.from_mlflow(
+        model_uri,
+        augments_config=augments_config,
+        runtime=runtime,
+        batch_size=max_batch_size,
+        num_workers=0,
+        device=device
+    )
+    server = create_server(
+        engine, host, port,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        allowed_root=allowed_root,
+        max_body_bytes=max_body_bytes
+    )
+    logger.info(f"推論サーバーを起動しました: http://{host}:{server.server_port} (model: {model_uri})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("推論サーバーを停止します")
+    finally:
+        server.server_close()
@@ -10,6 +10,17 @@ from src.models.model_factory import (
     register_model,
     MODEL_REGISTRY
 )
+from src.models.weights import (
+    save_weights,
+    load_checkpoint,
+    load_model_from_weights,
+    load_state_dict_file,
+    normalize_state_dict,
+    read_weights_meta
+)
+from src.models.export import export_model, fuse_conv_bn, read_export_meta
+from src.models.quantization import quantize_model, load_quantized_model
+from src.models.model_cache import ModelCache, get_model_cache, load_cached_weights, load_run_model
 from src.models.mlflow_model import ClassificationPyFuncModel, log_model
 
 __all__ = [
@@ -19,6 +30,21 @@ __all__ = [
     "list_available_models",
     "register_model",
     "MODEL_REGISTRY",
+    "save_weights",
+    "load_checkpoint",
+    "load_model_from_weights",
+    "load_state_dict_file",
+    "normalize_state_dict",
+    "read_weights_meta",
+    "export_model",
+    "fuse_conv_bn",
+    "read_export_meta",
+    "quantize_model",
+    "load_quantized_model",
+    "ModelCache",
+    "get_model_cache",
+    "load_cached_weights",
+    "load_run_model",
     "ClassificationPyFuncModel",
     "log_model",
 ]
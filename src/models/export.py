@@ -0,0 +1,186 @@
+"""
+推論用モデルのエクスポート
+
+学習済みモデルのconv+bnを融合し、TorchScript（trace + freeze）と
+ONNX形式で書き出します。CPUのみの環境ではeager実行より高速に推論できます。
+
+    export_dir/
+        export_meta.json        書き出した形式とファイル名、入力サイズ、クラス名
+        model.torchscript.pt    TorchScript（trace + freeze）
+        model.onnx              ONNX（onnxがインストールされている場合、バッチ・画像サイズは可変）
+"""
+
+import copy
+import importlib.util
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("torchscript", "onnx")
+EXPORT_META_FILE = "export_meta.json"
+EXPORT_FILES = {
+    "torchscript": "model.torchscript.pt",
+    "onnx": "model.onnx",
+}
+
+
+def is_onnx_available() -> bool:
+    """ONNXエクスポートが利用可能か"""
+    return importlib.util.find_spec("onnx") is not None
+
+
+def fuse_conv_bn(model: nn.Module) -> nn.Module:
+    """
+    Conv2dとBatchNorm2dを融合したモデルを作成（元のモデルは変更しない）
+
+    Args:
+        model: PyTorchモデル
+
+    Returns:
+        評価モードの融合済みモデル（torch.fx.GraphModule）
+    """
+    from torch.fx.experimental.optimization import fuse
+
+    model = copy.deepcopy(model).cpu().eval()
+    return fuse(model)
+
+
+def export_torchscript(
+    model: nn.Module,
+    path: Union[str, Path],
+    example_input: torch.Tensor
+) -> Path:
+    """
+    TorchScript（trace + freeze）で書き出す
+
+    Args:
+        model: 評価モードのモデル
+        path: 出力ファイルのパス
+        example_input: traceに使用する入力 [B, C, H, W]
+
+    Returns:
+        出力ファイルのパス
+    """
+    path = Path(path)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input)
+        frozen = torch.jit.freeze(traced.eval())
+    frozen.save(str(path))
+    logger.info(f"TorchScriptを書き出しました: {path}")
+    return path
+
+
+def export_onnx(
+    model: nn.Module,
+    path: Union[str, Path],
+    example_input: torch.Tensor,
+    opset_version: int = 17
+) -> Path:
+    """
+    ONNXで書き出す（バッチサイズ・画像サイズは可変）
+
+    Args:
+        model: 評価モードのモデル
+        path: 出力ファイルのパス
+        example_input: エクスポートに使用する入力 [B, C, H, W]
+        opset_version: ONNXのopsetバージョン
+
+    Returns:
+        出力ファイルのパス
+    """
+    if not is_onnx_available():
+        raise ImportError("onnxがインストールされていません。pip install onnx でインストールしてください。")
+
+    path = Path(path)
+    torch.onnx.export(
+        model,
+        (example_input,),
+        str(path),
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input": {0: "batch", 2: "height", 3: "width"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset_version,
+        dynamo=False
+    )
+    logger.info(f"ONNXを書き出しました: {path}")
+    return path
+
+
+def export_model(
+    model: nn.Module,
+    output_dir: Union[str, Path],
+    input_size: Tuple[int, int] = (224, 224),
+    formats: Sequence[str] = EXPORT_FORMATS,
+    class_names: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    conv+bnを融合したモデルを指定した形式で書き出す
+
+    onnxがインストールされていない場合、ONNXは警告を出してスキップします。
+
+    Args:
+        model: PyTorchモデル
+        output_dir: 出力ディレクトリ
+        input_size: エクスポートに使用する入力サイズ (height, width)
+        formats: 書き出す形式（"torchscript" / "onnx"）
+        class_names: クラス名のリスト
+
+    Returns:
+        メタデータ（{"formats": {形式: ファイル名}, "input_size": ..., "class_names": ...}）
+    """
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"サポートされていないエクスポート形式です: {sorted(unknown)}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    fused = fuse_conv_bn(model)
+    example_input = torch.randn(1, 3, *input_size)
+
+    exported = {}
+    for export_format in formats:
+        path = output_dir / EXPORT_FILES[export_format]
+        if export_format == "torchscript":
+            export_torchscript(fused, path, example_input)
+        elif export_format == "onnx":
+            if not is_onnx_available():
+                logger.warning("onnxがインストールされていないため、ONNXのエクスポートをスキップします")
+                continue
+            export_onnx(fused, path, example_input)
+        exported[export_format] = path.name
+
+    meta = {
+        "formats": exported,
+        "input_size": list(input_size),
+        "class_names": list(class_names) if class_names is not None else None,
+    }
+    with open(output_dir / EXPORT_META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def read_export_meta(export_dir: Union[str, Path]) -> Dict[str, Any]:
+    """
+    エクスポートディレクトリのメタデータを読み込む
+
+    Args:
+        export_dir: export_modelの出力ディレクトリ
+
+    Returns:
+        メタデータ
+    """
+    meta_path = Path(export_dir) / EXPORT_META_FILE
+    if not meta_path.exists():
+        raise FileNotFoundError(f"エクスポートのメタデータが見つかりません: {meta_path}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -8,14 +8,21 @@ MLflow PythonModel継承クラス
 import mlflow.pyfunc
 import torch
 import numpy as np
-from PIL import Image
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Sequence, Tuple
 import logging
+import shutil
+import tempfile
 import yaml
 from pathlib import Path
 
 from src.data.preprocessing import create_preprocessing_pipeline
 from src.data.augmentation import get_transforms
+from src.data.patching import split_patching_config
+from src.data.image_cache import compute_preprocessing_hash, load_preprocessing_config
+from src.inference.engine import ImagePreprocessor, InferenceEngine
+from src.models.model_cache import load_cached_weights
+from src.models.weights import load_checkpoint, save_weights
+from src.models.export import export_model
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +42,18 @@ class ClassificationPyFuncModel(mlflow.pyfunc.PythonModel):
             context: MLflowのコンテキスト（artifacts pathなど）
         """
         # PyTorchモデルのロード
-        model_path = context.artifacts["model"]
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = torch.load(model_path, map_location=self.device)
-        self.model.eval()
+        if "weights" in context.artifacts:
+            # 重みのみの形式（同じモデルはプロセス内で共有）
+            model_path = context.artifacts["weights"]
+            self.model, _ = load_cached_weights(model_path, device=self.device)
+        else:
+            # 旧形式（モデル全体をpickleしたmodel.pth）。この形式のみpickleの読み込みを許可する
+            model_path = context.artifacts["model"]
+            self.model = load_checkpoint(model_path, mmap=False, allow_pickle=True)
+            if not isinstance(self.model, torch.nn.Module):
+                raise ValueError(f"モデル全体を保存した形式ではありません: {model_path}")
+            self.model.to(self.device).eval()
         
         logger.info(f"モデルをロードしました: {model_path}")
         logger.info(f"デバイス: {self.device}")
@@ -48,6 +63,7 @@ class ClassificationPyFuncModel(mlflow.pyfunc.PythonModel):
         augments_config_path = context.artifacts.get("augments_config")
         
         self.preprocessing_pipeline = None
+        self.patching = None
         self.transform = None
         
         if preprocessing_config_path:
@@ -58,6 +74,8 @@ class ClassificationPyFuncModel(mlflow.pyfunc.PythonModel):
                     image_config = config.get("image", {})
                     
                     if preprocessing_config:
+                        # パッチ化は推論時に最初のパッチのみ切り出す
+                        preprocessing_config, self.patching = split_patching_config(preprocessing_config)
                         self.preprocessing_pipeline = create_preprocessing_pipeline(
                             preprocessing_config,
                             image_config=image_config
@@ -104,83 +122,35 @@ class ClassificationPyFuncModel(mlflow.pyfunc.PythonModel):
         Returns:
             予測結果 [batch_size, num_classes]
         """
-        # 入力の前処理
-        images = []
-        
-        if isinstance(model_input, list):
-            # 画像パスのリスト
-            for img_path in model_input:
-                image = self._load_and_preprocess_image(img_path)
-                images.append(image)
-        elif isinstance(model_input, np.ndarray):
-            # NumPy配列（バッチ）
-            for i in range(model_input.shape[0]):
-                img = model_input[i]
-                image = self._preprocess_image(img)
-                images.append(image)
-        else:
+        if not isinstance(model_input, (list, np.ndarray)):
             raise ValueError(
                 f"サポートされていない入力タイプ: {type(model_input)}. "
                 "numpy配列またはリストが必要です。"
             )
         
-        # バッチテンソルの作成
-        if len(images) == 0:
-            raise ValueError("入力画像が空です")
-        
-        batch_tensor = torch.stack(images).to(self.device)
-        
-        # 推論
-        with torch.no_grad():
-            outputs = self.model(batch_tensor)
-            predictions = outputs.cpu().numpy()
-        
-        return predictions
-    
-    def _load_and_preprocess_image(self, img_path: str) -> torch.Tensor:
-        """
-        画像をロードして前処理
-        
-        Args:
-            img_path: 画像のパス
-        
-        Returns:
-            前処理済みのテンソル
-        """
-        image = Image.open(img_path).convert('RGB')
-        image_np = np.array(image)
-        return self._preprocess_image(image_np)
+        # 前処理の並列化とマイクロバッチ推論は推論エンジンに任せる
+        return self._get_engine().predict(model_input)
     
-    def _preprocess_image(self, image_np: np.ndarray) -> torch.Tensor:
+    def _get_engine(self) -> InferenceEngine:
         """
-        画像を前処理
-        
-        Args:
-            image_np: NumPy配列の画像 [height, width, channels]
+        推論エンジンを取得（初回呼び出し時に作成）
         
         Returns:
-            前処理済みのテンソル [channels, height, width]
+            InferenceEngine
         """
-        # 前処理パイプラインを適用
-        if self.preprocessing_pipeline is not None:
-            image_list = self.preprocessing_pipeline(image_np)
-            image_np = image_list[0]  # 最初の画像を使用
-        
-        # 変換を適用
-        if self.transform is not None:
-            # albumentationsの場合
-            if hasattr(self.transform, '__class__') and 'albumentations' in str(type(self.transform)):
-                transformed = self.transform(image=image_np)
-                image_tensor = transformed['image']
-            # torchvisionの場合
-            else:
-                image_pil = Image.fromarray(image_np)
-                image_tensor = self.transform(image_pil)
-        else:
-            # transformがない場合はテンソルに変換
-            image_tensor = torch.from_numpy(image_np).permute(2, 0, 1).float() / 255.0
-        
-        return image_tensor
+        if getattr(self, "_engine", None) is None:
+            preprocessor = ImagePreprocessor(
+                preprocessing=self.preprocessing_pipeline,
+                patching=getattr(self, "patching", None),
+                transform=self.transform
+            )
+            self._engine = InferenceEngine(
+                self.model,
+                preprocessor=preprocessor,
+                class_names=self.class_names,
+                device=self.device
+            )
+        return self._engine
 
 
 def log_model(
@@ -190,6 +160,8 @@ def log_model(
     augments_config_path: str = None,
     class_names_path: str = None,
     registered_model_name: str = None,
+    export_formats: Sequence[str] = None,
+    export_input_size: Tuple[int, int] = (224, 224),
     **kwargs
 ):
     """
@@ -202,16 +174,47 @@ def log_model(
         augments_config_path: オーグメンテーション設定ファイルのパス
         class_names_path: クラス名ファイルのパス
         registered_model_name: 登録するモデル名
+        export_formats: 推論用に書き出す形式（"torchscript" / "onnx"、artifact "export"に保存）
+        export_input_size: エクスポートに使用する入力サイズ (height, width)
         **kwargs: その他のmlflow.pyfunc.log_modelのパラメータ
     """
+    # モデルの重みを保存（モデル全体はpickleしない）
+    weights_dir = Path(tempfile.mkdtemp(prefix="weights_"))
+    class_names = None
+    if class_names_path:
+        with open(class_names_path, "r") as f:
+            class_names = [line.strip() for line in f if line.strip()]
+    preprocessing_hash = None
+    if preprocessing_config_path:
+        config = load_preprocessing_config(preprocessing_config_path)
+        preprocessing_hash = compute_preprocessing_hash(config["preprocessing"], config["image"])
+    save_weights(
+        model,
+        weights_dir,
+        model_name=getattr(model, "model_name", type(model).__name__),
+        num_classes=getattr(model, "num_classes", len(class_names) if class_names else None),
+        class_names=class_names,
+        preprocessing_hash=preprocessing_hash,
+        run_id=mlflow.active_run().info.run_id if mlflow.active_run() else None
+    )
+    
     # Artifactsの準備
     artifacts = {
-        "model": "model.pth"
+        "weights": str(weights_dir)
     }
     
-    # モデルの保存
-    model_save_path = Path("model.pth")
-    torch.save(model, model_save_path)
+    # 推論用の形式（conv+bn融合済みのTorchScript / ONNX）
+    export_dir = None
+    if export_formats:
+        export_dir = Path(tempfile.mkdtemp(prefix="export_"))
+        export_model(
+            model,
+            export_dir,
+            input_size=export_input_size,
+            formats=export_formats,
+            class_names=class_names
+        )
+        artifacts["export"] = str(export_dir)
     
     if preprocessing_config_path:
         artifacts["preprocessing_config"] = preprocessing_config_path
@@ -232,8 +235,9 @@ def log_model(
     )
     
     # 一時ファイルを削除
-    if model_save_path.exists():
-        model_save_path.unlink()
+    shutil.rmtree(weights_dir, ignore_errors=True)
+    if export_dir is not None:
+        shutil.rmtree(export_dir, ignore_errors=True)
     
     logger.info(f"モデルをMLflowに登録しました: {artifact_path}")
 
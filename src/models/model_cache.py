@@ -0,0 +1,200 @@
+"""
+プロセス全体で共有するモデルキャッシュ
+
+同じMLflow runのモデルを何度も読み込まないよう、読み込み済みのモデルを
+(run ID, デバイス) をキーにしてプロセス内で共有します。
+Webアプリ、チューニング、推論のいずれからも get_model_cache() で同じキャッシュを参照します。
+
+キャッシュしたモデルは複数の呼び出し元で共有されるため、読み取り専用（推論用）として扱ってください。
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import torch
+import torch.nn as nn
+
+from src.models.weights import load_model_from_weights, read_weights_meta
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCache:
+    """
+    件数上限付きのLRUモデルキャッシュ
+
+    同じキーの読み込みが並行して要求された場合も、読み込みは1回だけ行います。
+
+    Args:
+        max_models: 保持する最大モデル数
+    """
+
+    def __init__(self, max_models: int = 4):
+        if max_models <= 0:
+            raise ValueError(f"max_modelsは正の値である必要があります: {max_models}")
+        self.max_models = max_models
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        キャッシュから取得し、なければloaderで読み込んで登録
+
+        Args:
+            key: キャッシュキー
+            loader: 読み込み関数
+
+        Returns:
+            キャッシュされた値
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # 待っている間に他のスレッドが読み込んだ場合
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                self.misses += 1
+
+            value = loader()
+
+            with self._lock:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_models:
+                    evicted_key, _ = self._entries.popitem(last=False)
+                    logger.info(f"モデルキャッシュから削除しました: {evicted_key}")
+                self._key_locks.pop(key, None)
+            return value
+
+    def invalidate(self, key: Hashable):
+        """指定したキーを削除"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """すべて削除"""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_MODEL_CACHE: Optional[ModelCache] = None
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def get_model_cache() -> ModelCache:
+    """
+    プロセス全体で共有するモデルキャッシュを取得
+
+    最大モデル数は環境変数 MODEL_CACHE_SIZE で指定できます（デフォルト: 4）。
+
+    Returns:
+        ModelCache
+    """
+    global _MODEL_CACHE
+    with _MODEL_CACHE_LOCK:
+        if _MODEL_CACHE is None:
+            _MODEL_CACHE = ModelCache(max_models=int(os.environ.get("MODEL_CACHE_SIZE", 4)))
+        return _MODEL_CACHE
+
+
+def _default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_cached_weights(
+    weights_dir: Union[str, Path],
+    device: Optional[Union[str, torch.device]] = None,
+    cache: Optional[ModelCache] = None
+) -> Tuple[nn.Module, Dict[str, Any]]:
+    """
+    重みディレクトリからモデルを読み込む（キャッシュ付き）
+
+    メタデータにrun IDがあればrun IDを、なければディレクトリのパスをキーにします。
+
+    Args:
+        weights_dir: save_weightsの出力ディレクトリ
+        device: 読み込み先のデバイス
+        cache: 使用するキャッシュ（Noneの場合はプロセス全体のキャッシュ）
+
+    Returns:
+        (モデル, メタデータ)
+    """
+    device = str(device or _default_device())
+    cache = cache or get_model_cache()
+    meta = read_weights_meta(weights_dir)
+    key = (meta.get("run_id") or str(Path(weights_dir).resolve()), device)
+    return cache.get(key, lambda: load_model_from_weights(weights_dir, device=device))
+
+
+def load_run_model(
+    run_id: str,
+    device: Optional[Union[str, torch.device]] = None,
+    cache: Optional[ModelCache] = None
+) -> Tuple[nn.Module, Dict[str, Any]]:
+    """
+    MLflow runのモデルを読み込む（キャッシュ付き）
+
+    weights artifact（重みのみの形式）があればそれを使用し、
+    なければ旧形式のmodel artifactをmlflow.pytorchで読み込みます。
+
+    Args:
+        run_id: MLflow run ID
+        device: 読み込み先のデバイス
+        cache: 使用するキャッシュ（Noneの場合はプロセス全体のキャッシュ）
+
+    Returns:
+        (モデル, メタデータ)
+    """
+    device = str(device or _default_device())
+    cache = cache or get_model_cache()
+
+    def loader():
+        import mlflow.artifacts
+
+        try:
+            weights_dir = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="weights")
+        except Exception:
+            weights_dir = None
+        if weights_dir is not None:
+            return load_model_from_weights(weights_dir, device=device)
+
+        logger.warning(f"weights artifactがないため、model artifactから読み込みます: {run_id}")
+        import mlflow.pytorch
+        from src.inference.engine import read_class_names
+
+        model_dir = Path(mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="model"))
+        model = mlflow.pytorch.load_model(str(model_dir), map_location=device).eval()
+        class_names = read_class_names(model_dir / "class_names.txt")
+        meta = {
+            "model_name": getattr(model, "model_name", None),
+            "num_classes": getattr(model, "num_classes", None),
+            "class_names": class_names,
+            "preprocessing_hash": None,
+            "run_id": run_id,
+        }
+        return model, meta
+
+    return cache.get((run_id, device), loader)
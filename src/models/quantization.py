@@ -0,0 +1,212 @@
+"""
+学習後の静的量子化（int8）
+
+FXグラフモードでモデルを量子化します。
+
+1. prepare_fx でオブザーバーを挿入
+2. validデータの数バッチでキャリブレーション（活性値の範囲を収集）
+3. convert_fx でint8モデルに変換
+
+量子化済みモデルはTorchScript（trace + freeze）として保存し、
+CPUのみの環境でそのまま読み込めるようにします。
+
+    quantized_dir/
+        quantization_meta.json          バックエンド、キャリブレーション、精度・レイテンシ・サイズの比較
+        model.int8.torchscript.pt       量子化済みモデル
+"""
+
+import copy
+import io
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_MODEL_FILE = "model.int8.torchscript.pt"
+QUANTIZATION_META_FILE = "quantization_meta.json"
+
+# 量子化をサポートするモデル（CPUデプロイ対象）
+QUANTIZABLE_MODELS = ("ResNet18", "ResNet34", "ResNet50")
+
+
+def get_default_backend() -> str:
+    """ホストで利用可能な量子化バックエンドを取得（x86 > fbgemm > qnnpack）"""
+    supported = torch.backends.quantized.supported_engines
+    for backend in ("x86", "fbgemm", "qnnpack"):
+        if backend in supported:
+            return backend
+    raise RuntimeError(f"利用可能な量子化バックエンドがありません: {supported}")
+
+
+def _batch_images(batch: Any) -> torch.Tensor:
+    """DataLoaderのバッチから画像テンソルを取り出す"""
+    return batch[0] if isinstance(batch, (list, tuple)) else batch
+
+
+def quantize_model(
+    model: nn.Module,
+    calibration_batches: Iterable[Any],
+    num_batches: int = 10,
+    backend: Optional[str] = None
+) -> nn.Module:
+    """
+    FXグラフモードで静的量子化
+
+    Args:
+        model: fp32のPyTorchモデル（変更されません）
+        calibration_batches: キャリブレーションに使用するバッチ（DataLoaderなど）
+        num_batches: キャリブレーションに使用するバッチ数
+        backend: 量子化バックエンド（Noneの場合は自動選択）
+
+    Returns:
+        int8に変換したモデル（torch.fx.GraphModule）
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if num_batches <= 0:
+        raise ValueError(f"num_batchesは正の値である必要があります: {num_batches}")
+
+    backend = backend or get_default_backend()
+    torch.backends.quantized.engine = backend
+
+    batches = iter(calibration_batches)
+    try:
+        first = _batch_images(next(batches))
+    except StopIteration:
+        raise ValueError("キャリブレーション用のデータが空です")
+
+    model = copy.deepcopy(model).cpu().eval()
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), (first[:1],))
+
+    calibrated = 0
+    with torch.inference_mode():
+        prepared(first)
+        calibrated += 1
+        for batch in batches:
+            if calibrated >= num_batches:
+                break
+            prepared(_batch_images(batch))
+            calibrated += 1
+
+    logger.info(f"キャリブレーションが完了しました: {calibrated}バッチ (backend={backend})")
+    return convert_fx(prepared)
+
+
+def evaluate_accuracy(model: nn.Module, dataloader: Iterable[Any]) -> float:
+    """
+    CPUで精度を計算
+
+    Args:
+        model: モデル
+        dataloader: (画像, ラベル) のバッチを返すDataLoader
+
+    Returns:
+        精度（0〜1）
+    """
+    correct = 0
+    total = 0
+    with torch.inference_mode():
+        for images, labels in dataloader:
+            predictions = model(images.cpu()).argmax(dim=1)
+            correct += (predictions == labels.cpu()).sum().item()
+            total += labels.numel()
+    if total == 0:
+        raise ValueError("評価用のデータが空です")
+    return correct / total
+
+
+def measure_latency(
+    model: nn.Module,
+    example_input: torch.Tensor,
+    warmup: int = 2,
+    repeats: int = 10
+) -> float:
+    """
+    1バッチあたりの推論時間を計測
+
+    Args:
+        model: モデル
+        example_input: 入力 [B, C, H, W]
+        warmup: ウォームアップ回数
+        repeats: 計測回数
+
+    Returns:
+        推論時間の中央値（ミリ秒）
+    """
+    timings = []
+    with torch.inference_mode():
+        for _ in range(warmup):
+            model(example_input)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(example_input)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000.0
+
+
+def model_size_bytes(model: nn.Module) -> int:
+    """state_dictをシリアライズした場合のサイズ（バイト）"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def save_quantized_model(
+    quantized_model: nn.Module,
+    output_dir: Union[str, Path],
+    example_input: torch.Tensor,
+    meta: Dict[str, Any]
+) -> Path:
+    """
+    量子化済みモデルをTorchScriptとして保存
+
+    Args:
+        quantized_model: quantize_modelの結果
+        output_dir: 出力ディレクトリ
+        example_input: traceに使用する入力 [B, C, H, W]
+        meta: 一緒に保存するメタデータ
+
+    Returns:
+        量子化済みモデルのパス
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / QUANTIZED_MODEL_FILE
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(quantized_model, example_input[:1]).eval())
+    traced.save(str(path))
+
+    with open(output_dir / QUANTIZATION_META_FILE, "w", encoding="utf-8") as f:
+        json.dump({**meta, "model_file": QUANTIZED_MODEL_FILE}, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"量子化済みモデルを保存しました: {path}")
+    return path
+
+
+def load_quantized_model(quantized_dir: Union[str, Path]) -> torch.jit.ScriptModule:
+    """
+    量子化済みモデルを読み込む
+
+    Args:
+        quantized_dir: save_quantized_modelの出力ディレクトリ
+
+    Returns:
+        量子化済みモデル
+    """
+    quantized_dir = Path(quantized_dir)
+    meta_path = quantized_dir / QUANTIZATION_META_FILE
+    if meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            backend = json.load(f).get("backend")
+        if backend in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = backend
+    return torch.jit.load(str(quantized_dir / QUANTIZED_MODEL_FILE), map_location="cpu").eval()
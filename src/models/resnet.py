@@ -7,12 +7,39 @@ torchvision.models.resnetを使用してResNetベースのモデルを構築し
 import torch
 import torch.nn as nn
 from torchvision import models
-from typing import Optional
+from typing import Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# モデル名 -> (torchvisionのモデル関数, 事前学習済みの重み)
+BACKBONES = {
+    "ResNet18": (models.resnet18, models.ResNet18_Weights.IMAGENET1K_V1),
+    "ResNet34": (models.resnet34, models.ResNet34_Weights.IMAGENET1K_V1),
+    "ResNet50": (models.resnet50, models.ResNet50_Weights.IMAGENET1K_V1),
+    "ResNet101": (models.resnet101, models.ResNet101_Weights.IMAGENET1K_V1),
+    "ResNet152": (models.resnet152, models.ResNet152_Weights.IMAGENET1K_V1),
+}
+
+
+def load_pretrained_backbone_state_dict(model_name: str) -> Dict[str, torch.Tensor]:
+    """
+    torchvisionの事前学習済みバックボーンのstate_dictを読み込む（最終層を除く）
+    
+    Args:
+        model_name: モデル名
+    
+    Returns:
+        ResNetClassifierのbackbone_state_dictに渡せるstate_dict
+    """
+    if model_name not in BACKBONES:
+        raise ValueError(f"サポートされていないモデル名: {model_name}")
+    backbone_factory, pretrained_weights = BACKBONES[model_name]
+    state_dict = backbone_factory(weights=pretrained_weights).state_dict()
+    return {key: value for key, value in state_dict.items() if not key.startswith("fc.")}
+
+
 class ResNetClassifier(nn.Module):
     """
     ResNetベースの画像分類モデル
@@ -22,6 +49,8 @@ class ResNetClassifier(nn.Module):
         num_classes: クラス数
         pretrained: 事前学習済みモデルを使用するか
         freeze_backbone: バックボーンを凍結するか
+        backbone_state_dict: 事前学習済みバックボーンのstate_dict（最終層を除く。
+            指定した場合はtorchvisionの重みを読み込まずにこれを使用）
     """
     
     def __init__(
@@ -29,7 +58,8 @@ class ResNetClassifier(nn.Module):
         model_name: str = "ResNet18",
         num_classes: int = 10,
         pretrained: bool = True,
-        freeze_backbone: bool = False
+        freeze_backbone: bool = False,
+        backbone_state_dict: Optional[Dict[str, torch.Tensor]] = None
     ):
         super().__init__()
         
@@ -39,41 +69,31 @@ class ResNetClassifier(nn.Module):
         self.freeze_backbone = freeze_backbone
         
         # ResNetモデルの取得
-        if model_name == "ResNet18":
-            if pretrained:
-                weights = models.ResNet18_Weights.IMAGENET1K_V1
-            else:
-                weights = None
-            self.backbone = models.resnet18(weights=weights)
-        elif model_name == "ResNet34":
-            if pretrained:
-                weights = models.ResNet34_Weights.IMAGENET1K_V1
-            else:
-                weights = None
-            self.backbone = models.resnet34(weights=weights)
-        elif model_name == "ResNet50":
-            if pretrained:
-                weights = models.ResNet50_Weights.IMAGENET1K_V1
-            else:
-                weights = None
-            self.backbone = models.resnet50(weights=weights)
-        elif model_name == "ResNet101":
-            if pretrained:
-                weights = models.ResNet101_Weights.IMAGENET1K_V1
-            else:
-                weights = None
-            self.backbone = models.resnet101(weights=weights)
-        elif model_name == "ResNet152":
-            if pretrained:
-                weights = models.ResNet152_Weights.IMAGENET1K_V1
-            else:
-                weights = None
-            self.backbone = models.resnet152(weights=weights)
-        else:
+        if model_name not in BACKBONES:
             raise ValueError(
                 f"サポートされていないモデル名: {model_name}. "
-                f"サポートされているモデル: ResNet18, ResNet34, ResNet50, ResNet101, ResNet152"
+                f"サポートされているモデル: {', '.join(BACKBONES)}"
             )
+        backbone_factory, pretrained_weights = BACKBONES[model_name]
+        
+        if pretrained and backbone_state_dict is not None:
+            # 読み込み済みの事前学習済み重みを使用（ダウンロード・読み込み・初期化を省略）
+            with torch.device("meta"):
+                self.backbone = backbone_factory(weights=None)
+            missing, unexpected = self.backbone.load_state_dict(
+                {key: value.clone() for key, value in backbone_state_dict.items()},
+                strict=False,
+                assign=True
+            )
+            # 最終層は下で作り直すため、それ以外の重みが揃っていることを確認
+            missing = [key for key in missing if not key.startswith("fc.")]
+            if missing or unexpected:
+                raise ValueError(
+                    f"バックボーンのstate_dictが{model_name}と一致しません: "
+                    f"missing={missing}, unexpected={unexpected}"
+                )
+        else:
+            self.backbone = backbone_factory(weights=pretrained_weights if pretrained else None)
         
         # 最終層の置き換え
         in_features = self.backbone.fc.in_features
@@ -0,0 +1,227 @@
+"""
+重みのみのモデル保存形式
+
+モデル全体をpickleせず、state_dictと小さなメタデータ（JSON）だけを保存します。
+
+    weights_dir/
+        model_meta.json        model_name, num_classes, class_names, preprocessing_hash など
+        weights.safetensors    safetensorsがインストールされている場合（mmapで読み込み）
+        weights.pt             それ以外（torch.load(weights_only=True, mmap=True)で読み込み）
+
+読み込み時はmetaデバイス上にモデルを作成し、読み込んだテンソルをそのまま
+割り当てる（assign=True）ため、初期化済みの重みとの二重確保が発生しません。
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+try:
+    import safetensors.torch as safetensors_torch
+    SAFETENSORS_AVAILABLE = True
+except ImportError:
+    safetensors_torch = None
+    SAFETENSORS_AVAILABLE = False
+
+WEIGHTS_FORMAT_VERSION = 1
+METADATA_FILE = "model_meta.json"
+WEIGHTS_FILES = {
+    "safetensors": "weights.safetensors",
+    "torch": "weights.pt",
+}
+
+
+def normalize_state_dict(checkpoint: Any) -> Dict[str, torch.Tensor]:
+    """
+    さまざまな形式のチェックポイントからモデルのstate_dictを取り出す
+
+    - LightningModuleのチェックポイント（{"state_dict": ...}、キーに"model."プレフィックス）
+    - ネストされた形式（{"model": state_dict}）
+    - state_dictそのもの
+    - nn.Module（旧形式の model.pth）
+
+    Args:
+        checkpoint: torch.loadの結果
+
+    Returns:
+        モデルのstate_dict
+    """
+    if isinstance(checkpoint, nn.Module):
+        return checkpoint.state_dict()
+    if isinstance(checkpoint, Mapping) and "state_dict" in checkpoint:
+        state_dict = checkpoint["state_dict"]
+        # LightningModuleのstate_dictには'model.'プレフィックスが付く
+        return {
+            (key[len("model."):] if key.startswith("model.") else key): value
+            for key, value in state_dict.items()
+        }
+    if isinstance(checkpoint, Mapping) and isinstance(checkpoint.get("model"), Mapping):
+        return dict(checkpoint["model"])
+    if isinstance(checkpoint, Mapping):
+        return dict(checkpoint)
+    raise ValueError(f"サポートされていないチェックポイント形式です: {type(checkpoint)}")
+
+
+def save_weights(
+    model: nn.Module,
+    output_dir: Union[str, Path],
+    model_name: str,
+    num_classes: int,
+    class_names: Optional[List[str]] = None,
+    preprocessing_hash: Optional[str] = None,
+    run_id: Optional[str] = None,
+    weights_format: str = "auto"
+) -> Dict[str, Any]:
+    """
+    モデルの重みとメタデータを保存
+
+    Args:
+        model: PyTorchモデル
+        output_dir: 出力ディレクトリ
+        model_name: モデル名（create_modelに渡す名前）
+        num_classes: クラス数
+        class_names: クラス名のリスト
+        preprocessing_hash: 学習時の前処理設定のハッシュ
+        run_id: 学習時のMLflow run ID
+        weights_format: "auto" / "safetensors" / "torch"
+
+    Returns:
+        メタデータ
+    """
+    if weights_format == "auto":
+        weights_format = "safetensors" if SAFETENSORS_AVAILABLE else "torch"
+    if weights_format not in WEIGHTS_FILES:
+        raise ValueError(f"サポートされていない重みの形式です: {weights_format}")
+    if weights_format == "safetensors" and not SAFETENSORS_AVAILABLE:
+        raise ImportError("safetensorsがインストールされていません。pip install safetensors でインストールしてください。")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    state_dict = {key: value.detach().cpu().contiguous() for key, value in model.state_dict().items()}
+    weights_file = WEIGHTS_FILES[weights_format]
+    if weights_format == "safetensors":
+        safetensors_torch.save_file(state_dict, str(output_dir / weights_file))
+    else:
+        torch.save(state_dict, output_dir / weights_file)
+
+    meta = {
+        "format_version": WEIGHTS_FORMAT_VERSION,
+        "model_name": model_name,
+        "num_classes": num_classes,
+        "class_names": list(class_names) if class_names is not None else None,
+        "preprocessing_hash": preprocessing_hash,
+        "run_id": run_id,
+        "weights_file": weights_file,
+        "weights_format": weights_format,
+    }
+    with open(output_dir / METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"モデルの重みを保存しました: {output_dir / weights_file}")
+    return meta
+
+
+def read_weights_meta(weights_dir: Union[str, Path]) -> Dict[str, Any]:
+    """
+    重みディレクトリのメタデータを読み込む
+
+    Args:
+        weights_dir: save_weightsの出力ディレクトリ
+
+    Returns:
+        メタデータ
+    """
+    meta_path = Path(weights_dir) / METADATA_FILE
+    if not meta_path.exists():
+        raise FileNotFoundError(f"モデルのメタデータが見つかりません: {meta_path}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_checkpoint(path: Union[str, Path], mmap: bool = True, allow_pickle: bool = False) -> Any:
+    """
+    torch形式のファイルを読み込む
+
+    weights_only=Trueで読み込みます。旧形式（モデル全体をpickleしたmodel.pth）を読み込む場合のみ
+    allow_pickle=Trueを指定してください。pickleの読み込みは任意のコードを実行できるため、
+    信頼できるファイル以外には使用しないでください。
+
+    Args:
+        path: ファイルのパス
+        mmap: mmapで読み込むか
+        allow_pickle: weights_onlyで読み込めない場合に通常のtorch.loadで読み込むか
+
+    Returns:
+        torch.loadの結果
+
+    Raises:
+        pickle.UnpicklingError等: weights_onlyで読み込めず、allow_pickle=Falseの場合
+    """
+    try:
+        return torch.load(path, map_location="cpu", weights_only=True, mmap=mmap)
+    except Exception as e:
+        if not allow_pickle:
+            raise
+        logger.warning(f"weights_onlyで読み込めないため、旧形式として通常のtorch.loadで読み込みます: {path} ({e})")
+        return torch.load(path, map_location="cpu", weights_only=False)
+
+
+def load_state_dict_file(path: Union[str, Path], mmap: bool = True, allow_pickle: bool = False) -> Dict[str, torch.Tensor]:
+    """
+    重みファイルを読み込んでstate_dictを返す
+
+    .safetensorsはmmapで、それ以外はweights_only=Trueで読み込みます（load_checkpointを参照）。
+
+    Args:
+        path: 重みファイルのパス
+        mmap: mmapで読み込むか（torch形式の場合）
+        allow_pickle: 旧形式（モデル全体のpickle）の読み込みを許可するか
+
+    Returns:
+        モデルのstate_dict
+    """
+    path = Path(path)
+    if path.suffix == ".safetensors":
+        if not SAFETENSORS_AVAILABLE:
+            raise ImportError("safetensorsがインストールされていません。pip install safetensors でインストールしてください。")
+        return safetensors_torch.load_file(str(path), device="cpu")
+    return normalize_state_dict(load_checkpoint(path, mmap=mmap, allow_pickle=allow_pickle))
+
+
+def load_model_from_weights(
+    weights_dir: Union[str, Path],
+    device: Union[str, torch.device] = "cpu",
+    mmap: bool = True
+) -> Tuple[nn.Module, Dict[str, Any]]:
+    """
+    重みディレクトリからモデルを作成
+
+    Args:
+        weights_dir: save_weightsの出力ディレクトリ
+        device: 読み込み先のデバイス
+        mmap: mmapで読み込むか
+
+    Returns:
+        (評価モードのモデル, メタデータ)
+    """
+    from src.models.model_factory import create_model
+
+    weights_dir = Path(weights_dir)
+    meta = read_weights_meta(weights_dir)
+    state_dict = load_state_dict_file(weights_dir / meta["weights_file"], mmap=mmap)
+
+    # metaデバイス上で作成し、読み込んだテンソルを割り当てる（初期化・二重確保を省略）
+    with torch.device("meta"):
+        model = create_model(meta["model_name"], num_classes=meta["num_classes"], pretrained=False)
+    model.load_state_dict(state_dict, assign=True)
+    model = model.to(device).eval()
+
+    logger.info(f"モデルを読み込みました: {meta['model_name']} ({weights_dir})")
+    return model, meta
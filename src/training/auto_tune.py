@@ -0,0 +1,400 @@
+"""
+学習前の自動チューニング（バッチサイズ・学習率）
+
+params.yamlのtraining.auto_tuneを指定すると、学習の前に以下を実行します。
+
+1. バッチサイズの探索: メモリ予算（CPUはプロセスのRSS、GPUはデバイスメモリ）に収まる
+   最大のバッチサイズを、バッチサイズを倍にしながら1ステップの学習を試して求めます
+2. 学習率の探索: 決めたバッチサイズで学習率を指数的に上げながら損失を記録し（LR range test）、
+   損失が最も急に下がる学習率を選びます
+
+    training:
+      auto_tune: true                   # バッチサイズと学習率の両方を探索
+      # または
+      auto_tune:
+        batch_size: true
+        max_batch_size: 512
+        memory_fraction: 0.8            # 全メモリ（RAMまたはGPUメモリ）に対する予算の割合
+        memory_budget_mb: null          # 予算を直接指定する場合（memory_fractionより優先）
+        learning_rate: true
+        lr_min: 1.0e-07
+        lr_max: 1.0
+        lr_num_steps: 100
+
+探索した値はtraining.batch_size・training.learning_rateに書き込まれます（params_used.yamlに保存）。
+"""
+
+import copy
+import logging
+import os
+import resource
+import sys
+import tempfile
+from typing import Any, Dict, Optional
+
+import pytorch_lightning as pl
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTO_TUNE_CONFIG = {
+    "batch_size": True,
+    "max_batch_size": 512,
+    "memory_fraction": 0.8,
+    "memory_budget_mb": None,
+    "learning_rate": True,
+    "lr_min": 1e-7,
+    "lr_max": 1.0,
+    "lr_num_steps": 100,
+}
+
+# オプティマイザの状態（パラメータあたりのバッファ数）
+OPTIMIZER_STATE_FACTORS = {"Adam": 2, "AdamW": 2, "SGD": 1}
+
+
+def parse_auto_tune_config(auto_tune_config: Any) -> Optional[Dict[str, Any]]:
+    """
+    training.auto_tuneの設定を正規化
+
+    Args:
+        auto_tune_config: true / false / 辞書
+
+    Returns:
+        既定値を補った設定（無効な場合はNone）
+    """
+    if not auto_tune_config:
+        return None
+    if auto_tune_config is True:
+        auto_tune_config = {}
+    elif not isinstance(auto_tune_config, dict):
+        raise ValueError(f"training.auto_tuneの形式が不正です: {auto_tune_config}")
+
+    unknown = set(auto_tune_config) - set(DEFAULT_AUTO_TUNE_CONFIG)
+    if unknown:
+        raise ValueError(f"training.auto_tuneに不明なキーがあります: {sorted(unknown)}")
+
+    config = {**DEFAULT_AUTO_TUNE_CONFIG, **auto_tune_config}
+    if not 0.0 < config["memory_fraction"] <= 1.0:
+        raise ValueError(f"memory_fractionは0より大きく1以下である必要があります: {config['memory_fraction']}")
+    if not config["batch_size"] and not config["learning_rate"]:
+        return None
+    return config
+
+
+def resolve_device(accelerator: str = "auto") -> torch.device:
+    """
+    Trainerのacceleratorに対応するデバイスを取得
+
+    Args:
+        accelerator: "auto", "cpu", "gpu", "cuda", "mps"
+
+    Returns:
+        デバイス
+    """
+    if accelerator in ("gpu", "cuda") or (accelerator == "auto" and torch.cuda.is_available()):
+        return torch.device("cuda", 0)
+    if accelerator == "mps" or (accelerator == "auto" and torch.backends.mps.is_available()):
+        return torch.device("mps")
+    return torch.device("cpu")
+
+
+def get_memory_budget(
+    device: torch.device,
+    memory_fraction: float = 0.8,
+    memory_budget_mb: Optional[float] = None
+) -> int:
+    """
+    バッチサイズの探索に使うメモリ予算を取得
+
+    Args:
+        device: デバイス
+        memory_fraction: 全メモリに対する割合
+        memory_budget_mb: 予算（MB、指定した場合はこちらを使用）
+
+    Returns:
+        メモリ予算（バイト）
+    """
+    if memory_budget_mb is not None:
+        return int(memory_budget_mb * 1024 ** 2)
+    if device.type == "cuda":
+        total = torch.cuda.get_device_properties(device).total_memory
+    else:
+        # CPU・MPS（ユニファイドメモリ）は物理メモリを基準にする
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return int(total * memory_fraction)
+
+
+def peak_rss_bytes() -> int:
+    """プロセスのRSSの最大値（バイト）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LinuxはKB、macOSはバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _autocast_dtype(precision: str, device: torch.device) -> Optional[torch.dtype]:
+    """Trainerのprecisionに対応するautocastのdtype（使用しない場合はNone）"""
+    if precision.startswith("bf16"):
+        return torch.bfloat16
+    if precision.startswith("16"):
+        # LightningはCPUの16-mixedをbf16として実行する
+        return torch.float16 if device.type == "cuda" else torch.bfloat16
+    return None
+
+
+def measure_step_memory(
+    model: nn.Module,
+    batch_size: int,
+    input_shape: torch.Size,
+    num_classes: int,
+    device: torch.device,
+    precision: str = "32-true",
+    channels_last: bool = False
+) -> int:
+    """
+    1ステップの学習（順伝播・逆伝播）のメモリ使用量の最大値を測定
+
+    CPUではプロセスのRSSの最大値（単調増加）を返すため、バッチサイズを大きくしながら呼び出します。
+
+    Args:
+        model: 測定するモデル（勾配は測定後に破棄）
+        batch_size: バッチサイズ
+        input_shape: 1サンプルの入力の形状 [channels, height, width]
+        num_classes: クラス数
+        device: デバイス
+        precision: Trainerのprecision
+        channels_last: 入力をchannels_lastにするか
+
+    Returns:
+        メモリ使用量の最大値（バイト）
+    """
+    images = torch.rand(batch_size, *input_shape, device=device)
+    if channels_last:
+        images = images.contiguous(memory_format=torch.channels_last)
+    labels = torch.randint(0, num_classes, (batch_size,), device=device)
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+
+    dtype = _autocast_dtype(precision, device)
+    with torch.autocast(device_type=device.type, dtype=dtype or torch.float32, enabled=dtype is not None):
+        loss = F.cross_entropy(model(images), labels)
+    loss.backward()
+    model.zero_grad(set_to_none=True)
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        return torch.cuda.max_memory_reserved(device)
+    return peak_rss_bytes()
+
+
+def find_max_batch_size(
+    module: pl.LightningModule,
+    input_shape: torch.Size,
+    device: torch.device,
+    memory_budget: int,
+    initial_batch_size: int = 1,
+    max_batch_size: int = 512,
+    precision: str = "32-true"
+) -> Dict[str, Any]:
+    """
+    メモリ予算に収まる最大のバッチサイズを探索
+
+    initial_batch_sizeから倍にしながら測定し、予算を超えた時点で1つ前のバッチサイズを選びます。
+    CPU・MPSの測定値はプロセスのRSSの最大値（単調増加）のため、一度予算を超えると小さいバッチサイズを
+    測定し直せません。そのためinitial_batch_sizeは使わず、最小のバッチサイズから倍にしていきます。
+    モデルのコピーで測定するため、元のモデルの重み・BatchNormの統計量は変わりません。
+
+    Args:
+        module: ClassificationLightningModule
+        input_shape: 1サンプルの入力の形状
+        device: デバイス
+        memory_budget: メモリ予算（バイト）
+        initial_batch_size: 探索を始めるバッチサイズ（CUDAのみ。予算を超える場合は半分にしていく）
+        max_batch_size: バッチサイズの上限（trainデータの件数など）
+        precision: Trainerのprecision
+
+    Returns:
+        {"batch_size", "peak_memory_mb", "memory_budget_mb"}
+    """
+    probe = copy.deepcopy(module.model).to(device).train()
+    num_classes = module.hparams.num_classes
+    channels_last = bool(module.hparams.get("channels_last"))
+
+    # オプティマイザの状態は測定に含まれないため、パラメータのサイズから見積もって加える
+    param_bytes = sum(p.numel() * p.element_size() for p in probe.parameters() if p.requires_grad)
+    optimizer_bytes = param_bytes * OPTIMIZER_STATE_FACTORS.get(module.hparams.get("optimizer"), 2)
+
+    def fits(batch_size: int) -> Optional[int]:
+        try:
+            peak = measure_step_memory(
+                probe, batch_size, input_shape, num_classes, device,
+                precision=precision, channels_last=channels_last
+            ) + optimizer_bytes
+        except torch.cuda.OutOfMemoryError:
+            torch.cuda.empty_cache()
+            return None
+        logger.info(f"バッチサイズ {batch_size}: メモリ使用量 {peak / 1024 ** 2:.0f}MB / 予算 {memory_budget / 1024 ** 2:.0f}MB")
+        return peak if peak <= memory_budget else None
+
+    # BatchNormは学習時にバッチサイズ2以上が必要
+    has_batch_norm = any(isinstance(m, nn.modules.batchnorm._BatchNorm) for m in probe.modules())
+    min_batch_size = 2 if has_batch_norm else 1
+
+    if device.type == "cuda":
+        batch_size = max(min_batch_size, min(initial_batch_size, max_batch_size))
+    else:
+        # RSSの最大値は下がらないため、小さい方から測定する
+        batch_size = min_batch_size
+    peak = fits(batch_size)
+    # 初期値が予算を超える場合は半分にしていく（CUDAのみ）
+    while peak is None and batch_size > min_batch_size:
+        batch_size = max(min_batch_size, batch_size // 2)
+        peak = fits(batch_size)
+    if peak is None:
+        logger.warning(f"バッチサイズ{batch_size}でもメモリ予算を超えるため、バッチサイズ{batch_size}を使用します")
+
+    while peak is not None and batch_size * 2 <= max_batch_size:
+        next_peak = fits(batch_size * 2)
+        if next_peak is None:
+            break
+        batch_size, peak = batch_size * 2, next_peak
+
+    del probe
+    if device.type == "cuda":
+        torch.cuda.empty_cache()
+
+    return {
+        "batch_size": batch_size,
+        "peak_memory_mb": round((peak or 0) / 1024 ** 2, 1),
+        "memory_budget_mb": round(memory_budget / 1024 ** 2, 1),
+    }
+
+
+def find_learning_rate(
+    module: pl.LightningModule,
+    datamodule: pl.LightningDataModule,
+    accelerator: str = "auto",
+    precision: str = "32-true",
+    lr_min: float = 1e-7,
+    lr_max: float = 1.0,
+    num_steps: int = 100
+) -> Optional[float]:
+    """
+    LR range testで学習率を探索
+
+    Lightningの学習率探索を専用のTrainerで実行します（探索後にモデルの重みは元に戻ります）。
+
+    Args:
+        module: ClassificationLightningModule
+        datamodule: DataModule
+        accelerator: Trainerのaccelerator
+        precision: Trainerのprecision
+        lr_min: 探索する学習率の下限
+        lr_max: 探索する学習率の上限
+        num_steps: 探索のステップ数
+
+    Returns:
+        推奨された学習率（損失が発散するなどで決められない場合はNone）
+    """
+    from pytorch_lightning.tuner import Tuner
+
+    with tempfile.TemporaryDirectory(prefix="lr_find_") as root_dir:
+        trainer = pl.Trainer(
+            accelerator=accelerator,
+            devices=1,
+            precision=precision,
+            logger=False,
+            enable_checkpointing=False,
+            enable_progress_bar=False,
+            enable_model_summary=False,
+            default_root_dir=root_dir,
+        )
+        lr_finder = Tuner(trainer).lr_find(
+            module,
+            datamodule=datamodule,
+            min_lr=lr_min,
+            max_lr=lr_max,
+            num_training=num_steps,
+            update_attr=False,
+        )
+    return lr_finder.suggestion() if lr_finder is not None else None
+
+
+def auto_tune(
+    module: pl.LightningModule,
+    datamodule: pl.LightningDataModule,
+    auto_tune_config: Dict[str, Any],
+    accelerator: str = "auto",
+    precision: str = "32-true",
+    trial_context: Optional[Any] = None
+) -> Dict[str, Any]:
+    """
+    バッチサイズと学習率を探索してDataModule・LightningModuleに設定
+
+    Args:
+        module: ClassificationLightningModule（hparams.learning_rateを更新）
+        datamodule: セットアップ済みのDataModule（batch_sizeを更新）
+        auto_tune_config: parse_auto_tune_config()で正規化した設定
+        accelerator: Trainerのaccelerator
+        precision: Trainerのprecision
+        trial_context: トライアルコンテキスト（同じ構成のバッチサイズの探索結果を再利用）
+
+    Returns:
+        探索結果（"batch_size", "learning_rate"など）
+    """
+    results: Dict[str, Any] = {}
+
+    if auto_tune_config["batch_size"]:
+        device = resolve_device(accelerator)
+        train_dataset = datamodule.train_dataset
+        input_shape = train_dataset[0][0].shape
+        memory_budget = get_memory_budget(
+            device, auto_tune_config["memory_fraction"], auto_tune_config["memory_budget_mb"]
+        )
+
+        def _find():
+            return find_max_batch_size(
+                module,
+                input_shape=input_shape,
+                device=device,
+                memory_budget=memory_budget,
+                initial_batch_size=datamodule.batch_size,
+                max_batch_size=min(auto_tune_config["max_batch_size"], len(train_dataset)),
+                precision=precision,
+            )
+
+        if trial_context is not None:
+            key = (
+                module.hparams.model_name, module.hparams.num_classes, module.hparams.get("freeze_backbone"),
+                module.hparams.get("channels_last"), module.hparams.get("optimizer"), tuple(input_shape),
+                len(train_dataset), precision, str(device), memory_budget, auto_tune_config["max_batch_size"],
+            )
+            batch_size_results = trial_context.get_or_create("auto_batch_size", key, _find)
+        else:
+            batch_size_results = _find()
+
+        datamodule.batch_size = batch_size_results["batch_size"]
+        results.update(batch_size_results)
+        logger.info(f"バッチサイズを {datamodule.batch_size} に設定しました")
+
+    if auto_tune_config["learning_rate"]:
+        learning_rate = find_learning_rate(
+            module,
+            datamodule,
+            accelerator=accelerator,
+            precision=precision,
+            lr_min=auto_tune_config["lr_min"],
+            lr_max=auto_tune_config["lr_max"],
+            num_steps=auto_tune_config["lr_num_steps"],
+        )
+        if learning_rate is None:
+            logger.warning(f"学習率を決められなかったため、{module.hparams.learning_rate}を使用します")
+        else:
+            module.hparams.learning_rate = learning_rate
+            results["learning_rate"] = learning_rate
+            logger.info(f"学習率を {learning_rate:.3g} に設定しました")
+
+    return results
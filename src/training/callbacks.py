@@ -4,7 +4,11 @@ Lightning Callbacks
 カスタムCallbacksの定義と学習制御を行います。
 """
 
+import time
+from pathlib import Path
+
 import pytorch_lightning as pl
+import torch
 from pytorch_lightning.callbacks import (
     EarlyStopping,
     ModelCheckpoint,
@@ -144,6 +148,23 @@ class MetricsLoggerCallback(pl.Callback):
         logger.info(log_msg)
 
 
+def compute_total_grad_norm(grads: List[torch.Tensor]) -> torch.Tensor:
+    """
+    勾配全体のL2ノルムを計算
+
+    torch.nn.utils.get_total_norm（PyTorch 2.6以降）を使い、ない場合はパラメータごとのノルムから合成します。
+
+    Args:
+        grads: 勾配テンソルのリスト
+
+    Returns:
+        L2ノルム（0次元テンソル）
+    """
+    if hasattr(torch.nn.utils, "get_total_norm"):
+        return torch.nn.utils.get_total_norm(grads, norm_type=2.0)
+    return torch.linalg.vector_norm(torch.stack([torch.linalg.vector_norm(g) for g in grads]))
+
+
 class GradientNormCallback(pl.Callback):
     """
     勾配ノルムをモニタリングするカスタムCallback
@@ -155,18 +176,296 @@ class GradientNormCallback(pl.Callback):
         """
         逆伝播後
         """
-        # 勾配ノルムの計算
-        total_norm = 0.0
-        for p in pl_module.parameters():
-            if p.grad is not None:
-                param_norm = p.grad.data.norm(2)
-                total_norm += param_norm.item() ** 2
-        total_norm = total_norm ** 0.5
+        grads = [p.grad.detach() for p in pl_module.parameters() if p.grad is not None]
+        if not grads:
+            return
+        
+        # 勾配ノルムの計算（パラメータごとのノルムをデバイス上で合成する）
+        # テンソルのままログに渡すため、ステップごとのホストとの同期は発生しない
+        total_norm = compute_total_grad_norm(grads)
         
         # ログに記録
         pl_module.log("grad_norm", total_norm, on_step=True, on_epoch=False)
 
 
+class OptunaPruningCallback(pl.Callback):
+    """
+    Optunaの枝刈りを行うカスタムCallback
+    
+    検証エポック終了時にモニター対象のメトリクス（val_loss / val_acc）をトライアルに報告し、
+    Prunerが打ち切りを判断した場合はoptuna.TrialPrunedを送出して学習を中断します。
+    """
+    
+    def __init__(self, trial, monitor: str = "val_loss"):
+        """
+        Args:
+            trial: optuna.Trial
+            monitor: トライアルに報告するメトリクス
+        """
+        super().__init__()
+        self.trial = trial
+        self.monitor = monitor
+        self.pruned_epoch: Optional[int] = None
+    
+    def on_validation_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        検証終了時
+        """
+        if trainer.sanity_checking:
+            return
+        
+        value = trainer.callback_metrics.get(self.monitor)
+        if value is None:
+            logger.warning(f"{self.monitor}が記録されていないため、トライアルに報告できません")
+            return
+        
+        epoch = trainer.current_epoch
+        self.trial.report(float(value), step=epoch)
+        
+        if self.trial.should_prune():
+            import optuna
+            self.pruned_epoch = epoch
+            message = f"Trial {self.trial.number}: epoch {epoch} で枝刈りされました（{self.monitor}={float(value):.4f}）"
+            logger.info(message)
+            raise optuna.TrialPruned(message)
+
+
+class ThroughputProfilerCallback(pl.Callback):
+    """
+    学習のスループットとデータ待ちを計測するカスタムCallback
+    
+    学習ステップごとに以下を計測し、log_every_n_steps ステップごとに平均をメトリクスとして
+    Logger（MLflow）に記録します。
+    
+    - profile_data_wait_ms: 前のステップの終了から次のバッチが届くまでの時間（DataLoader・デバイス転送）
+    - profile_compute_ms: 順伝播・逆伝播・オプティマイザの時間
+    - profile_data_wait_fraction: ステップ時間に占めるデータ待ちの割合
+    - profile_samples_per_sec: 1秒あたりの学習サンプル数
+    - profile_peak_rss_mb / profile_peak_gpu_mb: プロセスのRSS・GPUメモリの最大値
+    
+    学習開始時にはメインプロセスでバッチの作成を段階ごとに計測し（profile_stage_<段階>_ms）、
+    trace_start_stepを指定するとそのステップから trace_steps ステップ分の torch.profiler の
+    トレース（Chrome trace形式）を保存してMLflowのartifactに記録します。
+    
+    GPUではカーネルが非同期に実行されるため、synchronize=Trueの場合のみ計算時間に
+    GPUの実行時間が正確に含まれます（ステップごとに同期するため少し遅くなります）。
+    """
+    
+    def __init__(
+        self,
+        log_every_n_steps: int = 50,
+        stage_batches: int = 2,
+        trace_start_step: Optional[int] = None,
+        trace_steps: int = 5,
+        trace_dir: str = "profiler_traces",
+        synchronize: bool = False
+    ):
+        """
+        Args:
+            log_every_n_steps: メトリクスを記録する間隔（ステップ数）
+            stage_batches: 段階ごとの計測に使うバッチ数（0の場合は計測しない）
+            trace_start_step: トレースを開始するステップ（Noneの場合はトレースしない）
+            trace_steps: トレースするステップ数
+            trace_dir: トレースの保存ディレクトリ
+            synchronize: ステップの終了時にGPUと同期するか
+        """
+        super().__init__()
+        self.log_every_n_steps = log_every_n_steps
+        self.stage_batches = stage_batches
+        self.trace_start_step = trace_start_step
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+        self.synchronize = synchronize
+        
+        self.trace_path: Optional[str] = None
+        self._profiler = None
+        self._profiled_batches = 0
+        self._last_batch_end: Optional[float] = None
+        self._batch_start: Optional[float] = None
+        self._reset_window()
+    
+    def _reset_window(self):
+        self._data_wait = 0.0
+        self._compute = 0.0
+        self._samples = 0
+        self._steps = 0
+    
+    def _log_metrics(self, trainer: pl.Trainer, metrics: Dict[str, float]):
+        for pl_logger in trainer.loggers:
+            pl_logger.log_metrics(metrics, step=trainer.global_step)
+    
+    def on_train_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        学習開始時
+        """
+        if self.stage_batches > 0 and trainer.train_dataloader is not None:
+            from src.data.loader_tuning import measure_loading_stages
+            try:
+                stages = measure_loading_stages(trainer.train_dataloader, num_batches=self.stage_batches)
+            except Exception as e:
+                logger.warning(f"データ読み込みの段階ごとの計測に失敗しました: {e}")
+            else:
+                logger.info("データ読み込みの段階ごとの時間（1バッチ）: " + ", ".join(
+                    f"{stage}={ms:.1f}ms" for stage, ms in stages.items()
+                ))
+                self._log_metrics(trainer, {f"profile_stage_{stage}_ms": ms for stage, ms in stages.items()})
+        
+        if self.trace_start_step is not None:
+            self._start_trace()
+    
+    def _start_trace(self):
+        from torch.profiler import ProfilerActivity, profile, schedule
+        
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        
+        def _export(prof):
+            Path(self.trace_dir).mkdir(parents=True, exist_ok=True)
+            self.trace_path = str(Path(self.trace_dir) / f"trace_step{self.trace_start_step}.json")
+            prof.export_chrome_trace(self.trace_path)
+            logger.info(f"torch.profilerのトレースを保存しました: {self.trace_path}")
+        
+        self._profiler = profile(
+            activities=activities,
+            schedule=schedule(
+                skip_first=max(self.trace_start_step - 1, 0), wait=0, warmup=1, active=self.trace_steps, repeat=1
+            ),
+            on_trace_ready=_export,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self._profiler.start()
+    
+    def _stop_trace(self, trainer: pl.Trainer):
+        if self._profiler is None:
+            return
+        self._profiler.stop()
+        self._profiler = None
+        if self.trace_path is None:
+            return
+        # MLFlowLoggerのrunにトレースを記録
+        from pytorch_lightning.loggers import MLFlowLogger
+        for pl_logger in trainer.loggers:
+            if isinstance(pl_logger, MLFlowLogger):
+                pl_logger.experiment.log_artifact(pl_logger.run_id, self.trace_path, artifact_path="profiler")
+    
+    def on_train_epoch_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        学習エポック開始時
+        """
+        # エポック間の検証・チェックポイント保存の時間はデータ待ちに含めない
+        self._last_batch_end = time.perf_counter()
+    
+    def on_validation_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        検証終了時
+        """
+        # val_check_interval < 1.0の場合、エポック途中の検証の時間もデータ待ちに含めない
+        self._last_batch_end = time.perf_counter()
+    
+    def on_train_batch_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule, batch, batch_idx: int):
+        """
+        学習ステップ開始時（バッチの取得・デバイス転送の後）
+        """
+        self._batch_start = time.perf_counter()
+        if self._last_batch_end is not None:
+            self._data_wait += self._batch_start - self._last_batch_end
+    
+    def on_train_batch_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule, outputs, batch, batch_idx: int):
+        """
+        学習ステップ終了時
+        """
+        if self.synchronize and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        if self._batch_start is not None:
+            self._compute += end - self._batch_start
+        self._samples += len(batch[0])
+        self._steps += 1
+        
+        if self._profiler is not None:
+            self._profiler.step()
+            self._profiled_batches += 1
+            if self._profiled_batches >= self.trace_start_step + self.trace_steps:
+                self._stop_trace(trainer)
+        
+        if self._steps >= self.log_every_n_steps:
+            self._flush(trainer)
+        self._last_batch_end = time.perf_counter()
+    
+    def _flush(self, trainer: pl.Trainer):
+        if self._steps == 0:
+            return
+        from src.training.auto_tune import peak_rss_bytes
+        
+        step_time = self._data_wait + self._compute
+        metrics = {
+            "profile_data_wait_ms": self._data_wait / self._steps * 1000,
+            "profile_compute_ms": self._compute / self._steps * 1000,
+            "profile_data_wait_fraction": self._data_wait / step_time if step_time > 0 else 0.0,
+            "profile_samples_per_sec": self._samples / step_time if step_time > 0 else 0.0,
+            "profile_peak_rss_mb": peak_rss_bytes() / 1024 ** 2,
+        }
+        if torch.cuda.is_available():
+            metrics["profile_peak_gpu_mb"] = torch.cuda.max_memory_allocated() / 1024 ** 2
+            torch.cuda.reset_peak_memory_stats()
+        self._log_metrics(trainer, metrics)
+        self._reset_window()
+    
+    def on_train_epoch_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        学習エポック終了時
+        """
+        self._flush(trainer)
+    
+    def on_train_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """
+        学習終了時
+        """
+        self._stop_trace(trainer)
+
+
+def create_profiler_callback(profiling_config: Any) -> Optional[ThroughputProfilerCallback]:
+    """
+    training.profilingの設定からThroughputProfilerCallbackを作成
+    
+    例:
+        profiling: true
+        # または
+        profiling:
+          log_every_n_steps: 50
+          stage_batches: 2
+          synchronize: false
+          trace:                  # torch.profilerのトレース（省略時はトレースしない）
+            start_step: 10
+            num_steps: 5
+            output_dir: profiler_traces
+    
+    Args:
+        profiling_config: true / false / 辞書
+    
+    Returns:
+        ThroughputProfilerCallback（無効な場合はNone）
+    """
+    if not profiling_config:
+        return None
+    if profiling_config is True:
+        profiling_config = {}
+    elif not isinstance(profiling_config, dict):
+        raise ValueError(f"training.profilingの形式が不正です: {profiling_config}")
+    
+    trace_config = profiling_config.get("trace") or {}
+    return ThroughputProfilerCallback(
+        log_every_n_steps=profiling_config.get("log_every_n_steps", 50),
+        stage_batches=profiling_config.get("stage_batches", 2),
+        trace_start_step=trace_config.get("start_step", 10) if trace_config else None,
+        trace_steps=trace_config.get("num_steps", 5),
+        trace_dir=trace_config.get("output_dir", "profiler_traces"),
+        synchronize=profiling_config.get("synchronize", False),
+    )
+
+
 def get_default_callbacks(
     checkpoint_dir: str = "checkpoints",
     monitor: str = "val_loss",
@@ -181,6 +480,8 @@ def get_default_callbacks(
         monitor: モニターするメトリクス
         patience: Early Stoppingの待機エポック数
         **kwargs: その他のパラメータ
+            log_grad_norm: 勾配ノルムを記録するか（GradientNormCallback）
+            profiling: training.profilingの設定（ThroughputProfilerCallback）
     
     Returns:
         Callbacksのリスト
@@ -194,7 +495,11 @@ def get_default_callbacks(
     
     # カスタムCallbacksを追加
     callbacks.append(MetricsLoggerCallback())
-    # callbacks.append(GradientNormCallback())  # 必要に応じて有効化
+    if kwargs.get("log_grad_norm", False):
+        callbacks.append(GradientNormCallback())
+    profiler_callback = create_profiler_callback(kwargs.get("profiling"))
+    if profiler_callback is not None:
+        callbacks.append(profiler_callback)
     
     return callbacks
 
@@ -0,0 +1,127 @@
+"""
+torch.compileの設定
+
+params.yamlのtraining.compileからtorch.compileの設定を読み込み、モデルをコンパイルします。
+
+    training:
+      compile: reduce-overhead          # true / false / モード名
+      # または
+      compile:
+        mode: max-autotune              # default / reduce-overhead / max-autotune
+        cache_dir: .cache/torch_compile # コンパイル結果のキャッシュ（同じ構成の学習・トライアルで再利用）
+        fallback: true                  # コンパイルに失敗した場合はeagerで実行
+
+コンパイル結果（Inductorが生成したコード・オートチューニングの結果）はcache_dirに保存され、
+同じモデル構成・入力形状の学習やOptunaのトライアルでは再コンパイルを省略できます。
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+COMPILE_MODES = ("default", "reduce-overhead", "max-autotune")
+DEFAULT_COMPILE_CACHE_DIR = ".cache/torch_compile"
+
+
+def parse_compile_config(compile_config: Any) -> Optional[Dict[str, Any]]:
+    """
+    training.compileの設定を正規化
+
+    Args:
+        compile_config: true / false / モード名 / 辞書（mode, cache_dir, fallback）
+
+    Returns:
+        {"mode", "cache_dir", "fallback"}（無効な場合はNone）
+    """
+    if not compile_config:
+        return None
+    if compile_config is True:
+        compile_config = {}
+    elif isinstance(compile_config, str):
+        compile_config = {"mode": compile_config}
+    elif not isinstance(compile_config, dict):
+        raise ValueError(f"training.compileの形式が不正です: {compile_config}")
+    elif not compile_config.get("enabled", True):
+        return None
+
+    mode = compile_config.get("mode", "default")
+    if mode not in COMPILE_MODES:
+        raise ValueError(f"サポートされていないコンパイルモードです: {mode}（{', '.join(COMPILE_MODES)}）")
+    return {
+        "mode": mode,
+        "cache_dir": str(compile_config.get("cache_dir", DEFAULT_COMPILE_CACHE_DIR)),
+        "fallback": bool(compile_config.get("fallback", True)),
+    }
+
+
+def configure_compile_cache(cache_dir: str):
+    """
+    コンパイル結果のディスクキャッシュを有効化
+
+    Inductorのキャッシュディレクトリを設定し、FXグラフキャッシュと
+    オートチューニングのキャッシュを有効にします（コンパイル前に呼び出す必要があります）。
+    環境変数TORCHINDUCTOR_CACHE_DIRが設定されている場合はそちらを使用します（異なる場合は警告を出します）。
+
+    Args:
+        cache_dir: キャッシュディレクトリ
+    """
+    cache_dir = Path(cache_dir).resolve()
+    env_cache_dir = os.environ.get("TORCHINDUCTOR_CACHE_DIR")
+    if env_cache_dir:
+        if Path(env_cache_dir).resolve() != cache_dir:
+            logger.warning(
+                f"環境変数TORCHINDUCTOR_CACHE_DIRが設定されているため、"
+                f"training.compile.cache_dir（{cache_dir}）ではなく{env_cache_dir}を使用します"
+            )
+    else:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(cache_dir)
+
+    import torch._inductor.config as inductor_config
+    inductor_config.fx_graph_cache = True
+    inductor_config.autotune_local_cache = True
+
+
+def compile_model(
+    model: nn.Module,
+    mode: str = "default",
+    cache_dir: Optional[str] = DEFAULT_COMPILE_CACHE_DIR,
+    fallback: bool = True
+) -> Optional[nn.Module]:
+    """
+    モデルをtorch.compileでコンパイル
+
+    torch.compileは初回の呼び出し時にコンパイルされます。コンパイルに失敗したグラフをeagerで実行するには、
+    呼び出しをtorch._dynamo.config.patch(suppress_errors=True)の中で行ってください
+    （グローバルな設定は変更しません）。
+
+    Args:
+        model: コンパイルするモデル（変更されません）
+        mode: コンパイルモード
+        cache_dir: コンパイル結果のキャッシュディレクトリ（Noneの場合はtorchの既定）
+        fallback: torch.compileを使用できない場合にNoneを返すか（Falseの場合は例外を送出）
+
+    Returns:
+        コンパイルしたモデル（コンパイルできない場合はNone）
+    """
+    if mode not in COMPILE_MODES:
+        raise ValueError(f"サポートされていないコンパイルモードです: {mode}（{', '.join(COMPILE_MODES)}）")
+
+    try:
+        if cache_dir:
+            configure_compile_cache(cache_dir)
+        compiled = torch.compile(model, mode=mode)
+    except Exception as e:
+        if not fallback:
+            raise
+        logger.warning(f"torch.compileを使用できないため、eagerで実行します: {e}")
+        return None
+
+    logger.info(f"torch.compileを使用します: mode={mode}, cache_dir={cache_dir}")
+    return compiled
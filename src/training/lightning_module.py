@@ -15,6 +15,8 @@ from torchmetrics import Accuracy, Precision, Recall, F1Score, ConfusionMatrix
 from typing import Dict, Any, Optional
 import logging
 
+from src.data.packed_dataset import to_channels_last
+from src.training.compile import compile_model, parse_compile_config
 from src.models.model_factory import create_model
 
 logger = logging.getLogger(__name__)
@@ -35,6 +37,9 @@ class ClassificationLightningModule(pl.LightningModule):
         scheduler_params: スケジューラのパラメータ
         pretrained: 事前学習済みモデルを使用するか
         freeze_backbone: バックボーンを凍結するか
+        backbone_state_dict: 読み込み済みの事前学習済みバックボーンの重み（トライアル間で再利用する場合）
+        channels_last: モデルと入力をchannels_last（NHWC）のメモリ形式で扱うか
+        compile: torch.compileの設定（training.compile。true / モード名 / 辞書）
     """
     
     def __init__(
@@ -49,21 +54,36 @@ class ClassificationLightningModule(pl.LightningModule):
         scheduler_params: Optional[Dict[str, Any]] = None,
         pretrained: bool = True,
         freeze_backbone: bool = False,
+        backbone_state_dict: Optional[Dict[str, torch.Tensor]] = None,
+        channels_last: bool = False,
+        compile: Any = None,
         **kwargs
     ):
         super().__init__()
         
-        # ハイパーパラメータの保存
-        self.save_hyperparameters()
+        # ハイパーパラメータの保存（バックボーンの重みはチェックポイントのstate_dictに含まれる）
+        self.save_hyperparameters(ignore=["backbone_state_dict"])
         
         # モデルの作成
+        model_kwargs = {}
+        if backbone_state_dict is not None:
+            model_kwargs["backbone_state_dict"] = backbone_state_dict
         self.model = create_model(
             model_name=model_name,
             num_classes=num_classes,
             pretrained=pretrained,
-            freeze_backbone=freeze_backbone
+            freeze_backbone=freeze_backbone,
+            **model_kwargs
         )
         
+        # channels_last: 畳み込みの重みと入力をNHWCにそろえる（bf16/fp16のoneDNN・Tensor Coreで高速）
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        
+        # torch.compile（setup()でコンパイルするため、チェックポイントの読み込み・エクスポートには影響しない）
+        self.compile_config = parse_compile_config(compile)
+        self._set_compiled_model(None)
+        
         # 損失関数
         self.criterion = nn.CrossEntropyLoss()
         
@@ -87,9 +107,26 @@ class ClassificationLightningModule(pl.LightningModule):
             f"LightningModule作成: model={model_name}, "
             f"num_classes={num_classes}, "
             f"lr={learning_rate}, "
-            f"optimizer={optimizer}"
+            f"optimizer={optimizer}, "
+            f"channels_last={channels_last}, "
+            f"compile={self.compile_config['mode'] if self.compile_config else None}"
         )
     
+    def _set_compiled_model(self, compiled_model: Optional[nn.Module]):
+        """コンパイル済みモデルを保持（サブモジュールとして登録せず、state_dictのキーを変えない）"""
+        self.__dict__["_compiled_model"] = compiled_model
+    
+    def setup(self, stage: str):
+        """
+        学習・評価の開始時にモデルをコンパイル
+        
+        Args:
+            stage: "fit", "validate", "test", "predict"
+        """
+        if self.compile_config is None or self._compiled_model is not None:
+            return
+        self._set_compiled_model(compile_model(self.model, **self.compile_config))
+    
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """
         順伝播
@@ -100,8 +137,30 @@ class ClassificationLightningModule(pl.LightningModule):
         Returns:
             出力テンソル [batch_size, num_classes]
         """
+        if self._compiled_model is not None:
+            try:
+                # fallback=Trueの場合、コンパイルに失敗したグラフはeagerで実行（この呼び出しの間だけ設定する）
+                with torch._dynamo.config.patch(suppress_errors=self.compile_config["fallback"]):
+                    return self._compiled_model(x)
+            except torch._dynamo.exc.TorchDynamoException as e:
+                if not self.compile_config["fallback"]:
+                    raise
+                logger.warning(f"torch.compileしたモデルの実行に失敗したため、eagerに切り替えます: {e}")
+                self._set_compiled_model(None)
         return self.model(x)
     
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        """
+        デバイス転送後のバッチの処理
+        
+        channels_lastの場合は画像をNHWCのメモリ形式に変換します
+        （DataModule側で変換済みの場合は何もしません）。
+        """
+        if self.hparams.get("channels_last", False):
+            images, labels = batch
+            batch = (to_channels_last(images), labels)
+        return batch
+    
     def training_step(self, batch, batch_idx):
         """
         学習ステップ
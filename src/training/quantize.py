@@ -0,0 +1,155 @@
+"""
+学習済みモデルの量子化
+
+MLflow runのfp32モデルをテーマのvalidデータでキャリブレーションしてint8に量子化し、
+testデータでfp32との精度差・レイテンシ・モデルサイズを比較します。
+結果は同じrunにartifact（quantized/）・メトリクス（quantized_*）・タグ（quantization_*）として記録します。
+量子化の設定はrunのparamsではなくタグに記録するため、設定を変えて再実行できます。
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import mlflow
+
+from src.models.model_cache import load_run_model
+from src.models.quantization import (
+    QUANTIZABLE_MODELS,
+    evaluate_accuracy,
+    get_default_backend,
+    measure_latency,
+    model_size_bytes,
+    quantize_model,
+    save_quantized_model,
+)
+from src.training.train import create_datamodule, load_config, load_params
+from src.utils.mlflow_utils import setup_mlflow
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_run(
+    run_id: str,
+    params_file: str = "params.yaml",
+    config_file: str = "config.yaml",
+    augments_config: str = "auguments.yaml",
+    calibration_batches: int = 10,
+    backend: Optional[str] = None,
+    use_preprocessing: bool = False,
+    log_to_mlflow: bool = True
+) -> Dict[str, Any]:
+    """
+    MLflow runのモデルを量子化して評価
+
+    Args:
+        run_id: 学習済みモデルのMLflow run ID
+        params_file: params.yamlファイルのパス（dataセクションとbatch_sizeを使用）
+        config_file: config.yamlファイルのパス（MLflowのtracking URIを使用）
+        augments_config: auguments.yamlファイルのパス
+        calibration_batches: キャリブレーションに使用するvalidデータのバッチ数
+        backend: 量子化バックエンド（Noneの場合は自動選択）
+        use_preprocessing: 前処理を使用するか（学習時と合わせる）
+        log_to_mlflow: 結果をMLflowに記録するか
+
+    Returns:
+        精度・レイテンシ・サイズの比較結果
+    """
+    params = load_params(params_file)
+    config = load_config(config_file)
+    data_config = params.get("data", {})
+    training_config = params.get("training", {})
+
+    setup_mlflow(tracking_uri=config.get("mlflow", {}).get("tracking_uri", "experiments/mlruns"))
+
+    model, meta = load_run_model(run_id, device="cpu")
+    model_name = meta.get("model_name")
+    if model_name not in QUANTIZABLE_MODELS:
+        logger.warning(f"{model_name}は量子化の対象モデル（{list(QUANTIZABLE_MODELS)}）ではありません")
+
+    if data_config.get("source", "database") == "database":
+        from src.data.packed_dataset import _setup_django
+        _setup_django()
+
+    datamodule = create_datamodule(
+        data_config=data_config,
+        augments_config=augments_config,
+        batch_size=training_config.get("batch_size", 32),
+        num_workers=training_config.get("num_workers", 4),
+        use_preprocessing=use_preprocessing
+    )
+    datamodule.setup("fit")
+    datamodule.setup("test")
+
+    # validデータでキャリブレーション
+    backend = backend or get_default_backend()
+    quantized = quantize_model(
+        model,
+        datamodule.val_dataloader(),
+        num_batches=calibration_batches,
+        backend=backend
+    )
+
+    # testデータでfp32と比較
+    test_loader = datamodule.test_dataloader()
+    fp32_acc = evaluate_accuracy(model, test_loader)
+    int8_acc = evaluate_accuracy(quantized, test_loader)
+
+    example_input = next(iter(test_loader))[0]
+    fp32_latency = measure_latency(model, example_input)
+    int8_latency = measure_latency(quantized, example_input)
+    fp32_size = model_size_bytes(model)
+    int8_size = model_size_bytes(quantized)
+
+    recorded_test_acc = mlflow.tracking.MlflowClient().get_run(run_id).data.metrics.get("test_acc")
+
+    results = {
+        "model_name": model_name,
+        "backend": backend,
+        "calibration_batches": calibration_batches,
+        "recorded_test_acc": recorded_test_acc,
+        "fp32_test_acc": fp32_acc,
+        "int8_test_acc": int8_acc,
+        "test_acc_delta": int8_acc - fp32_acc,
+        "fp32_latency_ms": fp32_latency,
+        "int8_latency_ms": int8_latency,
+        "speedup": fp32_latency / int8_latency if int8_latency > 0 else None,
+        "fp32_size_mb": fp32_size / (1024 ** 2),
+        "int8_size_mb": int8_size / (1024 ** 2),
+        "size_reduction": fp32_size / int8_size if int8_size > 0 else None,
+        "batch_size": int(example_input.shape[0]),
+    }
+    logger.info(
+        f"量子化結果: test_acc {fp32_acc:.4f} → {int8_acc:.4f} ({int8_acc - fp32_acc:+.4f}), "
+        f"レイテンシ {fp32_latency:.1f}ms → {int8_latency:.1f}ms, "
+        f"サイズ {results['fp32_size_mb']:.1f}MB → {results['int8_size_mb']:.1f}MB"
+    )
+
+    if log_to_mlflow:
+        with tempfile.TemporaryDirectory() as quantized_dir:
+            save_quantized_model(
+                quantized,
+                quantized_dir,
+                example_input,
+                meta={**results, "class_names": meta.get("class_names")}
+            )
+            with mlflow.start_run(run_id=run_id):
+                # 量子化済みモデルを最初に記録する（以降の記録が失敗しても成果物は残す）
+                mlflow.log_artifacts(quantized_dir, artifact_path="quantized")
+                mlflow.log_metrics({
+                    "quantized_test_acc": int8_acc,
+                    "quantized_test_acc_delta": int8_acc - fp32_acc,
+                    "quantized_latency_ms": int8_latency,
+                    "fp32_latency_ms": fp32_latency,
+                    "quantized_size_mb": results["int8_size_mb"],
+                })
+                # 学習済みrunのparamsは変更できない（再実行で値が変わるとエラーになる）ためタグで記録する
+                # （量子化済みモデルのmeta.jsonにも記録済み）
+                mlflow.set_tags({
+                    "quantization_backend": backend,
+                    "quantization_calibration_batches": str(calibration_batches),
+                })
+        logger.info(f"量子化済みモデルをMLflowに記録しました: runs:/{run_id}/quantized")
+
+    return results
@@ -4,19 +4,35 @@
 Lightning Trainerの初期化、Callbacksの設定、MLflowLoggerの設定、学習の実行を行います。
 """
 
+import json
+import tempfile
 import yaml
 import torch
 import pytorch_lightning as pl
 from pytorch_lightning.loggers import MLFlowLogger
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import mlflow
 import mlflow.pytorch
 
-from src.data.datamodule import ClassificationDataModule
+from src.data.packed_dataset import PackedDataModule, read_packed_meta
+from src.data.manifest import ManifestDataModule, load_manifest, compute_file_sha256
+from src.data.image_cache import (
+    PreprocessedImageCache,
+    create_image_cache,
+    compute_preprocessing_hash,
+    load_preprocessing_config,
+)
+from src.data.batch_preprocessing import BatchPreprocessingPipeline
+from src.data.loader_tuning import configure_loader, parse_loader_tune_config, tune_loader
+from src.data.subset import limit_train_split
+from src.models.export import export_model
+from src.models.weights import METADATA_FILE, load_state_dict_file, read_weights_meta, save_weights
 from src.training.lightning_module import ClassificationLightningModule
+from src.training.auto_tune import auto_tune, parse_auto_tune_config
 from src.training.callbacks import get_default_callbacks
+from src.training.trial_context import TrialContext
 from src.utils.mlflow_utils import (
     setup_mlflow,
     log_model_metadata,
@@ -64,6 +80,341 @@ def load_config(config_file: str = "config.yaml") -> Dict[str, Any]:
     return config
 
 
+def create_datamodule(
+    data_config: Dict[str, Any],
+    augments_config: str,
+    batch_size: int,
+    num_workers: int,
+    use_preprocessing: bool = False,
+    image_cache: Optional[PreprocessedImageCache] = None,
+    channels_last: bool = False
+) -> pl.LightningDataModule:
+    """
+    params.yamlのdataセクションに従ってDataModuleを作成
+    
+    Args:
+        data_config: params.yamlのdataセクション
+            source: "database"（デフォルト、Django ORM経由）、"packed"（パック済みデータセット）
+                または "manifest"（マニフェスト）
+            packed_dir: source=packedの場合のディレクトリ
+            manifest_path: source=manifestの場合のマニフェストファイル
+            media_root: source=manifestの場合の画像ルート（省略時はマニフェストの値）
+            image_cache: 前処理済み画像キャッシュの設定（source=manifestの場合）
+            batch_preprocessing: Trueの場合、前処理をcollate時にバッチ単位で適用
+                （source=packed/manifestかつuse_preprocessingの場合）
+        augments_config: auguments.yamlファイルのパス
+        batch_size: バッチサイズ
+        num_workers: DataLoaderのワーカー数
+        use_preprocessing: 前処理を使用するか
+        image_cache: 使用する画像キャッシュ（Noneの場合はdata.image_cacheの設定から作成）
+        channels_last: バッチの画像をchannels_lastで返すか（source=packed/manifestの場合）
+    
+    Returns:
+        DataModule
+    """
+    data_source = data_config.get("source", "database")
+    
+    batch_preprocessing = None
+    if use_preprocessing and data_config.get("batch_preprocessing", False):
+        batch_preprocessing = BatchPreprocessingPipeline.from_config(
+            load_preprocessing_config(augments_config)["preprocessing"]
+        )
+        logger.info(f"バッチ前処理を使用します: {batch_preprocessing}")
+    
+    if data_source == "packed":
+        logger.info(f"パック済みデータセットを使用します: {data_config.get('packed_dir')}")
+        datamodule = PackedDataModule(
+            packed_dir=data_config.get("packed_dir"),
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_preprocessing=use_preprocessing,
+            batch_preprocessing=batch_preprocessing,
+            channels_last=channels_last
+        )
+    elif data_source == "manifest":
+        logger.info(f"マニフェストを使用します: {data_config.get('manifest_path')}")
+        datamodule = ManifestDataModule(
+            manifest_path=data_config.get("manifest_path"),
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_preprocessing=use_preprocessing,
+            media_root=data_config.get("media_root"),
+            image_cache=image_cache if image_cache is not None else create_image_cache(data_config.get("image_cache")),
+            batch_preprocessing=batch_preprocessing,
+            channels_last=channels_last
+        )
+    elif data_source == "database":
+        if batch_preprocessing is not None:
+            logger.warning("data.source=databaseではバッチ前処理は使用できません。画像単位の前処理を使用します")
+        
+        from src.data.datamodule import ClassificationDataModule
+        datamodule = ClassificationDataModule(
+            theme_id=data_config.get("theme_id"),
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_preprocessing=use_preprocessing
+        )
+    else:
+        raise ValueError(f"不明なデータソースです: {data_source}")
+    
+    # trainデータの一部のみを使用（マルチフィデリティのチューニング用）
+    return limit_train_split(
+        datamodule,
+        data_config.get("train_fraction"),
+        seed=data_config.get("subset_seed", 0)
+    )
+
+
+def log_data_snapshot(data_config: Dict[str, Any]):
+    """
+    学習に使用したデータスナップショットをMLflowに記録
+    
+    source=manifestの場合はマニフェストのSHA-256をパラメータとして、
+    マニフェスト自体をartifactとして記録します。
+    
+    Args:
+        data_config: params.yamlのdataセクション
+    """
+    data_source = data_config.get("source", "database")
+    mlflow.log_param("data_source", data_source)
+    
+    if data_source == "manifest":
+        manifest_path = data_config["manifest_path"]
+        mlflow.log_param("manifest_sha256", compute_file_sha256(manifest_path))
+        mlflow.log_artifact(manifest_path, artifact_path="data")
+    elif data_source == "packed":
+        mlflow.log_param("packed_dir", data_config.get("packed_dir"))
+        mlflow.log_artifact(str(Path(data_config["packed_dir"]) / "meta.json"), artifact_path="data")
+
+
+def log_model_weights(
+    pytorch_model: torch.nn.Module,
+    model_name: str,
+    num_classes: int,
+    class_names: list,
+    augments_config: str
+):
+    """
+    重みのみの形式でモデルをMLflowに記録（artifact_path="weights"）
+    
+    Args:
+        pytorch_model: PyTorchモデル
+        model_name: モデル名
+        num_classes: クラス数
+        class_names: クラス名のリスト
+        augments_config: auguments.yamlファイルのパス
+    """
+    preprocessing = load_preprocessing_config(augments_config)
+    with tempfile.TemporaryDirectory() as weights_dir:
+        save_weights(
+            pytorch_model,
+            weights_dir,
+            model_name=model_name,
+            num_classes=num_classes,
+            class_names=class_names,
+            preprocessing_hash=compute_preprocessing_hash(preprocessing["preprocessing"], preprocessing["image"]),
+            run_id=mlflow.active_run().info.run_id
+        )
+        mlflow.log_artifacts(weights_dir, artifact_path="weights")
+
+
+def log_exported_models(
+    pytorch_model: torch.nn.Module,
+    export_config: Dict[str, Any],
+    class_names: list
+):
+    """
+    推論用に書き出したモデル（TorchScript / ONNX）をMLflowに記録（artifact_path="export"）
+    
+    Args:
+        pytorch_model: PyTorchモデル
+        export_config: params.yamlのexportセクション（formats, input_size）
+        class_names: クラス名のリスト
+    """
+    with tempfile.TemporaryDirectory() as export_dir:
+        meta = export_model(
+            pytorch_model,
+            export_dir,
+            input_size=tuple(export_config.get("input_size", (224, 224))),
+            formats=export_config["formats"],
+            class_names=class_names
+        )
+        mlflow.log_artifacts(export_dir, artifact_path="export")
+    logger.info(f"推論用モデルを書き出しました: {list(meta['formats'])}")
+
+
+def log_training_artifacts(
+    model: ClassificationLightningModule,
+    trainer: pl.Trainer,
+    params: Dict[str, Any],
+    augments_config: str,
+    config_file: str,
+    theme_id: int,
+    theme_name: str,
+    class_names: list,
+    num_classes: int
+):
+    """
+    学習後の情報・モデルをアクティブなMLflow runに記録
+    
+    テーマ情報・メタデータ・パラメータ・設定・データのスナップショットと、
+    最良のチェックポイントのモデル（MLflow形式・重みのみの形式・推論用の書き出し）を記録します。
+    モデルはレジストリには登録しません（後でregister_model.pyで登録）。
+    
+    Args:
+        model: 学習済みのLightningModule
+        trainer: 学習に使用したTrainer
+        params: params.yamlの内容
+        augments_config: auguments.yamlファイルのパス
+        config_file: config.yamlファイルのパス
+        theme_id: テーマID
+        theme_name: テーマ名
+        class_names: クラス名のリスト
+        num_classes: クラス数
+    """
+    # テーマ情報のログ
+    mlflow.log_param("theme_id", theme_id)
+    mlflow.log_param("theme_name", theme_name)
+    
+    # メタデータのログ
+    data_version = get_data_version_from_config(config_file)
+    log_model_metadata(
+        data_version=data_version,
+        config_file=config_file,
+        data_dvc_file="data.dvc"
+    )
+    
+    # パラメータの保存とログ
+    save_and_log_params(params, save_path="params_used.yaml")
+    
+    # auguments.yamlのログ
+    mlflow.log_artifact(augments_config, artifact_path="config")
+    log_data_snapshot(params.get("data", {}))
+    
+    # 最良のチェックポイントをロード
+    if trainer.checkpoint_callback and trainer.checkpoint_callback.best_model_path:
+        best_model_path = trainer.checkpoint_callback.best_model_path
+        logger.info(f"最良のチェックポイント: {best_model_path}")
+        model = ClassificationLightningModule.load_from_checkpoint(best_model_path)
+    
+    # PyTorchモデルを取得
+    pytorch_model = model.get_model()
+    
+    # モデルをMLflowにログ（レジストリには登録しない）
+    mlflow.pytorch.log_model(
+        pytorch_model=pytorch_model,
+        artifact_path="model",
+        registered_model_name=None
+    )
+    
+    # クラス名を保存
+    class_names_path = Path("class_names.txt")
+    with open(class_names_path, "w") as f:
+        for class_name in class_names:
+            f.write(f"{class_name}\n")
+    mlflow.log_artifact(str(class_names_path), artifact_path="model")
+    class_names_path.unlink()  # 削除
+    
+    # 重みのみの形式でも保存（推論・再学習時はこちらを読み込む）
+    log_model_weights(
+        pytorch_model,
+        model_name=params.get("model", {}).get("name", "ResNet18"),
+        num_classes=num_classes,
+        class_names=class_names,
+        augments_config=augments_config
+    )
+    
+    # 推論用の形式（conv+bn融合済みのTorchScript / ONNX）で書き出し
+    export_config = params.get("export") or {}
+    if export_config.get("formats"):
+        log_exported_models(pytorch_model, export_config, class_names)
+    
+    logger.info("モデルをMLflowに保存しました（レジストリには登録していません）")
+
+
+PRECISION_CHOICES = ("32-true", "16-mixed", "bf16-mixed")
+
+
+def check_precision_support(precision: str, accelerator: str = "auto"):
+    """
+    精度の設定を確認
+    
+    CPUで学習する場合、16-mixedはLightningによりbf16-mixedとして実行されます。
+    bf16-mixedはAVX512-BF16/AMXを持つCPUでのみ高速になるため、ない場合は警告します。
+    
+    Args:
+        precision: 精度（"32-true", "16-mixed", "bf16-mixed"）
+        accelerator: アクセラレータ
+    """
+    if precision not in PRECISION_CHOICES:
+        raise ValueError(f"サポートされていない精度です: {precision}（{', '.join(PRECISION_CHOICES)}）")
+    
+    on_cpu = accelerator == "cpu" or (accelerator == "auto" and not torch.cuda.is_available())
+    if not on_cpu or precision == "32-true":
+        return
+    if precision == "16-mixed":
+        logger.warning("CPUでは16-mixedはbf16-mixedとして実行されます")
+    if not torch.backends.mkldnn.is_available() or not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        logger.warning(f"このCPUはbf16に対応していないため、{precision}では高速化されない可能性があります")
+
+
+def resolve_theme(data_config: Dict[str, Any]) -> Tuple[int, str]:
+    """
+    params.yamlのdataセクションから学習対象のテーマを取得
+    
+    source=packed/manifestの場合はメタ情報から、source=databaseの場合はDBから取得します。
+    
+    Args:
+        data_config: params.yamlのdataセクション
+    
+    Returns:
+        (テーマID, テーマ名)
+    """
+    project_root = Path(__file__).resolve().parent.parent.parent
+    data_source = data_config.get("source", "database")
+    
+    if data_source == "packed":
+        # パック済みデータセットの場合はDBにアクセスせず、meta.jsonからテーマ情報を取得
+        packed_dir = data_config.get("packed_dir")
+        if not packed_dir:
+            raise ValueError("data.source=packedの場合はdata.packed_dirを設定してください")
+        packed_meta = read_packed_meta(packed_dir)
+        theme_id = packed_meta["theme_id"]
+        theme_name = packed_meta["theme_name"]
+    elif data_source == "manifest":
+        # マニフェストの場合もDBにアクセスしない
+        manifest_path = data_config.get("manifest_path")
+        if not manifest_path:
+            raise ValueError("data.source=manifestの場合はdata.manifest_pathを設定してください")
+        manifest_meta, _ = load_manifest(manifest_path)
+        theme_id = manifest_meta["theme_id"]
+        theme_name = manifest_meta["theme_name"]
+    else:
+        # theme_idを取得
+        theme_id = data_config.get("theme_id")
+        if theme_id is None:
+            raise ValueError("theme_idがparams.yamlのdataセクションに設定されていません")
+        
+        # Django環境のセットアップとテーマ名の取得
+        import sys
+        import os
+        sys.path.insert(0, str(project_root / 'src' / 'web'))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        import django
+        django.setup()
+        
+        from data_management.crud import get_theme
+        theme = get_theme(theme_id=theme_id)
+        if theme is None:
+            raise ValueError(f"テーマID {theme_id} が見つかりません")
+        
+        theme_name = theme.name
+    return theme_id, theme_name
+
+
 def train(
     params_file: str = "params.yaml",
     config_file: str = "config.yaml",
@@ -73,6 +424,8 @@ def train(
     enable_mlflow: bool = True,
     run_name: Optional[str] = None,
     mlflow_run_id: Optional[str] = None,
+    extra_callbacks: Optional[List[pl.Callback]] = None,
+    trial_context: Optional[TrialContext] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
@@ -87,6 +440,8 @@ def train(
         enable_mlflow: MLflowを使用するか
         run_name: MLflow run名
         mlflow_run_id: 既存のMLflow run ID（指定した場合はそのrunを使用）
+        extra_callbacks: 追加するCallbacks（Optunaの枝刈りなど）
+        trial_context: トライアル間で再利用するコンテキスト（テーマ情報・事前学習済みの重み・DataModule）
         **kwargs: その他のパラメータ
     
     Returns:
@@ -101,26 +456,14 @@ def train(
     training_config = params.get("training", {})
     data_config = params.get("data", {})
     
-    # theme_idを取得
-    theme_id = data_config.get("theme_id")
-    if theme_id is None:
-        raise ValueError("theme_idがparams.yamlのdataセクションに設定されていません")
-    
-    # Django環境のセットアップとテーマ名の取得
-    import sys
-    import os
     project_root = Path(__file__).resolve().parent.parent.parent
-    sys.path.insert(0, str(project_root / 'src' / 'web'))
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-    import django
-    django.setup()
-    
-    from data_management.crud import get_theme
-    theme = get_theme(theme_id=theme_id)
-    if theme is None:
-        raise ValueError(f"テーマID {theme_id} が見つかりません")
     
-    theme_name = theme.name
+    if trial_context is not None:
+        theme_id, theme_name = trial_context.get_or_create(
+            "theme", json.dumps(data_config, sort_keys=True, default=str), lambda: resolve_theme(data_config)
+        )
+    else:
+        theme_id, theme_name = resolve_theme(data_config)
     logger.info(f"テーマ '{theme_name}' (ID: {theme_id}) のデータを使用して学習を開始します")
     
     # MLflowのセットアップ（実験名をテーマ名に設定）
@@ -138,17 +481,34 @@ def train(
         if run_name:
             logger.info(f"MLflow run名: '{run_name}'")
     
-    # DataModuleの作成（Djangoベース）
+    # DataModuleの作成
     batch_size = training_config.get("batch_size", 32)
     num_workers = training_config.get("num_workers", 4)
-    
-    datamodule = ClassificationDataModule(
-        theme_id=theme_id,
-        augments_config=augments_config,
-        batch_size=batch_size,
-        num_workers=num_workers,
-        use_preprocessing=kwargs.get("use_preprocessing", False)
-    )
+    channels_last = training_config.get("channels_last", False)
+    compile_setting = kwargs.get("compile") or training_config.get("compile")
+    accelerator = kwargs.get("accelerator", "auto")
+    # 引数で指定されていなければparams.yamlのtraining.precisionを使用（Optunaでチューニング可能）
+    precision = kwargs.get("precision") or training_config.get("precision", "32-true")
+    check_precision_support(precision, accelerator)
+    
+    if trial_context is not None:
+        datamodule = trial_context.get_datamodule(
+            data_config=data_config,
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_preprocessing=kwargs.get("use_preprocessing", False),
+            channels_last=channels_last
+        )
+    else:
+        datamodule = create_datamodule(
+            data_config=data_config,
+            augments_config=augments_config,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            use_preprocessing=kwargs.get("use_preprocessing", False),
+            channels_last=channels_last
+        )
     
     # DataModuleのセットアップ（クラス数の取得のため）
     datamodule.setup("fit")
@@ -164,6 +524,11 @@ def train(
     # チェックポイントパスの取得
     checkpoint_path = training_config.get("checkpoint_path")
     
+    # 事前学習済みの重みはトライアル間で再利用（分類ヘッドは毎回作り直す）
+    backbone_state_dict = None
+    if trial_context is not None and model_config.get("pretrained", True):
+        backbone_state_dict = trial_context.get_backbone_state_dict(model_config.get("name", "ResNet18"))
+    
     # LightningModuleの作成
     model = ClassificationLightningModule(
         model_name=model_config.get("name", "ResNet18"),
@@ -175,7 +540,10 @@ def train(
         scheduler=training_config.get("scheduler"),
         scheduler_params=training_config.get("scheduler_params"),
         pretrained=model_config.get("pretrained", True),
-        freeze_backbone=model_config.get("freeze_backbone", False)
+        freeze_backbone=model_config.get("freeze_backbone", False),
+        backbone_state_dict=backbone_state_dict,
+        channels_last=channels_last,
+        compile=compile_setting
     )
     
     # チェックポイントから重みを読み込む
@@ -192,40 +560,31 @@ def train(
                 # 先頭のスラッシュを削除して、project_rootからの相対パスとして扱う
                 artifact_path = artifact_path.lstrip('/')
                 # experiments/mlruns/{experiment_id}/{run_id}/artifacts/model の形式
-                checkpoint_file = project_root / artifact_path / 'model.pth'
+                model_dir = project_root / artifact_path
             elif checkpoint_path.startswith('file://'):
-                checkpoint_file = Path(checkpoint_path[7:]) / 'model.pth'
+                model_dir = Path(checkpoint_path[7:])
             else:
                 # ファイルシステムパスの場合（既にmodelディレクトリを指している）
-                checkpoint_file = Path(checkpoint_path) / 'model.pth'
+                model_dir = Path(checkpoint_path)
+            
+            # 重みのみの形式（同じrunのweights artifact）を優先し、なければ旧形式のmodel.pthを使用
+            # 旧形式（モデル全体をpickleしたmodel.pth）の場合のみpickleの読み込みを許可する
+            weights_dir = model_dir.parent / 'weights'
+            allow_pickle = False
+            if (weights_dir / METADATA_FILE).exists():
+                checkpoint_file = weights_dir / read_weights_meta(weights_dir)['weights_file']
+            elif (model_dir / 'data' / 'model.pth').exists():
+                checkpoint_file = model_dir / 'data' / 'model.pth'
+                allow_pickle = True
+            else:
+                checkpoint_file = model_dir / 'model.pth'
+                allow_pickle = True
             
             # チェックポイントファイルが存在するか確認
             if checkpoint_file.exists():
                 logger.info(f"チェックポイントから重みを読み込みます: {checkpoint_file}")
-                # PyTorchモデルを読み込む
-                checkpoint = torch.load(checkpoint_file, map_location='cpu')
-                
-                # チェックポイントがLightningModuleの形式か、通常のPyTorchモデルの形式かを判定
-                if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
-                    # LightningModuleのチェックポイント形式
-                    state_dict = checkpoint['state_dict']
-                    # 'model.'プレフィックスを削除（LightningModuleのstate_dictには'model.'が付く場合がある）
-                    model_state_dict = {}
-                    for k, v in state_dict.items():
-                        if k.startswith('model.'):
-                            model_state_dict[k[6:]] = v
-                        else:
-                            model_state_dict[k] = v
-                    model.model.load_state_dict(model_state_dict, strict=False)
-                else:
-                    # 通常のPyTorchモデルの形式
-                    if isinstance(checkpoint, dict) and 'model' in checkpoint:
-                        # ネストされた形式
-                        model.model.load_state_dict(checkpoint['model'], strict=False)
-                    else:
-                        # 直接モデルのstate_dict
-                        model.model.load_state_dict(checkpoint, strict=False)
-                
+                # Lightningのチェックポイント（'model.'プレフィックス付き）や旧形式もstate_dictに正規化される
+                model.model.load_state_dict(load_state_dict_file(checkpoint_file, allow_pickle=allow_pickle), strict=False)
                 logger.info("チェックポイントから重みを読み込みました")
             else:
                 logger.warning(f"チェックポイントファイルが見つかりません: {checkpoint_file}")
@@ -233,12 +592,54 @@ def train(
             logger.warning(f"チェックポイントの読み込みに失敗しました: {e}")
             logger.warning("新しいモデルとして学習を開始します")
     
+    # 学習前の自動チューニング（探索した値はparams_used.yamlに保存される）
+    auto_tune_results = {}
+    auto_tune_config = parse_auto_tune_config(training_config.get("auto_tune"))
+    if auto_tune_config:
+        auto_tune_results = auto_tune(
+            model,
+            datamodule,
+            auto_tune_config,
+            accelerator=accelerator,
+            precision=precision,
+            trial_context=trial_context
+        )
+        training_config["batch_size"] = datamodule.batch_size
+        training_config["learning_rate"] = model.hparams.learning_rate
+    
+    # DataLoaderの設定（auto_tuneの場合はスループットを計測して選択し、params_used.yamlに保存）
+    loader_config = dict(training_config.get("loader") or {})
+    loader_tune_config = parse_loader_tune_config(loader_config.pop("auto_tune", None))
+    configure_loader(datamodule, loader_config)
+    loader_tune_results = {}
+    if loader_tune_config:
+        loader_tune_results = tune_loader(
+            datamodule,
+            loader_tune_config,
+            cache_key={
+                "theme_id": theme_id,
+                "data": data_config,
+                "augments_sha256": compute_file_sha256(augments_config) if Path(augments_config).exists() else None,
+                "use_preprocessing": kwargs.get("use_preprocessing", False),
+                "channels_last": channels_last,
+            }
+        )
+        training_config["num_workers"] = loader_tune_results["num_workers"]
+        training_config["loader"] = {
+            **(training_config.get("loader") or {}),
+            **{key: value for key, value in loader_tune_results.items() if key in ("prefetch_factor", "pin_memory")},
+        }
+    
     # Callbacksの作成
     callbacks = get_default_callbacks(
         checkpoint_dir=checkpoint_dir,
         monitor=kwargs.get("monitor", "val_loss"),
-        patience=training_config.get("patience", 10)
+        patience=training_config.get("patience", 10),
+        log_grad_norm=training_config.get("log_grad_norm", False),
+        profiling=training_config.get("profiling")
     )
+    if extra_callbacks:
+        callbacks.extend(extra_callbacks)
     
     # Loggerの作成
     loggers = []
@@ -263,10 +664,15 @@ def train(
                 log_model=False  # 手動でログする
             )
         loggers.append(mlflow_logger)
+        tuned_params = {
+            **{f"auto_tune.{key}": value for key, value in auto_tune_results.items()},
+            **{f"loader_tune.{key}": value for key, value in loader_tune_results.items()},
+        }
+        if tuned_params:
+            mlflow_logger.log_hyperparams(tuned_params)
     
     # Trainerの作成
     num_epochs = training_config.get("num_epochs", 100)
-    accelerator = kwargs.get("accelerator", "auto")
     devices = kwargs.get("devices", "auto")
     
     trainer = pl.Trainer(
@@ -280,10 +686,13 @@ def train(
         val_check_interval=kwargs.get("val_check_interval", 1.0),
         gradient_clip_val=training_config.get("gradient_clip_val"),
         accumulate_grad_batches=training_config.get("accumulate_grad_batches", 1),
-        precision=kwargs.get("precision", "32-true"),
+        precision=precision,
     )
     
-    logger.info(f"Trainer作成: max_epochs={num_epochs}, accelerator={accelerator}, devices={devices}")
+    logger.info(
+        f"Trainer作成: max_epochs={num_epochs}, accelerator={accelerator}, devices={devices}, "
+        f"precision={precision}, channels_last={channels_last}"
+    )
     
     # 学習の実行
     logger.info("学習を開始します...")
@@ -301,95 +710,17 @@ def train(
         # mlflow_run_idが指定されている場合は新たにstart_runしない
         if mlflow_run_id:
             # 既存のrunを使用している場合は、直接mlflow APIを使う
-            # テーマ情報のログ
-            mlflow.log_param("theme_id", theme_id)
-            mlflow.log_param("theme_name", theme_name)
-            
-            # メタデータのログ
-            data_version = get_data_version_from_config(config_file)
-            log_model_metadata(
-                data_version=data_version,
-                config_file=config_file,
-                data_dvc_file="data.dvc"
-            )
-            
-            # パラメータの保存とログ
-            save_and_log_params(params, save_path="params_used.yaml")
-            
-            # auguments.yamlのログ
-            mlflow.log_artifact(augments_config, artifact_path="config")
-            
-            # 最良のチェックポイントをロード
-            if trainer.checkpoint_callback and trainer.checkpoint_callback.best_model_path:
-                best_model_path = trainer.checkpoint_callback.best_model_path
-                logger.info(f"最良のチェックポイント: {best_model_path}")
-                model = ClassificationLightningModule.load_from_checkpoint(best_model_path)
-            
-            # PyTorchモデルを取得
-            pytorch_model = model.get_model()
-            
-            # モデルをMLflowにログ（レジストリには登録しない）
-            mlflow.pytorch.log_model(
-                pytorch_model=pytorch_model,
-                artifact_path="model",
-                registered_model_name=None  # レジストリには登録しない
+            log_training_artifacts(
+                model, trainer, params, augments_config, config_file,
+                theme_id, theme_name, class_names, num_classes
             )
-            
-            # クラス名を保存
-            class_names_path = Path("class_names.txt")
-            with open(class_names_path, "w") as f:
-                for class_name in class_names:
-                    f.write(f"{class_name}\n")
-            mlflow.log_artifact(str(class_names_path), artifact_path="model")
-            class_names_path.unlink()  # 削除
-            
-            logger.info("モデルをMLflowに保存しました（レジストリには登録していません）")
         else:
             # 新しいrunの場合は、明示的にrunコンテキストを使用
             with mlflow.start_run(run_id=mlflow_logger.run_id):
-                # テーマ情報のログ
-                mlflow.log_param("theme_id", theme_id)
-                mlflow.log_param("theme_name", theme_name)
-                
-                # メタデータのログ
-                data_version = get_data_version_from_config(config_file)
-                log_model_metadata(
-                    data_version=data_version,
-                    config_file=config_file,
-                    data_dvc_file="data.dvc"
-                )
-                
-                # パラメータの保存とログ
-                save_and_log_params(params, save_path="params_used.yaml")
-                
-                # auguments.yamlのログ
-                mlflow.log_artifact(augments_config, artifact_path="config")
-                
-                # 最良のチェックポイントをロード
-                if trainer.checkpoint_callback and trainer.checkpoint_callback.best_model_path:
-                    best_model_path = trainer.checkpoint_callback.best_model_path
-                    logger.info(f"最良のチェックポイント: {best_model_path}")
-                    model = ClassificationLightningModule.load_from_checkpoint(best_model_path)
-                
-                # PyTorchモデルを取得
-                pytorch_model = model.get_model()
-                
-                # モデルをMLflowにログ
-                mlflow.pytorch.log_model(
-                    pytorch_model=pytorch_model,
-                    artifact_path="model",
-                    registered_model_name=None  # 後でregister_model.pyで登録
+                log_training_artifacts(
+                    model, trainer, params, augments_config, config_file,
+                    theme_id, theme_name, class_names, num_classes
                 )
-                
-                # クラス名を保存
-                class_names_path = Path("class_names.txt")
-                with open(class_names_path, "w") as f:
-                    for class_name in class_names:
-                        f.write(f"{class_name}\n")
-                mlflow.log_artifact(str(class_names_path), artifact_path="model")
-                class_names_path.unlink()  # 削除
-                
-                logger.info("モデルをMLflowに保存しました")
     
     # 学習結果
     results = {
@@ -397,6 +728,8 @@ def train(
         "best_model_path": trainer.checkpoint_callback.best_model_path if trainer.checkpoint_callback else None,
         "mlflow_run_id": mlflow_logger.run_id if mlflow_logger else None,
         "trainer_callback_metrics": dict(trainer.callback_metrics),  # train/validのメトリクス
+        "auto_tune_results": auto_tune_results,
+        "loader_tune_results": loader_tune_results,
     }
     
     logger.info("学習が完了しました")
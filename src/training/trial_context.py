@@ -0,0 +1,159 @@
+"""
+トライアルコンテキスト
+
+同じプロセスで学習を繰り返す場合（Optunaのトライアルなど）に、
+トライアル間で変わらないものを保持して再利用します。
+
+- テーマ情報（DB・メタ情報の読み込み）
+- 事前学習済みバックボーンのstate_dict（torchvisionの重みの読み込み）
+- DataModule（データセットのインデックス）
+- 前処理済み画像のキャッシュ
+
+各トライアルでは分類ヘッドとオプティマイザのみを作り直します。
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pytorch_lightning as pl
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def _config_key(config: Any) -> str:
+    """設定（辞書など）をキャッシュのキーに変換"""
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class TrialContext:
+    """
+    トライアル間で再利用するオブジェクトを保持するコンテキスト
+
+    train()のtrial_context引数に渡して使用します。プロセス内でのみ有効です
+    （並列ワーカーではワーカーごとに作成します）。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, namespace: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        キャッシュ済みの値を取得し、なければ作成して保持
+
+        Args:
+            namespace: 種類（"theme", "backbone" など）
+            key: キー
+            factory: 値を作成する関数
+
+        Returns:
+            キャッシュ済みまたは作成した値
+        """
+        entry_key = (namespace, key)
+        with self._lock:
+            if entry_key in self._entries:
+                self.hits += 1
+                return self._entries[entry_key]
+
+        value = factory()
+        with self._lock:
+            self.misses += 1
+            return self._entries.setdefault(entry_key, value)
+
+    def get_backbone_state_dict(self, model_name: str) -> Dict[str, torch.Tensor]:
+        """
+        事前学習済みバックボーンのstate_dictを取得（最終層を除く）
+
+        Args:
+            model_name: モデル名
+
+        Returns:
+            ResNetClassifierのbackbone_state_dictに渡すstate_dict
+        """
+        from src.models.resnet import load_pretrained_backbone_state_dict
+
+        def _load():
+            logger.info(f"事前学習済みの重みを読み込みます: {model_name}")
+            return load_pretrained_backbone_state_dict(model_name)
+
+        return self.get_or_create("backbone", model_name, _load)
+
+    def get_image_cache(self, cache_config: Optional[Dict[str, Any]]):
+        """
+        data.image_cache設定に対応する画像キャッシュを取得
+
+        Args:
+            cache_config: data.image_cacheセクション
+
+        Returns:
+            PreprocessedImageCache（無効な場合はNone）
+        """
+        from src.data.image_cache import create_image_cache
+
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        return self.get_or_create(
+            "image_cache",
+            _config_key(cache_config),
+            lambda: create_image_cache(cache_config)
+        )
+
+    def get_datamodule(
+        self,
+        data_config: Dict[str, Any],
+        augments_config: str,
+        batch_size: int,
+        num_workers: int,
+        use_preprocessing: bool = False,
+        channels_last: bool = False
+    ) -> pl.LightningDataModule:
+        """
+        DataModuleを取得
+
+        dataセクションと前処理の設定が同じ場合は作成済みのDataModule（セットアップ済みの
+        データセットと画像キャッシュ）を再利用し、batch_sizeとnum_workersのみ更新します。
+
+        Args:
+            data_config: params.yamlのdataセクション
+            augments_config: auguments.yamlファイルのパス
+            batch_size: バッチサイズ
+            num_workers: DataLoaderのワーカー数
+            use_preprocessing: 前処理を使用するか
+            channels_last: バッチの画像をchannels_lastで返すか
+
+        Returns:
+            DataModule
+        """
+        from src.training.train import create_datamodule
+
+        key = (_config_key(data_config), augments_config, use_preprocessing, channels_last)
+        datamodule = self.get_or_create(
+            "datamodule",
+            key,
+            lambda: create_datamodule(
+                data_config=data_config,
+                augments_config=augments_config,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                use_preprocessing=use_preprocessing,
+                image_cache=self.get_image_cache(data_config.get("image_cache")),
+                channels_last=channels_last
+            )
+        )
+        datamodule.batch_size = batch_size
+        datamodule.num_workers = num_workers
+        return datamodule
+
+    def clear(self):
+        """保持しているオブジェクトをすべて破棄"""
+        with self._lock:
+            self._entries.clear()
+
+    def __repr__(self):
+        namespaces = sorted({namespace for namespace, _ in self._entries})
+        return f"TrialContext(entries={namespaces}, hits={self.hits}, misses={self.misses})"
@@ -16,13 +16,22 @@ import optuna
 import yaml
 import mlflow
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import copy
+import math
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
+import time
 
-from src.training.train import train as train_model
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+from src.training.callbacks import OptunaPruningCallback
+from src.training.train import resolve_theme, train as train_model
+from src.training.trial_context import TrialContext
 from src.utils.params_schema import (
     materialize_params,
     extract_tunable_specs,
@@ -60,6 +69,155 @@ def _suggest_value(trial: optuna.Trial, path: str, spec: Dict[str, Any]):
     raise ValueError(f"サポートされていないパラメータタイプ: {param_type}")
 
 
+PRUNER_TYPES = ("none", "median", "successive_halving", "hyperband")
+
+
+def create_pruner(pruner_config: Optional[Dict[str, Any]]) -> optuna.pruners.BasePruner:
+    """
+    params.yamlのoptuna.pruner設定からPrunerを作成
+    
+    例:
+        pruner:
+          type: median            # none / median / successive_halving / hyperband
+          n_startup_trials: 5     # その他のキーは各Prunerの引数として渡す
+          n_warmup_steps: 2
+          monitor: val_acc        # 報告するメトリクス（省略時はdirectionから決定）
+    
+    Args:
+        pruner_config: Pruner設定（Noneの場合は枝刈りしない）
+    
+    Returns:
+        Pruner
+    """
+    pruner_config = dict(pruner_config or {})
+    pruner_type = pruner_config.pop("type", "none")
+    pruner_config.pop("monitor", None)
+    
+    if pruner_type == "none":
+        return optuna.pruners.NopPruner()
+    if pruner_type == "median":
+        return optuna.pruners.MedianPruner(**pruner_config)
+    if pruner_type == "successive_halving":
+        return optuna.pruners.SuccessiveHalvingPruner(**pruner_config)
+    if pruner_type == "hyperband":
+        return optuna.pruners.HyperbandPruner(**pruner_config)
+    
+    raise ValueError(f"サポートされていないPrunerです: {pruner_type}（{', '.join(PRUNER_TYPES)}）")
+
+
+def get_pruning_monitor(optuna_config: Dict[str, Any]) -> Optional[str]:
+    """
+    トライアルに報告する検証メトリクスを取得
+    
+    Prunerは中間値をStudyのdirectionで比較するため、省略時は
+    maximizeならval_acc、minimizeならval_lossを使用します。
+    
+    Args:
+        optuna_config: Optuna設定
+    
+    Returns:
+        メトリクス名（枝刈りしない場合はNone）
+    """
+    pruner_config = optuna_config.get("pruner") or {}
+    if pruner_config.get("type", "none") == "none":
+        return None
+    direction = optuna_config.get("direction", "maximize")
+    default = "val_acc" if direction == "maximize" else "val_loss"
+    monitor = pruner_config.get("monitor", default)
+    if "loss" in monitor and direction == "maximize":
+        logger.warning(f"direction=maximize のStudyで{monitor}を報告すると、良いトライアルが枝刈りされます")
+    return monitor
+
+
+FIDELITY_RESOURCES = ("data", "epochs", "both")
+
+
+def get_fidelity_budgets(fidelity_config: Optional[Dict[str, Any]]) -> Optional[List[float]]:
+    """
+    params.yamlのoptuna.fidelity設定から段（rung）ごとの予算を計算
+    
+    予算はフル予算（trainデータ全体・num_epochs）に対する割合で、
+    最上段が1.0、1段下がるごとにreduction_factor分の1になります。
+    
+    例:
+        fidelity:
+          resource: data        # data（trainデータの割合）/ epochs（エポック数）/ both
+          min_budget: 0.1       # 最下段の予算の下限
+          reduction_factor: 3   # 段ごとの予算の倍率（次の段に進むトライアルは1/reduction_factor）
+    
+    Args:
+        fidelity_config: マルチフィデリティ設定（Noneの場合は使用しない）
+    
+    Returns:
+        段ごとの予算（昇順）。使用しない場合はNone
+    """
+    if not fidelity_config:
+        return None
+    
+    resource = fidelity_config.get("resource", "data")
+    if resource not in FIDELITY_RESOURCES:
+        raise ValueError(f"サポートされていないresourceです: {resource}（{', '.join(FIDELITY_RESOURCES)}）")
+    min_budget = float(fidelity_config.get("min_budget", 0.1))
+    if not 0.0 < min_budget <= 1.0:
+        raise ValueError(f"min_budgetは0より大きく1以下である必要があります: {min_budget}")
+    reduction_factor = float(fidelity_config.get("reduction_factor", 3))
+    if reduction_factor <= 1.0:
+        raise ValueError(f"reduction_factorは1より大きい必要があります: {reduction_factor}")
+    
+    n_rungs = int(math.floor(math.log(1.0 / min_budget) / math.log(reduction_factor) + 1e-9)) + 1
+    return [reduction_factor ** (rung - (n_rungs - 1)) for rung in range(n_rungs)]
+
+
+def apply_fidelity_budget(params: Dict[str, Any], budget: float, resource: str) -> Dict[str, Any]:
+    """
+    トライアルのパラメータに予算を反映
+    
+    Args:
+        params: トライアルのパラメータ（変更されます）
+        budget: 予算（フル予算に対する割合）
+        resource: "data" / "epochs" / "both"
+    
+    Returns:
+        反映した予算（MLflowに記録する値）
+    """
+    applied = {"fidelity_budget": budget}
+    if resource in ("data", "both"):
+        data_config = params.setdefault("data", {})
+        train_fraction = float(data_config.get("train_fraction") or 1.0) * budget
+        data_config["train_fraction"] = train_fraction
+        applied["budget_train_fraction"] = train_fraction
+    if resource in ("epochs", "both"):
+        training_config = params.setdefault("training", {})
+        num_epochs = max(1, math.ceil(training_config.get("num_epochs", 100) * budget))
+        training_config["num_epochs"] = num_epochs
+        applied["budget_num_epochs"] = num_epochs
+    return applied
+
+
+def _exclude_tuned_from_auto_tune(params: Dict[str, Any], tunable_specs: Dict[str, Dict[str, Any]]):
+    """
+    Optunaの探索対象になっている値をtraining.auto_tune・training.loader.auto_tuneの対象から外す
+    
+    Args:
+        params: トライアルのパラメータ（更新される）
+        tunable_specs: 探索対象のパラメータ
+    """
+    training_config = params.get("training") or {}
+    auto_tune_config = training_config.get("auto_tune")
+    if auto_tune_config:
+        auto_tune_config = {} if auto_tune_config is True else dict(auto_tune_config)
+        for key in ("batch_size", "learning_rate"):
+            if f"training.{key}" in tunable_specs and auto_tune_config.get(key, True):
+                auto_tune_config[key] = False
+                logger.info(f"training.{key}はOptunaで探索するため、自動チューニングの対象から外します")
+        training_config["auto_tune"] = auto_tune_config
+    
+    loader_config = training_config.get("loader") or {}
+    if loader_config.get("auto_tune") and "training.num_workers" in tunable_specs:
+        training_config["loader"] = {**loader_config, "auto_tune": False}
+        logger.info("training.num_workersはOptunaで探索するため、DataLoaderの自動チューニングを無効にします")
+
+
 def objective(
     trial: optuna.Trial,
     optuna_config: Dict[str, Any],
@@ -89,16 +247,42 @@ def objective(
         value = _suggest_value(trial, path, spec)
         set_nested_value(params, path.split("."), value)
     
-    # params.yamlを一時ファイルとして保存
-    temp_params_file = f"params_trial_{trial.number}.yaml"
+    # Optunaで探索するバッチサイズ・学習率は学習前の自動チューニングで上書きしない
+    _exclude_tuned_from_auto_tune(params, tunable_specs)
+    
+    # マルチフィデリティ: 段（rung）に応じた予算で学習（上の段のトライアルはenqueue時に段を指定）
+    budget = None
+    fidelity_budgets = get_fidelity_budgets(optuna_config.get("fidelity"))
+    if fidelity_budgets is not None:
+        rung = min(trial.user_attrs.get("fidelity_rung", 0), len(fidelity_budgets) - 1)
+        trial.set_user_attr("fidelity_rung", rung)
+        budget = apply_fidelity_budget(params, fidelity_budgets[rung], optuna_config["fidelity"].get("resource", "data"))
+        budget["fidelity_rung"] = rung
+        trial.set_user_attr("fidelity_budget", budget["fidelity_budget"])
+        logger.info(f"Trial {trial.number}: rung={rung}, 予算={budget}")
+    
+    # params.yamlを一時ファイルとして保存（並列実行時に衝突しないようトライアルごとのディレクトリに作成）
+    trial_dir = tempfile.mkdtemp(prefix=f"optuna_trial_{trial.number}_")
+    temp_params_file = str(Path(trial_dir) / f"params_trial_{trial.number}.yaml")
     with open(temp_params_file, "w") as f:
         yaml.dump(params, f, default_flow_style=False)
     
+    # チェックポイントもトライアルごとに分ける
+    if kwargs.get("checkpoint_dir"):
+        kwargs = {**kwargs, "checkpoint_dir": str(Path(kwargs["checkpoint_dir"]) / f"trial_{trial.number}")}
+    
     logger.info(f"Trial {trial.number}: {temp_params_file} を生成しました")
     
     # 子ラン名をtrial番号に設定
     child_run_name = f"trial_{trial.number}"
     
+    # 枝刈り用のCallback
+    pruning_callback = None
+    pruning_monitor = get_pruning_monitor(optuna_config)
+    if pruning_monitor is not None:
+        pruning_callback = OptunaPruningCallback(trial, monitor=pruning_monitor)
+        kwargs = {**kwargs, "extra_callbacks": [*kwargs.get("extra_callbacks", []), pruning_callback]}
+    
     # 変数の初期化（スコープ対策）
     child_run_id = None
     test_results = None
@@ -106,8 +290,12 @@ def objective(
     
     try:
         # 親子ラン構造で学習を実行
-        # 親ランは既にアクティブなので、直接子ランを作成
-        with mlflow.start_run(run_name=child_run_name, nested=True) as child_run:
+        # 親ランがアクティブな場合はネストし、ワーカープロセスでは親ランIDのタグで紐付ける
+        with mlflow.start_run(
+            run_name=child_run_name,
+            nested=True,
+            tags={MLFLOW_PARENT_RUN_ID: parent_run_id}
+        ) as child_run:
             child_run_id = child_run.info.run_id
             logger.info(f"Trial {trial.number}: 子ランID={child_run_id}")
             
@@ -116,19 +304,30 @@ def objective(
                 mlflow.log_param(param_name, param_value)
             
             mlflow.log_param("trial_number", trial.number)
+            if budget is not None:
+                mlflow.log_params(budget)
             
             # 子ランのコンテキスト内で学習を実行
             # 既存の子ランIDを使ってMLFlowLoggerを初期化
             
-            results = train_model(
-                params_file=temp_params_file,
-                config_file=config_file,
-                augments_config=augments_config,
-                enable_mlflow=True,  # MLflowLoggerを使用
-                mlflow_run_id=child_run_id,  # 既存の子ランIDを使用
-                run_name=child_run_name,
-                **kwargs
-            )
+            try:
+                results = train_model(
+                    params_file=temp_params_file,
+                    config_file=config_file,
+                    augments_config=augments_config,
+                    enable_mlflow=True,  # MLflowLoggerを使用
+                    mlflow_run_id=child_run_id,  # 既存の子ランIDを使用
+                    run_name=child_run_name,
+                    **kwargs
+                )
+            except optuna.TrialPruned:
+                # 枝刈りされたトライアルは子ランに状態を記録する
+                mlflow.set_tag("optuna_trial_state", "PRUNED")
+                mlflow.log_param("pruned_epoch", pruning_callback.pruned_epoch)
+                mlflow.log_param("pruning_monitor", pruning_monitor)
+                raise
+            
+            mlflow.set_tag("optuna_trial_state", "COMPLETE")
             
             # 評価メトリクスを取得
             test_results = results["test_results"]
@@ -159,14 +358,198 @@ def objective(
         
         return return_value
     
+    except optuna.TrialPruned:
+        trial.set_user_attr("mlflow_run_id", child_run_id)
+        trial.set_user_attr("pruned_epoch", pruning_callback.pruned_epoch)
+        # 子ランの状態を打ち切り（KILLED）にする
+        mlflow.tracking.MlflowClient().set_terminated(child_run_id, status="KILLED")
+        raise
+    
     except Exception as e:
         logger.error(f"Trial {trial.number} でエラーが発生しました: {e}", exc_info=True)
         raise
     
     finally:
         # 一時ファイルを削除
-        if Path(temp_params_file).exists():
-            Path(temp_params_file).unlink()
+        shutil.rmtree(trial_dir, ignore_errors=True)
+
+
+def create_storage(storage: Optional[str]):
+    """
+    Optunaのストレージを作成
+    
+    "journal:<path>" の場合はジャーナルファイルストレージ、
+    それ以外（"sqlite:///optuna.db" など）はRDBストレージのURLとしてそのまま使用します。
+    
+    Args:
+        storage: ストレージ指定（Noneの場合はインメモリ）
+    
+    Returns:
+        create_study / load_study に渡すストレージ
+    """
+    if storage is None or not storage.startswith("journal:"):
+        return storage
+    
+    journal_path = Path(storage[len("journal:"):])
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        from optuna.storages.journal import JournalFileBackend
+    except ImportError:  # optuna < 4.0
+        from optuna.storages import JournalFileStorage as JournalFileBackend
+    return optuna.storages.JournalStorage(JournalFileBackend(str(journal_path)))
+
+
+def _allocate_worker_resources(worker_id: int, n_workers: int) -> int:
+    """
+    ワーカープロセスにCPUスレッド（とGPU）を割り当てる
+    
+    CPUコアをワーカー数で等分し、各ワーカーのスレッド数とCPUアフィニティを設定します。
+    GPUが複数ある場合はワーカーごとにラウンドロビンで1枚ずつ割り当てます。
+    
+    Args:
+        worker_id: ワーカー番号（0始まり）
+        n_workers: ワーカー数
+    
+    Returns:
+        割り当てたスレッド数
+    """
+    cpu_count = os.cpu_count() or 1
+    n_threads = max(1, cpu_count // n_workers)
+    
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+    
+    import torch
+    torch.set_num_threads(n_threads)
+    
+    if hasattr(os, "sched_setaffinity") and cpu_count >= n_workers:
+        start = worker_id * n_threads
+        try:
+            os.sched_setaffinity(0, range(start, min(start + n_threads, cpu_count)))
+        except OSError as e:
+            logger.warning(f"ワーカー {worker_id}: CPUアフィニティの設定に失敗しました: {e}")
+    
+    if "CUDA_VISIBLE_DEVICES" not in os.environ and torch.cuda.is_available():
+        gpu_count = torch.cuda.device_count()
+        if gpu_count > 1:
+            os.environ["CUDA_VISIBLE_DEVICES"] = str(worker_id % gpu_count)
+    
+    return n_threads
+
+
+def _run_worker(
+    worker_id: int,
+    n_workers: int,
+    study_name: str,
+    storage: str,
+    n_trials: int,
+    timeout: Optional[float],
+    tracking_uri: str,
+    experiment_name: str,
+    log_level: int,
+    objective_kwargs: Dict[str, Any],
+):
+    """
+    ワーカープロセスのエントリポイント
+    
+    共有ストレージのStudyをロードし、Study全体の完了トライアル数がn_trialsに達するまで最適化します。
+    各トライアルは親ランIDのタグで共有の親ランにぶら下がる子ランとして記録されます。
+    
+    Args:
+        worker_id: ワーカー番号（0始まり）
+        n_workers: ワーカー数
+        study_name: Study名
+        storage: ストレージ指定（create_storageの引数）
+        n_trials: Study全体のトライアル数
+        timeout: タイムアウト（秒）
+        tracking_uri: MLflowのtracking URI
+        experiment_name: MLflowの実験名
+        log_level: ログレベル
+        objective_kwargs: objectiveに渡す引数
+    """
+    logging.basicConfig(
+        level=log_level,
+        format=f"%(asctime)s [%(levelname)8s] [worker {worker_id}] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    n_threads = _allocate_worker_resources(worker_id, n_workers)
+    logger.info(f"ワーカー {worker_id}/{n_workers} を開始します: スレッド数={n_threads}")
+    
+    from src.utils.mlflow_utils import setup_mlflow
+    setup_mlflow(tracking_uri=tracking_uri, experiment_name=experiment_name)
+    
+    study = optuna.load_study(
+        study_name=study_name,
+        storage=create_storage(storage),
+        pruner=create_pruner(objective_kwargs["optuna_config"].get("pruner"))
+    )
+    # トライアル間で事前学習済みの重みやデータセットを再利用（ワーカーごと）
+    objective_kwargs = {**objective_kwargs, "trial_context": TrialContext()}
+    study.optimize(
+        lambda trial: objective(trial, **objective_kwargs),
+        timeout=timeout,
+        callbacks=[
+            optuna.study.MaxTrialsCallback(
+                n_trials,
+                states=(optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+            )
+        ],
+    )
+    logger.info(f"ワーカー {worker_id} が終了しました")
+
+
+def _optimize_parallel(
+    n_workers: int,
+    study_name: str,
+    storage: str,
+    n_trials: int,
+    timeout: Optional[float],
+    tracking_uri: str,
+    experiment_name: str,
+    objective_kwargs: Dict[str, Any],
+):
+    """
+    ワーカープロセスを起動して並列に最適化
+    
+    Args:
+        n_workers: ワーカー数
+        study_name: Study名
+        storage: 共有ストレージ指定（SQLiteまたはジャーナルファイル）
+        n_trials: Study全体のトライアル数
+        timeout: タイムアウト（秒）
+        tracking_uri: MLflowのtracking URI
+        experiment_name: MLflowの実験名
+        objective_kwargs: objectiveに渡す引数
+    """
+    # CUDAやスレッドプールを引き継がないようspawnで起動
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for worker_id in range(n_workers):
+        process = context.Process(
+            target=_run_worker,
+            args=(
+                worker_id,
+                n_workers,
+                study_name,
+                storage,
+                n_trials,
+                timeout,
+                tracking_uri,
+                experiment_name,
+                logging.getLogger().getEffectiveLevel(),
+                objective_kwargs,
+            ),
+            name=f"optuna_worker_{worker_id}",
+        )
+        process.start()
+        processes.append(process)
+    
+    for process in processes:
+        process.join()
+    
+    failed = [p.name for p in processes if p.exitcode != 0]
+    if failed:
+        logger.warning(f"異常終了したワーカーがあります: {failed}")
 
 
 def tune(
@@ -177,6 +560,7 @@ def tune(
     study_name: Optional[str] = None,
     load_if_exists: bool = True,
     training_job_id: Optional[int] = None,
+    n_workers: Optional[int] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
@@ -189,9 +573,11 @@ def tune(
         params_file: params.yamlファイルのパス（run_name取得用）
         config_file: config.yamlファイルのパス
         augments_config: auguments.yamlファイルのパス
-        storage: Optunaのストレージ（例: "sqlite:///optuna.db"）
+        storage: Optunaのストレージ（例: "sqlite:///optuna.db", "journal:optuna_journal/study.log"）
         study_name: Study名（Noneの場合は自動生成）
         load_if_exists: 既存のStudyをロードするか
+        training_job_id: TrainingJob ID（Djangoデータベース連携用）
+        n_workers: 並列ワーカープロセス数（Noneの場合はparams.yamlのoptuna.n_workers、既定1）
         **kwargs: その他のパラメータ
     
     Returns:
@@ -208,25 +594,8 @@ def tune(
     training_config = base_params.get("training", {})
     parent_run_name = training_config.get("run_name", "optuna_tuning")
 
-    data_config = base_params.get("data", {})
-    theme_id = data_config.get("theme_id")
-    if theme_id is None:
-        raise ValueError("theme_idがparams.yamlのdataセクションに設定されていません")
-    
-    # Django環境のセットアップ
-    project_root = Path(__file__).resolve().parent.parent.parent
-    sys.path.insert(0, str(project_root / 'src' / 'web'))
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-    import django
-    django.setup()
-    
-    from data_management.crud import get_theme
-    from data_management.models import TrainingJob
-    theme = get_theme(theme_id=theme_id)
-    if theme is None:
-        raise ValueError(f"テーマID {theme_id} が見つかりません")
-    
-    theme_name = theme.name
+    # packed/manifestの場合はDBにアクセスせずにテーマを取得（train()と同じ）
+    theme_id, theme_name = resolve_theme(base_params.get("data", {}))
     logger.info(f"テーマ '{theme_name}' (ID: {theme_id}) でチューニングを開始します")
     
     # MLflowのセットアップ
@@ -251,18 +620,41 @@ def tune(
     direction = optuna_config.get("direction", "maximize")
     n_trials = optuna_config.get("n_trials", 50)
     timeout = optuna_config.get("timeout")
+    if n_workers is None:
+        n_workers = optuna_config.get("n_workers", 1)
+    if n_workers < 1:
+        raise ValueError(f"n_workersは1以上である必要があります: {n_workers}")
+    
+    if n_workers > 1:
+        if storage is None:
+            # ワーカー間でStudyを共有するため、ジャーナルファイルストレージを使用
+            storage = f"journal:optuna_journal/{study_name}.log"
+        elif storage.startswith("sqlite:") and ":memory:" in storage:
+            raise ValueError("並列実行ではインメモリのSQLiteストレージは使用できません")
+        logger.info(f"{n_workers}ワーカーで並列実行します: storage={storage}")
+    
+    pruner = create_pruner(optuna_config.get("pruner"))
     
     # Studyの作成
-    logger.info(f"Optuna Study作成: {study_name}, direction={direction}")
+    logger.info(f"Optuna Study作成: {study_name}, direction={direction}, pruner={type(pruner).__name__}")
     study = optuna.create_study(
         study_name=study_name,
         direction=direction,
-        storage=storage,
-        load_if_exists=load_if_exists
+        storage=create_storage(storage),
+        load_if_exists=load_if_exists,
+        pruner=pruner
     )
     
     training_job = None
     if training_job_id is not None:
+        # TrainingJobと連携する場合のみDjango環境をセットアップ
+        project_root = Path(__file__).resolve().parent.parent.parent
+        sys.path.insert(0, str(project_root / 'src' / 'web'))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        import django
+        django.setup()
+
+        from data_management.models import TrainingJob
         try:
             training_job = TrainingJob.objects.get(id=training_job_id)
         except TrainingJob.DoesNotExist:
@@ -284,6 +676,8 @@ def tune(
         mlflow.log_param("study_name", study_name)
         mlflow.log_param("direction", direction)
         mlflow.log_param("n_trials", n_trials)
+        mlflow.log_param("n_workers", n_workers)
+        mlflow.log_param("pruner", type(pruner).__name__)
         
         # 設定ファイルをログ
         mlflow.log_artifact(params_file, artifact_path="config")
@@ -293,27 +687,103 @@ def tune(
         
         # 最適化の実行
         logger.info(f"最適化を開始します: n_trials={n_trials}, timeout={timeout}")
-        def _objective_wrapper(trial):
-            return objective(
-                trial,
-                optuna_config,
-                parent_run_id=parent_run_id,
-                base_params=base_params,
-                tunable_specs=tunable_specs,
-                config_file=config_file,
-                augments_config=augments_config,
-                **kwargs,
-            )
-
-        study.optimize(
-            _objective_wrapper,
-            n_trials=n_trials,
-            timeout=timeout,
-            show_progress_bar=True,
+        objective_kwargs = dict(
+            optuna_config=optuna_config,
+            parent_run_id=parent_run_id,
+            base_params=base_params,
+            tunable_specs=tunable_specs,
+            config_file=config_file,
+            augments_config=augments_config,
+            **kwargs,
         )
+
+        trial_context = TrialContext()
+        finished_states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
+        def _run_trials(study, count):
+            """count件のトライアルを実行し、Studyを返す"""
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            if n_workers > 1:
+                # MaxTrialsCallbackはStudy全体の件数で判定するため、既存のトライアル数を加える
+                n_finished = len(study.get_trials(deepcopy=False, states=finished_states))
+                _optimize_parallel(
+                    n_workers=n_workers,
+                    study_name=study_name,
+                    storage=storage,
+                    n_trials=n_finished + count,
+                    timeout=remaining,
+                    tracking_uri=tracking_uri,
+                    experiment_name=experiment_name,
+                    objective_kwargs=objective_kwargs,
+                )
+                # ワーカーが書き込んだトライアルを読み直す
+                return optuna.load_study(study_name=study_name, storage=create_storage(storage), pruner=pruner)
+            
+            # トライアル間で事前学習済みの重みやデータセットを再利用
+            study.optimize(
+                lambda trial: objective(trial, trial_context=trial_context, **objective_kwargs),
+                n_trials=count,
+                timeout=remaining,
+                show_progress_bar=True,
+            )
+            return study
+        
+        fidelity_budgets = get_fidelity_budgets(optuna_config.get("fidelity"))
+        if fidelity_budgets is None:
+            study = _run_trials(study, n_trials)
+        else:
+            # 最下段でn_trials件を評価し、各段の上位1/reduction_factorを次の段の予算で再評価する
+            reduction_factor = float(optuna_config["fidelity"].get("reduction_factor", 3))
+            mlflow.log_param("fidelity_budgets", [round(b, 4) for b in fidelity_budgets])
+            first_trial_number = len(study.trials)
+            count = n_trials
+            for rung, rung_budget in enumerate(fidelity_budgets):
+                logger.info(f"rung {rung}: 予算={rung_budget:.4f}, トライアル数={count}")
+                study = _run_trials(study, count)
+                if rung == len(fidelity_budgets) - 1:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    logger.info("タイムアウトのため、次の段には進みません")
+                    break
+                
+                completed = [
+                    t for t in study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+                    if t.number >= first_trial_number and t.user_attrs.get("fidelity_rung") == rung
+                ]
+                if not completed:
+                    logger.warning(f"rung {rung}で完了したトライアルがないため、終了します")
+                    break
+                completed.sort(key=lambda t: t.value, reverse=direction == "maximize")
+                promoted = completed[:max(1, int(len(completed) // reduction_factor))]
+                for t in promoted:
+                    study.enqueue_trial(
+                        t.params,
+                        user_attrs={"fidelity_rung": rung + 1, "promoted_from": t.number}
+                    )
+                count = len(promoted)
+                logger.info(f"rung {rung + 1}に進むトライアル: {[t.number for t in promoted]}")
+        
+        # トライアルの状態を集計
+        n_pruned = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.PRUNED,)))
+        n_complete = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)))
+        logger.info(f"完了したトライアル: {n_complete}, 枝刈りされたトライアル: {n_pruned}")
+        mlflow.log_metric("n_complete_trials", n_complete)
+        mlflow.log_metric("n_pruned_trials", n_pruned)
         
-        # 最良のトライアル
+        # 最良のトライアル（マルチフィデリティの場合は最も予算の大きい段から選ぶ）
         best_trial = study.best_trial
+        if fidelity_budgets is not None:
+            top_trials = [
+                t for t in study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+                if t.number >= first_trial_number and "fidelity_rung" in t.user_attrs
+            ]
+            if top_trials:
+                top_rung = max(t.user_attrs["fidelity_rung"] for t in top_trials)
+                top_trials = [t for t in top_trials if t.user_attrs["fidelity_rung"] == top_rung]
+                select = max if direction == "maximize" else min
+                best_trial = select(top_trials, key=lambda t: t.value)
+                logger.info(f"rung {top_rung}（予算={fidelity_budgets[top_rung]:.4f}）のトライアルから選択しました")
         logger.info(f"最良のトライアル: {best_trial.number}")
         logger.info(f"最良の値: {best_trial.value}")
         logger.info(f"最良のパラメータ: {best_trial.params}")
@@ -83,6 +83,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# テーマの統計情報（data_management/statistics.py）をキャッシュします。
+# 複数プロセスで動かす場合はRedisなどプロセス間で共有されるバックエンドに変更してください
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'image-classifier',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -129,6 +142,12 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = str(BASE_DIR.parent.parent / 'images')
 
+# サムネイル（data_management/thumbnails.py）の保存先。元画像のコンテンツハッシュごとに保存されます
+THUMBNAIL_ROOT = str(BASE_DIR.parent.parent / '.cache' / 'thumbnails')
+
+# 画像の一括取り込み（data_management/ingest.py）のアップロード・展開の作業ディレクトリ
+INGEST_ROOT = str(BASE_DIR.parent.parent / '.cache' / 'ingest')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -20,13 +20,19 @@ urlpatterns = [
     path('', views.theme_list, name='theme_list'),
     path('theme/create/', views.theme_create, name='theme_create'),
     path('theme/<int:theme_id>/', views.theme_detail, name='theme_detail'),
+    path('theme/<int:theme_id>/thumbnail/<int:traindata_id>/', views.thumbnail, name='thumbnail'),
     
     # REST API
     path('api/theme/<int:theme_id>/label/update/<int:traindata_id>/', views.api_update_label, name='api_update_label'),
+    path('api/theme/<int:theme_id>/images/', views.api_traindata_list, name='api_traindata_list'),
     path('api/theme/<int:theme_id>/images/upload/', views.api_upload_images, name='api_upload_images'),
     path('api/theme/<int:theme_id>/images/<int:traindata_id>/', views.api_delete_image, name='api_delete_image'),
+    path('api/theme/<int:theme_id>/ingest/upload/', views.api_ingest_upload, name='api_ingest_upload'),
+    path('api/theme/<int:theme_id>/ingest/start/', views.api_ingest_start, name='api_ingest_start'),
+    path('api/theme/<int:theme_id>/ingest/<str:job_id>/', views.api_ingest_status, name='api_ingest_status'),
     path('api/theme/<int:theme_id>/split/', views.api_split_data, name='api_split_data'),
     path('api/theme/<int:theme_id>/statistics/', views.api_statistics, name='api_statistics'),
+    path('api/theme/<int:theme_id>/duplicates/', views.api_duplicates, name='api_duplicates'),
     
     # モデル開発関連
     path('theme/<int:theme_id>/model/development/', views.model_development, name='model_development'),
@@ -31,8 +31,8 @@ class LabelAdmin(admin.ModelAdmin):
 class TrainDataAdmin(admin.ModelAdmin):
     list_display = ['id', 'theme', 'label', 'split', 'labeled_by', 'created_at']
     list_filter = ['theme', 'label', 'split', 'created_at']
-    search_fields = ['theme__name', 'label__label_name', 'labeled_by']
-    readonly_fields = ['created_at', 'updated_at']
+    search_fields = ['theme__name', 'label__label_name', 'labeled_by', 'content_hash']
+    readonly_fields = ['content_hash', 'perceptual_hash', 'created_at', 'updated_at']
 
 
 @admin.register(Model)
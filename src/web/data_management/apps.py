@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DataManagementConfig(AppConfig):
     name = 'data_management'
+
+    def ready(self):
+        # シグナルハンドラを登録
+        from . import signals  # noqa: F401
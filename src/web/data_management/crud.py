@@ -1,9 +1,14 @@
 """
 CRUD操作のユーティリティ関数
 """
-from typing import List, Optional, Dict
-from django.db.models import Count, Q
+from collections import defaultdict
+from typing import Iterable, List, Optional, Dict, Tuple
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet
+from django.utils import timezone
+from .duplicates import compute_uploaded_file_hashes, get_duplicate_groups, majority
 from .models import Theme, Label, TrainData, Model, ModelTrainData
+from .statistics import SPLIT_KEYS, get_theme_statistics, get_themes_statistics, invalidate_theme_statistics
 import random
 
 
@@ -16,11 +21,13 @@ def get_theme(theme_id: int) -> Optional[Theme]:
 
 
 def get_all_themes() -> List[Theme]:
-    """すべてのテーマを取得"""
-    return Theme.objects.annotate(
-        label_count=Count('labels', distinct=True),
-        image_count=Count('traindata', distinct=True)
-    ).all()
+    """すべてのテーマを取得（label_countとimage_countを付与）"""
+    themes = list(Theme.objects.annotate(label_count=Count('labels')))
+    # 画像数はテーマの統計（キャッシュ）から取得
+    statistics = get_themes_statistics([theme.id for theme in themes])
+    for theme in themes:
+        theme.image_count = statistics[theme.id]['splits']['total']
+    return themes
 
 
 def create_theme(name: str, description: str = "") -> Theme:
@@ -109,6 +116,38 @@ def get_traindata_by_theme(theme_id: int, split: str = None, label_id: int = Non
     return list(queryset.order_by('-created_at'))
 
 
+def filter_traindata(theme_id: int, filter_type: str = 'all', label_id: int = None, split: str = None) -> QuerySet:
+    """
+    一覧表示用にテーマの学習データを絞り込む（ラベルも同時に取得）
+
+    Args:
+        theme_id: テーマID
+        filter_type: 'all' / 'labeled' / 'unlabeled'
+        label_id: ラベルID（Noneの場合は絞り込まない）
+        split: 'train' / 'valid' / 'test' / 'unsplit'（それ以外の場合は絞り込まない）
+
+    Returns:
+        TrainDataのクエリセット
+    """
+    queryset = TrainData.objects.filter(theme_id=theme_id).select_related('label')
+
+    # 基本フィルタ（未ラベル/ラベル済み）
+    if filter_type == 'unlabeled':
+        queryset = queryset.filter(label__isnull=True)
+    elif filter_type == 'labeled':
+        queryset = queryset.filter(label__isnull=False)
+
+    if label_id is not None:
+        queryset = queryset.filter(label_id=label_id)
+
+    if split == 'unsplit':
+        queryset = queryset.filter(split__isnull=True)
+    elif split in ('train', 'valid', 'test'):
+        queryset = queryset.filter(split=split)
+
+    return queryset
+
+
 def get_traindata(theme_id: int, traindata_id: int) -> Optional[TrainData]:
     """学習データを取得"""
     try:
@@ -118,7 +157,7 @@ def get_traindata(theme_id: int, traindata_id: int) -> Optional[TrainData]:
 
 
 def create_traindata(theme_id: int, image, label_id: int = None, labeled_by: str = None) -> Optional[TrainData]:
-    """学習データを作成"""
+    """学習データを作成（アップロードされたファイルの場合はコンテンツハッシュ・知覚ハッシュも保存）"""
     theme = get_theme(theme_id)
     if theme is None:
         return None
@@ -127,11 +166,17 @@ def create_traindata(theme_id: int, image, label_id: int = None, labeled_by: str
     if label_id:
         label = get_label(theme_id, label_id)
     
+    content_hash, perceptual_hash = None, None
+    if hasattr(image, 'chunks'):
+        content_hash, perceptual_hash = compute_uploaded_file_hashes(image)
+    
     return TrainData.objects.create(
         theme=theme,
         label=label,
         image=image,
-        labeled_by=labeled_by
+        labeled_by=labeled_by,
+        content_hash=content_hash,
+        perceptual_hash=perceptual_hash
     )
 
 
@@ -170,14 +215,151 @@ def get_class_names_by_theme(theme_id: int) -> List[str]:
 
 def get_split_statistics(theme_id: int) -> Dict[str, int]:
     """データ分割統計を取得"""
-    result = {
-        'train': TrainData.objects.filter(theme_id=theme_id, split='train').count(),
-        'valid': TrainData.objects.filter(theme_id=theme_id, split='valid').count(),
-        'test': TrainData.objects.filter(theme_id=theme_id, split='test').count(),
-        'unsplit': TrainData.objects.filter(theme_id=theme_id, split__isnull=True).count()
-    }
+    splits = get_theme_statistics(theme_id)['splits']
+    return {key: splits[key] for key in SPLIT_KEYS}
+
+
+SPLIT_NAMES = ('train', 'valid', 'test')
+
+# 1回のUPDATEで指定するIDの数（SQLiteのプレースホルダ数の上限999未満）
+SPLIT_UPDATE_BATCH_SIZE = 900
+
+
+def compute_stratified_splits(
+    rows: Iterable[Tuple[int, Optional[int]]],
+    train_ratio: float = 0.7,
+    valid_ratio: float = 0.15,
+    random_seed: int = 42,
+    groups: Optional[Dict[int, int]] = None
+) -> Dict[str, List[int]]:
+    """
+    (id, label_id)の組から層化分割を計算
+    
+    ラベルごとにIDをシャッフルし、先頭からtrain/valid/testに割り当てます。
+    ラベル・IDの順に処理するため、同じデータと同じシードでは常に同じ結果になります。
+    groupsを指定した場合、同じグループのIDはまとめて同じ分割に割り当てます
+    （グループは最も多いラベルの層に入ります）。
+    
+    Args:
+        rows: (TrainDataのID, ラベルID)の組
+        train_ratio: 学習データ比率
+        valid_ratio: 検証データ比率
+        random_seed: ランダムシード
+        groups: TrainDataのID -> グループの代表ID（重複グループ）
+    
+    Returns:
+        分割名 -> TrainDataのIDのリスト
+    """
+    groups = groups or {}
+    label_of = {}
+    units = defaultdict(list)
+    for traindata_id, label_id in rows:
+        label_of[traindata_id] = label_id
+        units[groups.get(traindata_id, traindata_id)].append(traindata_id)
+    
+    label_units = defaultdict(list)
+    for ids in units.values():
+        ids.sort()
+        label_units[majority(label_of[i] for i in ids)].append(ids)
+    
+    rng = random.Random(random_seed)
+    assignments = {split: [] for split in SPLIT_NAMES}
+    # 未ラベル（None）は最後に処理
+    for label_id in sorted(label_units, key=lambda x: (x is None, x or 0)):
+        unit_list = sorted(label_units[label_id])
+        rng.shuffle(unit_list)
+        
+        total = sum(len(ids) for ids in unit_list)
+        train_count = int(total * train_ratio)
+        valid_count = int(total * valid_ratio)
+        # グループの先頭の位置で分割を決める（testは残りすべて）
+        position = 0
+        for ids in unit_list:
+            if position < train_count:
+                split = 'train'
+            elif position < train_count + valid_count:
+                split = 'valid'
+            else:
+                split = 'test'
+            assignments[split].extend(ids)
+            position += len(ids)
     
-    return result
+    return assignments
+
+
+def apply_splits(theme_id: int, assignments: Dict[str, List[int]], batch_size: int = SPLIT_UPDATE_BATCH_SIZE) -> int:
+    """
+    分割の割り当てをまとめてデータベースに反映
+    
+    分割ごとにIDをbatch_size件ずつまとめて1回のUPDATEで更新し、全体を1つのトランザクションで実行します。
+    
+    Args:
+        theme_id: テーマID
+        assignments: 分割名 -> TrainDataのIDのリスト
+        batch_size: 1回のUPDATEで更新する件数
+    
+    Returns:
+        更新したデータ数
+    """
+    updated = 0
+    now = timezone.now()
+    with transaction.atomic():
+        for split, ids in assignments.items():
+            for start in range(0, len(ids), batch_size):
+                updated += TrainData.objects.filter(
+                    theme_id=theme_id, id__in=ids[start:start + batch_size]
+                ).update(split=split, updated_at=now)
+        # update()はシグナルを送らないため明示的に無効化
+        invalidate_theme_statistics(theme_id)
+    return updated
+
+
+def _assign_splits(
+    queryset,
+    theme_id: int,
+    train_ratio: float,
+    valid_ratio: float,
+    random_seed: int,
+    keep_duplicates_together: bool,
+    near_duplicate_distance: Optional[int],
+    respect_existing_splits: bool
+) -> Dict[str, int]:
+    """querysetのデータを層化分割してまとめて更新"""
+    rows = list(queryset.order_by('id').values_list('id', 'label_id'))
+    groups = {}
+    fixed = {split: [] for split in SPLIT_NAMES}
+    if keep_duplicates_together:
+        groups = get_duplicate_groups(theme_id, near_duplicate_distance)
+    
+    if groups and respect_existing_splits:
+        # 分割済みのデータと重複するデータは同じ分割にする
+        target_ids = {traindata_id for traindata_id, _ in rows}
+        group_splits = defaultdict(list)
+        for traindata_id, split in TrainData.objects.filter(
+            theme_id=theme_id, split__isnull=False
+        ).order_by('id').values_list('id', 'split'):
+            if traindata_id in groups and traindata_id not in target_ids:
+                group_splits[groups[traindata_id]].append(split)
+        remaining = []
+        for traindata_id, label_id in rows:
+            existing = group_splits.get(groups.get(traindata_id))
+            if existing:
+                fixed[majority(existing)].append(traindata_id)
+            else:
+                remaining.append((traindata_id, label_id))
+        rows = remaining
+    
+    assignments = compute_stratified_splits(
+        rows,
+        train_ratio=train_ratio,
+        valid_ratio=valid_ratio,
+        random_seed=random_seed,
+        groups=groups
+    )
+    for split, ids in fixed.items():
+        assignments[split].extend(ids)
+    apply_splits(theme_id, assignments)
+    return get_split_statistics(theme_id)
 
 
 def assign_splits_to_new_data(
@@ -185,12 +367,16 @@ def assign_splits_to_new_data(
     train_ratio: float = 0.7,
     valid_ratio: float = 0.15,
     test_ratio: float = 0.15,
-    random_seed: int = 42
+    random_seed: int = 42,
+    keep_duplicates_together: bool = True,
+    near_duplicate_distance: Optional[int] = None
 ) -> Dict[str, int]:
     """
     未分割のデータをtrain/valid/testに分割（層化分割）
     
     各クラスの割合がtrain/valid/testで維持されるように分割します。
+    (id, label_id)のみを取得して分割を計算し、分割ごとにまとめて更新します。
+    分割済みのデータと重複するデータは、そのデータと同じ分割に割り当てます。
     
     Args:
         theme_id: テーマID
@@ -198,48 +384,22 @@ def assign_splits_to_new_data(
         valid_ratio: 検証データ比率
         test_ratio: テストデータ比率
         random_seed: ランダムシード
+        keep_duplicates_together: 重複する画像（コンテンツハッシュが同じ画像）を同じ分割にするか
+        near_duplicate_distance: 知覚ハッシュのハミング距離がこの値以下の画像も重複とみなす（Noneの場合は完全一致のみ）
     
     Returns:
         分割結果の統計
     """
-    # 未分割のデータを取得
-    unsplit_data = TrainData.objects.filter(theme_id=theme_id, split__isnull=True)
-    
-    if not unsplit_data.exists():
-        return get_split_statistics(theme_id)
-    
-    # ランダムシードを設定
-    random.seed(random_seed)
-    
-    # ラベルごとにデータをグループ化（層化分割）
-    label_groups = {}
-    for traindata in unsplit_data:
-        label_id = traindata.label_id
-        if label_id not in label_groups:
-            label_groups[label_id] = []
-        label_groups[label_id].append(traindata)
-    
-    # 各ラベルグループを個別に分割
-    for label_id, data_list in label_groups.items():
-        # ラベルごとにシャッフル
-        random.shuffle(data_list)
-        
-        total = len(data_list)
-        train_count = int(total * train_ratio)
-        valid_count = int(total * valid_ratio)
-        # test_countは残りすべて（丸め誤差対策）
-        
-        # 分割を割り当て
-        for i, traindata in enumerate(data_list):
-            if i < train_count:
-                traindata.split = 'train'
-            elif i < train_count + valid_count:
-                traindata.split = 'valid'
-            else:
-                traindata.split = 'test'
-            traindata.save()
-    
-    return get_split_statistics(theme_id)
+    return _assign_splits(
+        TrainData.objects.filter(theme_id=theme_id, split__isnull=True),
+        theme_id=theme_id,
+        train_ratio=train_ratio,
+        valid_ratio=valid_ratio,
+        random_seed=random_seed,
+        keep_duplicates_together=keep_duplicates_together,
+        near_duplicate_distance=near_duplicate_distance,
+        respect_existing_splits=True
+    )
 
 
 def reset_splits(theme_id: int) -> int:
@@ -252,7 +412,8 @@ def reset_splits(theme_id: int) -> int:
     Returns:
         リセットされたデータ数
     """
-    count = TrainData.objects.filter(theme_id=theme_id).update(split=None)
+    count = TrainData.objects.filter(theme_id=theme_id).update(split=None, updated_at=timezone.now())
+    invalidate_theme_statistics(theme_id)
     return count
 
 
@@ -261,12 +422,14 @@ def assign_all_splits(
     train_ratio: float = 0.7,
     valid_ratio: float = 0.15,
     test_ratio: float = 0.15,
-    random_seed: int = 42
+    random_seed: int = 42,
+    keep_duplicates_together: bool = True,
+    near_duplicate_distance: Optional[int] = None
 ) -> Dict[str, int]:
     """
     全データをtrain/valid/testに再分割（層化分割）
     
-    既存の分割情報をリセットしてから、全データを再度分割します。
+    既存の分割情報を破棄して、全データを再度分割します。
     各クラスの割合がtrain/valid/testで維持されるように分割します。
     
     Args:
@@ -275,18 +438,20 @@ def assign_all_splits(
         valid_ratio: 検証データ比率
         test_ratio: テストデータ比率
         random_seed: ランダムシード
+        keep_duplicates_together: 重複する画像（コンテンツハッシュが同じ画像）を同じ分割にするか
+        near_duplicate_distance: 知覚ハッシュのハミング距離がこの値以下の画像も重複とみなす（Noneの場合は完全一致のみ）
     
     Returns:
         分割結果の統計
     """
-    # まず全データの分割をリセット
-    reset_splits(theme_id)
-    
-    # 未分割データとして再分割
-    return assign_splits_to_new_data(
+    # 全データの分割を計算し直して上書き（リセットと再分割を1回の更新で行う）
+    return _assign_splits(
+        TrainData.objects.filter(theme_id=theme_id),
         theme_id=theme_id,
         train_ratio=train_ratio,
         valid_ratio=valid_ratio,
-        test_ratio=test_ratio,
-        random_seed=random_seed
+        random_seed=random_seed,
+        keep_duplicates_together=keep_duplicates_together,
+        near_duplicate_distance=near_duplicate_distance,
+        respect_existing_splits=False
     )
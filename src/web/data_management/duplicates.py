@@ -0,0 +1,320 @@
+"""
+重複画像の検出
+
+TrainDataのコンテンツハッシュ（SHA-256、完全一致）と知覚ハッシュ（dHash、見た目が近い画像）から
+重複グループを求め、テーマごとのレポートを作成します。
+
+近似重複の検索は、64ビットの知覚ハッシュを (max_distance + 1) 個のブロックに分け、
+いずれかのブロックが一致する組だけを比較します（ハミング距離がmax_distance以下の組は、
+鳩の巣原理により少なくとも1つのブロックが一致するため、全組の比較をせずに漏れなく見つかります）。
+
+ハッシュの計算関数はDjangoに依存しないため、プロセスプールのワーカーからも呼び出せます。
+"""
+import hashlib
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import IO, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from .thumbnails import compute_content_hash
+
+# 知覚ハッシュのビット数（8x8のdHash）
+PERCEPTUAL_HASH_BITS = 64
+
+# 近似重複とみなすハミング距離のデフォルト値
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 4
+
+
+def compute_perceptual_hash(source: Union[str, Path, IO[bytes]]) -> str:
+    """
+    画像の知覚ハッシュ（dHash）を計算
+
+    9x8のグレースケールに縮小し、横に隣り合う画素の大小関係を64ビットにします。
+    縮小・再圧縮・軽い色調の変化では値がほとんど変わりません。
+
+    アップロード・バックフィル・一括取り込みで同じ値になるよう、呼び出し元の画像オブジェクトは受け取らず、
+    常にファイルを開き直してJPEGのdraft（縮小デコード）を適用してから計算します。
+
+    Args:
+        source: 画像ファイルのパス、またはファイルオブジェクト（先頭から読み込みます）
+
+    Returns:
+        16桁の16進数文字列
+    """
+    with Image.open(source) as image:
+        image.draft('L', (64, 64))
+        pixels = list(image.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return f"{value:016x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """2つの知覚ハッシュのハミング距離"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+def compute_image_hashes(image_path: str, perceptual: bool = True) -> Tuple[str, Optional[str]]:
+    """
+    画像ファイルのコンテンツハッシュと知覚ハッシュを計算
+
+    Args:
+        image_path: 画像ファイルのパス
+        perceptual: 知覚ハッシュも計算するか
+
+    Returns:
+        (コンテンツハッシュ, 知覚ハッシュ)。画像として読み込めない場合、知覚ハッシュはNone
+    """
+    content_hash = compute_content_hash(image_path)
+    perceptual_hash = None
+    if perceptual:
+        try:
+            perceptual_hash = compute_perceptual_hash(image_path)
+        except Exception:
+            perceptual_hash = None
+    return content_hash, perceptual_hash
+
+
+def compute_uploaded_file_hashes(uploaded_file) -> Tuple[str, Optional[str]]:
+    """
+    アップロードされたファイル（Djangoのアップロードファイル）のコンテンツハッシュと知覚ハッシュを計算
+
+    Args:
+        uploaded_file: アップロードされたファイル
+
+    Returns:
+        (コンテンツハッシュ, 知覚ハッシュ)。画像として読み込めない場合、知覚ハッシュはNone
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    perceptual_hash = None
+    try:
+        uploaded_file.seek(0)
+        perceptual_hash = compute_perceptual_hash(uploaded_file)
+    except Exception:
+        perceptual_hash = None
+    finally:
+        uploaded_file.seek(0)
+    return digest.hexdigest(), perceptual_hash
+
+
+def compute_image_hashes_for_file(args: tuple) -> Dict:
+    """
+    プロセスプール用のラッパー
+
+    Args:
+        args: (traindata_id, 画像ファイルのパス, 知覚ハッシュも計算するか)
+
+    Returns:
+        traindata_id・content_hash・perceptual_hash・errorの辞書
+    """
+    traindata_id, image_path, perceptual = args
+    try:
+        content_hash, perceptual_hash = compute_image_hashes(image_path, perceptual)
+        return {'traindata_id': traindata_id, 'content_hash': content_hash,
+                'perceptual_hash': perceptual_hash, 'error': None}
+    except Exception as e:
+        return {'traindata_id': traindata_id, 'content_hash': None, 'perceptual_hash': None, 'error': str(e)}
+
+
+class _UnionFind:
+    """IDのグループ化"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # 小さいIDを代表にする（結果を決定的にするため）
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+
+def find_near_duplicate_pairs(hashes: Dict[int, str], max_distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE) -> List[Tuple[int, int, int]]:
+    """
+    知覚ハッシュのハミング距離がmax_distance以下の組を検索
+
+    Args:
+        hashes: TrainDataのID -> 知覚ハッシュ
+        max_distance: 最大のハミング距離
+
+    Returns:
+        (ID, ID, 距離) のリスト（同一ハッシュの組も含む）
+    """
+    if max_distance < 0 or max_distance >= PERCEPTUAL_HASH_BITS:
+        raise ValueError(f"max_distanceは0以上{PERCEPTUAL_HASH_BITS}未満で指定してください: {max_distance}")
+    values = {traindata_id: int(value, 16) for traindata_id, value in hashes.items()}
+
+    num_blocks = max_distance + 1
+    bounds = [PERCEPTUAL_HASH_BITS * i // num_blocks for i in range(num_blocks + 1)]
+    candidates = set()
+    for block in range(num_blocks):
+        low, high = bounds[block], bounds[block + 1]
+        mask = (1 << (high - low)) - 1
+        buckets = defaultdict(list)
+        for traindata_id, value in values.items():
+            buckets[(value >> low) & mask].append(traindata_id)
+        for ids in buckets.values():
+            ids.sort()
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    candidates.add((a, b))
+
+    pairs = []
+    for a, b in sorted(candidates):
+        distance = bin(values[a] ^ values[b]).count('1')
+        if distance <= max_distance:
+            pairs.append((a, b, distance))
+    return pairs
+
+
+def build_duplicate_groups(
+    rows: Iterable[Tuple[int, Optional[str], Optional[str]]],
+    near_duplicate_distance: Optional[int] = None
+) -> Dict[int, int]:
+    """
+    重複グループを作成
+
+    コンテンツハッシュが一致する画像、およびnear_duplicate_distanceを指定した場合は
+    知覚ハッシュのハミング距離がその値以下の画像を同じグループにします。
+
+    Args:
+        rows: (TrainDataのID, コンテンツハッシュ, 知覚ハッシュ) の組
+        near_duplicate_distance: 近似重複とみなすハミング距離（Noneの場合は完全一致のみ）
+
+    Returns:
+        TrainDataのID -> グループの代表ID（グループ内の最小のID）。重複のない画像は含まない
+    """
+    union_find = _UnionFind()
+    first_by_hash = {}
+    perceptual_hashes = {}
+    for traindata_id, content_hash, perceptual_hash in rows:
+        if content_hash:
+            if content_hash in first_by_hash:
+                union_find.union(first_by_hash[content_hash], traindata_id)
+            else:
+                first_by_hash[content_hash] = traindata_id
+        if perceptual_hash:
+            perceptual_hashes[traindata_id] = perceptual_hash
+
+    if near_duplicate_distance is not None:
+        for a, b, _ in find_near_duplicate_pairs(perceptual_hashes, near_duplicate_distance):
+            union_find.union(a, b)
+
+    members = defaultdict(list)
+    for traindata_id in list(union_find.parent):
+        members[union_find.find(traindata_id)].append(traindata_id)
+    return {
+        traindata_id: root
+        for root, ids in members.items() if len(ids) > 1
+        for traindata_id in ids
+    }
+
+
+def get_duplicate_groups(theme_id: int, near_duplicate_distance: Optional[int] = None) -> Dict[int, int]:
+    """
+    テーマの重複グループを取得
+
+    Args:
+        theme_id: テーマID
+        near_duplicate_distance: 近似重複とみなすハミング距離（Noneの場合は完全一致のみ）
+
+    Returns:
+        TrainDataのID -> グループの代表ID（build_duplicate_groupsを参照）
+    """
+    from .models import TrainData
+
+    queryset = TrainData.objects.filter(theme_id=theme_id).order_by('id')
+    if near_duplicate_distance is None:
+        queryset = queryset.filter(content_hash__isnull=False)
+        rows = ((traindata_id, content_hash, None) for traindata_id, content_hash in queryset.values_list('id', 'content_hash'))
+    else:
+        rows = queryset.values_list('id', 'content_hash', 'perceptual_hash')
+    return build_duplicate_groups(rows, near_duplicate_distance)
+
+
+def build_duplicate_report(theme_id: int, near_duplicate_distance: Optional[int] = DEFAULT_NEAR_DUPLICATE_DISTANCE) -> Dict:
+    """
+    テーマの重複レポートを作成
+
+    Args:
+        theme_id: テーマID
+        near_duplicate_distance: 近似重複とみなすハミング距離（Noneの場合は完全一致のみ）
+
+    Returns:
+        以下のキーを持つ辞書
+        - total / hashed / perceptual_hashed: データ数・ハッシュ計算済みの数
+        - duplicate_groups: 完全一致のグループ（content_hash, ids, splits, labels）
+        - near_duplicate_groups: 近似重複のグループ（完全一致のみのグループは除く）
+        - split_leaks: 複数の分割にまたがるグループ数
+        - label_conflicts: 異なるラベルが付いたグループ数
+    """
+    from .models import TrainData
+
+    rows = list(
+        TrainData.objects.filter(theme_id=theme_id).order_by('id')
+        .values_list('id', 'content_hash', 'perceptual_hash', 'split', 'label_id')
+    )
+    info = {row[0]: row for row in rows}
+
+    def describe(ids: List[int]) -> Dict:
+        return {
+            'ids': ids,
+            'splits': sorted({info[i][3] or 'unsplit' for i in ids}),
+            'labels': sorted({info[i][4] for i in ids}, key=lambda x: (x is None, x or 0)),
+        }
+
+    exact_groups = defaultdict(list)
+    for traindata_id, content_hash, _, _, _ in rows:
+        if content_hash:
+            exact_groups[content_hash].append(traindata_id)
+    duplicate_groups = [
+        {'content_hash': content_hash, **describe(ids)}
+        for content_hash, ids in exact_groups.items() if len(ids) > 1
+    ]
+
+    near_duplicate_groups = []
+    if near_duplicate_distance is not None:
+        groups = defaultdict(list)
+        for traindata_id, root in build_duplicate_groups(
+            ((r[0], r[1], r[2]) for r in rows), near_duplicate_distance
+        ).items():
+            groups[root].append(traindata_id)
+        for ids in groups.values():
+            ids.sort()
+            # 完全一致のみのグループは duplicate_groups に含まれる
+            if len({info[i][1] for i in ids}) > 1:
+                near_duplicate_groups.append(describe(ids))
+
+    all_groups = duplicate_groups + near_duplicate_groups
+    return {
+        'theme_id': theme_id,
+        'total': len(rows),
+        'hashed': sum(1 for r in rows if r[1]),
+        'perceptual_hashed': sum(1 for r in rows if r[2]),
+        'near_duplicate_distance': near_duplicate_distance,
+        'duplicate_groups': duplicate_groups,
+        'near_duplicate_groups': near_duplicate_groups,
+        'split_leaks': sum(1 for g in all_groups if len([s for s in g['splits'] if s != 'unsplit']) > 1),
+        'label_conflicts': sum(1 for g in all_groups if len(g['labels']) > 1),
+    }
+
+
+def majority(values: Iterable[Hashable]):
+    """最も多い値（同数の場合は先に現れた値）"""
+    counts = Counter(values)
+    return max(counts, key=counts.get) if counts else None
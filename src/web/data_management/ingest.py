@@ -0,0 +1,523 @@
+"""
+画像の一括取り込み
+
+zip/tarアーカイブ（またはディレクトリ）の画像をまとめてテーマに登録します。
+
+- アーカイブの展開と並行して、スレッドプールで画像の検証・デコード・ハッシュ計算を行います
+  （PILのデコードとhashlibはGILを解放するため、スレッドで並列化されます）
+- コンテンツハッシュ（SHA-256）でテーマ内の既存画像・取り込み中の画像との重複を除外します
+- TrainDataはbulk_createでINGEST_BATCH_SIZE件ずつ登録します
+- 画像ファイルは images/<年>/<月>/<日>/<ハッシュ>.<拡張子> に保存します
+
+アーカイブ内のディレクトリ名がテーマのラベル名と一致する場合は、そのラベルを付けて登録します
+（例: cat/001.jpg → ラベル「cat」）。
+
+大きなアーカイブは append_upload_chunk() で分割してアップロードでき、
+中断した場合は get_upload_offset() の位置から再開できます。
+start_ingest_job() はバックグラウンドのスレッドで取り込みを実行し、進捗はキャッシュに保存されます。
+"""
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from PIL import Image
+
+from .duplicates import compute_perceptual_hash
+from .models import Label, Theme, TrainData
+from .statistics import invalidate_theme_statistics
+from .thumbnails import compute_content_hash, generate_thumbnails, get_content_hash
+
+logger = logging.getLogger(__name__)
+
+# 1回のbulk_createで登録する件数
+INGEST_BATCH_SIZE = 500
+
+# 取り込む画像ファイルの拡張子（TrainData.imageのバリデータと同じ）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+# PILのフォーマット -> 保存時の拡張子
+PIL_FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'MPO': 'jpg',
+    'PNG': 'png',
+    'BMP': 'bmp',
+    'GIF': 'gif',
+}
+
+# 1枚あたりの最大ファイルサイズ（バイト）
+MAX_IMAGE_BYTES = 64 * 1024 * 1024
+
+# 記録するエラーの最大件数
+MAX_REPORTED_ERRORS = 100
+
+# 進捗の保存期間（秒）
+INGEST_JOB_TIMEOUT = 24 * 60 * 60
+
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class UploadOffsetMismatch(ValueError):
+    """分割アップロードのオフセットがサーバー側のファイルサイズと一致しない"""
+
+    def __init__(self, current_offset: int):
+        super().__init__(f"オフセットが一致しません（サーバー側のサイズ: {current_offset}）")
+        self.current_offset = current_offset
+
+
+class UploadAlreadyClaimed(ValueError):
+    """分割アップロードが既に別の取り込みジョブに使用された"""
+
+
+def default_worker_count() -> int:
+    """取り込みのデフォルトのワーカー数"""
+    return min(8, os.cpu_count() or 1)
+
+
+def _ingest_root() -> Path:
+    root = Path(settings.INGEST_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+# ---------------------------------------------------------------------------
+# 分割アップロード
+# ---------------------------------------------------------------------------
+
+def get_upload_path(theme_id: int, upload_id: str) -> Path:
+    """
+    分割アップロードの保存先パスを取得
+
+    アップロードはテーマごとのディレクトリ（uploads/<theme_id>/）に保存します。
+
+    Args:
+        theme_id: テーマID
+        upload_id: クライアントが生成したアップロードID（英数字・-・_ の8〜64文字）
+
+    Returns:
+        アップロード中のファイルのパス
+    """
+    if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+        raise ValueError(f"不正なアップロードIDです: {upload_id}")
+    upload_dir = _ingest_root() / 'uploads' / str(int(theme_id))
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir / f"{upload_id}.part"
+
+
+def claim_upload(theme_id: int, upload_id: str) -> Path:
+    """
+    アップロード済みのファイルを取り込みジョブ用に確保
+
+    ファイルをジョブ専用のパスへos.renameで移動します。移動はアトミックなため、
+    同じアップロードで取り込みを2回開始しても（クライアントの再送など）確保できるのは1回だけです。
+
+    Args:
+        theme_id: テーマID
+        upload_id: アップロードID
+
+    Returns:
+        確保したファイルのパス
+
+    Raises:
+        UploadAlreadyClaimed: 別のジョブが既に確保した場合
+    """
+    path = get_upload_path(theme_id, upload_id)
+    claimed = path.with_name(f"{upload_id}.{uuid.uuid4().hex}.ingest")
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        raise UploadAlreadyClaimed(f"アップロードは既に取り込み中か、見つかりません: {upload_id}")
+    return claimed
+
+
+def get_upload_offset(theme_id: int, upload_id: str) -> int:
+    """
+    分割アップロードの受信済みバイト数を取得（再開位置）
+
+    Args:
+        theme_id: テーマID
+        upload_id: アップロードID
+
+    Returns:
+        受信済みのバイト数
+    """
+    path = get_upload_path(theme_id, upload_id)
+    return path.stat().st_size if path.exists() else 0
+
+
+def append_upload_chunk(theme_id: int, upload_id: str, offset: int, chunk) -> int:
+    """
+    分割アップロードのチャンクを追記
+
+    Args:
+        theme_id: テーマID
+        upload_id: アップロードID
+        offset: チャンクの開始位置（受信済みバイト数と一致する必要がある）
+        chunk: チャンクのファイルオブジェクト（Djangoのアップロードファイルなど）
+
+    Returns:
+        追記後の受信済みバイト数
+
+    Raises:
+        UploadOffsetMismatch: offsetが受信済みバイト数と一致しない場合
+    """
+    path = get_upload_path(theme_id, upload_id)
+    current_offset = path.stat().st_size if path.exists() else 0
+    if offset != current_offset:
+        raise UploadOffsetMismatch(current_offset)
+
+    with open(path, 'ab') as f:
+        if hasattr(chunk, 'chunks'):
+            for data in chunk.chunks():
+                f.write(data)
+        else:
+            shutil.copyfileobj(chunk, f)
+    return path.stat().st_size
+
+
+# ---------------------------------------------------------------------------
+# 取り込み
+# ---------------------------------------------------------------------------
+
+def _is_image_name(name: str) -> bool:
+    path = PurePosixPath(name)
+    if path.parts and path.parts[0] == '__MACOSX':
+        return False
+    return not path.name.startswith('.') and path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def iter_source_files(source: str, staging_dir: str) -> Iterator[Tuple[str, Optional[str], bool]]:
+    """
+    取り込み元の画像ファイルを順に取得
+
+    アーカイブの場合はメンバーを1つずつstaging_dirに展開します（メンバー名はパスに使用しません）。
+
+    Args:
+        source: zip/tarアーカイブまたはディレクトリのパス
+        staging_dir: アーカイブの展開先
+
+    Yields:
+        (元のファイル名, ファイルのパス, 展開したファイルか)
+        ファイルサイズが上限を超える場合、パスはNone
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, source).replace(os.sep, '/')
+                if _is_image_name(name):
+                    too_large = os.path.getsize(path) > MAX_IMAGE_BYTES
+                    yield name, None if too_large else path, False
+        return
+
+    def extract(index: int, name: str, fileobj) -> str:
+        path = os.path.join(staging_dir, f"{index}{PurePosixPath(name).suffix.lower()}")
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        return path
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for index, info in enumerate(archive.infolist()):
+                if info.is_dir() or not _is_image_name(info.filename):
+                    continue
+                if info.file_size > MAX_IMAGE_BYTES:
+                    yield info.filename, None, False
+                    continue
+                with archive.open(info) as fileobj:
+                    yield info.filename, extract(index, info.filename, fileobj), True
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, 'r:*') as archive:
+            for index, member in enumerate(archive):
+                if not member.isfile() or not _is_image_name(member.name):
+                    continue
+                if member.size > MAX_IMAGE_BYTES:
+                    yield member.name, None, False
+                    continue
+                yield member.name, extract(index, member.name, archive.extractfile(member)), True
+    else:
+        raise ValueError(f"zip/tarアーカイブまたはディレクトリではありません: {source}")
+
+
+def inspect_image(path: str, thumbnail_root: Optional[str] = None) -> Dict:
+    """
+    画像を検証・デコードしてコンテンツハッシュを計算（ワーカーで実行）
+
+    Args:
+        path: 画像ファイルのパス
+        thumbnail_root: サムネイルの保存先（指定した場合はサムネイルも生成）
+
+    Returns:
+        content_hash・perceptual_hash・extension・width・height、または error を持つ辞書
+    """
+    try:
+        content_hash = compute_content_hash(path)
+
+        with Image.open(path) as image:
+            extension = PIL_FORMAT_EXTENSIONS.get(image.format)
+            if extension is None:
+                return {'error': f"サポートされていない画像形式です: {image.format}"}
+            # 破損した画像を除外するため最後までデコードする
+            image.load()
+            width, height = image.size
+        perceptual_hash = compute_perceptual_hash(path)
+
+        if thumbnail_root is not None:
+            generate_thumbnails(path, thumbnail_root, content_hash=content_hash)
+    except Exception as e:
+        return {'error': f"画像を読み込めません: {e}"}
+
+    return {
+        'content_hash': content_hash,
+        'perceptual_hash': perceptual_hash,
+        'extension': extension,
+        'width': width,
+        'height': height,
+    }
+
+
+def existing_content_hashes(theme_id: int) -> set:
+    """
+    テーマの既存画像のコンテンツハッシュを取得
+
+    TrainData.content_hashを使用し、未計算（backfill_content_hashes実行前）の画像のみファイルから計算します。
+
+    Args:
+        theme_id: テーマID
+
+    Returns:
+        コンテンツハッシュの集合（ファイルが存在しない画像は含まない）
+    """
+    hashes = set()
+    rows = TrainData.objects.filter(theme_id=theme_id).values_list('content_hash', 'image')
+    for content_hash, image_name in rows.iterator():
+        if content_hash:
+            hashes.add(content_hash)
+            continue
+        try:
+            hashes.add(get_content_hash(os.path.join(settings.MEDIA_ROOT, image_name)))
+        except OSError:
+            continue
+    return hashes
+
+
+def ingest_images(
+    theme_id: int,
+    source: str,
+    label_id: Optional[int] = None,
+    labeled_by: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    create_thumbnails: bool = True,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    アーカイブ・ディレクトリの画像をテーマに一括登録
+
+    Args:
+        theme_id: テーマID
+        source: zip/tarアーカイブまたはディレクトリのパス
+        label_id: ディレクトリ名がラベル名と一致しない画像に付けるラベルID（Noneの場合は未ラベル）
+        labeled_by: ラベル付けした人
+        workers: 検証・デコードのワーカー数（Noneの場合はdefault_worker_count()）
+        batch_size: 1回のbulk_createで登録する件数
+        create_thumbnails: サムネイルを生成するか
+        progress_callback: 進捗（戻り値と同じ形式の辞書）を受け取る関数
+
+    Returns:
+        取り込み結果の統計
+        (found: 見つかった画像数, processed: 処理済み数, created: 登録数,
+         duplicates: 重複で除外した数, invalid: 読み込めなかった数, errors: エラーの一覧, elapsed_seconds)
+    """
+    if not Theme.objects.filter(id=theme_id).exists():
+        raise ValueError(f"テーマID {theme_id} が見つかりません")
+    if not os.path.exists(source):
+        raise ValueError(f"取り込み元が見つかりません: {source}")
+    if label_id is not None and not Label.objects.filter(id=label_id, theme_id=theme_id).exists():
+        raise ValueError(f"ラベルID {label_id} がテーマ {theme_id} に見つかりません")
+    workers = workers or default_worker_count()
+    labels_by_name = dict(Label.objects.filter(theme_id=theme_id).values_list('label_name', 'id'))
+    thumbnail_root = settings.THUMBNAIL_ROOT if create_thumbnails else None
+
+    start_time = time.perf_counter()
+    stats = {'found': 0, 'processed': 0, 'created': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    seen_hashes = existing_content_hashes(theme_id)
+    pending = []
+
+    def report():
+        if progress_callback is not None:
+            progress_callback({**stats, 'elapsed_seconds': round(time.perf_counter() - start_time, 3)})
+
+    def add_error(name: str, message: str):
+        stats['invalid'] += 1
+        if len(stats['errors']) < MAX_REPORTED_ERRORS:
+            stats['errors'].append({'file': name, 'error': message})
+
+    def resolve_label(name: str) -> Optional[int]:
+        parent = PurePosixPath(name).parent.name
+        return labels_by_name.get(parent, label_id)
+
+    def flush():
+        if not pending:
+            return
+        today = date.today()
+        rows = []
+        for name, path, owned, result in pending:
+            image_name = f"images/{today:%Y/%m/%d}/{result['content_hash']}.{result['extension']}"
+            destination = os.path.join(settings.MEDIA_ROOT, image_name)
+            if os.path.exists(destination):
+                # 同じ内容のファイルが既にある（別テーマなど）
+                if owned:
+                    os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                if owned:
+                    shutil.move(path, destination)
+                else:
+                    shutil.copyfile(path, destination)
+            rows.append(TrainData(
+                theme_id=theme_id,
+                label_id=resolve_label(name),
+                image=image_name,
+                labeled_by=labeled_by,
+                content_hash=result['content_hash'],
+                perceptual_hash=result['perceptual_hash'],
+            ))
+        with transaction.atomic():
+            TrainData.objects.bulk_create(rows, batch_size=batch_size)
+            # bulk_create()はシグナルを送らないため明示的に無効化
+            invalidate_theme_statistics(theme_id)
+        stats['created'] += len(rows)
+        pending.clear()
+
+    def handle(name: str, path: str, owned: bool, result: Dict):
+        stats['processed'] += 1
+        if 'error' in result:
+            add_error(name, result['error'])
+        elif result['content_hash'] in seen_hashes:
+            stats['duplicates'] += 1
+        else:
+            seen_hashes.add(result['content_hash'])
+            pending.append((name, path, owned, result))
+            if len(pending) >= batch_size:
+                flush()
+                report()
+            return
+        if owned:
+            os.remove(path)
+
+    staging_dir = tempfile.mkdtemp(dir=_ingest_root(), prefix='staging_')
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 結果は投入順に処理する（重複時は先に現れたファイルを残すため）
+            in_flight = deque()
+            # 展開とデコードを並行して行う（展開済みで未処理のファイルはworkers*4件まで）
+            for name, path, owned in iter_source_files(source, staging_dir):
+                stats['found'] += 1
+                if path is None:
+                    stats['processed'] += 1
+                    add_error(name, f"ファイルサイズが上限（{MAX_IMAGE_BYTES}バイト）を超えています")
+                    continue
+                in_flight.append((name, path, owned, executor.submit(inspect_image, path, thumbnail_root)))
+                if len(in_flight) >= workers * 4:
+                    name, path, owned, future = in_flight.popleft()
+                    handle(name, path, owned, future.result())
+            while in_flight:
+                name, path, owned, future = in_flight.popleft()
+                handle(name, path, owned, future.result())
+        flush()
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - start_time, 3)
+    report()
+    logger.info(
+        f"テーマ {theme_id} に画像を取り込みました: 登録 {stats['created']}件, 重複 {stats['duplicates']}件, "
+        f"エラー {stats['invalid']}件 ({stats['elapsed_seconds']:.1f}秒)"
+    )
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# バックグラウンド実行
+# ---------------------------------------------------------------------------
+
+def _job_cache_key(job_id: str) -> str:
+    return f"data_management:ingest_job:{job_id}"
+
+
+def _update_job(job_id: str, **values) -> None:
+    job = cache.get(_job_cache_key(job_id)) or {}
+    job.update(values)
+    cache.set(_job_cache_key(job_id), job, INGEST_JOB_TIMEOUT)
+
+
+def get_ingest_job(job_id: str) -> Optional[Dict]:
+    """
+    取り込みジョブの状態を取得
+
+    Args:
+        job_id: ジョブID
+
+    Returns:
+        status（queued/running/completed/failed）・theme_id・進捗の辞書（存在しない場合はNone）
+    """
+    return cache.get(_job_cache_key(job_id))
+
+
+def _run_ingest_job(job_id: str, theme_id: int, source: str, remove_source: bool, kwargs: Dict) -> None:
+    try:
+        _update_job(job_id, status='running')
+        stats = ingest_images(
+            theme_id,
+            source,
+            progress_callback=lambda progress: _update_job(job_id, **progress),
+            **kwargs
+        )
+        _update_job(job_id, status='completed', **stats)
+    except Exception as e:
+        logger.error(f"画像の取り込みに失敗しました (job_id={job_id}): {e}", exc_info=True)
+        _update_job(job_id, status='failed', error=str(e))
+    finally:
+        if remove_source and os.path.isfile(source):
+            os.remove(source)
+        connection.close()
+
+
+def start_ingest_job(theme_id: int, source: str, remove_source: bool = False, **kwargs) -> str:
+    """
+    バックグラウンドのスレッドで画像の取り込みを開始
+
+    Args:
+        theme_id: テーマID
+        source: zip/tarアーカイブまたはディレクトリのパス
+        remove_source: 完了後にsourceのファイルを削除するか
+        **kwargs: ingest_imagesに渡す引数
+
+    Returns:
+        ジョブID（get_ingest_jobで進捗を取得）
+    """
+    job_id = uuid.uuid4().hex
+    _update_job(job_id, status='queued', theme_id=theme_id)
+    thread = threading.Thread(
+        target=_run_ingest_job,
+        args=(job_id, theme_id, source, remove_source, kwargs),
+        name=f"ingest-{job_id}",
+        daemon=True,
+    )
+    thread.start()
+    return job_id
@@ -0,0 +1,103 @@
+"""
+既存の学習データのコンテンツハッシュ・知覚ハッシュを一括計算するコマンド
+
+使用例:
+    python manage.py backfill_content_hashes                    # ハッシュ未計算のデータのみ
+    python manage.py backfill_content_hashes --theme-id 7 --workers 8
+    python manage.py backfill_content_hashes --all              # 計算済みのデータも再計算
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from data_management.duplicates import compute_image_hashes_for_file
+from data_management.models import TrainData
+
+
+class Command(BaseCommand):
+    help = '既存の学習データのコンテンツハッシュ・知覚ハッシュを並列に計算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--theme-id', type=int, nargs='*', default=None,
+                            help='対象のテーマID（省略時は全テーマ）')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='ワーカープロセス数（1の場合はこのプロセスで実行）')
+        parser.add_argument('--all', action='store_true',
+                            help='計算済みのデータも再計算する')
+        parser.add_argument('--no-perceptual', action='store_true',
+                            help='知覚ハッシュを計算しない')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='1回のbulk_updateで更新する件数')
+        parser.add_argument('--chunksize', type=int, default=16,
+                            help='ワーカーに一度に渡す画像数')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workersは1以上を指定してください')
+        perceptual = not options['no_perceptual']
+
+        queryset = TrainData.objects.order_by('id')
+        if options['theme_id']:
+            queryset = queryset.filter(theme_id__in=options['theme_id'])
+        if not options['all']:
+            missing = Q(content_hash__isnull=True)
+            if perceptual:
+                missing |= Q(perceptual_hash__isnull=True)
+            queryset = queryset.filter(missing)
+
+        tasks = [
+            (traindata_id, os.path.join(settings.MEDIA_ROOT, image_name), perceptual)
+            for traindata_id, image_name in queryset.values_list('id', 'image').iterator()
+        ]
+        total = len(tasks)
+        self.stdout.write(f'{total}件の画像のハッシュを計算します（ワーカー数: {options["workers"]}）')
+        if total == 0:
+            return
+
+        start_time = time.perf_counter()
+        fields = ['content_hash', 'perceptual_hash'] if perceptual else ['content_hash']
+        pending = []
+        updated = failed = 0
+        progress_interval = max(1, total // 20)
+
+        def flush():
+            nonlocal updated
+            TrainData.objects.bulk_update(pending, fields, batch_size=options['batch_size'])
+            updated += len(pending)
+            pending.clear()
+
+        if options['workers'] == 1:
+            results = map(compute_image_hashes_for_file, tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+            results = executor.map(compute_image_hashes_for_file, tasks, chunksize=options['chunksize'])
+
+        try:
+            for done, result in enumerate(results, start=1):
+                if result['error'] is not None:
+                    failed += 1
+                    self.stderr.write(f'  traindata_id={result["traindata_id"]}: {result["error"]}')
+                else:
+                    pending.append(TrainData(
+                        id=result['traindata_id'],
+                        content_hash=result['content_hash'],
+                        perceptual_hash=result['perceptual_hash'],
+                    ))
+                    if len(pending) >= options['batch_size']:
+                        flush()
+                if done % progress_interval == 0 or done == total:
+                    elapsed = time.perf_counter() - start_time
+                    self.stdout.write(f'  {done}/{total} ({done / elapsed:.1f}枚/秒)')
+            if pending:
+                flush()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write(self.style.SUCCESS(f'完了: {updated}件更新, {failed}件失敗 ({elapsed:.1f}秒)'))
@@ -0,0 +1,80 @@
+"""
+既存の学習データのサムネイルを一括生成するコマンド
+
+使用例:
+    python manage.py backfill_thumbnails                    # 全テーマ
+    python manage.py backfill_thumbnails --theme-id 7 --workers 8
+    python manage.py backfill_thumbnails --sizes small medium --formats webp
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management.models import TrainData
+from data_management.thumbnails import THUMBNAIL_SIZES, available_formats, generate_thumbnails_for_file
+
+
+class Command(BaseCommand):
+    help = '既存の学習データのサムネイルを並列に生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--theme-id', type=int, nargs='*', default=None,
+                            help='対象のテーマID（省略時は全テーマ）')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='ワーカープロセス数（1の場合はこのプロセスで実行）')
+        parser.add_argument('--sizes', nargs='*', choices=list(THUMBNAIL_SIZES), default=None,
+                            help='生成するサイズ（省略時はすべて）')
+        parser.add_argument('--formats', nargs='*', choices=list(available_formats()), default=None,
+                            help='生成するフォーマット（省略時はすべて）')
+        parser.add_argument('--chunksize', type=int, default=16,
+                            help='ワーカーに一度に渡す画像数')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workersは1以上を指定してください')
+
+        queryset = TrainData.objects.order_by('id')
+        if options['theme_id']:
+            queryset = queryset.filter(theme_id__in=options['theme_id'])
+
+        media_root = settings.MEDIA_ROOT
+        tasks = [
+            (traindata_id, os.path.join(media_root, image_name), settings.THUMBNAIL_ROOT,
+             options['sizes'], options['formats'])
+            for traindata_id, image_name in queryset.values_list('id', 'image').iterator()
+        ]
+        total = len(tasks)
+        self.stdout.write(f'{total}件の画像のサムネイルを生成します（ワーカー数: {options["workers"]}）')
+        if total == 0:
+            return
+
+        start_time = time.perf_counter()
+        failed = 0
+        progress_interval = max(1, total // 20)
+
+        if options['workers'] == 1:
+            results = map(generate_thumbnails_for_file, tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+            results = executor.map(generate_thumbnails_for_file, tasks, chunksize=options['chunksize'])
+
+        try:
+            for done, result in enumerate(results, start=1):
+                if result['error'] is not None:
+                    failed += 1
+                    self.stderr.write(f'  traindata_id={result["traindata_id"]}: {result["error"]}')
+                if done % progress_interval == 0 or done == total:
+                    elapsed = time.perf_counter() - start_time
+                    self.stdout.write(f'  {done}/{total} ({done / elapsed:.1f}枚/秒)')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'完了: {total - failed}件成功, {failed}件失敗 ({elapsed:.1f}秒)'
+        ))
@@ -0,0 +1,54 @@
+"""
+テーマの重複画像レポートを出力するコマンド
+
+使用例:
+    python manage.py duplicate_report --theme-id 7
+    python manage.py duplicate_report --theme-id 7 --max-distance 6 --json > duplicates.json
+    python manage.py duplicate_report --theme-id 7 --exact-only
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management.duplicates import DEFAULT_NEAR_DUPLICATE_DISTANCE, build_duplicate_report
+from data_management.models import Theme
+
+
+class Command(BaseCommand):
+    help = 'テーマの重複・近似重複の画像と、分割をまたぐ重複を報告します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--theme-id', type=int, required=True, help='テーマID')
+        parser.add_argument('--max-distance', type=int, default=DEFAULT_NEAR_DUPLICATE_DISTANCE,
+                            help='近似重複とみなす知覚ハッシュのハミング距離')
+        parser.add_argument('--exact-only', action='store_true', help='完全一致の重複のみ報告する')
+        parser.add_argument('--json', action='store_true', help='JSON形式で出力する')
+
+    def handle(self, *args, **options):
+        if not Theme.objects.filter(id=options['theme_id']).exists():
+            raise CommandError(f'テーマID {options["theme_id"]} が見つかりません')
+        try:
+            report = build_duplicate_report(
+                options['theme_id'],
+                near_duplicate_distance=None if options['exact_only'] else options['max_distance'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f'データ数: {report["total"]}（ハッシュ計算済み: {report["hashed"]}, '
+                          f'知覚ハッシュ計算済み: {report["perceptual_hashed"]}）')
+        if report['hashed'] < report['total']:
+            self.stdout.write(self.style.WARNING(
+                'ハッシュ未計算のデータがあります。backfill_content_hashesを実行してください'
+            ))
+        for title, groups in (('完全一致', report['duplicate_groups']), ('近似重複', report['near_duplicate_groups'])):
+            self.stdout.write(f'\n{title}: {len(groups)}グループ')
+            for group in groups:
+                self.stdout.write(f'  ids={group["ids"]} splits={group["splits"]} labels={group["labels"]}')
+        style = self.style.ERROR if report['split_leaks'] else self.style.SUCCESS
+        self.stdout.write(style(f'\n分割をまたぐグループ: {report["split_leaks"]}'))
+        self.stdout.write(f'ラベルが異なるグループ: {report["label_conflicts"]}')
@@ -0,0 +1,52 @@
+"""
+アーカイブ・ディレクトリの画像をテーマに一括登録するコマンド
+
+使用例:
+    python manage.py ingest_images --theme-id 7 dataset.zip
+    python manage.py ingest_images --theme-id 7 /path/to/images --label-id 3 --workers 8
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management.ingest import INGEST_BATCH_SIZE, default_worker_count, ingest_images
+
+
+class Command(BaseCommand):
+    help = 'zip/tarアーカイブまたはディレクトリの画像をテーマに一括登録します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='zip/tarアーカイブまたはディレクトリのパス')
+        parser.add_argument('--theme-id', type=int, required=True, help='登録先のテーマID')
+        parser.add_argument('--label-id', type=int, default=None,
+                            help='ディレクトリ名がラベル名と一致しない画像に付けるラベルID（省略時は未ラベル）')
+        parser.add_argument('--labeled-by', default=None, help='ラベル付けした人')
+        parser.add_argument('--workers', type=int, default=default_worker_count(), help='ワーカー数')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='1回の登録件数')
+        parser.add_argument('--no-thumbnails', action='store_true', help='サムネイルを生成しない')
+
+    def handle(self, *args, **options):
+        def report(progress):
+            self.stdout.write(
+                f"  {progress['processed']}/{progress['found']} 処理済み "
+                f"(登録 {progress['created']}, 重複 {progress['duplicates']}, エラー {progress['invalid']})"
+            )
+
+        try:
+            stats = ingest_images(
+                options['theme_id'],
+                options['source'],
+                label_id=options['label_id'],
+                labeled_by=options['labeled_by'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                create_thumbnails=not options['no_thumbnails'],
+                progress_callback=report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for error in stats['errors']:
+            self.stderr.write(f"  {error['file']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"完了: 登録 {stats['created']}件, 重複 {stats['duplicates']}件, エラー {stats['invalid']}件 "
+            f"({stats['elapsed_seconds']:.1f}秒)"
+        ))
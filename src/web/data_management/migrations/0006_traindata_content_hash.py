@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0005_trainingjob_mlflow_parent_run_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traindata',
+            name='content_hash',
+            field=models.CharField(
+                max_length=64,
+                blank=True,
+                null=True,
+                verbose_name='コンテンツハッシュ（SHA-256）'
+            ),
+        ),
+        migrations.AddField(
+            model_name='traindata',
+            name='perceptual_hash',
+            field=models.CharField(
+                max_length=16,
+                blank=True,
+                null=True,
+                verbose_name='知覚ハッシュ（dHash）'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='traindata',
+            index=models.Index(fields=['theme', 'content_hash'], name='traindata_theme_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0006_traindata_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traindata',
+            index=models.Index(fields=['theme', 'split', 'label', 'created_at'], name='traindata_theme_split_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traindata',
+            index=models.Index(fields=['theme', 'created_at', 'id'], name='traindata_theme_created_idx'),
+        ),
+    ]
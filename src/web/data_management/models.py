@@ -66,6 +66,8 @@ class TrainData(models.Model):
     )
     split = models.CharField(max_length=10, choices=SPLIT_CHOICES, blank=True, null=True, verbose_name="データ分割")
     labeled_by = models.CharField(max_length=100, blank=True, null=True, verbose_name="ラベル付けした人")
+    content_hash = models.CharField(max_length=64, blank=True, null=True, verbose_name="コンテンツハッシュ（SHA-256）")
+    perceptual_hash = models.CharField(max_length=16, blank=True, null=True, verbose_name="知覚ハッシュ（dHash）")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
 
@@ -73,6 +75,12 @@ class TrainData(models.Model):
         verbose_name = "学習データ"
         verbose_name_plural = "学習データ"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['theme', 'content_hash'], name='traindata_theme_hash_idx'),
+            # 一覧の絞り込み（分割・ラベル）とキーセットページネーション用
+            models.Index(fields=['theme', 'split', 'label', 'created_at'], name='traindata_theme_split_idx'),
+            models.Index(fields=['theme', 'created_at', 'id'], name='traindata_theme_created_idx'),
+        ]
 
     def __str__(self):
         label_name = self.label.label_name if self.label else "未ラベル"
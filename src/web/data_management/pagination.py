@@ -0,0 +1,119 @@
+"""
+TrainDataのキーセット（カーソル）ページネーション
+
+一覧は (-created_at, -id) の順に並べ、前のページの最後の行の (created_at, id) より後の行を
+LIMITで取得します。OFFSETで読み飛ばさないため、深いページでも最初のページと同じコストで取得でき、
+インデックス（theme, created_at, id）/（theme, split, label, created_at）の範囲検索だけで済みます。
+
+総件数は統計のキャッシュ（statistics.count_traindata）から求め、リクエストごとのCOUNT(*)は行いません。
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.db.models import Q, QuerySet
+
+# 1ページの件数
+DEFAULT_PAGE_SIZE = 20
+
+# APIで指定できる1ページの最大件数
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, traindata_id: int) -> str:
+    """
+    行の位置をカーソル文字列にエンコード
+
+    Args:
+        created_at: 作成日時
+        traindata_id: TrainDataのID
+
+    Returns:
+        URLに含められるカーソル文字列
+    """
+    raw = f"{created_at.isoformat()}|{traindata_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    カーソル文字列をデコード
+
+    Args:
+        cursor: encode_cursorで作成したカーソル文字列
+
+    Returns:
+        (作成日時, TrainDataのID)
+
+    Raises:
+        ValueError: カーソルが不正な場合
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, traindata_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(traindata_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+
+
+def keyset_page(
+    queryset: QuerySet,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Dict:
+    """
+    キーセットページネーションで1ページ分の行を取得
+
+    afterを指定した場合はその行の次から、beforeを指定した場合はその行の直前までを取得します。
+    どちらも指定しない場合は最初のページです。
+
+    Args:
+        queryset: TrainDataのクエリセット（絞り込み済み、並び順は上書きされます）
+        after: 次のページを取得するカーソル
+        before: 前のページを取得するカーソル
+        page_size: 1ページの件数
+
+    Returns:
+        以下のキーを持つ辞書
+        - items: 行のリスト（-created_at, -idの順）
+        - has_next / has_previous: 次・前のページがあるか
+        - next_cursor / previous_cursor: 次・前のページを取得するカーソル（ない場合はNone）
+
+    Raises:
+        ValueError: afterとbeforeを両方指定した場合、カーソルやpage_sizeが不正な場合
+    """
+    if after and before:
+        raise ValueError("afterとbeforeは同時に指定できません")
+    if page_size < 1:
+        raise ValueError(f"page_sizeは1以上で指定してください: {page_size}")
+
+    if before:
+        created_at, traindata_id = decode_cursor(before)
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=traindata_id))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        if len(rows) <= page_size:
+            # 前に残りの行がない場合は最初のページ（件数が足りない場合も最初のページで揃える）
+            return keyset_page(queryset, page_size=page_size)
+        has_previous = True
+        items = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after:
+            created_at, traindata_id = decode_cursor(after)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=traindata_id))
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        items = rows[:page_size]
+        has_previous = bool(after)
+
+    return {
+        'items': items,
+        'has_next': has_next and bool(items),
+        'has_previous': has_previous and bool(items),
+        'next_cursor': encode_cursor(items[-1].created_at, items[-1].id) if has_next and items else None,
+        'previous_cursor': encode_cursor(items[0].created_at, items[0].id) if has_previous and items else None,
+    }
@@ -0,0 +1,17 @@
+"""
+シグナルハンドラ
+
+TrainDataの作成・更新・削除時にテーマの統計のキャッシュを無効化します。
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import TrainData
+from .statistics import invalidate_theme_statistics
+
+
+@receiver(post_save, sender=TrainData)
+@receiver(post_delete, sender=TrainData)
+def invalidate_statistics_on_traindata_change(sender, instance, **kwargs):
+    """TrainDataの変更時に統計のキャッシュを無効化"""
+    invalidate_theme_statistics(instance.theme_id)
@@ -0,0 +1,149 @@
+"""
+テーマの統計情報（ラベル × 分割ごとのデータ数）
+
+テーマごとに (label_id, split) ごとの件数を1回の集計クエリで取得し、Djangoのキャッシュに保存します。
+キャッシュはTrainDataの作成・更新・削除のシグナル（signals.py）で無効化されます。
+queryset.update()やbulk_create()はシグナルを送らないため、これらでTrainDataを変更した場合は
+invalidate_theme_statistics()を呼び出してください。
+"""
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import TrainData
+
+SPLIT_KEYS = ('train', 'valid', 'test', 'unsplit')
+
+# キャッシュの有効期限（秒）。別プロセスでの変更はシグナルが届かないため、この時間で反映されます
+STATISTICS_CACHE_TIMEOUT = 300
+
+CACHE_KEY_PREFIX = 'data_management:theme_statistics'
+
+
+def _cache_key(theme_id: int) -> str:
+    return f"{CACHE_KEY_PREFIX}:{theme_id}"
+
+
+def _empty_counts() -> Dict[str, int]:
+    counts = {key: 0 for key in SPLIT_KEYS}
+    counts['total'] = 0
+    return counts
+
+
+def _build_statistics(rows: Iterable[dict]) -> Dict:
+    """(label_id, split, count)の行からテーマの統計を作成"""
+    statistics = {
+        'splits': _empty_counts(),
+        'labels': {},
+        'unlabeled': _empty_counts(),
+    }
+    for row in rows:
+        split = row['split'] or 'unsplit'
+        if row['label_id'] is None:
+            label_counts = statistics['unlabeled']
+        else:
+            label_counts = statistics['labels'].setdefault(row['label_id'], _empty_counts())
+        for counts in (statistics['splits'], label_counts):
+            counts[split] += row['count']
+            counts['total'] += row['count']
+    return statistics
+
+
+def compute_themes_statistics(theme_ids: List[int]) -> Dict[int, Dict]:
+    """
+    複数テーマの統計を1回の集計クエリで計算（キャッシュを使用しない）
+
+    Args:
+        theme_ids: テーマIDのリスト
+
+    Returns:
+        テーマID -> 統計
+        統計は 'splits'（分割ごとの件数と'total'）、'labels'（ラベルID -> 分割ごとの件数）、
+        'unlabeled'（未ラベルの分割ごとの件数）を持つ辞書
+    """
+    rows_by_theme = {theme_id: [] for theme_id in theme_ids}
+    rows = (
+        TrainData.objects.filter(theme_id__in=theme_ids)
+        .values('theme_id', 'label_id', 'split')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        rows_by_theme[row['theme_id']].append(row)
+    return {theme_id: _build_statistics(theme_rows) for theme_id, theme_rows in rows_by_theme.items()}
+
+
+def get_themes_statistics(theme_ids: List[int]) -> Dict[int, Dict]:
+    """
+    複数テーマの統計を取得
+
+    キャッシュにないテーマのみをまとめて1回のクエリで計算し、キャッシュに保存します。
+
+    Args:
+        theme_ids: テーマIDのリスト
+
+    Returns:
+        テーマID -> 統計（compute_themes_statisticsを参照）
+    """
+    keys = {theme_id: _cache_key(theme_id) for theme_id in theme_ids}
+    cached = cache.get_many(list(keys.values()))
+    result = {theme_id: cached[key] for theme_id, key in keys.items() if key in cached}
+
+    missing = [theme_id for theme_id in theme_ids if theme_id not in result]
+    if missing:
+        computed = compute_themes_statistics(missing)
+        cache.set_many({keys[theme_id]: stats for theme_id, stats in computed.items()}, STATISTICS_CACHE_TIMEOUT)
+        result.update(computed)
+    return result
+
+
+def get_theme_statistics(theme_id: int) -> Dict:
+    """
+    テーマの統計を取得
+
+    Args:
+        theme_id: テーマID
+
+    Returns:
+        統計（compute_themes_statisticsを参照）
+    """
+    return get_themes_statistics([theme_id])[theme_id]
+
+
+def invalidate_theme_statistics(theme_id: int) -> None:
+    """
+    テーマの統計のキャッシュを無効化
+
+    トランザクション中の場合はコミット後に無効化します（コミット前の値が再びキャッシュされるのを防ぐため）。
+
+    Args:
+        theme_id: テーマID
+    """
+    transaction.on_commit(lambda: cache.delete(_cache_key(theme_id)))
+
+
+def count_traindata(statistics: Dict, filter_type: str = 'all', label_id: Optional[int] = None, split: Optional[str] = None) -> int:
+    """
+    統計から絞り込み条件に一致するデータ数を求める（COUNT(*)を実行しない）
+
+    Args:
+        statistics: テーマの統計（get_theme_statisticsの戻り値）
+        filter_type: 'all' / 'labeled' / 'unlabeled'
+        label_id: ラベルID（Noneの場合は絞り込まない）
+        split: 'train' / 'valid' / 'test' / 'unsplit'（Noneの場合は絞り込まない）
+
+    Returns:
+        データ数
+    """
+    key = split if split in SPLIT_KEYS else 'total'
+    if label_id is not None:
+        if filter_type == 'unlabeled':
+            return 0
+        return statistics['labels'].get(label_id, {}).get(key, 0)
+    if filter_type == 'unlabeled':
+        return statistics['unlabeled'][key]
+    if filter_type == 'labeled':
+        return statistics['splits'][key] - statistics['unlabeled'][key]
+    return statistics['splits'][key]
@@ -0,0 +1,251 @@
+"""
+サムネイルの生成とキャッシュ
+
+元画像から固定サイズ（THUMBNAIL_SIZES）のWebP/JPEGサムネイルを生成し、
+元画像のコンテンツハッシュ（SHA-256）をキーとしてディスクに保存します。
+
+保存先: <thumbnail_root>/<ハッシュ先頭2文字>/<ハッシュ>_<サイズ>.<拡張子>
+
+同じ内容の画像はサムネイルを共有し、元画像が変わればハッシュが変わるため古いサムネイルは参照されません。
+生成関数はDjangoの設定やDBに依存しないため、プロセスプールのワーカーからも呼び出せます。
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from PIL import Image, ImageOps, features
+
+# サイズ名 -> 長辺のピクセル数
+THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 256,
+    'large': 512,
+}
+DEFAULT_THUMBNAIL_SIZE = 'medium'
+
+# フォーマット名 -> (PILのフォーマット, Content-Type, 拡張子)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+THUMBNAIL_QUALITY = 80
+
+WEBP_SUPPORTED = features.check('webp')
+
+
+def available_formats() -> tuple:
+    """このPILで保存できるサムネイルのフォーマット"""
+    return tuple(fmt for fmt in THUMBNAIL_FORMATS if fmt != 'webp' or WEBP_SUPPORTED)
+
+
+def compute_content_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    ファイルのSHA-256ハッシュを計算
+
+    Args:
+        path: ファイルパス
+        chunk_size: 読み込み単位（バイト）
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_thumbnail_path(thumbnail_root: str, content_hash: str, size: str, fmt: str) -> Path:
+    """
+    サムネイルの保存先パスを取得
+
+    Args:
+        thumbnail_root: サムネイルのルートディレクトリ
+        content_hash: 元画像のコンテンツハッシュ
+        size: サイズ名（THUMBNAIL_SIZESのキー）
+        fmt: フォーマット名（THUMBNAIL_FORMATSのキー）
+
+    Returns:
+        サムネイルのパス
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"サムネイルのサイズ {size} はサポートされていません: {list(THUMBNAIL_SIZES)}")
+    if fmt not in THUMBNAIL_FORMATS:
+        raise ValueError(f"サムネイルのフォーマット {fmt} はサポートされていません: {list(THUMBNAIL_FORMATS)}")
+    extension = THUMBNAIL_FORMATS[fmt][2]
+    return Path(thumbnail_root) / content_hash[:2] / f"{content_hash}_{size}.{extension}"
+
+
+def _save_atomic(image: Image.Image, path: Path, fmt: str) -> None:
+    """一時ファイルに保存してから置き換える（並列生成時に途中のファイルを読まれないように）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pil_format = THUMBNAIL_FORMATS[fmt][0]
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if pil_format == 'JPEG':
+                image.save(f, pil_format, quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            else:
+                image.save(f, pil_format, quality=THUMBNAIL_QUALITY, method=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def generate_thumbnails(
+    image_path: str,
+    thumbnail_root: str,
+    content_hash: Optional[str] = None,
+    sizes: Optional[Iterable[str]] = None,
+    formats: Optional[Iterable[str]] = None,
+    overwrite: bool = False
+) -> str:
+    """
+    元画像からサムネイルを生成
+
+    既に存在するサムネイルは生成しません。元画像は1回だけデコードし、
+    大きいサイズから順に縮小して各サイズ・各フォーマットを保存します。
+
+    Args:
+        image_path: 元画像のパス
+        thumbnail_root: サムネイルのルートディレクトリ
+        content_hash: 元画像のコンテンツハッシュ（Noneの場合は計算）
+        sizes: 生成するサイズ名（Noneの場合はすべて）
+        formats: 生成するフォーマット名（Noneの場合は利用可能なすべて）
+        overwrite: 既存のサムネイルを作り直すか
+
+    Returns:
+        元画像のコンテンツハッシュ
+    """
+    if content_hash is None:
+        content_hash = compute_content_hash(image_path)
+    sizes = list(THUMBNAIL_SIZES) if sizes is None else list(sizes)
+    formats = list(available_formats()) if formats is None else list(formats)
+
+    targets = [
+        (size, fmt, get_thumbnail_path(thumbnail_root, content_hash, size, fmt))
+        for size in sizes
+        for fmt in formats
+    ]
+    if not overwrite:
+        targets = [target for target in targets if not target[2].exists()]
+    if not targets:
+        return content_hash
+
+    max_pixels = max(THUMBNAIL_SIZES[size] for size, _, _ in targets)
+    with Image.open(image_path) as image:
+        # JPEGは縮小しながらデコードする（大きな画像のデコード時間を削減）
+        image.draft('RGB', (max_pixels, max_pixels))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # 大きいサイズから順に縮小（前のサイズの結果を次の縮小元に使う）
+        for size in sorted({size for size, _, _ in targets}, key=lambda s: -THUMBNAIL_SIZES[s]):
+            pixels = THUMBNAIL_SIZES[size]
+            image.thumbnail((pixels, pixels), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for target_size, fmt, path in targets:
+                if target_size == size:
+                    _save_atomic(image, path, fmt)
+
+    return content_hash
+
+
+def generate_thumbnails_for_file(args: tuple) -> Dict:
+    """
+    プロセスプール用のラッパー
+
+    Args:
+        args: (traindata_id, 元画像のパス, サムネイルのルート, サイズ名, フォーマット名)
+
+    Returns:
+        traindata_id・コンテンツハッシュ・エラーの辞書
+    """
+    traindata_id, image_path, thumbnail_root, sizes, formats = args
+    try:
+        content_hash = generate_thumbnails(image_path, thumbnail_root, sizes=sizes, formats=formats)
+        return {'traindata_id': traindata_id, 'content_hash': content_hash, 'error': None}
+    except Exception as e:
+        return {'traindata_id': traindata_id, 'content_hash': None, 'error': str(e)}
+
+
+def select_format(accept: str) -> str:
+    """
+    Acceptヘッダからサムネイルのフォーマットを選択
+
+    Args:
+        accept: HTTPのAcceptヘッダ
+
+    Returns:
+        フォーマット名（WebPに対応していればwebp、それ以外はjpeg）
+    """
+    if WEBP_SUPPORTED and 'image/webp' in (accept or ''):
+        return 'webp'
+    return 'jpeg'
+
+
+def get_content_hash(image_path: str) -> str:
+    """
+    元画像のコンテンツハッシュを取得（Djangoのキャッシュを使用）
+
+    パス・更新日時・ファイルサイズをキーとしてキャッシュするため、
+    2回目以降は元画像を読み込みません。
+
+    Args:
+        image_path: 元画像のパス
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    from django.core.cache import cache
+
+    stat = os.stat(image_path)
+    key = f"data_management:content_hash:{hashlib.md5(image_path.encode()).hexdigest()}:{stat.st_mtime_ns}:{stat.st_size}"
+    content_hash = cache.get(key)
+    if content_hash is None:
+        content_hash = compute_content_hash(image_path)
+        cache.set(key, content_hash, None)
+    return content_hash
+
+
+def ensure_thumbnail(image_path: str, size: str, fmt: str, content_hash: Optional[str] = None) -> tuple:
+    """
+    サムネイルを取得（存在しない場合は生成）
+
+    Args:
+        image_path: 元画像のパス
+        size: サイズ名
+        fmt: フォーマット名
+        content_hash: 元画像のコンテンツハッシュ（TrainData.content_hash。Noneの場合はファイルから取得）
+
+    Returns:
+        (サムネイルのパス, 元画像のコンテンツハッシュ)
+    """
+    from django.conf import settings
+
+    if content_hash is None:
+        content_hash = get_content_hash(image_path)
+    path = get_thumbnail_path(settings.THUMBNAIL_ROOT, content_hash, size, fmt)
+    if not path.exists():
+        generate_thumbnails(image_path, settings.THUMBNAIL_ROOT, content_hash=content_hash, sizes=[size], formats=[fmt])
+    return path, content_hash
+
+
+def generate_traindata_thumbnails(image_path: str) -> str:
+    """
+    アップロードされた画像のすべてのサイズ・フォーマットのサムネイルを生成
+
+    Args:
+        image_path: 元画像のパス
+
+    Returns:
+        元画像のコンテンツハッシュ
+    """
+    from django.conf import settings
+
+    return generate_thumbnails(image_path, settings.THUMBNAIL_ROOT, content_hash=get_content_hash(image_path))
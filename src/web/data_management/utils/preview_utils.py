@@ -19,6 +19,7 @@ sys.path.insert(0, str(project_root))
 try:
     from src.data.augmentation import AugmentationBuilder, get_transforms
     from src.data.preprocessing import load_image, create_preprocessing_pipeline, PreprocessingPipeline
+    from src.data.patching import split_patching_config
 except ImportError:
     # Django環境外でも動作するように
     pass
@@ -122,6 +123,8 @@ def generate_preprocessing_preview(
         preprocessing_config = auguments_config.get('preprocessing', {})
         image_config = auguments_config.get('image', {})
         
+        # パッチ化は最初のパッチのみ切り出す（全パッチを生成しない）
+        preprocessing_config, patching = split_patching_config(preprocessing_config)
         pipeline = create_preprocessing_pipeline(
             preprocessing_config,
             image_config=image_config
@@ -138,10 +141,11 @@ def generate_preprocessing_preview(
             # 前処理を適用
             if pipeline is not None:
                 result_list = pipeline(original_image)
-                # 最初の結果を使用（パッチ化の場合は最初のパッチ）
                 preprocessed_image = result_list[0] if result_list else original_image
             else:
                 preprocessed_image = original_image
+            if patching is not None:
+                preprocessed_image = patching.get_patch(preprocessed_image, 0)
             
             preprocessed_images.append(image_to_base64(preprocessed_image))
         
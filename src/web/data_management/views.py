@@ -4,20 +4,43 @@
 要件定義に基づくLabel-Studio風UI
 """
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
 from django.db.models import Q, Count
 from django.conf import settings
 import json
+import logging
 import os
+import time
+import uuid
 from pathlib import Path
 
 from .models import Theme, Label, TrainData, Model, TrainingJob
 from .constants import MLFLOW_UI_URL
+from .duplicates import DEFAULT_NEAR_DUPLICATE_DISTANCE, build_duplicate_report
+from .ingest import (
+    UploadAlreadyClaimed,
+    UploadOffsetMismatch,
+    append_upload_chunk,
+    claim_upload,
+    get_ingest_job,
+    get_upload_offset,
+    start_ingest_job,
+)
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page
+from .statistics import count_traindata, get_theme_statistics
+from .thumbnails import (
+    DEFAULT_THUMBNAIL_SIZE,
+    THUMBNAIL_FORMATS,
+    THUMBNAIL_SIZES,
+    ensure_thumbnail,
+    generate_traindata_thumbnails,
+    select_format,
+)
 from .crud import (
     get_all_themes,
     create_theme,
@@ -25,6 +48,7 @@ from .crud import (
     create_label,
     delete_label,
     get_traindata_by_theme,
+    filter_traindata,
     create_traindata,
     update_traindata_label,
     delete_traindata,
@@ -42,12 +66,19 @@ from .utils.yaml_utils import (
 )
 from .utils.preview_utils import generate_preprocessing_preview, generate_augmentation_preview
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 import subprocess
 import tempfile
 import yaml
 from mlflow.tracking import MlflowClient
 from mlflow.exceptions import MlflowException
 
+logger = logging.getLogger(__name__)
+
+# サムネイルのブラウザキャッシュの有効期限（秒）。期限切れ後はETagで再検証されます
+THUMBNAIL_CACHE_MAX_AGE = 24 * 60 * 60
+
 
 def login_view(request):
     """ログイン画面"""
@@ -76,19 +107,12 @@ def logout_view(request):
 @login_required
 def theme_list(request):
     """テーマ一覧画面"""
-    themes = list(get_all_themes())
+    # label_countとimage_countはget_all_themesで付与済み
+    themes = get_all_themes()
     
     # 統計情報
     total_themes = len(themes)
-    total_images = TrainData.objects.count()
-    
-    # 各テーマのカウントを確実に取得（annotateの値を使用）
-    for theme in themes:
-        # annotateで設定された値が存在しない場合は、メソッドで取得
-        if not hasattr(theme, 'label_count'):
-            theme.label_count = theme.get_label_count()
-        if not hasattr(theme, 'image_count'):
-            theme.image_count = theme.get_image_count()
+    total_images = sum(theme.image_count for theme in themes)
     
     context = {
         'themes': themes,
@@ -136,54 +160,57 @@ def theme_detail(request, theme_id):
     filter_label = request.GET.get('label', '')  # ラベルIDでフィルタ
     filter_split = request.GET.get('split', '')  # train/valid/testでフィルタ
     
-    queryset = TrainData.objects.filter(theme_id=theme_id)
+    label_id = int(filter_label) if filter_label.isdigit() else None
+    queryset = filter_traindata(theme_id, filter_type=filter_type, label_id=label_id, split=filter_split)
     
-    # 基本フィルタ（未ラベル/ラベル済み）
-    if filter_type == 'unlabeled':
-        queryset = queryset.filter(label__isnull=True)
-    elif filter_type == 'labeled':
-        queryset = queryset.filter(label__isnull=False)
-    
-    # ラベルフィルタ
-    if filter_label and filter_label.isdigit():
-        queryset = queryset.filter(label_id=int(filter_label))
-    
-    # 分割フィルタ
-    if filter_split:
-        if filter_split == 'unsplit':
-            queryset = queryset.filter(split__isnull=True)
-        elif filter_split in ['train', 'valid', 'test']:
-            queryset = queryset.filter(split=filter_split)
-    
-    # ページネーション
-    paginator = Paginator(queryset, 20)  # 1ページ20件
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # キーセットページネーション（OFFSET・COUNT(*)を使わない）
+    # pageはカーソルと一緒に渡される表示用のページ番号
+    try:
+        page = keyset_page(queryset, after=request.GET.get('after'), before=request.GET.get('before'))
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = keyset_page(queryset)
+        page_number = 1
+    if not page['has_previous']:
+        page_number = 1
     
-    # 統計情報
+    # 統計情報（1回の集計クエリ、キャッシュあり）
+    statistics = get_theme_statistics(theme_id)
     stats = get_split_statistics(theme_id=theme_id)
     
+    # 件数は統計のキャッシュから求める
+    total_count = count_traindata(statistics, filter_type=filter_type, label_id=label_id, split=filter_split)
+    num_pages = max((total_count + DEFAULT_PAGE_SIZE - 1) // DEFAULT_PAGE_SIZE, 1)
+    if not page['has_next']:
+        page_number = num_pages if page['has_previous'] else 1
+    page_obj = {
+        'number': min(page_number, num_pages),
+        'num_pages': num_pages,
+        'total_count': total_count,
+        'has_next': page['has_next'],
+        'has_previous': page['has_previous'],
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+        'has_other_pages': page['has_next'] or page['has_previous'],
+    }
+    
     # ラベルごとの詳細統計
     label_stats = []
     for label in labels:
-        train_count = TrainData.objects.filter(theme_id=theme_id, label_id=label.id, split='train').count()
-        valid_count = TrainData.objects.filter(theme_id=theme_id, label_id=label.id, split='valid').count()
-        test_count = TrainData.objects.filter(theme_id=theme_id, label_id=label.id, split='test').count()
-        unsplit_count = TrainData.objects.filter(theme_id=theme_id, label_id=label.id, split__isnull=True).count()
-        total_count = train_count + valid_count + test_count + unsplit_count
-        
+        counts = statistics['labels'].get(label.id, {})
         label_stats.append({
             'label': label,
-            'train': train_count,
-            'valid': valid_count,
-            'test': test_count,
-            'unsplit': unsplit_count,
-            'total': total_count,
+            'train': counts.get('train', 0),
+            'valid': counts.get('valid', 0),
+            'test': counts.get('test', 0),
+            'unsplit': counts.get('unsplit', 0),
+            'total': counts.get('total', 0),
         })
     
     context = {
         'theme': theme,
         'labels': labels,
+        'traindata_list': page['items'],
         'page_obj': page_obj,
         'filter_type': filter_type,
         'filter_label': filter_label,
@@ -246,13 +273,19 @@ def api_upload_images(request, theme_id):
         created_count = 0
         
         for image_file in uploaded_files:
-            create_traindata(
+            traindata = create_traindata(
                 theme_id=theme_id,
                 image=image_file,
                 label_id=label_id,
                 labeled_by=request.user.username
             )
             created_count += 1
+            
+            # サムネイルを生成（失敗しても初回表示時に生成されるためアップロードは続行）
+            try:
+                generate_traindata_thumbnails(traindata.image.path)
+            except Exception as e:
+                logger.warning(f"サムネイルの生成に失敗しました (traindata_id={traindata.id}): {e}")
         
         return JsonResponse({
             'success': True,
@@ -262,6 +295,120 @@ def api_upload_images(request, theme_id):
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def api_ingest_upload(request, theme_id):
+    """
+    アーカイブの分割アップロードAPI
+    
+    GET: upload_idの受信済みバイト数（再開位置）を返す
+    POST: upload_id・offset・chunkを受け取り、チャンクを追記する
+    """
+    get_object_or_404(Theme, id=theme_id)
+    try:
+        if request.method == 'GET':
+            upload_id = request.GET.get('upload_id', '')
+            return JsonResponse({'success': True, 'offset': get_upload_offset(theme_id, upload_id)})
+        
+        upload_id = request.POST.get('upload_id', '')
+        offset = int(request.POST.get('offset', 0))
+        chunk = request.FILES.get('chunk')
+        if chunk is None:
+            return JsonResponse({'success': False, 'error': 'chunkが指定されていません'}, status=400)
+        return JsonResponse({'success': True, 'offset': append_upload_chunk(theme_id, upload_id, offset, chunk)})
+    except UploadOffsetMismatch as e:
+        # クライアントはoffsetから再送する
+        return JsonResponse({'success': False, 'error': str(e), 'offset': e.current_offset}, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@login_required
+@require_http_methods(["POST"])
+def api_ingest_start(request, theme_id):
+    """
+    画像の一括取り込み開始API
+    
+    分割アップロード済みのアーカイブ（upload_id）または1回で送信したアーカイブ（archive）を
+    バックグラウンドで取り込み、ジョブIDを返します。
+    アップロードはジョブの開始時に確保するため、同じupload_idで2回開始した場合
+    （またはアップロードが見つからない場合）は409を返します。
+    """
+    get_object_or_404(Theme, id=theme_id)
+    try:
+        label_id = request.POST.get('label_id')
+        label_id = int(label_id) if label_id else None
+        if label_id is not None:
+            get_object_or_404(Label, id=label_id, theme_id=theme_id)
+        
+        archive = request.FILES.get('archive')
+        if archive is not None:
+            upload_id = uuid.uuid4().hex
+            append_upload_chunk(theme_id, upload_id, 0, archive)
+        else:
+            upload_id = request.POST.get('upload_id', '')
+        source = claim_upload(theme_id, upload_id)
+        
+        job_id = start_ingest_job(
+            theme_id,
+            str(source),
+            remove_source=True,
+            label_id=label_id,
+            labeled_by=request.user.username,
+        )
+        return JsonResponse({'success': True, 'job_id': job_id})
+    except UploadAlreadyClaimed as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_ingest_status(request, theme_id, job_id):
+    """画像の一括取り込みの進捗API"""
+    job = get_ingest_job(job_id)
+    if job is None or job.get('theme_id') != theme_id:
+        return JsonResponse({'success': False, 'error': 'ジョブが見つかりません'}, status=404)
+    return JsonResponse({'success': True, 'job': job})
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def thumbnail(request, theme_id, traindata_id):
+    """
+    サムネイル配信
+    
+    クエリパラメータsize（small/medium/large）のサムネイルを返します。
+    AcceptヘッダがWebPに対応していればWebP、それ以外はJPEGです。
+    未生成の場合はこの時点で生成します。
+    """
+    traindata = get_object_or_404(TrainData.objects.only('id', 'theme_id', 'image', 'content_hash'), id=traindata_id, theme_id=theme_id)
+    size = request.GET.get('size', DEFAULT_THUMBNAIL_SIZE)
+    if size not in THUMBNAIL_SIZES:
+        return JsonResponse({'success': False, 'error': f'サイズ {size} はサポートされていません'}, status=400)
+    fmt = select_format(request.META.get('HTTP_ACCEPT', ''))
+    
+    try:
+        path, content_hash = ensure_thumbnail(traindata.image.path, size, fmt, traindata.content_hash)
+    except OSError as e:
+        # 元画像が存在しない・画像として読み込めない
+        logger.warning(f"サムネイルを作成できません (traindata_id={traindata_id}): {e}")
+        raise Http404('画像が見つかりません')
+    
+    # 内容はコンテンツハッシュ・サイズ・フォーマットで決まる
+    etag = f'"{content_hash[:32]}-{size}-{fmt}"'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_FORMATS[fmt][1])
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={THUMBNAIL_CACHE_MAX_AGE}'
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
 @login_required
 @require_http_methods(["DELETE"])
 def api_delete_image(request, theme_id, traindata_id):
@@ -288,7 +435,12 @@ def api_split_data(request, theme_id):
         test_ratio = float(data.get('test_ratio', 0.15))
         random_seed = int(data.get('random_seed', 42))
         unsplit_only = bool(data.get('unsplit_only', True))  # デフォルトはTrue（未分割のみ）
+        # 重複する画像は同じ分割にする（near_duplicate_distanceを指定すると近似重複も含める）
+        keep_duplicates_together = bool(data.get('keep_duplicates_together', True))
+        near_duplicate_distance = data.get('near_duplicate_distance')
+        near_duplicate_distance = int(near_duplicate_distance) if near_duplicate_distance is not None else None
         
+        start_time = time.perf_counter()
         # unsplit_onlyがTrueの場合は未分割データのみを分割、Falseの場合は全データを再分割
         if unsplit_only:
             stats = assign_splits_to_new_data(
@@ -296,7 +448,9 @@ def api_split_data(request, theme_id):
                 train_ratio=train_ratio,
                 valid_ratio=valid_ratio,
                 test_ratio=test_ratio,
-                random_seed=random_seed
+                random_seed=random_seed,
+                keep_duplicates_together=keep_duplicates_together,
+                near_duplicate_distance=near_duplicate_distance
             )
         else:
             from data_management.crud import assign_all_splits
@@ -305,13 +459,19 @@ def api_split_data(request, theme_id):
                 train_ratio=train_ratio,
                 valid_ratio=valid_ratio,
                 test_ratio=test_ratio,
-                random_seed=random_seed
+                random_seed=random_seed,
+                keep_duplicates_together=keep_duplicates_together,
+                near_duplicate_distance=near_duplicate_distance
             )
         
+        elapsed_seconds = time.perf_counter() - start_time
+        logger.info(f"テーマ {theme_id} のデータ分割: {elapsed_seconds:.2f}秒 (unsplit_only={unsplit_only})")
+        
         return JsonResponse({
             'success': True,
             'stats': stats,
             'unsplit_only': unsplit_only,
+            'elapsed_seconds': round(elapsed_seconds, 3),
         })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
@@ -322,20 +482,18 @@ def api_split_data(request, theme_id):
 def api_statistics(request, theme_id):
     """統計取得API"""
     try:
+        statistics = get_theme_statistics(theme_id)
         stats = get_split_statistics(theme_id=theme_id)
         
-        # ラベル別統計
-        label_stats = TrainData.objects.filter(theme_id=theme_id).values(
-            'label__id', 'label__label_name'
-        ).annotate(count=Count('id')).order_by('label__id')
-        
+        # ラベル別統計（データのあるラベルのみ）
         label_counts = [
             {
-                'label_id': item['label__id'],
-                'label_name': item['label__label_name'],
-                'count': item['count']
+                'label_id': label.id,
+                'label_name': label.label_name,
+                'count': statistics['labels'][label.id]['total']
             }
-            for item in label_stats if item['label__id']
+            for label in get_labels_by_theme(theme_id=theme_id)
+            if label.id in statistics['labels']
         ]
         
         return JsonResponse({
@@ -347,6 +505,75 @@ def api_statistics(request, theme_id):
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
+@login_required
+@require_http_methods(["GET"])
+def api_duplicates(request, theme_id):
+    """
+    重複画像レポートAPI
+    
+    クエリパラメータmax_distanceで近似重複とみなすハミング距離を指定します（exact_only=1の場合は完全一致のみ）。
+    """
+    get_object_or_404(Theme, id=theme_id)
+    try:
+        if request.GET.get('exact_only') in ('1', 'true'):
+            max_distance = None
+        else:
+            max_distance = int(request.GET.get('max_distance', DEFAULT_NEAR_DUPLICATE_DISTANCE))
+        report = build_duplicate_report(theme_id, near_duplicate_distance=max_distance)
+        return JsonResponse({'success': True, 'report': report})
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_traindata_list(request, theme_id):
+    """
+    画像一覧API（キーセットページネーション）
+
+    クエリパラメータはfilter・label・splitで絞り込み、after/beforeに前回のnext_cursor/previous_cursorを
+    指定して次・前のページを取得します（page_sizeは最大MAX_PAGE_SIZE）。件数は統計のキャッシュから求めます。
+    """
+    get_object_or_404(Theme, id=theme_id)
+    filter_type = request.GET.get('filter', 'all')
+    filter_label = request.GET.get('label', '')
+    filter_split = request.GET.get('split', '')
+    label_id = int(filter_label) if filter_label.isdigit() else None
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_sizeは1以上{MAX_PAGE_SIZE}以下で指定してください: {page_size}")
+        queryset = filter_traindata(theme_id, filter_type=filter_type, label_id=label_id, split=filter_split)
+        page = keyset_page(queryset, after=request.GET.get('after'), before=request.GET.get('before'), page_size=page_size)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    statistics = get_theme_statistics(theme_id)
+    items = []
+    for traindata in page['items']:
+        thumbnail_url = reverse('thumbnail', args=[theme_id, traindata.id])
+        items.append({
+            'id': traindata.id,
+            'image_name': os.path.basename(traindata.image.name),
+            'label_id': traindata.label_id,
+            'label_name': traindata.label.label_name if traindata.label else None,
+            'split': traindata.split,
+            'labeled_by': traindata.labeled_by,
+            'created_at': traindata.created_at.isoformat(),
+            'thumbnail_url': f"{thumbnail_url}?size=medium",
+            'large_thumbnail_url': f"{thumbnail_url}?size=large",
+        })
+    return JsonResponse({
+        'success': True,
+        'items': items,
+        'total_count': count_traindata(statistics, filter_type=filter_type, label_id=label_id, split=filter_split),
+        'has_next': page['has_next'],
+        'has_previous': page['has_previous'],
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+    })
+
+
 def _get_mlflow_tracking_uri() -> str:
     """
     MLflowのtracking URIをconfig.yamlから取得
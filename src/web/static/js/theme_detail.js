@@ -173,7 +173,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const filterType = this.dataset.filterType;
             const url = new URL(window.location);
             url.searchParams.set('filter', filterType);
-            url.searchParams.set('page', '1');
+            resetPagination(url);
             window.location.href = url.toString();
         });
     });
@@ -190,7 +190,7 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 url.searchParams.delete('label');
             }
-            url.searchParams.set('page', '1');
+            resetPagination(url);
             window.location.href = url.toString();
         });
     }
@@ -206,7 +206,7 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 url.searchParams.delete('split');
             }
-            url.searchParams.set('page', '1');
+            resetPagination(url);
             window.location.href = url.toString();
         });
     });
@@ -219,7 +219,7 @@ document.addEventListener('DOMContentLoaded', function() {
             url.searchParams.delete('filter');
             url.searchParams.delete('label');
             url.searchParams.delete('split');
-            url.searchParams.set('page', '1');
+            resetPagination(url);
             window.location.href = url.toString();
         });
     }
@@ -228,6 +228,13 @@ document.addEventListener('DOMContentLoaded', function() {
     setInterval(updateStatistics, 10000);
 });
 
+// 絞り込みを変更したときは最初のページに戻す（カーソルは絞り込み条件ごとに異なるため）
+function resetPagination(url) {
+    url.searchParams.delete('after');
+    url.searchParams.delete('before');
+    url.searchParams.set('page', '1');
+}
+
 // ラベル更新
 function updateLabel(imageId, labelId) {
     if (!imageId || !labelId) {
@@ -298,7 +305,13 @@ function deleteImage(imageId) {
 // 画像アップロード
 function uploadImages() {
     const form = document.getElementById('upload-form');
+    const archiveInput = document.getElementById('upload-archive');
+    if (archiveInput && archiveInput.files.length > 0) {
+        ingestArchive(archiveInput.files[0], document.getElementById('upload-label').value);
+        return;
+    }
     const formData = new FormData(form);
+    formData.delete('archive');
     
     const url = `/api/theme/${themeId}/images/upload/`;
     
@@ -325,6 +338,92 @@ function uploadImages() {
     });
 }
 
+// アーカイブの一括取り込み
+const INGEST_CHUNK_SIZE = 8 * 1024 * 1024;
+
+function showIngestProgress(message) {
+    const progress = document.getElementById('ingest-progress');
+    progress.style.display = 'block';
+    progress.textContent = message;
+}
+
+async function ingestArchive(file, labelId) {
+    const baseUrl = `/api/theme/${themeId}/ingest`;
+    // 同じファイルは同じアップロードIDになり、中断した位置から再開できる
+    const uploadId = `${file.size}-${file.lastModified}-${file.name.replace(/[^A-Za-z0-9_-]/g, '_')}`.slice(0, 64);
+    
+    try {
+        let response = await fetch(`${baseUrl}/upload/?upload_id=${encodeURIComponent(uploadId)}`);
+        let data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        let offset = Math.min(data.offset, file.size);
+        
+        // 分割アップロード
+        while (offset < file.size) {
+            const formData = new FormData();
+            formData.append('upload_id', uploadId);
+            formData.append('offset', offset);
+            formData.append('chunk', file.slice(offset, offset + INGEST_CHUNK_SIZE));
+            response = await fetch(`${baseUrl}/upload/`, {
+                method: 'POST',
+                headers: {'X-CSRFToken': csrfToken},
+                body: formData
+            });
+            data = await response.json();
+            if (!data.success && data.offset === undefined) {
+                throw new Error(data.error);
+            }
+            offset = data.offset;
+            showIngestProgress(`アップロード中: ${Math.floor(offset / file.size * 100)}%`);
+        }
+        
+        // 取り込み開始
+        const startData = new FormData();
+        startData.append('upload_id', uploadId);
+        startData.append('label_id', labelId);
+        response = await fetch(`${baseUrl}/start/`, {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrfToken},
+            body: startData
+        });
+        data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        pollIngestJob(data.job_id);
+    } catch (error) {
+        console.error('Error:', error);
+        alert('アーカイブの取り込みに失敗しました: ' + error.message);
+    }
+}
+
+function pollIngestJob(jobId) {
+    fetch(`/api/theme/${themeId}/ingest/${jobId}/`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        const job = data.job;
+        if (job.status === 'completed') {
+            alert(`${job.created}件の画像を登録しました（重複 ${job.duplicates}件, エラー ${job.invalid}件, ${job.elapsed_seconds.toFixed(1)}秒）`);
+            document.getElementById('upload-modal').style.display = 'none';
+            location.reload();
+        } else if (job.status === 'failed') {
+            alert('アーカイブの取り込みに失敗しました: ' + job.error);
+        } else {
+            showIngestProgress(`取り込み中: ${job.processed || 0}/${job.found || 0}件（登録 ${job.created || 0}件, 重複 ${job.duplicates || 0}件）`);
+            setTimeout(() => pollIngestJob(jobId), 1000);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('エラーが発生しました');
+    });
+}
+
 // データ分割
 function splitData() {
     const form = document.getElementById('split-form');
@@ -367,7 +466,7 @@ function splitData() {
             const message = data.unsplit_only 
                 ? 'データ分割が完了しました（未分割データのみ）' 
                 : 'データ分割が完了しました（全データを再分割）';
-            alert(message);
+            alert(`${message}\n処理時間: ${data.elapsed_seconds.toFixed(2)}秒`);
             document.getElementById('split-modal').style.display = 'none';
             updateStatistics();
             location.reload();
@@ -434,7 +533,9 @@ function showImageModal(imageId) {
         return;
     }
     
-    const imageSrc = imageCard.querySelector('.image-thumbnail').src;
+    // 拡大表示には大きいサイズのサムネイルを使用
+    const thumbnail = imageCard.querySelector('.image-thumbnail');
+    const imageSrc = thumbnail.dataset.largeSrc || thumbnail.src;
     const currentLabel = imageCard.querySelector('.label-badge')?.textContent || '未ラベル';
     
     // モーダルコンテンツを設定
@@ -0,0 +1,111 @@
+"""
+学習前の自動チューニング（バッチサイズ・学習率）のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.auto_tune import auto_tune, find_max_batch_size, parse_auto_tune_config
+from src.training.lightning_module import ClassificationLightningModule
+from src.training.trial_context import TrialContext
+
+
+class TensorDataModule(pl.LightningDataModule):
+    """テスト用のDataModule"""
+
+    def __init__(self, batch_size: int = 2):
+        super().__init__()
+        self.batch_size = batch_size
+        self.train_dataset = TensorDataset(torch.rand(64, 3, 32, 32), torch.randint(0, 2, (64,)))
+
+    def train_dataloader(self):
+        return DataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True)
+
+    def val_dataloader(self):
+        return DataLoader(self.train_dataset, batch_size=self.batch_size)
+
+
+def _create_module():
+    torch.manual_seed(0)
+    return ClassificationLightningModule(model_name="ResNet18", num_classes=2, pretrained=False)
+
+
+def test_parse_auto_tune_config():
+    """training.auto_tuneの各形式を正規化できるか"""
+    assert parse_auto_tune_config(None) is None
+    assert parse_auto_tune_config({"batch_size": False, "learning_rate": False}) is None
+
+    config = parse_auto_tune_config(True)
+    assert config["batch_size"] and config["learning_rate"]
+    assert parse_auto_tune_config({"max_batch_size": 64})["max_batch_size"] == 64
+
+    with pytest.raises(ValueError):
+        parse_auto_tune_config({"max_batch": 64})
+    with pytest.raises(ValueError):
+        parse_auto_tune_config({"memory_fraction": 1.5})
+
+
+def test_find_max_batch_size():
+    """メモリ予算と上限に応じてバッチサイズが決まり、元のモデルは変わらないか"""
+    module = _create_module()
+    state = {k: v.clone() for k, v in module.state_dict().items()}
+    shape = torch.Size([3, 32, 32])
+    cpu = torch.device("cpu")
+
+    # 予算が十分な場合は上限まで倍にする
+    result = find_max_batch_size(module, shape, cpu, memory_budget=1 << 50, initial_batch_size=2, max_batch_size=16)
+    assert result["batch_size"] == 16
+
+    # 予算を超える場合は下限（BatchNormがあるため2）まで下げる
+    result = find_max_batch_size(module, shape, cpu, memory_budget=1, initial_batch_size=8, max_batch_size=16)
+    assert result["batch_size"] == 2
+
+    for key, value in module.state_dict().items():
+        assert torch.equal(value, state[key])
+
+
+def test_find_max_batch_size_cpu_doubles_from_minimum(monkeypatch):
+    """CPUではRSSの最大値が下がらないため、初期値に関係なく最小のバッチサイズから倍にしていくか"""
+    import src.training.auto_tune as auto_tune_module
+
+    measured = []
+
+    def fake_measure(model, batch_size, *args, **kwargs):
+        measured.append(batch_size)
+        return batch_size * 1000
+
+    monkeypatch.setattr(auto_tune_module, "measure_step_memory", fake_measure)
+    module = _create_module()
+    optimizer_bytes = 2 * sum(p.numel() * p.element_size() for p in module.model.parameters())
+    result = find_max_batch_size(
+        module, torch.Size([3, 32, 32]), torch.device("cpu"),
+        memory_budget=optimizer_bytes + 4500, initial_batch_size=16, max_batch_size=64
+    )
+    assert measured == [2, 4, 8]
+    assert result["batch_size"] == 4
+
+
+def test_auto_tune():
+    """バッチサイズと学習率がDataModule・LightningModuleに設定され、トライアル間で再利用されるか"""
+    config = parse_auto_tune_config({"max_batch_size": 8, "memory_budget_mb": 1 << 30, "lr_num_steps": 20})
+    context = TrialContext()
+
+    for _ in range(2):
+        module = _create_module()
+        datamodule = TensorDataModule()
+        results = auto_tune(module, datamodule, config, accelerator="cpu", trial_context=context)
+
+        assert datamodule.batch_size == results["batch_size"] == 8
+        if "learning_rate" in results:
+            assert module.hparams.learning_rate == results["learning_rate"]
+
+    assert context.hits == 1
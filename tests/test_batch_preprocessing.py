@@ -0,0 +1,125 @@
+"""
+バッチ前処理のテスト
+
+画像単位の処理（cv2）とバッチ処理の結果が一致するか確認
+"""
+
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.batch_preprocessing import (
+    BatchPreprocessingCollate,
+    BatchPreprocessingPipeline,
+    apply_lut,
+    build_gamma_lut,
+    equalize_histogram_batch,
+    equalize_histogram_batch_torch,
+)
+
+
+@pytest.fixture
+def batch():
+    """テスト用のランダムなバッチ（低コントラスト）"""
+    rng = np.random.default_rng(0)
+    images = rng.integers(60, 140, size=(4, 32, 24, 3), dtype=np.uint8)
+    images[3] = 100  # 単色画像
+    return images
+
+
+def _equalize_reference(image):
+    ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
+    ycrcb[..., 0] = cv2.equalizeHist(ycrcb[..., 0])
+    return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
+
+
+def _clahe_reference(image, clip_limit=2.0, tile_grid_size=(8, 8)):
+    ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+    ycrcb[..., 0] = clahe.apply(ycrcb[..., 0])
+    return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
+
+
+def test_gamma_lut_direction():
+    """ガンマ値 > 1.0で暗く、< 1.0で明るくなるか（docs/data_pipeline.mdの定義）"""
+    darker = build_gamma_lut(2.0)
+    assert (darker[0], darker[64], darker[128], darker[255]) == (0, 16, 64, 255)
+    assert darker[128] < 128
+    brighter = build_gamma_lut(0.5)
+    assert (brighter[0], brighter[64], brighter[128], brighter[255]) == (0, 128, 181, 255)
+    np.testing.assert_array_equal(build_gamma_lut(1.0), np.arange(256))
+
+
+def test_apply_lut(batch):
+    """LUTがnumpy・torchのバッチ全体に適用されるか"""
+    lut = build_gamma_lut(2.0)
+    expected = lut[batch]
+    np.testing.assert_array_equal(apply_lut(batch, lut), expected)
+
+    tensor_result = apply_lut(torch.from_numpy(batch), lut)
+    np.testing.assert_array_equal(tensor_result.numpy(), expected)
+
+
+def test_gamma_must_be_positive():
+    """不正なガンマ値でエラーになるか"""
+    with pytest.raises(ValueError):
+        build_gamma_lut(0)
+
+
+def test_global_equalization_matches_cv2(batch):
+    """バッチのヒストグラム均等化がcv2.equalizeHistと一致するか"""
+    result = equalize_histogram_batch(batch.copy())
+    for image, actual in zip(batch, result):
+        np.testing.assert_array_equal(actual, _equalize_reference(image))
+
+
+def test_torch_equalization_matches_cv2(batch):
+    """torch版がcv2と一致するか"""
+    result = equalize_histogram_batch_torch(torch.from_numpy(batch)).numpy()
+    expected = np.stack([_equalize_reference(image) for image in batch])
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_pipeline_from_config(batch):
+    """設定から作成したパイプラインが画像単位の処理と一致するか"""
+    config = {
+        "histogram_equalization": {"enabled": True, "method": "clahe", "clahe": {"clip_limit": 2, "tile_grid_size": [4, 4]}},
+        "gamma_correction": {"enabled": True, "gamma": 2},
+    }
+    pipeline = BatchPreprocessingPipeline.from_config(config)
+    result = pipeline(batch.copy())
+
+    lut = build_gamma_lut(2)
+    for image, actual in zip(batch, result):
+        np.testing.assert_array_equal(actual, lut[_clahe_reference(image, 2, (4, 4))])
+
+
+def test_pipeline_disabled():
+    """有効な前処理がない場合はNoneを返すか"""
+    assert BatchPreprocessingPipeline.from_config({"gamma_correction": {"enabled": False}}) is None
+
+
+def test_list_with_different_shapes():
+    """形状の異なる画像のリストを処理できるか"""
+    pipeline = BatchPreprocessingPipeline(gamma=2.0)
+    images = [np.full((4, 4, 3), 64, dtype=np.uint8), np.full((6, 2, 3), 64, dtype=np.uint8)]
+    result = pipeline(images)
+    assert [image.shape for image in result] == [(4, 4, 3), (6, 2, 3)]
+    assert result[1].max() == build_gamma_lut(2.0)[64]
+
+
+def test_collate(batch):
+    """collate_fnがテンソルのバッチを返すか"""
+    collate = BatchPreprocessingCollate(BatchPreprocessingPipeline(histogram_equalization="global"))
+    images, labels = collate([(image, i) for i, image in enumerate(batch)])
+    assert images.shape == (4, 3, 32, 24)
+    assert images.dtype == torch.float32
+    assert labels.tolist() == [0, 1, 2, 3]
@@ -0,0 +1,65 @@
+"""
+データ分割（層化分割）のまとめて更新のテスト
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def _create_traindata(theme, labels, per_label=20):
+    """ラベルごとにper_label件の学習データを作成"""
+    from data_management.models import TrainData
+
+    TrainData.objects.bulk_create([
+        TrainData(theme=theme, label=label, image=f"images/{label.id}_{i}.png")
+        for label in labels
+        for i in range(per_label)
+    ])
+
+
+def test_compute_stratified_splits(setup_django_env):
+    """ラベルごとの比率が維持され、同じシードでは同じ結果になるか"""
+    from data_management.crud import compute_stratified_splits
+
+    rows = [(i, i % 2) for i in range(40)] + [(100 + i, None) for i in range(10)]
+    assignments = compute_stratified_splits(rows, train_ratio=0.7, valid_ratio=0.15, random_seed=0)
+
+    assert [len(assignments[s]) for s in ("train", "valid", "test")] == [14 + 14 + 7, 3 + 3 + 1, 3 + 3 + 2]
+    assert sorted(sum(assignments.values(), [])) == sorted(i for i, _ in rows)
+    assert compute_stratified_splits(list(reversed(rows)), random_seed=0) == compute_stratified_splits(rows, random_seed=0)
+    assert compute_stratified_splits(rows, random_seed=1) != compute_stratified_splits(rows, random_seed=0)
+
+
+def test_assign_splits(test_theme):
+    """未分割データのみ・全データの分割がまとめて反映されるか"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from data_management.crud import assign_all_splits, assign_splits_to_new_data
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    _create_traindata(theme, labels[:2])
+
+    with CaptureQueriesContext(connection) as queries:
+        stats = assign_splits_to_new_data(theme.id, random_seed=0)
+    assert stats == {"train": 28, "valid": 6, "test": 6, "unsplit": 0}
+    # データ数に関係なく、取得・分割ごとの更新・統計のクエリ数は一定
+    assert len(queries) < 15
+
+    # 追加したデータのみ分割され、既存の分割は変わらない
+    before = dict(TrainData.objects.filter(theme=theme).values_list("id", "split"))
+    _create_traindata(theme, labels[2:3], per_label=10)
+    stats = assign_splits_to_new_data(theme.id, random_seed=0)
+    assert stats == {"train": 35, "valid": 7, "test": 8, "unsplit": 0}
+    after = dict(TrainData.objects.filter(theme=theme).values_list("id", "split"))
+    assert all(after[i] == split for i, split in before.items())
+
+    # 全データの再分割は同じシードで同じ結果になる
+    assign_all_splits(theme.id, random_seed=1)
+    first = dict(TrainData.objects.filter(theme=theme).values_list("id", "split"))
+    assign_all_splits(theme.id, random_seed=1)
+    assert dict(TrainData.objects.filter(theme=theme).values_list("id", "split")) == first
@@ -0,0 +1,94 @@
+"""
+torch.compileの設定とeagerへのフォールバックのテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.compile import DEFAULT_COMPILE_CACHE_DIR, parse_compile_config
+from src.training.lightning_module import ClassificationLightningModule
+
+
+def test_parse_compile_config():
+    """training.compileの各形式を正規化できるか"""
+    assert parse_compile_config(None) is None
+    assert parse_compile_config(False) is None
+    assert parse_compile_config({"enabled": False, "mode": "max-autotune"}) is None
+
+    assert parse_compile_config(True) == {"mode": "default", "cache_dir": DEFAULT_COMPILE_CACHE_DIR, "fallback": True}
+    assert parse_compile_config("reduce-overhead")["mode"] == "reduce-overhead"
+    assert parse_compile_config({"mode": "max-autotune", "cache_dir": "/tmp/cache", "fallback": False}) == {
+        "mode": "max-autotune", "cache_dir": "/tmp/cache", "fallback": False
+    }
+
+    with pytest.raises(ValueError):
+        parse_compile_config("fast")
+
+
+def test_state_dict_unchanged(tmp_path):
+    """コンパイルしてもstate_dictのキーとget_model()は変わらないか"""
+    module = ClassificationLightningModule(
+        model_name="ResNet18", num_classes=2, pretrained=False,
+        compile={"mode": "default", "cache_dir": str(tmp_path)}
+    )
+    keys = set(module.state_dict())
+    module.setup("fit")
+
+    assert module._compiled_model is not None
+    assert set(module.state_dict()) == keys
+    assert module.hparams.compile["mode"] == "default"
+
+
+def test_eager_fallback():
+    """コンパイル済みモデルの実行に失敗した場合にeagerで実行されるか"""
+    module = ClassificationLightningModule(model_name="ResNet18", num_classes=2, pretrained=False, compile=True)
+    module.eval()
+
+    def failing_model(x):
+        raise torch._dynamo.exc.TorchDynamoException("compile failed")
+
+    module._set_compiled_model(failing_model)
+    x = torch.rand(1, 3, 32, 32)
+    with torch.no_grad():
+        assert torch.equal(module(x), module.model(x))
+    assert module._compiled_model is None
+
+    # fallback=Falseの場合はエラーを送出
+    module = ClassificationLightningModule(
+        model_name="ResNet18", num_classes=2, pretrained=False, compile={"fallback": False}
+    )
+    module._set_compiled_model(failing_model)
+    with pytest.raises(torch._dynamo.exc.TorchDynamoException):
+        module(x)
+
+
+def test_suppress_errors_is_scoped(tmp_path):
+    """fallbackのsuppress_errorsがコンパイル済みモデルの呼び出し中だけ有効になるか"""
+    import torch._dynamo
+
+    module = ClassificationLightningModule(
+        model_name="ResNet18", num_classes=2, pretrained=False,
+        compile={"mode": "default", "cache_dir": str(tmp_path)}
+    )
+    module.setup("fit")
+    assert torch._dynamo.config.suppress_errors is False
+
+    seen = []
+
+    def recording_model(x):
+        seen.append(torch._dynamo.config.suppress_errors)
+        return module.model(x)
+
+    module._set_compiled_model(recording_model)
+    module.eval()
+    with torch.no_grad():
+        module(torch.rand(1, 3, 32, 32))
+    assert seen == [True]
+    assert torch._dynamo.config.suppress_errors is False
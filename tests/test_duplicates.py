@@ -0,0 +1,149 @@
+"""
+コンテンツハッシュ・知覚ハッシュによる重複検出と、重複を考慮したデータ分割のテスト
+"""
+
+import io
+import json
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def _image(seed, size=64):
+    # 滑らかな画像（知覚ハッシュが縮小・再圧縮で変わらないように）
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((size, size), Image.Resampling.BICUBIC)
+
+
+def _png_bytes(image, fmt='PNG', **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_perceptual_hash_and_near_duplicates(setup_django_env):
+    """縮小・再圧縮した画像の知覚ハッシュが近く、近似重複の検索が全組の比較と一致するか"""
+    from data_management.duplicates import compute_perceptual_hash, find_near_duplicate_pairs, hamming_distance
+
+    original = io.BytesIO(_png_bytes(_image(0, 256)))
+    recompressed = io.BytesIO(_png_bytes(_image(0, 256).resize((128, 128)), 'JPEG', quality=70))
+    other = io.BytesIO(_png_bytes(_image(1, 256)))
+    assert hamming_distance(compute_perceptual_hash(original), compute_perceptual_hash(recompressed)) <= 4
+    assert hamming_distance(compute_perceptual_hash(original), compute_perceptual_hash(other)) > 10
+
+    rng = random.Random(0)
+    hashes = {}
+    for i in range(300):
+        value = rng.getrandbits(64) if i % 3 == 0 else int(hashes[i - 1], 16) ^ (1 << rng.randrange(64))
+        hashes[i] = f"{value:016x}"
+    expected = [
+        (a, b, hamming_distance(hashes[a], hashes[b]))
+        for a in hashes for b in hashes
+        if a < b and hamming_distance(hashes[a], hashes[b]) <= 3
+    ]
+    assert find_near_duplicate_pairs(hashes, max_distance=3) == expected
+    with pytest.raises(ValueError):
+        find_near_duplicate_pairs(hashes, max_distance=64)
+
+
+def test_perceptual_hash_same_for_all_entry_points(setup_django_env, tmp_path):
+    """アップロード・バックフィル・一括取り込みでJPEGの知覚ハッシュが一致するか"""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from data_management.duplicates import compute_image_hashes, compute_uploaded_file_hashes
+    from data_management.ingest import inspect_image
+
+    # draft（縮小デコード）が効く大きさのJPEG
+    path = tmp_path / 'large.jpg'
+    path.write_bytes(_png_bytes(_image(3, 1024), 'JPEG', quality=90))
+
+    _, backfill_hash = compute_image_hashes(str(path))
+    _, upload_hash = compute_uploaded_file_hashes(SimpleUploadedFile('large.jpg', path.read_bytes()))
+    ingest_hash = inspect_image(str(path))['perceptual_hash']
+    assert backfill_hash == upload_hash == ingest_hash
+
+
+def test_splits_keep_duplicates_together(test_theme):
+    """重複グループが同じ分割に割り当てられ、未分割の重複は既存の分割に合わせられるか"""
+    from data_management.crud import assign_all_splits, assign_splits_to_new_data
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    rows = []
+    for i in range(60):
+        # 3枚ずつ同じ内容（10グループ）、残りは重複なし
+        content_hash = f"{i // 3:064x}" if i < 30 else f"{1000 + i:064x}"
+        rows.append(TrainData(theme=theme, label=labels[i % 2], image=f"images/{i}.png", content_hash=content_hash))
+    TrainData.objects.bulk_create(rows)
+
+    stats = assign_all_splits(theme.id, random_seed=3)
+    assert sum(stats.values()) == 60 and stats['unsplit'] == 0
+    splits_by_hash = {}
+    for content_hash, split in TrainData.objects.filter(theme=theme).values_list('content_hash', 'split'):
+        splits_by_hash.setdefault(content_hash, set()).add(split)
+    assert all(len(splits) == 1 for splits in splits_by_hash.values())
+
+    # 既存の画像と同じ内容の画像は、その画像と同じ分割になる
+    existing = TrainData.objects.filter(theme=theme, content_hash=f"{0:064x}").first()
+    new = TrainData.objects.create(theme=theme, label=labels[5], image="images/new.png", content_hash=existing.content_hash)
+    assign_splits_to_new_data(theme.id, random_seed=3)
+    new.refresh_from_db()
+    assert new.split == existing.split
+
+    # 重複を考慮しない場合も全件が分割される
+    stats = assign_all_splits(theme.id, random_seed=3, keep_duplicates_together=False)
+    assert sum(stats.values()) == 61 and stats['unsplit'] == 0
+
+
+def test_hash_on_upload_backfill_and_report(test_theme, setup_django_env, tmp_path):
+    """アップロード時にハッシュが保存され、一括計算コマンドとレポートで重複が検出されるか"""
+    from io import StringIO
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.management import call_command
+    from django.test import override_settings
+    from data_management.crud import create_traindata
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    media = tmp_path / 'media'
+    with override_settings(MEDIA_ROOT=str(media)):
+        data = _png_bytes(_image(0))
+        uploaded = create_traindata(theme.id, SimpleUploadedFile('a.png', data), label_id=labels[0].id)
+        assert uploaded.content_hash is not None and uploaded.perceptual_hash is not None
+
+        # ハッシュ未計算の既存データ（完全一致1件、縮小した近似重複1件、別の画像1件）
+        (media / 'old').mkdir(parents=True)
+        (media / 'old' / 'copy.png').write_bytes(data)
+        (media / 'old' / 'small.jpg').write_bytes(_png_bytes(_image(0).resize((48, 48)), 'JPEG', quality=80))
+        (media / 'old' / 'other.png').write_bytes(_png_bytes(_image(7)))
+        TrainData.objects.bulk_create([
+            TrainData(theme=theme, label=labels[1], image='old/copy.png', split='test'),
+            TrainData(theme=theme, label=labels[0], image='old/small.jpg', split='train'),
+            TrainData(theme=theme, label=labels[0], image='old/other.png', split='train'),
+        ])
+
+        stdout = StringIO()
+        call_command('backfill_content_hashes', theme_id=[theme.id], workers=2, stdout=stdout)
+        assert '3件更新, 0件失敗' in stdout.getvalue()
+        assert not TrainData.objects.filter(theme=theme, content_hash__isnull=True).exists()
+        copy = TrainData.objects.get(theme=theme, image='old/copy.png')
+        assert copy.content_hash == uploaded.content_hash
+
+        stdout = StringIO()
+        call_command('duplicate_report', theme_id=theme.id, max_distance=6, json=True, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+
+    assert report['total'] == report['hashed'] == 4
+    assert [group['ids'] for group in report['duplicate_groups']] == [sorted([uploaded.id, copy.id])]
+    small = TrainData.objects.get(theme=theme, image='old/small.jpg')
+    assert [group['ids'] for group in report['near_duplicate_groups']] == [sorted([uploaded.id, copy.id, small.id])]
+    assert report['split_leaks'] == 1
+    assert report['label_conflicts'] == 2
@@ -0,0 +1,196 @@
+"""
+前処理済み画像キャッシュのテスト
+
+LRU退避、キャッシュキー（mtime・前処理設定）、CachedImageLoaderの動作を確認
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.image_cache import (
+    PreprocessedImageCache,
+    CachedImageLoader,
+    compute_preprocessing_hash,
+    make_cache_key,
+    create_image_cache,
+)
+
+
+def _image(value: int, size: int = 8) -> np.ndarray:
+    return np.full((size, size, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    """テスト用のPNG画像を作成"""
+    path = tmp_path / "sample.png"
+    Image.fromarray(_image(100, size=16)).save(path)
+    return path
+
+
+class TestPreprocessingHash:
+    """前処理設定ハッシュのテスト"""
+
+    def test_hash_is_order_independent(self):
+        """キーの順序に依存しないか"""
+        a = {"gamma_correction": {"enabled": True, "gamma": 2}, "patching": {"enabled": False}}
+        b = {"patching": {"enabled": False}, "gamma_correction": {"gamma": 2, "enabled": True}}
+        assert compute_preprocessing_hash(a) == compute_preprocessing_hash(b)
+
+    def test_hash_changes_with_config(self):
+        """設定が変わるとハッシュが変わるか"""
+        a = {"gamma_correction": {"enabled": True, "gamma": 2}}
+        b = {"gamma_correction": {"enabled": True, "gamma": 1.2}}
+        assert compute_preprocessing_hash(a) != compute_preprocessing_hash(b)
+
+    def test_key_changes_with_mtime(self, image_file):
+        """ファイル更新でキーが変わるか"""
+        key1 = make_cache_key(image_file, "abc")
+        stat = image_file.stat()
+        os.utime(image_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        key2 = make_cache_key(image_file, "abc")
+        assert key1 != key2
+
+
+class TestMemoryCache:
+    """メモリバックエンドのテスト"""
+
+    def test_lru_eviction_by_bytes(self):
+        """上限バイト数を超えたら古いものから退避されるか"""
+        entry_bytes = _image(0).nbytes
+        cache = PreprocessedImageCache(max_bytes=entry_bytes * 2, backend="memory")
+
+        cache.put("a", [_image(1)])
+        cache.put("b", [_image(2)])
+        # aを参照して最近使用にする
+        assert cache.get("a") is not None
+        cache.put("c", [_image(3)])
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.current_bytes == entry_bytes * 2
+
+    def test_returned_arrays_do_not_alias_cache(self):
+        """取得した配列を書き換えてもキャッシュが壊れないか"""
+        cache = PreprocessedImageCache(max_bytes=10 ** 6, backend="memory")
+        cache.put("a", [_image(1)])
+        cached = cache.get("a")
+        cached[0][:] = 255
+        assert cache.get("a")[0].max() == 1
+
+    def test_stats(self):
+        """ヒット/ミスが記録されるか"""
+        cache = PreprocessedImageCache(max_bytes=10 ** 6, backend="memory")
+        assert cache.get("missing") is None
+        cache.put("a", [_image(1)])
+        cache.get("a")
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_split_for_workers(self):
+        """ワーカー数で上限を分割し、超えた分を退避するか"""
+        entry_bytes = _image(0).nbytes
+        cache = PreprocessedImageCache(max_bytes=entry_bytes * 4, backend="memory")
+        for key in "abcd":
+            cache.put(key, [_image(1)])
+        cache.split_for_workers(2)
+        assert cache.max_bytes == entry_bytes * 2
+        assert len(cache) == 2 and "d" in cache
+
+
+class TestDiskCache:
+    """ディスクバックエンドのテスト"""
+
+    def test_shared_between_workers(self, tmp_path):
+        """他ワーカーが書き込んだファイルはヒット、削除したファイルはミスになるか"""
+        cache_dir = str(tmp_path / "cache")
+        probe = PreprocessedImageCache(max_bytes=10 ** 6, backend="disk", cache_dir=str(tmp_path / "probe"))
+        probe.put("probe", [_image(0)])
+        entry_bytes = probe.current_bytes
+
+        worker_a = PreprocessedImageCache(max_bytes=entry_bytes, backend="disk", cache_dir=cache_dir)
+        worker_b = PreprocessedImageCache(max_bytes=entry_bytes, backend="disk", cache_dir=cache_dir)
+        worker_a.put("a", [_image(1)])
+        assert worker_b.get("a")[0].max() == 1
+        worker_b.split_for_workers(2)
+        assert worker_b.max_bytes == entry_bytes
+
+        # worker_aの退避でaが削除される
+        worker_a.put("b", [_image(2)])
+        assert worker_b.get("a") is None
+        assert "a" not in worker_b
+
+    def test_roundtrip_and_reload(self, tmp_path):
+        """保存した内容を別インスタンスから読めるか"""
+        cache_dir = tmp_path / "cache"
+        cache = PreprocessedImageCache(max_bytes=10 ** 6, backend="disk", cache_dir=str(cache_dir))
+        cache.put("a", [_image(7), _image(8)])
+
+        reopened = PreprocessedImageCache(max_bytes=10 ** 6, backend="disk", cache_dir=str(cache_dir))
+        images = reopened.get("a")
+        assert len(images) == 2
+        assert images[0].max() == 7
+        assert images[1].max() == 8
+
+    def test_disk_eviction_removes_files(self, tmp_path):
+        """退避時にファイルが削除されるか"""
+        cache_dir = tmp_path / "cache"
+        cache = PreprocessedImageCache(max_bytes=400, backend="disk", cache_dir=str(cache_dir))
+        cache.put("a", [_image(1)])
+        cache.put("b", [_image(2)])
+        assert not (cache_dir / "a.npy").exists()
+        assert (cache_dir / "b.npy").exists()
+
+
+class TestCachedImageLoader:
+    """CachedImageLoaderのテスト"""
+
+    def test_pipeline_runs_once_per_image(self, image_file):
+        """2回目以降は前処理が実行されないか"""
+        calls = []
+
+        def pipeline(image):
+            calls.append(1)
+            return [255 - image]
+
+        loader = CachedImageLoader(
+            preprocessing_config={"gamma_correction": {"enabled": True}},
+            cache=PreprocessedImageCache(max_bytes=10 ** 6),
+            pipeline=pipeline,
+            image_loader=lambda path: np.array(Image.open(path).convert("RGB")),
+        )
+
+        first = loader(image_file)
+        second = loader(image_file)
+
+        assert len(calls) == 1
+        np.testing.assert_array_equal(first[0], second[0])
+        assert first[0].max() == 155
+
+    def test_without_cache(self, image_file):
+        """キャッシュなしでも動作するか"""
+        loader = CachedImageLoader(
+            pipeline=lambda image: [image],
+            image_loader=lambda path: np.array(Image.open(path).convert("RGB")),
+        )
+        images = loader(image_file)
+        assert images[0].shape == (16, 16, 3)
+
+
+def test_create_image_cache_disabled():
+    """無効設定の場合はNoneを返すか"""
+    assert create_image_cache(None) is None
+    assert create_image_cache({"enabled": False}) is None
+    cache = create_image_cache({"enabled": True, "max_size_mb": 1})
+    assert cache.max_bytes == 1024 ** 2
@@ -0,0 +1,91 @@
+"""
+バッチ推論エンジンのテスト
+
+入力の展開、マイクロバッチ化、並列前処理での順序保持を確認
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.inference.engine import ImagePreprocessor, InferenceEngine, iter_inputs
+
+
+class MeanModel(torch.nn.Module):
+    """チャンネル平均をそのままロジットとして返すモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, x):
+        self.batch_sizes.append(x.shape[0])
+        assert torch.is_inference_mode_enabled()
+        return x.mean(dim=(2, 3))
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """テスト用の画像ディレクトリを作成"""
+    for i in range(5):
+        image = np.zeros((4, 4, 3), dtype=np.uint8)
+        image[:, :, i % 3] = 255
+        Image.fromarray(image).save(tmp_path / f"{i:02d}.png")
+    (tmp_path / "notes.txt").write_text("not an image")
+    return tmp_path
+
+
+def test_iter_inputs(image_dir):
+    """ディレクトリ・配列・リストが1件ずつに展開されるか"""
+    paths = list(iter_inputs(str(image_dir)))
+    assert [Path(p).name for p in paths] == [f"{i:02d}.png" for i in range(5)]
+    assert len(list(iter_inputs(np.zeros((3, 2, 2, 3), dtype=np.uint8)))) == 3
+    assert len(list(iter_inputs([image_dir, paths[0]]))) == 6
+
+
+@pytest.mark.parametrize("num_workers", [0, 3])
+def test_micro_batches_preserve_order(image_dir, num_workers):
+    """マイクロバッチ単位で推論され、入力順に結果が返るか"""
+    model = MeanModel()
+    engine = InferenceEngine(model, batch_size=2, num_workers=num_workers, device="cpu")
+
+    logits = engine.predict(image_dir)
+    assert model.batch_sizes == [2, 2, 1]
+    assert logits.shape == (5, 3)
+    assert logits.argmax(axis=1).tolist() == [0, 1, 2, 0, 1]
+
+
+def test_predict_iter(image_dir):
+    """1件ずつの結果にクラス名と確率が含まれるか"""
+    engine = InferenceEngine(
+        MeanModel(), class_names=["r", "g", "b"], batch_size=4, num_workers=2, device="cpu"
+    )
+    results = list(engine.predict_iter(image_dir))
+    assert [r["label"] for r in results] == ["r", "g", "b", "r", "g"]
+    assert results[0]["input"].endswith("00.png")
+    assert np.isclose(results[0]["probabilities"].sum(), 1.0)
+
+
+def test_numpy_batch_input():
+    """numpy配列のバッチとグレースケール画像を推論できるか"""
+    engine = InferenceEngine(MeanModel(), batch_size=8, num_workers=0, device="cpu")
+    batch = np.full((3, 2, 2, 3), 51, dtype=np.uint8)
+    np.testing.assert_allclose(engine.predict(batch), np.full((3, 3), 0.2), rtol=1e-6)
+
+    gray = ImagePreprocessor()(np.zeros((2, 2), dtype=np.uint8))
+    assert gray.shape == (3, 2, 2)
+
+
+def test_empty_input(tmp_path):
+    """入力が空の場合はエラーになるか"""
+    engine = InferenceEngine(MeanModel(), num_workers=0, device="cpu")
+    with pytest.raises(ValueError):
+        engine.predict(tmp_path)
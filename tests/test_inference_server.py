@@ -0,0 +1,217 @@
+"""
+推論サーバーのテスト
+
+動的バッチ化とHTTPエンドポイント、メトリクスを確認
+"""
+
+import io
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.inference.engine import InferenceEngine
+from src.inference.server import DynamicBatcher, QueueFullError, create_server
+
+
+class MeanModel(torch.nn.Module):
+    """チャンネル平均をそのままロジットとして返すモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, x):
+        self.batch_sizes.append(x.shape[0])
+        return x.mean(dim=(2, 3))
+
+
+def _image_tensor(channel):
+    tensor = torch.zeros(3, 2, 2)
+    tensor[channel] = 1.0
+    return tensor
+
+
+def test_concurrent_requests_are_batched():
+    """待ち時間内に届いたリクエストが1回の推論にまとめられるか"""
+    model = MeanModel()
+    engine = InferenceEngine(model, class_names=["r", "g", "b"], num_workers=0, device="cpu")
+    batcher = DynamicBatcher(engine, max_batch_size=8, max_wait_ms=200)
+
+    futures = [batcher.submit([_image_tensor(i % 3)]) for i in range(5)]
+    futures.append(batcher.submit([_image_tensor(0), _image_tensor(1), _image_tensor(2), _image_tensor(0)]))
+    assert batcher.queue_depth == 9
+    batcher.start()
+    results = [future.result(timeout=5) for future in futures]
+    batcher.stop()
+
+    # 最大バッチサイズを超える分は次のバッチに回る
+    assert model.batch_sizes == [5, 4]
+    assert [r[0]["label"] for r in results[:5]] == ["r", "g", "b", "r", "g"]
+    assert [r["prediction"] for r in results[5]] == [0, 1, 2, 0]
+    assert batcher.queue_depth == 0
+    assert batcher.metrics.snapshot()["batch_size"] == {"mean": 4.5, "max": 5}
+
+
+def test_queue_full():
+    """キューが満杯の場合にエラーになるか"""
+    engine = InferenceEngine(MeanModel(), num_workers=0, device="cpu")
+    batcher = DynamicBatcher(engine, max_queue_size=1)
+    batcher.submit([_image_tensor(0)])
+    with pytest.raises(QueueFullError):
+        batcher.submit([_image_tensor(0)])
+
+
+@pytest.fixture
+def server():
+    """テスト用の推論サーバーを起動"""
+    engine = InferenceEngine(MeanModel(), class_names=["r", "g", "b"], num_workers=0, device="cpu")
+    server = create_server(engine, port=0, max_batch_size=4, max_wait_ms=20)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _png_bytes(channel):
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    image[:, :, channel] = 255
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _post(url, body, content_type):
+    request = urllib.request.Request(f"{url}/predict", data=body, headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_http_predict_and_metrics(server):
+    """並行したHTTPリクエストに正しい結果が返り、メトリクスが記録されるか"""
+    results = {}
+
+    def send(i):
+        results[i] = _post(server, _png_bytes(i % 3), "image/png")
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i in range(6):
+        prediction = results[i]["predictions"][0]
+        assert prediction["prediction"] == i % 3
+        assert len(prediction["probabilities"]) == 3
+
+    with urllib.request.urlopen(f"{server}/metrics") as response:
+        metrics = json.loads(response.read())
+    assert metrics["requests"] == 6
+    assert metrics["latency_ms"]["p99"] >= metrics["latency_ms"]["p50"] > 0
+    assert metrics["queue_depth"] == 0
+
+
+def test_http_bad_request(server):
+    """デコードできない入力は400になるか"""
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        _post(server, json.dumps({"foo": 1}).encode(), "application/json")
+    assert exc_info.value.code == 400
+
+
+def test_http_paths_and_body_limit(tmp_path):
+    """pathsはallowed_root配下のファイルのみ受け付け、大きすぎるボディは413になるか"""
+    root = tmp_path / "images"
+    root.mkdir()
+    (root / "g.png").write_bytes(_png_bytes(1))
+    (tmp_path / "secret.png").write_bytes(_png_bytes(0))
+
+    engine = InferenceEngine(MeanModel(), class_names=["r", "g", "b"], num_workers=0, device="cpu")
+    servers = [
+        create_server(engine, port=0, max_wait_ms=1, max_body_bytes=1024),
+        create_server(engine, port=0, max_wait_ms=1, allowed_root=str(root)),
+    ]
+    for s in servers:
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+    default_url, root_url = (f"http://127.0.0.1:{s.server_port}" for s in servers)
+
+    def status(url, body, content_type="application/json"):
+        try:
+            _post(url, body, content_type)
+            return 200
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    try:
+        # allowed_rootを指定しない場合はpathsを受け付けない
+        assert status(default_url, json.dumps({"paths": [str(root / "g.png")]}).encode()) == 400
+        assert status(default_url, b"\0" * 2048, "image/png") == 413
+
+        assert _post(root_url, json.dumps({"paths": ["g.png"]}).encode(), "application/json")["predictions"][0]["label"] == "g"
+        assert status(root_url, json.dumps({"paths": ["../secret.png"]}).encode()) == 400
+        assert status(root_url, json.dumps({"paths": [str(tmp_path / "secret.png")]}).encode()) == 400
+        assert status(root_url, json.dumps({"paths": ["missing.png"]}).encode()) == 400
+    finally:
+        for s in servers:
+            s.shutdown()
+            s.server_close()
+
+
+class BlockingModel(MeanModel):
+    """releaseがセットされるまで推論を止めるモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def forward(self, x):
+        self.started.set()
+        self.release.wait(timeout=10)
+        return super().forward(x)
+
+
+def test_http_timeout_returns_504_and_skips_cancelled():
+    """推論が時間内に終わらない場合は504になり、キューに残ったリクエストは推論しないか"""
+    model = BlockingModel()
+    engine = InferenceEngine(model, class_names=["r", "g", "b"], num_workers=0, device="cpu")
+    server = create_server(engine, port=0, max_batch_size=1, max_wait_ms=1, request_timeout=0.2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    codes = []
+
+    def send():
+        try:
+            _post(url, _png_bytes(0), "image/png")
+            codes.append(200)
+        except urllib.error.HTTPError as e:
+            codes.append(e.code)
+
+    try:
+        # 1件目は推論中、2件目はキューで待ったままタイムアウトする
+        first = threading.Thread(target=send)
+        first.start()
+        assert model.started.wait(timeout=5)
+        send()
+        first.join()
+        assert codes == [504, 504]
+    finally:
+        model.release.set()
+        server.shutdown()
+        server.server_close()
+
+    assert model.batch_sizes == [1]
+    assert server.get_metrics()["errors"] == 2
@@ -0,0 +1,167 @@
+"""
+画像の一括取り込み（アーカイブ・分割アップロード）のテスト
+"""
+
+import io
+import json
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def _image_bytes(seed, fmt='PNG'):
+    array = np.random.default_rng(seed).integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def ingest_settings(setup_django_env, tmp_path):
+    """MEDIA_ROOT・THUMBNAIL_ROOT・INGEST_ROOTを一時ディレクトリに変更"""
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    with override_settings(
+        MEDIA_ROOT=str(tmp_path / 'media'),
+        THUMBNAIL_ROOT=str(tmp_path / 'thumbnails'),
+        INGEST_ROOT=str(tmp_path / 'ingest'),
+    ):
+        yield tmp_path
+    cache.clear()
+
+
+def test_ingest_zip(test_theme, ingest_settings):
+    """アーカイブの画像が重複・破損を除いて登録され、フォルダ名のラベルが付くか"""
+    from data_management.ingest import ingest_images
+    from data_management.models import TrainData
+    from data_management.statistics import get_theme_statistics
+
+    theme, labels = test_theme
+    archive_path = ingest_settings / 'dataset.zip'
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        archive.writestr('0/a.png', _image_bytes(0))
+        archive.writestr('1/b.jpg', _image_bytes(1, 'JPEG'))
+        archive.writestr('unknown/c.png', _image_bytes(2))
+        archive.writestr('copy/a.png', _image_bytes(0))       # 重複
+        archive.writestr('broken.png', b'not an image')        # 破損
+        archive.writestr('readme.txt', b'text')                # 画像以外
+        archive.writestr('__MACOSX/0/._a.png', b'metadata')    # macOSのメタデータ
+
+    assert get_theme_statistics(theme.id)['splits']['total'] == 0
+    progress = []
+    stats = ingest_images(theme.id, str(archive_path), labeled_by='tester', workers=2, batch_size=2,
+                          progress_callback=progress.append)
+
+    assert (stats['found'], stats['created'], stats['duplicates'], stats['invalid']) == (5, 3, 1, 1)
+    assert stats['errors'][0]['file'] == 'broken.png'
+    assert len(progress) >= 2
+
+    rows = list(TrainData.objects.filter(theme=theme))
+    assert sorted(str(t.label_id) for t in rows) == sorted([str(labels[0].id), str(labels[1].id), 'None'])
+    assert all(t.labeled_by == 'tester' for t in rows)
+    assert all((ingest_settings / 'media' / t.image.name).exists() for t in rows)
+    assert get_theme_statistics(theme.id)['splits']['total'] == 3
+
+    # 同じアーカイブを再度取り込んでも登録されない
+    stats = ingest_images(theme.id, str(archive_path), workers=2)
+    assert (stats['created'], stats['duplicates']) == (0, 4)
+    assert not list((ingest_settings / 'ingest').glob('staging_*'))
+
+
+def test_ingest_directory_and_tar(test_theme, ingest_settings):
+    """ディレクトリとtar.gzアーカイブから取り込めるか"""
+    from data_management.ingest import ingest_images
+
+    theme, labels = test_theme
+    directory = ingest_settings / 'images' / '2'
+    directory.mkdir(parents=True)
+    (directory / 'a.png').write_bytes(_image_bytes(10))
+    stats = ingest_images(theme.id, str(ingest_settings / 'images'), label_id=labels[5].id)
+    assert stats['created'] == 1
+    assert (directory / 'a.png').exists()
+
+    tar_path = ingest_settings / 'dataset.tar.gz'
+    with tarfile.open(tar_path, 'w:gz') as archive:
+        for i in range(3):
+            data = _image_bytes(20 + i)
+            info = tarfile.TarInfo(f'images/{i}.png')
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    assert ingest_images(theme.id, str(tar_path))['created'] == 3
+
+    csv_path = ingest_settings / 'dataset.csv'
+    csv_path.write_text('a,b\n')
+    with pytest.raises(ValueError):
+        ingest_images(theme.id, str(csv_path))
+    with pytest.raises(ValueError):
+        ingest_images(theme.id, str(ingest_settings / 'missing.zip'))
+
+
+def test_chunked_upload_and_job(test_theme, ingest_settings):
+    """分割アップロードの再開位置の確認とバックグラウンドの取り込みが動作し、同じアップロードで2回開始できないか"""
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+    from data_management.ingest import (
+        UploadAlreadyClaimed, UploadOffsetMismatch, append_upload_chunk, claim_upload, get_ingest_job,
+        get_upload_offset, get_upload_path,
+    )
+    from data_management.models import TrainData
+    from data_management.views import api_ingest_start
+
+    theme, labels = test_theme
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for i in range(5):
+            archive.writestr(f'{labels[3].label_name}/{i}.png', _image_bytes(30 + i))
+    data = buffer.getvalue()
+
+    upload_id = 'test-upload-0001'
+    half = len(data) // 2
+    assert append_upload_chunk(theme.id, upload_id, 0, io.BytesIO(data[:half])) == half
+    with pytest.raises(UploadOffsetMismatch) as excinfo:
+        append_upload_chunk(theme.id, upload_id, 0, io.BytesIO(data[:half]))
+    assert excinfo.value.current_offset == get_upload_offset(theme.id, upload_id) == half
+    append_upload_chunk(theme.id, upload_id, half, io.BytesIO(data[half:]))
+    with pytest.raises(ValueError):
+        get_upload_path(theme.id, '../../etc')
+    # アップロードはテーマごとに保存される
+    assert get_upload_path(theme.id, upload_id).parent.name == str(theme.id)
+    assert get_upload_offset(theme.id + 1, upload_id) == 0
+
+    def start():
+        request = RequestFactory().post(f'/api/theme/{theme.id}/ingest/start/', {'upload_id': upload_id})
+        request.user = User(username='ingest_test_user')
+        return api_ingest_start(request, theme.id)
+
+    response = start()
+    assert response.status_code == 200
+    job_id = json.loads(response.content)['job_id']
+    assert not get_upload_path(theme.id, upload_id).exists()
+
+    # 確保済みのアップロードでは開始できない（クライアントの再送など）
+    assert start().status_code == 409
+    append_upload_chunk(theme.id, 'test-upload-0002', 0, io.BytesIO(data))
+    claim_upload(theme.id, 'test-upload-0002')
+    with pytest.raises(UploadAlreadyClaimed):
+        claim_upload(theme.id, 'test-upload-0002')
+
+    deadline = time.time() + 30
+    while get_ingest_job(job_id)['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.1)
+
+    job = get_ingest_job(job_id)
+    assert job['status'] == 'completed', job
+    assert job['created'] == 5
+    assert TrainData.objects.filter(theme=theme, label=labels[3]).count() == 5
+    assert not list(get_upload_path(theme.id, upload_id).parent.glob(f'{upload_id}*'))
@@ -0,0 +1,89 @@
+"""
+DataLoaderの設定と自動チューニングのテスト
+"""
+
+import json
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import src.data.loader_tuning as loader_tuning
+from src.data.loader_tuning import configure_loader, parse_loader_tune_config, tune_loader
+from src.data.packed_dataset import SnapshotDataModule
+
+
+class TensorSnapshotDataModule(SnapshotDataModule):
+    """テスト用のDataModule"""
+
+    def _create_dataset(self, split: str):
+        return TensorDataset(torch.rand(32, 3, 8, 8), torch.randint(0, 2, (32,)))
+
+
+def _create_datamodule():
+    datamodule = TensorSnapshotDataModule(meta={"class_names": ["a", "b"]}, augments_config=None, batch_size=4)
+    datamodule.setup("fit")
+    return datamodule
+
+
+def test_parse_loader_tune_config():
+    """training.loader.auto_tuneの各形式を正規化できるか"""
+    assert parse_loader_tune_config(None) is None
+
+    config = parse_loader_tune_config(True)
+    assert config["num_workers"][0] == 0
+    assert config["pin_memory"] == ([False, True] if torch.cuda.is_available() else [False])
+    assert parse_loader_tune_config({"num_workers": [0, 2]})["num_workers"] == [0, 2]
+
+    with pytest.raises(ValueError):
+        parse_loader_tune_config({"workers": [0, 2]})
+
+
+def test_configure_loader():
+    """DataLoaderの設定がDataModuleのDataLoaderに反映されるか"""
+    datamodule = _create_datamodule()
+    configure_loader(datamodule, {"num_workers": 2, "prefetch_factor": 4, "pin_memory": False, "persistent_workers": False})
+
+    loader = datamodule.train_dataloader()
+    assert loader.num_workers == 2
+    assert loader.prefetch_factor == 4
+    assert not loader.persistent_workers
+
+    with pytest.raises(ValueError):
+        configure_loader(datamodule, {"batch": 8})
+
+
+def test_tune_loader_cache(tmp_path, monkeypatch):
+    """計測結果が選択・キャッシュされ、同じ条件では再計測しないか"""
+    config = parse_loader_tune_config({
+        "num_workers": [0, 1], "prefetch_factor": [2], "num_batches": 4, "warmup_batches": 1,
+        "cache_dir": str(tmp_path),
+    })
+    datamodule = _create_datamodule()
+    result = tune_loader(datamodule, config, cache_key={"theme_id": 1})
+
+    assert result["num_workers"] in (0, 1)
+    assert result["samples_per_sec"] > 0
+    assert datamodule.num_workers == result["num_workers"]
+    cache = json.loads((tmp_path / f"{socket.gethostname()}.json").read_text())
+    assert list(cache.values()) == [result]
+
+    # 同じ条件ではキャッシュを使用する
+    def fail(*args, **kwargs):
+        raise AssertionError("再計測されました")
+
+    monkeypatch.setattr(loader_tuning, "benchmark_loader", fail)
+    datamodule = _create_datamodule()
+    assert tune_loader(datamodule, config, cache_key={"theme_id": 1}) == result
+    assert datamodule.num_workers == result["num_workers"]
+
+    # 条件が変わる場合は再計測する
+    with pytest.raises(AssertionError):
+        tune_loader(datamodule, config, cache_key={"theme_id": 2})
@@ -0,0 +1,104 @@
+"""
+学習データマニフェストのテスト
+
+Djangoを使わずにマニフェストの書き出し・読み込み・Dataset化ができるか確認
+"""
+
+import pickle
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.image_cache import CachedImageLoader, identity_pipeline
+from src.data.manifest import (
+    ManifestDataModule,
+    ManifestDataset,
+    build_manifest_records,
+    compute_file_sha256,
+    load_manifest,
+    write_manifest,
+)
+
+
+def _load_rgb(path):
+    return np.array(Image.open(path).convert("RGB"))
+
+
+@pytest.fixture
+def media_root(tmp_path):
+    """テスト用の画像ディレクトリを作成"""
+    root = tmp_path / "media"
+    (root / "images").mkdir(parents=True)
+    for name, value in [("a.png", 10), ("b.png", 20), ("c.png", 30), ("d.png", 40)]:
+        Image.fromarray(np.full((8, 8, 3), value, dtype=np.uint8)).save(root / "images" / name)
+    return root
+
+
+@pytest.fixture
+def manifest_path(tmp_path, media_root):
+    """テスト用のマニフェストを作成"""
+    traindata_list = [
+        SimpleNamespace(id=4, image="images/d.png", label_id=None, split="train"),
+        SimpleNamespace(id=3, image="images/c.png", label_id=11, split="test"),
+        SimpleNamespace(id=2, image="images/b.png", label_id=11, split="train"),
+        SimpleNamespace(id=1, image="images/a.png", label_id=10, split="valid"),
+    ]
+    records = build_manifest_records(traindata_list, {10: 0, 11: 1}, str(media_root))
+    meta = {"theme_id": 7, "theme_name": "test", "class_names": ["ok", "ng"], "media_root": str(media_root)}
+    path = tmp_path / "manifest.jsonl"
+    write_manifest(str(path), meta, records)
+    return path
+
+
+def test_records_are_sorted_and_filtered(manifest_path, media_root):
+    """ラベル未設定は除外され、ID順に並ぶか"""
+    meta, records = load_manifest(str(manifest_path))
+    assert meta["class_names"] == ["ok", "ng"]
+    assert [r["traindata_id"] for r in records] == [1, 2, 3]
+    assert records[1]["label"] == 1
+    assert records[1]["sha256"] == compute_file_sha256(str(media_root / "images" / "b.png"))
+
+
+def test_manifest_is_deterministic(tmp_path, manifest_path):
+    """同じ内容なら同じハッシュになるか"""
+    meta, records = load_manifest(str(manifest_path))
+    other = tmp_path / "other.jsonl"
+    assert write_manifest(str(other), meta, records) == compute_file_sha256(str(manifest_path))
+
+
+def test_dataset_from_manifest(manifest_path):
+    """分割ごとにDatasetを作成できるか"""
+    loader = CachedImageLoader(pipeline=identity_pipeline, image_loader=_load_rgb)
+    dataset = ManifestDataset.from_manifest(str(manifest_path), split="train", image_loader=loader)
+    assert len(dataset) == 1
+    image, label = dataset[0]
+    assert image.shape == (3, 8, 8)
+    assert label == 1
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored.image_paths == dataset.image_paths
+
+
+def test_media_root_override(tmp_path, manifest_path, media_root):
+    """画像ルートを上書きできるか"""
+    dataset = ManifestDataset.from_manifest(str(manifest_path), media_root=str(tmp_path / "moved"))
+    assert dataset.image_paths[0] == str(tmp_path / "moved" / "images" / "a.png")
+
+
+def test_datamodule(manifest_path):
+    """DataModuleがクラス情報と分割を提供するか"""
+    datamodule = ManifestDataModule(str(manifest_path), augments_config=None, batch_size=2, num_workers=0)
+    datamodule.setup(None)
+    assert datamodule.get_num_classes() == 2
+    assert datamodule.get_theme_name() == "test"
+    assert len(datamodule.train_dataset) == 1
+    assert len(datamodule.val_dataset) == 1
+    assert len(datamodule.test_dataset) == 1
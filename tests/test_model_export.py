@@ -0,0 +1,74 @@
+"""
+推論用モデルのエクスポートとランタイム選択のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.inference.engine import InferenceEngine
+from src.inference.runtimes import available_runtimes, load_runtime, select_runtime
+from src.models.export import fuse_conv_bn, export_model, read_export_meta
+from src.models.resnet import ResNetClassifier
+
+
+@pytest.fixture
+def model():
+    """テスト用のモデル（BatchNormの統計量を初期値から変えておく）"""
+    torch.manual_seed(0)
+    model = ResNetClassifier(model_name="ResNet18", num_classes=3, pretrained=False)
+    model.train()
+    with torch.no_grad():
+        model(torch.randn(4, 3, 32, 32))
+    return model.eval()
+
+
+def test_fuse_conv_bn(model):
+    """conv+bnを融合しても出力が変わらず、元のモデルは変更されないか"""
+    fused = fuse_conv_bn(model)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+    assert any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+
+    x = torch.randn(2, 3, 32, 32)
+    with torch.inference_mode():
+        torch.testing.assert_close(fused(x), model(x), rtol=1e-4, atol=1e-4)
+
+
+def test_export_torchscript(tmp_path, model):
+    """TorchScriptで書き出したモデルが別の入力サイズでも同じ出力になるか"""
+    meta = export_model(model, tmp_path, input_size=(32, 32), formats=["torchscript"], class_names=["a", "b", "c"])
+    assert meta["formats"] == {"torchscript": "model.torchscript.pt"}
+    assert read_export_meta(tmp_path)["class_names"] == ["a", "b", "c"]
+
+    scripted = load_runtime("torchscript", tmp_path)
+    x = torch.randn(3, 3, 48, 40)
+    with torch.inference_mode():
+        torch.testing.assert_close(scripted(x), model(x), rtol=1e-4, atol=1e-4)
+
+
+def test_select_runtime(tmp_path, model):
+    """利用可能なランタイムから選択され、推論エンジンで使用できるか"""
+    export_model(model, tmp_path, input_size=(32, 32), formats=["torchscript"])
+    assert set(available_runtimes(tmp_path, model)) >= {"torchscript", "eager"}
+
+    name, runtime = select_runtime(tmp_path, eager_model=model, preference=["torchscript"])
+    assert name == "torchscript"
+
+    name, runtime = select_runtime(
+        tmp_path, eager_model=model, preference=["torchscript", "eager"],
+        example_input=torch.randn(2, 3, 32, 32)
+    )
+    assert name in ("torchscript", "eager")
+
+    engine = InferenceEngine(runtime, num_workers=0, device="cpu")
+    logits = engine.predict(torch.rand(2, 32, 32, 3).mul(255).byte().numpy())
+    assert logits.shape == (2, 3)
+
+    with pytest.raises(ValueError):
+        select_runtime(None, eager_model=None)
@@ -0,0 +1,95 @@
+"""
+重みのみのモデル保存形式とモデルキャッシュのテスト
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.models.model_cache import ModelCache, load_cached_weights
+from src.models.resnet import ResNetClassifier
+from src.models.weights import (
+    load_model_from_weights,
+    load_state_dict_file,
+    normalize_state_dict,
+    read_weights_meta,
+    save_weights,
+)
+
+
+@pytest.fixture
+def model():
+    """テスト用のモデル"""
+    torch.manual_seed(0)
+    return ResNetClassifier(model_name="ResNet18", num_classes=3, pretrained=False).eval()
+
+
+def test_roundtrip(tmp_path, model):
+    """保存した重みから同じ出力のモデルが復元されるか"""
+    meta = save_weights(
+        model, tmp_path, model_name="ResNet18", num_classes=3,
+        class_names=["a", "b", "c"], preprocessing_hash="abc", weights_format="torch"
+    )
+    assert read_weights_meta(tmp_path) == meta
+    assert meta["class_names"] == ["a", "b", "c"]
+
+    restored, restored_meta = load_model_from_weights(tmp_path)
+    assert restored_meta["preprocessing_hash"] == "abc"
+    x = torch.randn(2, 3, 32, 32)
+    with torch.inference_mode():
+        torch.testing.assert_close(restored(x), model(x))
+
+
+def test_normalize_state_dict(model):
+    """Lightningのチェックポイントや旧形式からstate_dictを取り出せるか"""
+    state_dict = model.state_dict()
+    lightning = {"state_dict": {f"model.{k}": v for k, v in state_dict.items()}, "epoch": 3}
+    assert normalize_state_dict(lightning).keys() == state_dict.keys()
+    assert normalize_state_dict({"model": state_dict}).keys() == state_dict.keys()
+    assert normalize_state_dict(model).keys() == state_dict.keys()
+
+
+def test_load_legacy_pickled_model(tmp_path, model):
+    """モデル全体をpickleした旧形式のmodel.pthは、allow_pickle=Trueを指定した場合のみ読み込めるか"""
+    torch.save(model, tmp_path / "model.pth")
+    with pytest.raises(Exception):
+        load_state_dict_file(tmp_path / "model.pth")
+    state_dict = load_state_dict_file(tmp_path / "model.pth", allow_pickle=True)
+    assert state_dict.keys() == model.state_dict().keys()
+
+
+def test_model_cache_loads_once(tmp_path, model):
+    """同じモデルの並行読み込みが1回にまとめられ、LRUで削除されるか"""
+    cache = ModelCache(max_models=1)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("run", loader))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+    cache.get("other", loader)
+    assert "run" not in cache and len(cache) == 1
+
+    save_weights(model, tmp_path, model_name="ResNet18", num_classes=3, run_id="r1", weights_format="torch")
+    first, _ = load_cached_weights(tmp_path, device="cpu", cache=cache)
+    second, _ = load_cached_weights(tmp_path, device="cpu", cache=cache)
+    assert first is second
+    assert ("r1", "cpu") in cache
@@ -0,0 +1,95 @@
+"""
+マルチフィデリティのチューニング（層化サブセット・段ごとの予算）のテスト
+"""
+
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+import torch
+from torch.utils.data import Dataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.subset import limit_train_split, stratified_subset_indices
+from src.tuning.optuna_tuner import apply_fidelity_budget, get_fidelity_budgets
+
+
+class LabeledDataset(Dataset):
+    """ラベルのみを持つDataset"""
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return torch.zeros(1), self.labels[idx]
+
+    def get_labels(self):
+        return self.labels
+
+
+class DummyDataModule:
+    """setup()でDatasetを作り直すDataModule"""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.train_dataset = None
+        self.val_dataset = None
+
+    def setup(self, stage=None):
+        self.train_dataset = LabeledDataset(self.labels)
+        self.val_dataset = LabeledDataset(self.labels)
+
+
+def test_stratified_subset_indices():
+    """クラス比率が保たれ、割合を大きくしたサブセットが小さいサブセットを含むか"""
+    labels = [0] * 80 + [1] * 20 + [2] * 2
+
+    small = stratified_subset_indices(labels, 0.25, seed=1)
+    large = stratified_subset_indices(labels, 0.5, seed=1)
+
+    counts = Counter(labels[i] for i in small)
+    assert counts == {0: 20, 1: 5, 2: 1}
+    assert set(small) <= set(large)
+    assert stratified_subset_indices(labels, 0.25, seed=1) == small
+    assert stratified_subset_indices(labels, 1.0) == list(range(len(labels)))
+
+    with pytest.raises(ValueError):
+        stratified_subset_indices(labels, 0.0)
+
+
+def test_limit_train_split():
+    """trainデータのみがサブセットになるか"""
+    datamodule = limit_train_split(DummyDataModule([0] * 10 + [1] * 10), 0.3, seed=0)
+    datamodule.setup("fit")
+    datamodule.setup("fit")
+
+    assert len(datamodule.train_dataset) == 6
+    assert len(datamodule.val_dataset) == 20
+
+
+def test_fidelity_budgets():
+    """段ごとの予算が最上段1.0から1/reduction_factorずつ小さくなるか"""
+    assert get_fidelity_budgets(None) is None
+    budgets = get_fidelity_budgets({"resource": "data", "min_budget": 0.1, "reduction_factor": 3})
+    assert budgets == pytest.approx([1 / 9, 1 / 3, 1.0])
+    assert get_fidelity_budgets({"min_budget": 1.0}) == [1.0]
+
+    with pytest.raises(ValueError):
+        get_fidelity_budgets({"resource": "images"})
+
+
+def test_apply_fidelity_budget():
+    """予算がtrainデータの割合とエポック数に反映されるか"""
+    params = {"data": {"theme_id": 1}, "training": {"num_epochs": 10}}
+    applied = apply_fidelity_budget(params, 1 / 3, "both")
+
+    assert params["data"]["train_fraction"] == pytest.approx(1 / 3)
+    assert params["training"]["num_epochs"] == 4
+    assert applied["budget_num_epochs"] == 4
@@ -0,0 +1,80 @@
+"""
+Optunaの枝刈りCallbackのテスト
+"""
+
+import sys
+from pathlib import Path
+
+import optuna
+import pytest
+import pytorch_lightning as pl
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.callbacks import OptunaPruningCallback
+
+
+class TinyModule(pl.LightningModule):
+    """val_accを記録するだけの小さなモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.layer = nn.Linear(4, 2)
+
+    def training_step(self, batch, batch_idx):
+        x, y = batch
+        return nn.functional.cross_entropy(self.layer(x), y)
+
+    def validation_step(self, batch, batch_idx):
+        x, y = batch
+        acc = (self.layer(x).argmax(dim=1) == y).float().mean()
+        self.log("val_acc", acc)
+
+    def configure_optimizers(self):
+        return torch.optim.SGD(self.parameters(), lr=0.1)
+
+
+def _fit(trial, max_epochs=3):
+    torch.manual_seed(0)
+    dataset = TensorDataset(torch.randn(16, 4), torch.randint(0, 2, (16,)))
+    callback = OptunaPruningCallback(trial, monitor="val_acc")
+    trainer = pl.Trainer(
+        max_epochs=max_epochs,
+        accelerator="cpu",
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        callbacks=[callback],
+    )
+    trainer.fit(TinyModule(), DataLoader(dataset, batch_size=8), DataLoader(dataset, batch_size=8))
+    return callback
+
+
+def test_reports_each_epoch():
+    """エポックごとにval_accが報告されるか"""
+    study = optuna.create_study(direction="maximize", pruner=optuna.pruners.NopPruner())
+    trial = study.ask()
+
+    callback = _fit(trial, max_epochs=3)
+
+    assert callback.pruned_epoch is None
+    study.tell(trial, 0.5)
+    assert sorted(study.trials[0].intermediate_values) == [0, 1, 2]
+
+
+def test_prunes_trial():
+    """Prunerが打ち切りを判断した場合にTrialPrunedが送出されるか"""
+    # val_acc（最大1.0）が閾値を下回るため最初のエポックで枝刈りされる
+    study = optuna.create_study(direction="maximize", pruner=optuna.pruners.ThresholdPruner(lower=2.0))
+    trial = study.ask()
+
+    with pytest.raises(optuna.TrialPruned):
+        _fit(trial, max_epochs=3)
+
+    assert list(study.trials[0].intermediate_values) == [0]
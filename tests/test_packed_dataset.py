@@ -0,0 +1,134 @@
+"""
+パック済みデータセットのテスト
+
+書き出し・memmap読み込み・pickle時の挙動を確認
+"""
+
+import json
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.packed_dataset import (
+    PackedDataset,
+    PackedDataModule,
+    SnapshotDataModule,
+    write_packed_split,
+)
+
+
+@pytest.fixture
+def packed_dir(tmp_path):
+    """テスト用のパック済みデータセットを作成"""
+    images = {
+        "a.png": np.full((4, 6, 3), 10, dtype=np.uint8),
+        "b.png": np.full((5, 5, 3), 20, dtype=np.uint8),
+        "c.png": np.full((3, 3), 30, dtype=np.uint8),
+    }
+    records = [
+        {"traindata_id": 1, "image_path": "a.png", "label_index": 0},
+        {"traindata_id": 2, "image_path": "b.png", "label_index": 1},
+        {"traindata_id": 3, "image_path": "c.png", "label_index": 1},
+    ]
+    write_packed_split(str(tmp_path), "train", records, lambda path: [images[path]])
+    write_packed_split(str(tmp_path), "valid", records[:1], lambda path: [images[path]])
+    write_packed_split(str(tmp_path), "test", [], lambda path: [images[path]])
+
+    meta = {"theme_id": 7, "theme_name": "test", "class_names": ["ok", "ng"]}
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return tmp_path
+
+
+def test_roundtrip(packed_dir):
+    """書き出した画像とラベルが読み込めるか"""
+    dataset = PackedDataset(str(packed_dir), "train")
+    assert len(dataset) == 3
+    assert dataset.get_image(0).shape == (4, 6, 3)
+    assert dataset.get_image(1).max() == 20
+    # グレースケールは3チャンネルに変換される
+    assert dataset.get_image(2).shape == (3, 3, 3)
+
+    image, label = dataset[1]
+    assert isinstance(image, torch.Tensor)
+    assert image.shape == (3, 5, 5)
+    assert label == 1
+    assert dataset.get_class_distribution() == {"ok": 1, "ng": 2}
+
+
+def test_patches_are_separate_samples(tmp_path):
+    """1画像から複数パッチが出る場合はそれぞれサンプルになるか"""
+    patches = [np.full((2, 2, 3), v, dtype=np.uint8) for v in (1, 2)]
+    count = write_packed_split(
+        str(tmp_path), "train",
+        [{"traindata_id": 5, "image_path": "x", "label_index": 0}],
+        lambda path: patches
+    )
+    assert count == 2
+    index = np.load(tmp_path / "train.index.npz")
+    assert index["traindata_ids"].tolist() == [5, 5]
+    assert index["offsets"].tolist() == [0, 12]
+
+
+def test_memmap_not_pickled(packed_dir):
+    """pickle時にmemmapが含まれないか"""
+    dataset = PackedDataset(str(packed_dir), "train")
+    dataset.get_image(0)
+    assert dataset._data is not None
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored._data is None
+    np.testing.assert_array_equal(restored.get_image(1), dataset.get_image(1))
+
+
+def test_datamodule(packed_dir):
+    """DataModuleがクラス情報とDataLoaderを提供するか"""
+    datamodule = PackedDataModule(str(packed_dir), augments_config=None, batch_size=1, num_workers=0)
+    datamodule.setup(None)
+
+    assert datamodule.get_num_classes() == 2
+    assert datamodule.get_class_names() == ["ok", "ng"]
+    assert len(datamodule.test_dataset) == 0
+
+    images, labels = next(iter(datamodule.val_dataloader()))
+    assert images.shape == (1, 3, 4, 6)
+    assert labels.tolist() == [0]
+
+
+def test_datamodule_with_batch_preprocessing(tmp_path):
+    """バッチ前処理を指定した場合にcollate時に前処理が適用されるか"""
+    from src.data.batch_preprocessing import BatchPreprocessingPipeline, build_gamma_lut
+
+    image = np.full((4, 4, 3), 64, dtype=np.uint8)
+    records = [{"traindata_id": i, "image_path": "x", "label_index": 0} for i in range(3)]
+    for split in ("train", "valid", "test"):
+        write_packed_split(str(tmp_path), split, records, lambda path: [image])
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"theme_id": 1, "theme_name": "t", "class_names": ["a"]}, f)
+
+    datamodule = PackedDataModule(
+        str(tmp_path), augments_config=None, batch_size=3, num_workers=0,
+        batch_preprocessing=BatchPreprocessingPipeline(gamma=2.0)
+    )
+    datamodule.setup("fit")
+    images, labels = next(iter(datamodule.train_dataloader()))
+    assert images.shape == (3, 3, 4, 4)
+    expected = build_gamma_lut(2.0)[64] / 255.0
+    assert torch.allclose(images, torch.full_like(images, expected))
+
+
+def test_snapshot_datamodule_requires_create_dataset():
+    """_create_datasetを実装しないサブクラスは作成時にエラーになるか"""
+    class IncompleteDataModule(SnapshotDataModule):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteDataModule(meta={"class_names": ["a", "b"]}, augments_config=None)
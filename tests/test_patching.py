@@ -0,0 +1,190 @@
+"""
+ストリーミングパッチ抽出のテスト
+
+ストライドビュー・遅延生成・パッチインデックスの動作を確認
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.patching import (
+    ImageGroupedPatchSampler,
+    PatchDataset,
+    PatchIndex,
+    StreamingPatching,
+    compute_patch_grid,
+    create_patch_sampler,
+    extract_patches,
+    extract_patches_torch,
+    patch_grid_view,
+    split_patching_config,
+)
+
+
+def _naive_patches(image, patch_size, stride):
+    """パディング後の画像から素朴にパッチを切り出す（比較用）"""
+    rows, cols, padded_h, padded_w = compute_patch_grid(image.shape[0], image.shape[1], patch_size, stride)
+    padded = np.zeros((padded_h, padded_w) + image.shape[2:], dtype=image.dtype)
+    padded[:image.shape[0], :image.shape[1]] = image
+    return [
+        padded[r * stride[0]:r * stride[0] + patch_size[0], c * stride[1]:c * stride[1] + patch_size[1]]
+        for r in range(rows) for c in range(cols)
+    ]
+
+
+@pytest.fixture
+def image():
+    return np.arange(30 * 29 * 3, dtype=np.int64).reshape(30, 29, 3).astype(np.uint8)
+
+
+def test_grid_shape():
+    """パディングあり・なしでグリッドが正しいか"""
+    assert compute_patch_grid(28, 28, (14, 14), (7, 7), padding=True) == (3, 3, 28, 28)
+    assert compute_patch_grid(30, 29, (14, 14), (7, 7), padding=True) == (4, 4, 35, 35)
+    assert compute_patch_grid(30, 29, (14, 14), (7, 7), padding=False) == (3, 3, 30, 29)
+    assert compute_patch_grid(10, 10, (14, 14), (7, 7), padding=False)[:2] == (0, 0)
+
+
+def test_view_matches_naive(image):
+    """ストライドビューが素朴な切り出しと一致するか"""
+    patches = extract_patches(image, (14, 14), (7, 7))
+    expected = _naive_patches(image, (14, 14), (7, 7))
+    assert patches.shape == (16, 14, 14, 3)
+    for actual, exp in zip(patches, expected):
+        np.testing.assert_array_equal(actual, exp)
+
+
+def test_view_is_zero_copy():
+    """パディング不要の場合は元画像を共有するビューか"""
+    image = np.zeros((28, 28, 3), dtype=np.uint8)
+    grid = patch_grid_view(image, (14, 14), (7, 7))
+    assert grid.shape == (3, 3, 14, 14, 3)
+    assert np.shares_memory(grid, image)
+
+
+def test_get_patch_and_iter(image):
+    """1枚だけの切り出しと遅延生成が一致するか"""
+    patching = StreamingPatching(patch_size=[14, 14], stride=[7, 7])
+    expected = _naive_patches(image, (14, 14), (7, 7))
+    for index, patch in enumerate(patching.iter(image)):
+        np.testing.assert_array_equal(patch, expected[index])
+        np.testing.assert_array_equal(patching.get_patch(image, index), expected[index])
+    with pytest.raises(IndexError):
+        patching.get_patch(image, len(expected))
+
+
+def test_default_stride_is_patch_size():
+    """strideを省略した場合はパッチサイズと同じ（重なりなし）になるか"""
+    patching = StreamingPatching.from_config({"patching": {"enabled": True, "patch_size": [14, 14]}})
+    assert patching.stride == (14, 14)
+    assert patching.num_patches(28, 28) == 4
+
+
+def test_torch_unfold(image):
+    """torch版がnumpy版と一致するか"""
+    tensor = torch.from_numpy(image).permute(2, 0, 1)
+    grid = extract_patches_torch(tensor, (14, 14), (7, 7))
+    assert grid.shape == (3, 4, 4, 14, 14)
+    numpy_grid = patch_grid_view(image, (14, 14), (7, 7))
+    np.testing.assert_array_equal(grid.permute(1, 2, 3, 4, 0).numpy(), numpy_grid)
+
+
+def test_split_patching_config():
+    """前処理設定からパッチ化が分離されるか"""
+    config = {"gamma_correction": {"enabled": True}, "patching": {"enabled": True, "patch_size": [8, 8], "stride": [4, 4]}}
+    stripped, patching = split_patching_config(config)
+    assert stripped["patching"]["enabled"] is False
+    assert config["patching"]["enabled"] is True
+    assert patching.patch_size == (8, 8)
+    assert split_patching_config({"patching": {"enabled": False}})[1] is None
+
+
+def test_patch_index():
+    """フラットなインデックスが (画像, パッチ) に変換されるか"""
+    patching = StreamingPatching(patch_size=(14, 14), stride=(7, 7))
+    index = PatchIndex([(28, 28), (14, 14), (30, 29)], patching)
+    assert len(index) == 9 + 1 + 16
+    assert index.locate(0) == (0, 0)
+    assert index.locate(8) == (0, 8)
+    assert index.locate(9) == (1, 0)
+    assert index.locate(10) == (2, 0)
+    assert index.locate(-1) == (2, 15)
+    assert index.sample_labels([0, 1, 2]).tolist() == [0] * 9 + [1] + [2] * 16
+
+
+def test_patch_dataset_reads_headers_only(tmp_path):
+    """インデックス作成時に画像をデコードしないか"""
+    paths = []
+    for i, size in enumerate([(28, 28), (14, 28)]):
+        path = tmp_path / f"{i}.png"
+        Image.fromarray(np.full(size + (3,), i * 100, dtype=np.uint8)).save(path)
+        paths.append(str(path))
+
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return np.array(Image.open(path).convert("RGB"))
+
+    dataset = PatchDataset(paths, [0, 1], StreamingPatching((14, 14), (7, 7)), image_loader=loader)
+    assert len(dataset) == 9 + 3
+    assert calls == []
+
+    image, label = dataset[10]
+    assert image.shape == (3, 14, 14)
+    assert label == 1
+    assert calls == [paths[1]]
+    dataset[11]
+    assert calls == [paths[1]]  # デコード済み画像を再利用
+
+    assert len(dataset.__getstate__()["_decoded"]) == 0
+    assert dataset.get_labels() == [0] * 9 + [1] * 3
+
+
+def test_image_grouped_sampler(tmp_path):
+    """画像単位でシャッフルされ、シャッフルしても画像のデコードが画像数と同じ回数で済むか"""
+    from torch.utils.data import DataLoader
+
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"{i}.png"
+        Image.fromarray(np.full((28, 28, 3), i * 40, dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return np.array(Image.open(path).convert("RGB"))
+
+    dataset = PatchDataset(paths, list(range(6)), StreamingPatching((14, 14), (7, 7)), image_loader=loader,
+                           return_raw=True, decoded_cache_size=1)
+    sampler = create_patch_sampler(dataset, shuffle=True)
+    assert isinstance(sampler, ImageGroupedPatchSampler)
+    assert create_patch_sampler(dataset, shuffle=False) is None
+
+    order = list(sampler)
+    assert sorted(order) == list(range(len(dataset)))
+    images = [dataset.index.locate(i)[0] for i in order]
+    # 同じ画像のパッチは連続する
+    assert [images[i] for i in range(0, len(images), 9)] == [images[i + 8] for i in range(0, len(images), 9)]
+    assert len(set(images[:9])) == 1
+
+    labels = torch.cat([batch_labels for _, batch_labels in DataLoader(dataset, batch_size=4, sampler=sampler)])
+    assert len(labels) == len(dataset)
+    assert len(calls) == 6
+
+    seeded = ImageGroupedPatchSampler(dataset.index, seed=0)
+    first = list(seeded)
+    assert list(seeded) == first
+    seeded.set_epoch(1)
+    assert list(seeded) != first
+
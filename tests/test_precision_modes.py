@@ -0,0 +1,71 @@
+"""
+混合精度・channels_lastの学習モードのテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.packed_dataset import ChannelsLastCollate
+from src.training.lightning_module import ClassificationLightningModule
+from src.training.train import check_precision_support
+
+
+def test_channels_last_collate():
+    """collate後の画像がchannels_lastになるか"""
+    samples = [(torch.rand(3, 8, 8), 0), (torch.rand(3, 8, 8), 1)]
+    images, labels = ChannelsLastCollate()(samples)
+
+    assert images.is_contiguous(memory_format=torch.channels_last)
+    assert labels.tolist() == [0, 1]
+
+
+def test_channels_last_module():
+    """モデルの重みと入力がchannels_lastになるか"""
+    module = ClassificationLightningModule(model_name="ResNet18", num_classes=2, pretrained=False, channels_last=True)
+
+    assert module.model.backbone.conv1.weight.is_contiguous(memory_format=torch.channels_last)
+    images, labels = module.on_after_batch_transfer((torch.rand(2, 3, 8, 8), torch.tensor([0, 1])), 0)
+    assert images.is_contiguous(memory_format=torch.channels_last)
+
+    # 無効な場合は変換しない
+    module = ClassificationLightningModule(model_name="ResNet18", num_classes=2, pretrained=False)
+    images, _ = module.on_after_batch_transfer((torch.rand(2, 3, 8, 8), torch.tensor([0, 1])), 0)
+    assert images.is_contiguous()
+
+
+@pytest.mark.parametrize("precision", ["32-true", "bf16-mixed"])
+def test_fit(precision):
+    """channels_last・各精度で学習できるか"""
+    torch.manual_seed(0)
+    dataset = TensorDataset(torch.rand(8, 3, 32, 32), torch.randint(0, 2, (8,)))
+    loader = DataLoader(dataset, batch_size=4, collate_fn=ChannelsLastCollate())
+    module = ClassificationLightningModule(model_name="ResNet18", num_classes=2, pretrained=False, channels_last=True)
+
+    check_precision_support(precision, "cpu")
+    trainer = pl.Trainer(
+        max_epochs=1,
+        accelerator="cpu",
+        precision=precision,
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+    )
+    trainer.fit(module, loader, loader)
+
+    assert torch.isfinite(trainer.callback_metrics["val_loss"])
+
+
+def test_invalid_precision():
+    """サポートされていない精度はエラーになるか"""
+    with pytest.raises(ValueError):
+        check_precision_support("8-true", "cpu")
@@ -0,0 +1,156 @@
+"""
+スループット計測・勾配ノルムのCallbackのテスト
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytorch_lightning as pl
+import torch
+import torch.nn as nn
+from pytorch_lightning.loggers.logger import Logger
+from torch.utils.data import DataLoader, TensorDataset
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.loader_tuning import measure_loading_stages
+from src.training.callbacks import (
+    GradientNormCallback,
+    ThroughputProfilerCallback,
+    compute_total_grad_norm,
+    create_profiler_callback,
+)
+
+
+class TinyModule(pl.LightningModule):
+    """小さなモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.layer = nn.Linear(4, 2)
+
+    def training_step(self, batch, batch_idx):
+        x, y = batch
+        return nn.functional.cross_entropy(self.layer(x), y)
+
+    def configure_optimizers(self):
+        return torch.optim.SGD(self.parameters(), lr=0.1)
+
+
+class MemoryLogger(Logger):
+    """記録されたメトリクスを保持するLogger"""
+
+    def __init__(self):
+        super().__init__()
+        self.metrics = []
+
+    @property
+    def name(self):
+        return "memory"
+
+    @property
+    def version(self):
+        return 0
+
+    def log_metrics(self, metrics, step=None):
+        self.metrics.append(dict(metrics))
+
+    def log_hyperparams(self, params, *args, **kwargs):
+        pass
+
+
+def test_gradient_norm():
+    """勾配ノルムがパラメータごとのノルムから計算した値と一致するか"""
+    module = TinyModule()
+    x, y = torch.randn(8, 4), torch.randint(0, 2, (8,))
+    module.training_step((x, y), 0).backward()
+
+    logged = {}
+    module.log = lambda name, value, **kwargs: logged.update({name: value})
+    GradientNormCallback().on_after_backward(None, module)
+
+    expected = sum(p.grad.norm(2).item() ** 2 for p in module.parameters()) ** 0.5
+    assert isinstance(logged["grad_norm"], torch.Tensor)
+    assert abs(logged["grad_norm"].item() - expected) < 1e-5
+
+
+def test_total_grad_norm_fallback(monkeypatch):
+    """get_total_normがないPyTorchでも同じ値になるか"""
+    grads = [torch.randn(3, 4), torch.randn(5)]
+    expected = torch.cat([g.flatten() for g in grads]).norm(2).item()
+    assert abs(compute_total_grad_norm(grads).item() - expected) < 1e-5
+
+    monkeypatch.delattr(torch.nn.utils, "get_total_norm", raising=False)
+    assert abs(compute_total_grad_norm(grads).item() - expected) < 1e-5
+
+
+def test_measure_loading_stages():
+    """バッチの作成時間が段階ごとに計測されるか"""
+    dataset = TensorDataset(torch.randn(16, 4), torch.randint(0, 2, (16,)))
+    stages = measure_loading_stages(DataLoader(dataset, batch_size=4), num_batches=2)
+
+    assert set(stages) == {"dataset", "collate"}
+    assert all(ms >= 0 for ms in stages.values())
+
+
+def test_profiler_callback(tmp_path):
+    """スループット・データ待ち・段階ごとの時間がLoggerに記録され、トレースが保存されるか"""
+    assert create_profiler_callback(None) is None
+    callback = create_profiler_callback({
+        "log_every_n_steps": 2,
+        "trace": {"start_step": 1, "num_steps": 2, "output_dir": str(tmp_path)},
+    })
+    assert isinstance(callback, ThroughputProfilerCallback)
+
+    dataset = TensorDataset(torch.randn(32, 4), torch.randint(0, 2, (32,)))
+    memory_logger = MemoryLogger()
+    trainer = pl.Trainer(
+        max_epochs=1,
+        accelerator="cpu",
+        logger=memory_logger,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        callbacks=[callback],
+    )
+    trainer.fit(TinyModule(), DataLoader(dataset, batch_size=4))
+
+    step_metrics = [m for m in memory_logger.metrics if "profile_samples_per_sec" in m]
+    assert len(step_metrics) == 4
+    assert all(m["profile_samples_per_sec"] > 0 and 0 <= m["profile_data_wait_fraction"] <= 1 for m in step_metrics)
+    assert any("profile_stage_dataset_ms" in m for m in memory_logger.metrics)
+    assert callback.trace_path is not None and Path(callback.trace_path).exists()
+
+
+class SlowValidationModule(TinyModule):
+    """検証に時間がかかるモデル"""
+
+    def validation_step(self, batch, batch_idx):
+        time.sleep(0.05)
+
+
+def test_profiler_excludes_mid_epoch_validation():
+    """val_check_interval < 1.0の場合、エポック途中の検証の時間がデータ待ちに含まれないか"""
+    callback = ThroughputProfilerCallback(log_every_n_steps=1, stage_batches=0)
+    dataset = TensorDataset(torch.randn(32, 4), torch.randint(0, 2, (32,)))
+    memory_logger = MemoryLogger()
+    trainer = pl.Trainer(
+        max_epochs=1,
+        accelerator="cpu",
+        logger=memory_logger,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        num_sanity_val_steps=0,
+        val_check_interval=0.5,
+        callbacks=[callback],
+    )
+    trainer.fit(SlowValidationModule(), DataLoader(dataset, batch_size=4), DataLoader(dataset, batch_size=8))
+
+    # 検証（4バッチ×50ms）の時間がデータ待ちに含まれると200ms以上になる
+    wait_ms = [m["profile_data_wait_ms"] for m in memory_logger.metrics if "profile_data_wait_ms" in m]
+    assert len(wait_ms) == 8
+    assert max(wait_ms) < 100
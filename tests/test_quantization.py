@@ -0,0 +1,72 @@
+"""
+学習後の静的量子化のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.models.quantization import (
+    evaluate_accuracy,
+    load_quantized_model,
+    model_size_bytes,
+    quantize_model,
+    save_quantized_model,
+)
+from src.models.resnet import ResNetClassifier
+
+
+@pytest.fixture
+def model():
+    """テスト用のモデル"""
+    torch.manual_seed(0)
+    return ResNetClassifier(model_name="ResNet18", num_classes=3, pretrained=False).eval()
+
+
+@pytest.fixture
+def batches():
+    """(画像, ラベル) のバッチ"""
+    torch.manual_seed(1)
+    return [(torch.rand(4, 3, 32, 32), torch.randint(0, 3, (4,))) for _ in range(3)]
+
+
+def test_quantize_model(model, batches):
+    """量子化したモデルが小さくなり、fp32に近い出力になるか"""
+    quantized = quantize_model(model, batches, num_batches=2)
+
+    assert model_size_bytes(quantized) < model_size_bytes(model) / 2
+    # 元のモデルは変更されない
+    assert not any("quantized" in type(m).__module__ for m in model.modules())
+
+    x = batches[0][0]
+    with torch.inference_mode():
+        fp32 = model(x)
+        int8 = quantized(x)
+    assert int8.shape == fp32.shape
+    assert (int8 - fp32).abs().max() < 0.5 * fp32.abs().max() + 0.1
+
+    accuracy = evaluate_accuracy(quantized, batches)
+    assert 0.0 <= accuracy <= 1.0
+
+
+def test_save_and_load(tmp_path, model, batches):
+    """保存した量子化済みモデルを読み込めるか"""
+    quantized = quantize_model(model, batches, num_batches=1)
+    save_quantized_model(quantized, tmp_path, batches[0][0], meta={"backend": "x86"})
+
+    loaded = load_quantized_model(tmp_path)
+    x = batches[1][0]
+    with torch.inference_mode():
+        torch.testing.assert_close(loaded(x), quantized(x))
+
+
+def test_empty_calibration(model):
+    """キャリブレーションデータが空の場合はエラーになるか"""
+    with pytest.raises(ValueError):
+        quantize_model(model, [], num_batches=1)
@@ -0,0 +1,96 @@
+"""
+テーマの統計情報（集計クエリとキャッシュ）のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+@pytest.fixture
+def theme_with_data(test_theme):
+    """ラベル0に train 3件・未分割 1件、ラベル1に valid 2件、未ラベルに 1件のテーマ"""
+    from django.core.cache import cache
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    rows = [(labels[0], 'train')] * 3 + [(labels[0], None), (labels[1], 'valid'), (labels[1], 'valid'), (None, None)]
+    TrainData.objects.bulk_create([
+        TrainData(theme=theme, label=label, split=split, image=f"images/{i}.png")
+        for i, (label, split) in enumerate(rows)
+    ])
+    cache.clear()
+    yield theme, labels
+    cache.clear()
+
+
+def test_theme_statistics(theme_with_data):
+    """ラベル×分割ごとの件数が1回のクエリで計算され、2回目はキャッシュから返るか"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from data_management.crud import get_split_statistics
+    from data_management.statistics import get_theme_statistics
+
+    theme, labels = theme_with_data
+    with CaptureQueriesContext(connection) as queries:
+        statistics = get_theme_statistics(theme.id)
+    assert len(queries) == 1
+
+    assert statistics['splits'] == {'train': 3, 'valid': 2, 'test': 0, 'unsplit': 2, 'total': 7}
+    assert statistics['labels'][labels[0].id] == {'train': 3, 'valid': 0, 'test': 0, 'unsplit': 1, 'total': 4}
+    assert statistics['labels'][labels[1].id]['valid'] == 2
+    assert labels[2].id not in statistics['labels']
+    assert statistics['unlabeled']['total'] == 1
+
+    with CaptureQueriesContext(connection) as queries:
+        assert get_split_statistics(theme.id) == {'train': 3, 'valid': 2, 'test': 0, 'unsplit': 2}
+    assert len(queries) == 0
+
+
+def test_statistics_invalidation(theme_with_data):
+    """TrainDataの作成・更新・削除と分割の更新でキャッシュが無効化されるか"""
+    from data_management.crud import assign_all_splits, create_traindata, update_traindata_label
+    from data_management.statistics import get_theme_statistics
+
+    theme, labels = theme_with_data
+    assert get_theme_statistics(theme.id)['splits']['total'] == 7
+
+    traindata = create_traindata(theme.id, image="images/new.png", label_id=labels[2].id)
+    assert get_theme_statistics(theme.id)['labels'][labels[2].id]['unsplit'] == 1
+
+    update_traindata_label(theme.id, traindata.id, labels[1].id)
+    statistics = get_theme_statistics(theme.id)
+    assert labels[2].id not in statistics['labels']
+    assert statistics['labels'][labels[1].id]['total'] == 3
+
+    traindata.delete()
+    assert get_theme_statistics(theme.id)['splits']['total'] == 7
+
+    # queryset.update()による一括更新
+    assign_all_splits(theme.id)
+    assert get_theme_statistics(theme.id)['splits']['unsplit'] == 0
+
+
+def test_api_statistics(theme_with_data):
+    """統計APIがデータのあるラベルの件数を返すか"""
+    import json
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+    from data_management.views import api_statistics
+
+    theme, labels = theme_with_data
+    request = RequestFactory().get(f'/api/theme/{theme.id}/statistics/')
+    request.user = User(username='statistics_test_user')
+    data = json.loads(api_statistics(request, theme.id).content)
+
+    assert data['success']
+    assert data['stats'] == {'train': 3, 'valid': 2, 'test': 0, 'unsplit': 2}
+    assert data['label_counts'] == [
+        {'label_id': labels[0].id, 'label_name': labels[0].label_name, 'count': 4},
+        {'label_id': labels[1].id, 'label_name': labels[1].label_name, 'count': 2},
+    ]
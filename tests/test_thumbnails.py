@@ -0,0 +1,111 @@
+"""
+サムネイルの生成・配信・一括生成コマンドのテスト
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def _save_image(path, width=800, height=600, seed=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    array = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    Image.fromarray(array).save(path, quality=95)
+    return path
+
+
+@pytest.fixture
+def thumbnail_settings(setup_django_env, tmp_path):
+    """MEDIA_ROOT・THUMBNAIL_ROOTを一時ディレクトリに変更"""
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    with override_settings(MEDIA_ROOT=str(tmp_path / 'media'), THUMBNAIL_ROOT=str(tmp_path / 'thumbnails')):
+        yield tmp_path
+    cache.clear()
+
+
+def test_generate_thumbnails(tmp_path, setup_django_env):
+    """各サイズ・フォーマットのサムネイルがコンテンツハッシュごとに生成されるか"""
+    from data_management.thumbnails import THUMBNAIL_SIZES, available_formats, generate_thumbnails, get_thumbnail_path
+
+    image_path = _save_image(tmp_path / 'a.jpg')
+    root = tmp_path / 'thumbnails'
+    content_hash = generate_thumbnails(str(image_path), str(root))
+
+    for size, pixels in THUMBNAIL_SIZES.items():
+        for fmt in available_formats():
+            with Image.open(get_thumbnail_path(str(root), content_hash, size, fmt)) as thumbnail:
+                assert thumbnail.size == (pixels, pixels * 3 // 4)
+
+    # 同じ内容の画像は同じサムネイルを使い、再生成しない
+    copy_path = tmp_path / 'b.jpg'
+    copy_path.write_bytes(image_path.read_bytes())
+    mtimes = sorted(p.stat().st_mtime_ns for p in root.rglob('*.*'))
+    assert generate_thumbnails(str(copy_path), str(root)) == content_hash
+    assert sorted(p.stat().st_mtime_ns for p in root.rglob('*.*')) == mtimes
+
+    with pytest.raises(ValueError):
+        get_thumbnail_path(str(root), content_hash, 'huge', 'jpeg')
+
+
+def test_thumbnail_view(test_theme, thumbnail_settings):
+    """サムネイルがAcceptに応じたフォーマット・ETag付きで返され、If-None-Matchで304になるか"""
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+    from data_management.models import TrainData
+    from data_management.views import thumbnail
+
+    theme, labels = test_theme
+    _save_image(thumbnail_settings / 'media' / 'images' / 'a.jpg')
+    traindata = TrainData.objects.create(theme=theme, label=labels[0], image='images/a.jpg')
+
+    def request(**headers):
+        req = RequestFactory().get(f'/theme/{theme.id}/thumbnail/{traindata.id}/', {'size': 'small'}, **headers)
+        req.user = User(username='thumbnail_test_user')
+        return thumbnail(req, theme.id, traindata.id)
+
+    response = request(HTTP_ACCEPT='image/webp,image/*')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'image/webp'
+    assert 'max-age' in response['Cache-Control']
+    assert 'Accept' in response['Vary']
+    etag = response['ETag']
+    response.close()
+
+    response = request(HTTP_ACCEPT='image/*')
+    assert response['Content-Type'] == 'image/jpeg'
+    assert response['ETag'] != etag
+    response.close()
+
+    assert request(HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+def test_backfill_thumbnails_command(test_theme, thumbnail_settings):
+    """一括生成コマンドが並列にサムネイルを生成し、読み込めない画像は失敗として数えるか"""
+    from io import StringIO
+    from django.core.management import call_command
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    for i in range(4):
+        _save_image(thumbnail_settings / 'media' / 'images' / f'{i}.jpg', seed=i)
+    TrainData.objects.bulk_create(
+        [TrainData(theme=theme, label=labels[0], image=f'images/{i}.jpg') for i in range(4)]
+        + [TrainData(theme=theme, label=labels[0], image='images/missing.jpg')]
+    )
+
+    stdout, stderr = StringIO(), StringIO()
+    call_command('backfill_thumbnails', theme_id=[theme.id], workers=2, sizes=['small'], formats=['jpeg'],
+                 stdout=stdout, stderr=stderr)
+
+    assert len(list((thumbnail_settings / 'thumbnails').rglob('*_small.jpg'))) == 4
+    assert '4件成功, 1件失敗' in stdout.getvalue()
+    assert 'missing.jpg' in stderr.getvalue()
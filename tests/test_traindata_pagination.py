@@ -0,0 +1,141 @@
+"""
+画像一覧のキーセットページネーション（画面・API）のテスト
+"""
+
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+@pytest.fixture
+def listed_theme(test_theme):
+    """作成日時が重複する行を含む45件のTrainData"""
+    from django.core.cache import cache
+    from django.utils import timezone
+    from data_management.models import TrainData
+
+    theme, labels = test_theme
+    TrainData.objects.bulk_create([
+        TrainData(theme=theme, label=labels[i % 3] if i % 5 else None, image=f'images/{i}.png',
+                  split=(None, 'train', 'valid', 'test')[i % 4])
+        for i in range(45)
+    ])
+    # 同じ作成日時の行が複数あってもページの境界で漏れ・重複がないことを確認するため、4件ずつ同じ日時にする
+    base = timezone.now()
+    for index, traindata_id in enumerate(TrainData.objects.filter(theme=theme).order_by('id').values_list('id', flat=True)):
+        TrainData.objects.filter(id=traindata_id).update(created_at=base - timedelta(seconds=index // 4))
+    cache.clear()
+    yield theme, labels
+    cache.clear()
+
+
+def test_keyset_page_and_counts(listed_theme):
+    """次・前のページを順にたどると全件が並び順どおりに1回ずつ現れ、件数が統計と一致するか"""
+    from data_management.crud import filter_traindata
+    from data_management.pagination import decode_cursor, keyset_page
+    from data_management.statistics import count_traindata, get_theme_statistics
+
+    theme, labels = listed_theme
+    queryset = filter_traindata(theme.id)
+    expected = list(queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    pages, cursor = [], None
+    while True:
+        page = keyset_page(queryset, after=cursor, page_size=10)
+        pages.append([t.id for t in page['items']])
+        if not page['has_next']:
+            break
+        cursor = page['next_cursor']
+    assert [i for ids in pages for i in ids] == expected
+    assert [len(ids) for ids in pages] == [10, 10, 10, 10, 5]
+
+    # 最後のページから前のページへ戻る
+    back = keyset_page(queryset, before=page['previous_cursor'], page_size=10)
+    assert [t.id for t in back['items']] == pages[-2]
+    assert back['has_next'] and back['has_previous']
+    first = keyset_page(queryset, before=keyset_page(queryset, page_size=10)['next_cursor'], page_size=10)
+    assert [t.id for t in first['items']] == pages[0] and not first['has_previous']
+
+    with pytest.raises(ValueError):
+        decode_cursor('invalid')
+    with pytest.raises(ValueError):
+        keyset_page(queryset, after=cursor, before=cursor)
+
+    statistics = get_theme_statistics(theme.id)
+    for filter_type in ('all', 'labeled', 'unlabeled'):
+        for label_id in (None, labels[1].id, labels[9].id):
+            for split in ('', 'train', 'valid', 'test', 'unsplit'):
+                assert count_traindata(statistics, filter_type, label_id, split) == \
+                    filter_traindata(theme.id, filter_type, label_id, split).count()
+
+
+def test_listing_uses_indexes(listed_theme):
+    """一覧のクエリが追加したインデックスを使うか"""
+    from django.db import connection
+    from data_management.crud import filter_traindata
+
+    theme, labels = listed_theme
+    for queryset in (
+        filter_traindata(theme.id),
+        filter_traindata(theme.id, split='train', label_id=labels[1].id),
+    ):
+        sql, params = queryset.order_by('-created_at', '-id')[:21].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        assert 'traindata_theme_created_idx' in plan or 'traindata_theme_split_idx' in plan, plan
+
+
+def test_theme_detail_and_api(listed_theme):
+    """画面とAPIが深いページでもCOUNT・OFFSETなしで一覧を返すか"""
+    import json
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from data_management.crud import filter_traindata
+    from data_management.pagination import keyset_page
+    from data_management.statistics import get_theme_statistics
+    from data_management.views import api_traindata_list, theme_detail
+
+    theme, labels = listed_theme
+    get_theme_statistics(theme.id)
+
+    def call(view, path, params):
+        request = RequestFactory().get(path, params)
+        request.user = User(username='pagination_test_user')
+        return view(request, theme.id)
+
+    seen, cursor = [], None
+    while True:
+        params = {'page_size': 20, 'filter': 'labeled', **({'after': cursor} if cursor else {})}
+        with CaptureQueriesContext(connection) as queries:
+            data = json.loads(call(api_traindata_list, f'/api/theme/{theme.id}/images/', params).content)
+        sql = ' '.join(q['sql'] for q in queries.captured_queries).upper()
+        assert 'COUNT(' not in sql and 'OFFSET' not in sql
+        assert data['success'] and data['total_count'] == 36
+        seen += [item['id'] for item in data['items']]
+        assert all(item['label_name'] for item in data['items'])
+        if not data['has_next']:
+            break
+        cursor = data['next_cursor']
+    assert len(seen) == len(set(seen)) == 36
+
+    assert call(api_traindata_list, '/', {'after': 'invalid'}).status_code == 400
+    assert call(api_traindata_list, '/', {'page_size': 1000}).status_code == 400
+
+    first = call(theme_detail, f'/theme/{theme.id}/', {})
+    assert 'ページ 1 / 3（45件）' in first.content.decode()
+    with CaptureQueriesContext(connection) as queries:
+        next_cursor = keyset_page(filter_traindata(theme.id))['next_cursor']
+        response = call(theme_detail, f'/theme/{theme.id}/', {'after': next_cursor, 'page': 2})
+    sql = ' '.join(q['sql'] for q in queries.captured_queries).upper()
+    assert response.status_code == 200
+    assert 'COUNT(' not in sql and 'OFFSET' not in sql
+    assert 'ページ 2 / 3（45件）' in response.content.decode()
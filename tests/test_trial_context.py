@@ -0,0 +1,63 @@
+"""
+トライアルコンテキスト（トライアル間の再利用）のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import torch
+from torchvision import models
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.models.resnet import ResNetClassifier
+from src.training.trial_context import TrialContext
+
+
+def test_get_or_create():
+    """同じキーでは作成済みの値が再利用されるか"""
+    context = TrialContext()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return object()
+
+    first = context.get_or_create("backbone", "ResNet18", factory)
+    second = context.get_or_create("backbone", "ResNet18", factory)
+    other = context.get_or_create("backbone", "ResNet34", factory)
+
+    assert first is second
+    assert other is not first
+    assert len(calls) == 2
+    assert (context.hits, context.misses) == (1, 2)
+
+    context.clear()
+    context.get_or_create("backbone", "ResNet18", factory)
+    assert len(calls) == 3
+
+
+def test_backbone_state_dict():
+    """渡したバックボーンの重みが使われ、分類ヘッドは新しく作られるか"""
+    torch.manual_seed(0)
+    state_dict = {
+        key: value for key, value in models.resnet18(weights=None).state_dict().items()
+        if not key.startswith("fc.")
+    }
+
+    model = ResNetClassifier(model_name="ResNet18", num_classes=3, pretrained=True, backbone_state_dict=state_dict)
+
+    assert model.backbone.fc.out_features == 3
+    assert not any(p.is_meta for p in model.parameters())
+    torch.testing.assert_close(model.backbone.conv1.weight, state_dict["conv1.weight"])
+    torch.testing.assert_close(model.backbone.bn1.running_mean, state_dict["bn1.running_mean"])
+
+    # 学習で更新しても元の重みは変わらない
+    with torch.no_grad():
+        model.backbone.conv1.weight.add_(1.0)
+    assert not torch.equal(model.backbone.conv1.weight, state_dict["conv1.weight"])
+
+    model.eval()
+    assert model(torch.rand(2, 3, 32, 32)).shape == (2, 3)